@@ -1,16 +1,37 @@
 """
 OpenAI Service for DISCERA AI Integration
 """
+import json
 import logging
+import time
 from typing import List, Dict, Any, Optional
 import openai
 from openai import OpenAI
 
+from app.ai.rate_limiter import estimate_tokens, rate_limiter
+from app.ai.resilience import call_with_retries, hedged_call
 from app.core.config import settings
+from app.services.llm_usage import usage_recorder
 
 logger = logging.getLogger(__name__)
 
 
+def parse_json_response(text: str) -> Any:
+    """Parse a JSON object from a model response, tolerating code fences and prose"""
+    text = (text or "").strip()
+    if text.startswith("```"):
+        text = text.strip("`")
+        if text.startswith("json"):
+            text = text[4:]
+    try:
+        return json.loads(text)
+    except ValueError:
+        start, end = text.find("{"), text.rfind("}")
+        if start == -1 or end <= start:
+            raise
+        return json.loads(text[start:end + 1])
+
+
 class OpenAIService:
     """OpenAI service for DISCERA AI features"""
     
@@ -20,11 +41,67 @@ class OpenAIService:
         self.model = "gpt-4"
         
         if settings.OPENAI_API_KEY:
-            self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
+            # Retries are handled by the resilience layer, not by the client
+            self.client = OpenAI(
+                api_key=settings.OPENAI_API_KEY,
+                max_retries=0,
+                timeout=settings.LLM_REQUEST_TIMEOUT
+            )
             logger.info("✅ OpenAI service initialized")
         else:
             logger.warning("⚠️ OpenAI API key not configured")
     
+    def _create_completion(
+        self,
+        operation: str,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        hedge: bool = False
+    ):
+        """Chat completion behind the rate limiter, with retries and circuit breaking; optionally hedged.
+
+        Every call, successful or not, is written to the usage ledger under `operation`.
+        """
+        def request():
+            return self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature
+            )
+        
+        lease = None
+        response = None
+        error = None
+        start = time.perf_counter()
+        try:
+            if settings.LLM_RATE_LIMIT_ENABLED:
+                lease = rate_limiter.acquire(estimate_tokens(messages, max_tokens))
+            if hedge and settings.LLM_HEDGING_ENABLED:
+                response = hedged_call(request, provider="openai")
+            else:
+                response = call_with_retries(request, provider="openai")
+            return response
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            usage = getattr(response, "usage", None)
+            if lease is not None:
+                # Failed calls return their estimate; successful ones are charged what they used
+                rate_limiter.settle(lease, usage.total_tokens if usage else 0)
+            usage_recorder.record(
+                provider="openai",
+                model=self.model,
+                operation=operation,
+                prompt_tokens=usage.prompt_tokens if usage else 0,
+                completion_tokens=usage.completion_tokens if usage else 0,
+                latency_ms=(time.perf_counter() - start) * 1000,
+                success=error is None,
+                error=error
+            )
+    
     def generate_response(
         self, 
         query: str, 
@@ -60,12 +137,13 @@ Please provide a comprehensive and accurate answer based on the context provided
             # Add user query
             messages.append({"role": "user", "content": query})
             
-            # Generate response
-            response = self.client.chat.completions.create(
-                model=self.model,
+            # Generate response; chat is latency sensitive, so slow calls are hedged
+            response = self._create_completion(
+                operation="generate_response",
                 messages=messages,
                 max_tokens=max_tokens,
-                temperature=temperature
+                temperature=temperature,
+                hedge=True
             )
             
             return {
@@ -90,7 +168,8 @@ Please provide a comprehensive and accurate answer based on the context provided
         self, 
         content: str, 
         num_questions: int = 5,
-        question_types: List[str] = ["multiple_choice", "true_false", "short_answer"]
+        question_types: List[str] = ["multiple_choice", "true_false", "short_answer"],
+        difficulty: str = "medium"
     ) -> Dict[str, Any]:
         """Generate test questions from content"""
         try:
@@ -103,15 +182,17 @@ Please provide a comprehensive and accurate answer based on the context provided
             system_prompt = f"""You are an expert educator creating test questions. Generate {num_questions} diverse test questions from the provided content.
 
 Question types to include: {', '.join(question_types)}
+Target difficulty: {difficulty}
 
 For each question, provide:
 1. Question text
 2. Question type (multiple_choice, true_false, short_answer)
-3. Correct answer
+3. Correct answer (for multiple_choice, the exact text of the correct option; for true_false, "True" or "False")
 4. Options (for multiple choice)
-5. Difficulty level (easy, medium, hard)
+5. A one-sentence explanation
+6. Difficulty level (easy, medium, hard)
 
-Format the response as JSON:
+Respond with JSON only, in this format:
 {{
     "questions": [
         {{
@@ -119,24 +200,28 @@ Format the response as JSON:
             "type": "multiple_choice",
             "correct_answer": "Correct answer",
             "options": ["A", "B", "C", "D"],
+            "explanation": "Why the answer is correct",
             "difficulty": "medium"
         }}
     ]
 }}"""
 
-            response = self.client.chat.completions.create(
-                model=self.model,
+            response = self._create_completion(
+                operation="generate_test_questions",
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": f"Generate test questions from this content:\n\n{content}"}
                 ],
-                max_tokens=2000,
+                max_tokens=300 + 250 * num_questions,
                 temperature=0.7
             )
             
+            raw_response = response.choices[0].message.content
+            
             return {
                 "success": True,
-                "response": response.choices[0].message.content,
+                "response": raw_response,
+                "data": parse_json_response(raw_response),
                 "model": self.model
             }
             
@@ -167,8 +252,8 @@ Format the response as JSON:
 
 Format as structured analysis."""
 
-            response = self.client.chat.completions.create(
-                model=self.model,
+            response = self._create_completion(
+                operation="analyze_document",
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": f"Analyze this document:\n\n{content}"}
@@ -190,6 +275,148 @@ Format as structured analysis."""
                 "error": str(e)
             }
     
+    def summarize_section(self, content: str) -> Dict[str, Any]:
+        """Map step of document analysis: summarize one section of a document"""
+        try:
+            if not self.client:
+                return {
+                    "success": False,
+                    "error": "OpenAI client not initialized"
+                }
+            
+            system_prompt = """You summarize one section of a longer educational document. Provide:
+
+1. A short summary (at most 5 sentences)
+2. Key concepts introduced in the section
+3. Main topics
+4. Difficulty level (easy, medium, hard)
+
+Respond with JSON only, in this format:
+{
+    "summary": "Section summary",
+    "key_concepts": ["concept"],
+    "topics": ["topic"],
+    "difficulty_level": "medium"
+}"""
+
+            response = self._create_completion(
+                operation="summarize_section",
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": f"Summarize this section:\n\n{content}"}
+                ],
+                max_tokens=500,
+                temperature=0.3
+            )
+            
+            return {
+                "success": True,
+                "data": parse_json_response(response.choices[0].message.content),
+                "model": self.model
+            }
+            
+        except Exception as e:
+            logger.error(f"❌ Error summarizing section: {e}")
+            return {
+                "success": False,
+                "error": str(e)
+            }
+    
+    def combine_summaries(self, summaries: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Reduce step of document analysis: merge section summaries into one analysis"""
+        try:
+            if not self.client:
+                return {
+                    "success": False,
+                    "error": "OpenAI client not initialized"
+                }
+            
+            system_prompt = """You receive summaries of consecutive sections of one educational document, in order.
+Combine them into an analysis of the whole document. Provide:
+
+1. A summary of the whole document (at most 8 sentences)
+2. The most important key concepts (at most 15)
+3. Main topics (at most 10)
+4. Overall difficulty level (easy, medium, hard)
+5. Suggested learning objectives (at most 6)
+
+Respond with JSON only, in this format:
+{
+    "summary": "Document summary",
+    "key_concepts": ["concept"],
+    "topics": ["topic"],
+    "difficulty_level": "medium",
+    "learning_objectives": ["objective"]
+}"""
+
+            response = self._create_completion(
+                operation="combine_summaries",
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": json.dumps({"sections": summaries}, ensure_ascii=False)}
+                ],
+                max_tokens=1200,
+                temperature=0.3
+            )
+            
+            return {
+                "success": True,
+                "data": parse_json_response(response.choices[0].message.content),
+                "model": self.model
+            }
+            
+        except Exception as e:
+            logger.error(f"❌ Error combining summaries: {e}")
+            return {
+                "success": False,
+                "error": str(e)
+            }
+    
+    def grade_short_answers(self, items: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Judge borderline short answers against their accepted answers in one request"""
+        try:
+            if not self.client:
+                return {
+                    "success": False,
+                    "error": "OpenAI client not initialized"
+                }
+            
+            system_prompt = """You are a strict but fair exam grader. For each item you receive the question, the accepted answers and the student's answer.
+Decide whether the student's answer means the same as one of the accepted answers. Ignore spelling mistakes and wording, but not factual differences.
+
+Format the response as JSON:
+{
+    "verdicts": [true, false]
+}
+with exactly one boolean per item, in the same order."""
+
+            response = self._create_completion(
+                operation="grade_short_answers",
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": json.dumps({"items": items}, ensure_ascii=False)}
+                ],
+                max_tokens=20 + 10 * len(items),
+                temperature=0
+            )
+            
+            verdicts = parse_json_response(response.choices[0].message.content)["verdicts"]
+            if len(verdicts) != len(items):
+                raise ValueError(f"Expected {len(items)} verdicts, got {len(verdicts)}")
+            
+            return {
+                "success": True,
+                "verdicts": [bool(verdict) for verdict in verdicts],
+                "model": self.model
+            }
+            
+        except Exception as e:
+            logger.error(f"❌ Error grading short answers: {e}")
+            return {
+                "success": False,
+                "error": str(e)
+            }
+    
     def is_available(self) -> bool:
         """Check if OpenAI service is available"""
         return self.client is not None and settings.OPENAI_API_KEY is not None 
\ No newline at end of file
@@ -0,0 +1,352 @@
+"""
+Token-bucket rate limiting and per-tenant quotas for LLM calls in DISCERA
+"""
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Generator, Iterator, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a quota cannot admit a call within the allowed wait"""
+
+    def __init__(self, scope: str, retry_after: float):
+        super().__init__(f"LLM quota exceeded for {scope}, retry in {retry_after:.0f}s")
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+@dataclass
+class LLMCallContext:
+    """Who an LLM call is made for, and how urgent it is"""
+    user_id: Optional[int] = None
+    role: Optional[str] = None
+    course_id: Optional[int] = None  # no course model yet; callers may pass one
+    priority: str = INTERACTIVE
+    endpoint: Optional[str] = None  # feature making the call, for usage accounting
+
+
+_current_context: ContextVar[Optional[LLMCallContext]] = ContextVar("llm_call_context", default=None)
+
+
+@contextmanager
+def llm_call_context(
+    user_id: Optional[int] = None,
+    role=None,
+    course_id: Optional[int] = None,
+    priority: str = INTERACTIVE,
+    endpoint: Optional[str] = None
+) -> Iterator[LLMCallContext]:
+    """Attribute LLM calls made inside the block (including `asyncio.to_thread`) to a tenant"""
+    context = LLMCallContext(
+        user_id=user_id,
+        role=getattr(role, "value", role),
+        course_id=course_id,
+        priority=priority,
+        endpoint=endpoint
+    )
+    token = _current_context.set(context)
+    try:
+        yield context
+    finally:
+        _current_context.reset(token)
+
+
+def current_llm_context() -> LLMCallContext:
+    return _current_context.get() or LLMCallContext()
+
+
+@dataclass
+class BucketRequest:
+    """Take `amount` from bucket `key`, leaving at least `reserve` behind"""
+    key: str
+    amount: float
+    per_minute: float
+    reserve: float = 0.0
+
+    @property
+    def rate(self) -> float:
+        return self.per_minute / 60.0
+
+
+def _refill(tokens: float, updated: float, now: float, request: BucketRequest) -> float:
+    # Buckets hold one minute of budget, so bursts never exceed the per-minute quota
+    return min(request.per_minute, tokens + max(0.0, now - updated) * request.rate)
+
+
+def _shortfall_wait(tokens: float, request: BucketRequest) -> float:
+    # A request larger than the bucket itself is admitted once the bucket is full
+    needed = min(request.amount + request.reserve, request.per_minute)
+    return max(0.0, needed - tokens) / request.rate
+
+
+class MemoryBucketStore:
+    """Token buckets in this process"""
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+
+    def acquire(self, requests: List[BucketRequest]) -> Tuple[float, Optional[str]]:
+        """Take from every bucket, or from none. Returns (wait, blocking key)"""
+        with self._lock:
+            now = self.clock()
+            levels = {}
+            wait, blocking = 0.0, None
+            for request in requests:
+                tokens, updated = self._buckets.get(request.key, (request.per_minute, now))
+                levels[request.key] = _refill(tokens, updated, now, request)
+                needed = _shortfall_wait(levels[request.key], request)
+                if needed > wait:
+                    wait, blocking = needed, request.key
+            if blocking is not None:
+                return wait, blocking
+            for request in requests:
+                self._buckets[request.key] = (levels[request.key] - request.amount, now)
+            return 0.0, None
+
+    def adjust(self, request: BucketRequest, delta: float):
+        """Return (positive) or additionally take (negative) tokens; buckets may go into debt"""
+        with self._lock:
+            now = self.clock()
+            tokens, updated = self._buckets.get(request.key, (request.per_minute, now))
+            self._buckets[request.key] = (_refill(tokens, updated, now, request) + delta, now)
+
+
+class SQLiteBucketStore:
+    """Token buckets shared by every worker process through one SQLite file"""
+
+    def __init__(self, path: str, clock: Callable[[], float] = time.time):
+        self.path = path
+        self.clock = clock
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_buckets "
+                "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _levels(self, conn: sqlite3.Connection, requests: List[BucketRequest], now: float) -> Dict[str, float]:
+        keys = [request.key for request in requests]
+        rows = dict(
+            (key, (tokens, updated))
+            for key, tokens, updated in conn.execute(
+                f"SELECT key, tokens, updated FROM llm_buckets WHERE key IN ({','.join('?' * len(keys))})", keys
+            )
+        )
+        return {
+            request.key: _refill(*rows.get(request.key, (request.per_minute, now)), now, request)
+            for request in requests
+        }
+
+    def acquire(self, requests: List[BucketRequest]) -> Tuple[float, Optional[str]]:
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = self.clock()
+            levels = self._levels(conn, requests, now)
+            wait, blocking = 0.0, None
+            for request in requests:
+                needed = _shortfall_wait(levels[request.key], request)
+                if needed > wait:
+                    wait, blocking = needed, request.key
+            if blocking is None:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO llm_buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                    [(request.key, levels[request.key] - request.amount, now) for request in requests]
+                )
+            conn.execute("COMMIT")
+            return wait, blocking
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def adjust(self, request: BucketRequest, delta: float):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = self.clock()
+            level = self._levels(conn, [request], now)[request.key]
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                (request.key, level + delta, now)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+@dataclass
+class Lease:
+    """Admission for one call; settle it with the real token usage"""
+    token_requests: List[BucketRequest] = field(default_factory=list)
+    estimated_tokens: int = 0
+
+
+class LLMRateLimiter:
+    """Meters LLM requests and tokens globally and per user, role and course.
+
+    Global buckets protect the provider's rate limit. Per-tenant buckets
+    are quotas: a call that would have to wait longer than its timeout for
+    its own quota fails with RateLimitExceeded instead of queueing.
+
+    Two priority lanes share the global buckets. Batch calls leave
+    `LLM_INTERACTIVE_RESERVE` of the global budget untouched and yield to
+    interactive callers in this process that are waiting for the global
+    buckets, so chat is admitted ahead of bulk generation. An interactive
+    caller held back only by its own quota does not stall batch work.
+
+    `acquire` sleeps while it waits and belongs in worker threads;
+    coroutines use `acquire_async`.
+    """
+
+    def __init__(self, store=None, sleep: Callable[[float], None] = time.sleep):
+        self._store = store
+        self.sleep = sleep
+        self._waiting_lock = threading.Lock()
+        self._interactive_blocked = 0  # interactive callers waiting for a global bucket
+
+    @property
+    def store(self):
+        if self._store is None:
+            if settings.LLM_RATE_LIMIT_DB:
+                self._store = SQLiteBucketStore(settings.LLM_RATE_LIMIT_DB)
+            else:
+                self._store = MemoryBucketStore()
+        return self._store
+
+    def _requests(self, context: LLMCallContext, tokens: int) -> Tuple[List[BucketRequest], List[BucketRequest]]:
+        """(request buckets, token buckets) that a call has to pass"""
+        batch = context.priority == BATCH
+        reserve = settings.LLM_INTERACTIVE_RESERVE if batch else 0.0
+        requests = [BucketRequest("global:requests", 1, settings.LLM_GLOBAL_RPM,
+                                  reserve * settings.LLM_GLOBAL_RPM)]
+        token_requests = [BucketRequest("global:tokens", tokens, settings.LLM_GLOBAL_TPM,
+                                        reserve * settings.LLM_GLOBAL_TPM)]
+
+        if context.user_id is not None:
+            requests.append(BucketRequest(f"user:{context.user_id}:requests", 1, settings.LLM_USER_RPM))
+            token_requests.append(BucketRequest(f"user:{context.user_id}:tokens", tokens, settings.LLM_USER_TPM))
+        role_tpm = settings.LLM_ROLE_TPM.get(context.role) if context.role else None
+        if role_tpm:
+            token_requests.append(BucketRequest(f"role:{context.role}:tokens", tokens, role_tpm))
+        if context.course_id is not None:
+            token_requests.append(BucketRequest(f"course:{context.course_id}:tokens", tokens, settings.LLM_COURSE_TPM))
+        return requests, token_requests
+
+    def acquire(
+        self,
+        estimated_tokens: int,
+        context: Optional[LLMCallContext] = None,
+        timeout: Optional[float] = None
+    ) -> Lease:
+        """Block until the call is admitted; raises RateLimitExceeded"""
+        admission = self._admission(estimated_tokens, context or current_llm_context(), timeout)
+        try:
+            while True:
+                self.sleep(next(admission))
+        except StopIteration as admitted:
+            return admitted.value
+        finally:
+            admission.close()
+
+    async def acquire_async(
+        self,
+        estimated_tokens: int,
+        context: Optional[LLMCallContext] = None,
+        timeout: Optional[float] = None
+    ) -> Lease:
+        """`acquire` for coroutines: waits without blocking the event loop"""
+        admission = self._admission(estimated_tokens, context or current_llm_context(), timeout)
+        try:
+            while True:
+                await asyncio.sleep(next(admission))
+        except StopIteration as admitted:
+            return admitted.value
+        finally:
+            # Also runs on cancellation, so the lane bookkeeping is never left behind
+            admission.close()
+
+    def _admission(
+        self,
+        estimated_tokens: int,
+        context: LLMCallContext,
+        timeout: Optional[float]
+    ) -> Generator[float, None, Lease]:
+        """Try the buckets until admitted, yielding how long to sleep between attempts"""
+        lane = BATCH if context.priority == BATCH else INTERACTIVE
+        if timeout is None:
+            timeout = settings.LLM_BATCH_WAIT_TIMEOUT if lane == BATCH else settings.LLM_INTERACTIVE_WAIT_TIMEOUT
+
+        requests, token_requests = self._requests(context, estimated_tokens)
+        start = time.monotonic()
+        deadline = start + timeout
+        blocked_on_global = False
+        try:
+            while True:
+                with self._waiting_lock:
+                    yielding = lane == BATCH and self._interactive_blocked > 0
+                if yielding:
+                    wait, blocking = 0.05, "interactive lane"
+                else:
+                    wait, blocking = self.store.acquire(requests + token_requests)
+                    if blocking is None:
+                        break
+                    if lane == INTERACTIVE and blocking.startswith("global:") != blocked_on_global:
+                        blocked_on_global = not blocked_on_global
+                        with self._waiting_lock:
+                            self._interactive_blocked += 1 if blocked_on_global else -1
+
+                remaining = deadline - time.monotonic()
+                if wait > remaining:
+                    scope = blocking if blocking.startswith(("user:", "role:", "course:")) else "global"
+                    metrics.inc("llm_rate_limit_rejections_total", lane=lane, scope=scope.split(":")[0])
+                    raise RateLimitExceeded(scope, wait)
+                yield min(wait, 0.25, max(remaining, 0.0))
+        finally:
+            if blocked_on_global:
+                with self._waiting_lock:
+                    self._interactive_blocked -= 1
+
+        metrics.observe("llm_rate_limit_wait_seconds", time.monotonic() - start, lane=lane)
+        return Lease(token_requests=token_requests, estimated_tokens=estimated_tokens)
+
+    def settle(self, lease: Lease, actual_tokens: Optional[int]):
+        """Correct the token buckets once the real usage is known"""
+        if actual_tokens is None:
+            return
+        delta = lease.estimated_tokens - actual_tokens
+        if delta:
+            for request in lease.token_requests:
+                self.store.adjust(request, delta)
+
+
+def estimate_tokens(messages: List[Dict[str, str]], max_tokens: int) -> int:
+    """Upper estimate before the call: ~4 characters per prompt token plus the completion budget"""
+    return sum(len(message.get("content") or "") for message in messages) // 4 + max_tokens
+
+
+rate_limiter = LLMRateLimiter()
@@ -0,0 +1,271 @@
+"""
+Retries, circuit breaking and request hedging for LLM calls in DISCERA
+"""
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+import openai
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit is open"""
+
+    def __init__(self, provider: str, retry_in: float):
+        super().__init__(f"{provider} is unavailable (circuit open), retry in {retry_in:.0f}s")
+        self.provider = provider
+        self.retry_in = retry_in
+
+
+def is_retryable(error: Exception) -> bool:
+    """Transient provider errors: timeouts, connection errors, 408/409/429 and 5xx"""
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError, TimeoutError, ConnectionError)):
+        return True
+    status_code = getattr(error, "status_code", None)
+    return status_code is not None and (status_code in RETRYABLE_STATUS_CODES or status_code >= 500)
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Seconds the provider asked us to wait, from Retry-After(-Ms) headers"""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return max(0.0, float(headers["retry-after-ms"]) / 1000)
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass
+class RetryPolicy:
+    """Exponential backoff with full jitter"""
+    max_attempts: int = settings.LLM_MAX_ATTEMPTS
+    base_delay: float = settings.LLM_RETRY_BASE_DELAY
+    max_delay: float = settings.LLM_RETRY_MAX_DELAY
+
+    def next_delay(self, attempt: int, error: Exception) -> Optional[float]:
+        """Delay before retry number `attempt`, or None when it is not worth waiting"""
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        requested = retry_after(error)
+        if requested is None:
+            return backoff
+        # A provider asking for a longer pause than we allow is treated as exhausted
+        return max(requested, backoff) if requested <= self.max_delay else None
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker for one provider.
+
+    Closed: calls pass. After `failure_threshold` consecutive transient
+    failures the circuit opens and calls fail immediately for
+    `recovery_timeout` seconds. It then half-opens and lets a single probe
+    through; the probe's outcome closes or re-opens the circuit.
+    """
+
+    CLOSED = "closed"
+    HALF_OPEN = "half_open"
+    OPEN = "open"
+    STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = settings.LLM_CIRCUIT_FAILURE_THRESHOLD,
+        recovery_timeout: float = settings.LLM_CIRCUIT_RECOVERY_SECONDS,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.recovery_timeout = recovery_timeout
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._publish()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == self.OPEN and self.clock() - self._opened_at >= self.recovery_timeout:
+            self._set_state(self.HALF_OPEN)
+        return self._state
+
+    def _set_state(self, state: str):
+        if state != self._state:
+            logger.warning(f"⚠️ Circuit for {self.name}: {self._state} -> {state}")
+            self._state = state
+            metrics.inc("llm_circuit_transitions_total", provider=self.name, state=state)
+            self._publish()
+
+    def _publish(self):
+        metrics.set_gauge("llm_circuit_state", self.STATE_VALUES[self._state], provider=self.name)
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go through now"""
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return
+            if state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            retry_in = max(0.0, self.recovery_timeout - (self.clock() - self._opened_at))
+        metrics.inc("llm_circuit_rejections_total", provider=self.name)
+        raise CircuitOpenError(self.name, retry_in)
+
+    def record_success(self):
+        """The provider answered (including with a client error)"""
+        with self._lock:
+            self._failures = 0
+            self._probe_in_flight = False
+            self._set_state(self.CLOSED)
+
+    def record_failure(self):
+        """The provider failed with a transient error"""
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = self.clock()
+                self._set_state(self.OPEN)
+
+
+class LatencyTracker:
+    """Recent successful call latencies, used to pick the hedging delay"""
+
+    def __init__(self, size: int = 200):
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=size)
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < 20:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_latencies: Dict[str, LatencyTracker] = {}
+_registry_lock = threading.Lock()
+_hedge_executor = ThreadPoolExecutor(max_workers=settings.LLM_HEDGE_WORKERS, thread_name_prefix="llm-hedge")
+
+
+def get_circuit_breaker(provider: str) -> CircuitBreaker:
+    with _registry_lock:
+        if provider not in _breakers:
+            _breakers[provider] = CircuitBreaker(provider)
+        return _breakers[provider]
+
+
+def get_latency_tracker(provider: str) -> LatencyTracker:
+    with _registry_lock:
+        if provider not in _latencies:
+            _latencies[provider] = LatencyTracker()
+        return _latencies[provider]
+
+
+def call_with_retries(
+    request: Callable[[], T],
+    provider: str = "openai",
+    policy: Optional[RetryPolicy] = None,
+    sleep: Callable[[float], Any] = time.sleep
+) -> T:
+    """Run `request`, retrying transient failures behind the provider's circuit breaker"""
+    policy = policy or RetryPolicy()
+    breaker = get_circuit_breaker(provider)
+    attempt = 0
+    while True:
+        breaker.before_call()
+        attempt += 1
+        start = time.perf_counter()
+        try:
+            result = request()
+        except Exception as e:
+            if not is_retryable(e):
+                # The provider is up; the request itself was rejected
+                breaker.record_success()
+                metrics.inc("llm_requests_total", provider=provider, outcome="client_error")
+                raise
+            breaker.record_failure()
+            metrics.inc("llm_requests_total", provider=provider, outcome="transient_error")
+
+            delay = policy.next_delay(attempt, e) if attempt < policy.max_attempts else None
+            if delay is None:
+                metrics.inc("llm_retries_exhausted_total", provider=provider)
+                raise
+            metrics.inc("llm_retries_total", provider=provider, reason=type(e).__name__)
+            logger.warning(f"⚠️ {provider} call failed ({e}); retry {attempt} in {delay:.2f}s")
+            sleep(delay)
+            continue
+
+        elapsed = time.perf_counter() - start
+        breaker.record_success()
+        get_latency_tracker(provider).record(elapsed)
+        metrics.inc("llm_requests_total", provider=provider, outcome="success")
+        metrics.observe("llm_request_seconds", elapsed, provider=provider)
+        return result
+
+
+def hedged_call(
+    request: Callable[[], T],
+    provider: str = "openai",
+    policy: Optional[RetryPolicy] = None,
+    hedge_delay: Optional[float] = None
+) -> T:
+    """Send a backup request if the first one is slower than usual; first success wins.
+
+    The delay defaults to the provider's recent p95 latency. No backup is
+    sent while the circuit is not closed, so hedging never adds load to a
+    provider that is already failing.
+    """
+    if hedge_delay is None:
+        hedge_delay = get_latency_tracker(provider).quantile(0.95) or settings.LLM_HEDGE_DELAY
+    hedge_delay = max(settings.LLM_HEDGE_MIN_DELAY, hedge_delay)
+
+    primary = _hedge_executor.submit(call_with_retries, request, provider, policy)
+    done, _ = wait([primary], timeout=hedge_delay)
+    if done or get_circuit_breaker(provider).state != CircuitBreaker.CLOSED:
+        return primary.result()
+
+    metrics.inc("llm_hedged_requests_total", provider=provider)
+    backup = _hedge_executor.submit(call_with_retries, request, provider, policy)
+    pending, error = {primary, backup}, None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                metrics.inc("llm_hedge_wins_total", provider=provider, winner="backup" if future is backup else "primary")
+                return future.result()
+            error = future.exception()
+    raise error
@@ -1,14 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
+import asyncio
 import json
 
-from ...core.database import get_db
+from ...ai.rate_limiter import BATCH, llm_call_context
+from ...core.database import get_db, SessionLocal
 from ...core.security import oauth2_scheme, verify_token
 from ...core.config import settings
 from ...models.user import User, UserRole
 from ...models.document import Document
+from ...models.generation_job import JobStatus, TestGenerationJob
+from ...services.test_generation import test_generation_pipeline, TestGenerationError, TestGenerationRequestError
+from ...services.generation_jobs import create_job, can_resume, job_progress, run_job
+from ...services.question_bank import question_bank
+from ...services.document_analysis import document_analyzer, DocumentAnalysisError
+from ...services.llm_usage import get_usage_summary, usage_recorder, GROUP_COLUMNS
 
 router = APIRouter()
 
@@ -25,7 +34,7 @@ class ChatResponse(BaseModel):
 
 class TestGenerationRequest(BaseModel):
     document_id: int
-    num_questions: int = 10
+    num_questions: int = Field(10, ge=1, le=200)
     difficulty: str = "medium"
     question_types: List[str] = ["multiple_choice", "true_false"]
 
@@ -36,6 +45,16 @@ class TestGenerationResponse(BaseModel):
     questions: List[dict]
 
 
+class TestGenerationJobResponse(BaseModel):
+    job_id: str
+    status: str
+    sections_total: int
+    sections_completed: int
+    questions_generated: int
+    test_id: Optional[int] = None
+    error: Optional[str] = None
+
+
 def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
     """Get current user from token."""
     payload = verify_token(token)
@@ -120,35 +139,237 @@ async def generate_test(
             detail="Document is not processed yet. Please wait for processing to complete."
         )
     
-    # For now, return a mock test
-    # In the future, this will use AI to generate actual questions
-    
-    mock_questions = [
-        {
-            "question_text": "What is the main topic of this document?",
-            "question_type": "multiple_choice",
-            "options": ["A", "B", "C", "D"],
-            "correct_answer": "A",
-            "points": 1
-        },
-        {
-            "question_text": "True or False: This document contains important information.",
-            "question_type": "true_false",
-            "correct_answer": "True",
-            "points": 1
-        }
-    ]
+    try:
+        with llm_call_context(user_id=current_user.id, role=current_user.role, priority=BATCH,
+                              endpoint="ai.generate_test"):
+            test, questions = await test_generation_pipeline.run(
+                db,
+                document=document,
+                creator_id=current_user.id,
+                num_questions=request.num_questions,
+                question_types=request.question_types,
+                difficulty=request.difficulty
+            )
+    except TestGenerationRequestError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except TestGenerationError as e:
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=f"Test generation failed: {str(e)}"
+        )
     
     return TestGenerationResponse(
-        test_id=1,
-        title=f"Test generated from {document.title}",
-        questions=mock_questions
+        test_id=test.id,
+        title=test.title,
+        questions=[
+            {
+                "question_text": question["question_text"],
+                "question_type": question["question_type"].value,
+                "options": json.loads(question["options"]) if question["options"] else None,
+                "correct_answer": question["correct_answer"],
+                "explanation": question["explanation"],
+                "points": question["points"]
+            }
+            for question in questions
+        ]
     )
 
 
+def get_owned_job(db: Session, job_id: str, current_user: User) -> TestGenerationJob:
+    """Get a generation job owned by the current user."""
+    job = db.query(TestGenerationJob).filter(
+        TestGenerationJob.id == job_id,
+        TestGenerationJob.owner_id == current_user.id
+    ).first()
+    
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Generation job not found"
+        )
+    
+    return job
+
+
+@router.post("/generate-test/jobs", response_model=TestGenerationJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def create_test_generation_job(
+    request: TestGenerationRequest,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Start generating a test in the background and return the job to poll."""
+    if current_user.role not in [UserRole.TEACHER, UserRole.ADMIN]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only teachers and admins can generate tests"
+        )
+    
+    document = db.query(Document).filter(
+        Document.id == request.document_id,
+        Document.owner_id == current_user.id
+    ).first()
+    
+    if not document:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Document not found"
+        )
+    
+    if not document.is_processed:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Document is not processed yet. Please wait for processing to complete."
+        )
+    
+    try:
+        job = create_job(
+            db,
+            owner_id=current_user.id,
+            document_id=document.id,
+            num_questions=request.num_questions,
+            question_types=request.question_types,
+            difficulty=request.difficulty
+        )
+    except TestGenerationError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    background_tasks.add_task(run_job, job.id)
+    return job_progress(job)
+
+
+@router.get("/generate-test/jobs/{job_id}", response_model=TestGenerationJobResponse)
+async def get_test_generation_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get the progress of a test generation job."""
+    return job_progress(get_owned_job(db, job_id, current_user))
+
+
+@router.post("/generate-test/jobs/{job_id}/resume", response_model=TestGenerationJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def resume_test_generation_job(
+    job_id: str,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Retry the sections of a failed or interrupted job."""
+    job = get_owned_job(db, job_id, current_user)
+    if not can_resume(job):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Job is {job.status.value} and cannot be resumed"
+        )
+    
+    job.status = JobStatus.PENDING
+    job.error = None
+    db.commit()
+    
+    background_tasks.add_task(run_job, job.id)
+    return job_progress(job)
+
+
+@router.get("/generate-test/jobs/{job_id}/events")
+async def stream_test_generation_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Stream job progress as server-sent events until the job finishes."""
+    get_owned_job(db, job_id, current_user)
+    
+    async def events():
+        last = None
+        while True:
+            # A fresh session per poll sees the background task's commits
+            poll_db = SessionLocal()
+            try:
+                job = poll_db.query(TestGenerationJob).filter(TestGenerationJob.id == job_id).first()
+                progress = job_progress(job) if job else None
+            finally:
+                poll_db.close()
+            
+            if progress is None:
+                return
+            if progress != last:
+                finished = progress["status"] in (JobStatus.COMPLETED.value, JobStatus.FAILED.value)
+                event = progress["status"] if finished else "progress"
+                yield f"event: {event}\ndata: {json.dumps(progress)}\n\n"
+                if finished:
+                    return
+                last = progress
+            await asyncio.sleep(1)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.post("/question-bank/reindex")
+async def reindex_question_bank(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Rebuild the question bank index from all stored questions (admin only)."""
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admins can rebuild the question bank"
+        )
+    
+    try:
+        # Embeds every stored question: keep it off the event loop
+        return await asyncio.to_thread(question_bank.reindex, db)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Question bank rebuild failed: {str(e)}"
+        )
+
+
+@router.get("/usage")
+async def get_llm_usage(
+    group_by: str = "endpoint",
+    since_hours: int = 24,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """LLM calls, tokens, latency and cost per endpoint, user, model or hour (admin only)."""
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admins can view LLM usage"
+        )
+    
+    if group_by not in GROUP_COLUMNS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"group_by must be one of: {', '.join(GROUP_COLUMNS)}"
+        )
+    
+    # Include events still waiting in the buffer
+    usage_recorder.flush()
+    return {
+        "group_by": group_by,
+        "since_hours": since_hours,
+        "usage": get_usage_summary(db, group_by=group_by, since_hours=since_hours)
+    }
+
+
 @router.get("/documents/{document_id}/analyze")
 async def analyze_document(
     document_id: int,
+    refresh: bool = False,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -164,13 +385,12 @@ async def analyze_document(
             detail="Document not found"
         )
     
-    # Mock analysis - in the future, this will use AI
-    analysis = {
-        "key_concepts": ["concept1", "concept2", "concept3"],
-        "summary": "This is a mock summary of the document content.",
-        "difficulty_level": "medium",
-        "estimated_reading_time": "5 minutes",
-        "topics": ["topic1", "topic2"]
-    }
-    
-    return analysis 
\ No newline at end of file
+    try:
+        with llm_call_context(user_id=current_user.id, role=current_user.role, priority=BATCH,
+                              endpoint="ai.analyze_document"):
+            return await document_analyzer.analyze(db, document, refresh=refresh)
+    except DocumentAnalysisError as e:
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=f"Document analysis failed: {str(e)}"
+        )
@@ -0,0 +1,121 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+from pydantic import BaseModel
+from typing import List, Optional
+
+from ...core.database import get_db
+from ...core.security import oauth2_scheme, verify_token
+from ...models.user import User, UserRole
+from ...models.test import Test
+from ...services.analytics import get_test_summary, get_question_summaries, get_student_summary
+
+router = APIRouter()
+
+
+class HistogramBucket(BaseModel):
+    range: str
+    count: int
+
+
+class TestAnalyticsResponse(BaseModel):
+    test_id: int
+    attempts: int
+    average_percentage: Optional[float]
+    std_percentage: Optional[float]
+    min_percentage: Optional[int]
+    max_percentage: Optional[int]
+    histogram: List[HistogramBucket]
+
+
+class QuestionAnalyticsResponse(BaseModel):
+    question_id: int
+    attempts: int
+    correct_count: int
+    difficulty: Optional[float]
+    discrimination: Optional[float]
+
+
+class StudentAnalyticsResponse(BaseModel):
+    student_id: int
+    tests_taken: int
+    average_percentage: Optional[float]
+    rolling_average: Optional[float]
+    last_percentage: Optional[int]
+    best_percentage: Optional[int]
+
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    """Get current user from token."""
+    payload = verify_token(token)
+    if not payload:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid token"
+        )
+
+    user = db.query(User).filter(User.email == payload.get("sub")).first()
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+
+    return user
+
+
+def get_test_for_analytics(test_id: int, current_user: User, db: Session) -> Test:
+    """Get a test whose analytics the current user may see."""
+    test = db.query(Test).filter(Test.id == test_id).first()
+    if not test:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Test not found"
+        )
+
+    if current_user.role == UserRole.STUDENT or (
+        current_user.role == UserRole.TEACHER and test.creator_id != current_user.id
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not enough permissions"
+        )
+
+    return test
+
+
+@router.get("/tests/{test_id}", response_model=TestAnalyticsResponse)
+async def get_test_analytics(
+    test_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get score distribution for a test."""
+    get_test_for_analytics(test_id, current_user, db)
+    return get_test_summary(db, test_id)
+
+
+@router.get("/tests/{test_id}/questions", response_model=List[QuestionAnalyticsResponse])
+async def get_question_analytics(
+    test_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get per-question difficulty and discrimination for a test."""
+    get_test_for_analytics(test_id, current_user, db)
+    return get_question_summaries(db, test_id)
+
+
+@router.get("/students/{student_id}", response_model=StudentAnalyticsResponse)
+async def get_student_analytics(
+    student_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get rolling performance for a student."""
+    if current_user.role == UserRole.STUDENT and current_user.id != student_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not enough permissions"
+        )
+
+    return get_student_summary(db, student_id)
@@ -1,9 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, status
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import List, Optional
+import logging
 import os
-import shutil
 from datetime import datetime
 
 from ...core.database import get_db
@@ -11,6 +11,13 @@ from ...core.security import oauth2_scheme, verify_token
 from ...core.config import settings
 from ...models.user import User, UserRole
 from ...models.document import Document
+from ...services.blob_storage import blob_store, acquire_blob, release_blob, delete_unreferenced_blob, UploadTooLarge
+from ...services.upload_stream import receive_upload, InvalidUpload
+from ...services.document_analysis import delete_document_analysis
+from ...services.document_ingest import add_document, document_ingestor
+from ...services.generation_jobs import delete_document_jobs
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -47,57 +54,131 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     return user
 
 
-@router.post("/upload", response_model=DocumentResponse)
-async def upload_document(
-    file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    """Upload a document."""
-    # Check file size
-    if file.size and file.size > settings.MAX_FILE_SIZE:
+# The body is parsed by the endpoint itself, so describe it for the docs
+UPLOAD_REQUEST_BODY = {
+    "required": True,
+    "content": {
+        "multipart/form-data": {
+            "schema": {
+                "type": "object",
+                "required": ["file"],
+                "properties": {"file": {"type": "string", "format": "binary"}}
+            }
+        }
+    }
+}
+
+
+def remove_unused_file(db: Session, blob_hash: Optional[str], file_path: str, last_reference: bool):
+    """Delete a document's old file from the filesystem once no document uses it"""
+    try:
+        if last_reference:
+            delete_unreferenced_blob(db, blob_hash)
+        elif not blob_hash and os.path.exists(file_path):
+            os.remove(file_path)
+    except Exception as e:
+        # Log error but don't fail the request
+        logger.error(f"Error deleting file: {e}")
+
+
+async def receive_document_upload(request: Request):
+    """Stream the file to disk, checking size and type while it arrives"""
+    try:
+        return await receive_upload(
+            content_type=request.headers.get("content-type", ""),
+            content_length=request.headers.get("content-length"),
+            body=request.stream(),
+            store=blob_store,
+            max_size=settings.MAX_FILE_SIZE,
+            allowed_extensions=settings.ALLOWED_EXTENSIONS
+        )
+    except UploadTooLarge as e:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="File too large"
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
         )
-    
-    # Check file extension
-    file_extension = os.path.splitext(file.filename)[1].lower()
-    if file_extension not in settings.ALLOWED_EXTENSIONS:
+    except InvalidUpload as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"File type not allowed. Allowed types: {settings.ALLOWED_EXTENSIONS}"
+            detail=str(e)
         )
-    
-    # Create unique filename
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"{timestamp}_{file.filename}"
-    file_path = os.path.join(settings.UPLOAD_DIR, filename)
-    
-    # Save file
-    try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-    except Exception as e:
+    except OSError as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error saving file: {str(e)}"
         )
+
+
+@router.post("/upload", response_model=DocumentResponse, openapi_extra={"requestBody": UPLOAD_REQUEST_BODY})
+async def upload_document(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Upload a document (multipart field `file`) and index it in the background."""
+    upload = await receive_document_upload(request)
+    staged = upload.blob
     
-    # Create document record
-    document = Document(
-        title=file.filename,
-        filename=filename,
-        file_path=file_path,
-        file_size=file.size or 0,
-        file_type=file_extension,
-        owner_id=current_user.id
-    )
-    
-    db.add(document)
-    db.commit()
+    try:
+        document = add_document(db, staged, upload.filename, upload.extension, current_user.id)
+        db.commit()
+    except Exception:
+        db.rollback()
+        blob_store.discard(staged)
+        raise
     db.refresh(document)
     
+    background_tasks.add_task(document_ingestor.ingest, document.id)
+    return document
+
+
+@router.put("/{document_id}/file", response_model=DocumentResponse, openapi_extra={"requestBody": UPLOAD_REQUEST_BODY})
+async def replace_document_file(
+    document_id: int,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Upload a new version of a document; only changed chunks are re-embedded."""
+    document = db.query(Document).filter(
+        Document.id == document_id,
+        Document.owner_id == current_user.id
+    ).first()
+    
+    if not document:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Document not found"
+        )
+    
+    upload = await receive_document_upload(request)
+    staged = upload.blob
+    
+    if staged.sha256 == document.blob_hash:
+        blob_store.discard(staged)
+        return document
+    
+    old_hash, old_path = document.blob_hash, document.file_path
+    try:
+        blob = acquire_blob(db, staged)
+        document.filename = upload.filename
+        document.file_path = blob.file_path
+        document.file_size = staged.size
+        document.file_type = upload.extension
+        document.blob_hash = blob.sha256
+        last_reference = release_blob(db, old_hash)
+        db.commit()
+    except Exception:
+        db.rollback()
+        blob_store.discard(staged)
+        raise
+    db.refresh(document)
+    
+    remove_unused_file(db, old_hash, old_path, last_reference)
+    
+    background_tasks.add_task(document_ingestor.ingest, document.id)
     return document
 
 
@@ -140,6 +221,7 @@ async def get_document(
 @router.delete("/{document_id}")
 async def delete_document(
     document_id: int,
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -155,16 +237,18 @@ async def delete_document(
             detail="Document not found"
         )
     
-    # Delete file from filesystem
-    try:
-        if os.path.exists(document.file_path):
-            os.remove(document.file_path)
-    except Exception as e:
-        # Log error but don't fail the request
-        print(f"Error deleting file: {e}")
+    blob_hash, file_path = document.blob_hash, document.file_path
     
-    # Delete from database
+    # Delete from database with the rows that reference it, dropping this document's reference to the file
+    delete_document_jobs(db, document.id)
+    delete_document_analysis(db, document.id)
     db.delete(document)
+    last_reference = release_blob(db, blob_hash)
     db.commit()
     
+    remove_unused_file(db, blob_hash, file_path, last_reference)
+    
+    # Delete chunks from the vector store
+    background_tasks.add_task(document_ingestor.delete, document_id)
+    
     return {"message": "Document deleted successfully"} 
\ No newline at end of file
@@ -1,13 +1,19 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import List, Optional
+import asyncio
 from datetime import datetime
 
+from ...ai.rate_limiter import BATCH, INTERACTIVE, llm_call_context
 from ...core.database import get_db
 from ...core.security import oauth2_scheme, verify_token
 from ...models.user import User, UserRole
-from ...models.test import Test, Question, TestResult, TestAnswer, DifficultyLevel, QuestionType
+from ...models.test import Test, TestResult, TestAnswer, DifficultyLevel, QuestionType
+from ...services.grading import answer_key_cache, regrade_test
+from ...services.short_answer_grading import short_answer_grader
+from ...services.analytics import record_submission, rebuild_test_statistics
 
 router = APIRouter()
 
@@ -163,46 +169,42 @@ async def submit_test(
     db: Session = Depends(get_db)
 ):
     """Submit test answers and calculate results."""
-    # Check if test exists and is active
-    test = db.query(Test).filter(Test.id == test_id, Test.is_active == True).first()
-    if not test:
+    # Answer key comes from the per-test cache, not a Question query per submission
+    answer_key = answer_key_cache.get(db, test_id)
+    if not answer_key or not answer_key.is_active:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Test not found or not active"
         )
     
-    # Get test questions
-    questions = db.query(Question).filter(Question.test_id == test_id).all()
-    if not questions:
+    if not len(answer_key):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Test has no questions"
         )
     
-    # Calculate results
-    total_points = sum(q.points for q in questions)
-    score = 0
-    test_answers = []
+    # Calculate results in one pass over the compiled key, off the event loop:
+    # short answers may load the embedding model or call the LLM
+    with llm_call_context(user_id=current_user.id, role=current_user.role, priority=INTERACTIVE,
+                          endpoint="tests.submit"):
+        graded = await asyncio.to_thread(answer_key.grade, answers, short_answer_grader)
+    score = graded.score
+    total_points = graded.total_points
+    percentage = graded.percentage
     
-    for question in questions:
-        answer_text = answers.get(str(question.id), "")
-        is_correct = answer_text.lower().strip() == question.correct_answer.lower().strip()
-        points_earned = question.points if is_correct else 0
-        score += points_earned
-        
-        # Create test answer record
-        test_answer = TestAnswer(
-            question_id=question.id,
-            answer_text=answer_text,
-            is_correct=is_correct,
-            points_earned=points_earned
+    answer_rows = [
+        {
+            "question_id": question_id,
+            "answer_text": answer_text,
+            "is_correct": is_correct,
+            "points_earned": points_earned
+        }
+        for question_id, answer_text, is_correct, points_earned in zip(
+            answer_key.question_ids, graded.answers, graded.correct, graded.points_earned
         )
-        test_answers.append(test_answer)
+    ]
     
-    # Calculate percentage
-    percentage = int((score / total_points) * 100) if total_points > 0 else 0
-    
-    # Create test result
+    # Persist result and answers in a single transaction
     test_result = TestResult(
         test_id=test_id,
         student_id=current_user.id,
@@ -211,20 +213,62 @@ async def submit_test(
         percentage=percentage
     )
     
-    db.add(test_result)
-    db.commit()
-    db.refresh(test_result)
-    
-    # Add test answers
-    for answer in test_answers:
-        answer.test_result_id = test_result.id
-        db.add(answer)
-    
-    db.commit()
+    try:
+        db.add(test_result)
+        db.flush()  # assigns test_result.id without committing
+        test_result_id = test_result.id
+        
+        for row in answer_rows:
+            row["test_result_id"] = test_result_id
+        db.execute(insert(TestAnswer), answer_rows)
+        
+        record_submission(
+            db,
+            test_id=test_id,
+            student_id=current_user.id,
+            percentage=percentage,
+            question_ids=answer_key.question_ids,
+            correct=graded.correct
+        )
+        
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
     
     return {
-        "test_result_id": test_result.id,
+        "test_result_id": test_result_id,
         "score": score,
         "total_points": total_points,
         "percentage": percentage
-    } 
\ No newline at end of file
+    }
+
+
+@router.post("/{test_id}/regrade")
+async def regrade_test_results(
+    test_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Re-grade all submitted answers after the answer key was corrected."""
+    test = db.query(Test).filter(Test.id == test_id).first()
+    if not test:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Test not found"
+        )
+    
+    if current_user.role == UserRole.STUDENT or (
+        current_user.role == UserRole.TEACHER and test.creator_id != current_user.id
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not enough permissions"
+        )
+    
+    with llm_call_context(user_id=current_user.id, role=current_user.role, priority=BATCH,
+                          endpoint="tests.regrade"):
+        summary = await asyncio.to_thread(regrade_test, db, test_id, short_answer_grader)
+    rebuild_test_statistics(db, test_id)
+    
+    return summary
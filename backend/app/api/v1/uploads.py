@@ -0,0 +1,230 @@
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Request, Response, status
+from sqlalchemy.orm import Session
+from starlette.requests import ClientDisconnect
+from pydantic import BaseModel
+from typing import Optional
+from datetime import datetime
+
+from ...core.database import get_db
+from ...core.security import oauth2_scheme, verify_token
+from ...core.config import settings
+from ...models.user import User
+from ...models.document import Document
+from ...models.upload_session import UploadSession, UploadStatus
+from ...services.blob_storage import blob_store, UploadTooLarge
+from ...services.document_ingest import document_ingestor
+from ...services.upload_stream import InvalidUpload
+from ...services.resumable_uploads import (
+    create_upload, delete_upload, expire_uploads, append_part, finalize_upload, complete_upload,
+    UploadOffsetConflict, UploadIncomplete, UploadAlreadyCompleted
+)
+from .documents import DocumentResponse
+
+router = APIRouter()
+
+
+class UploadCreateRequest(BaseModel):
+    filename: str
+    size: int
+
+
+class UploadResponse(BaseModel):
+    id: str
+    filename: str
+    total_size: int
+    offset: int
+    status: UploadStatus
+    expires_at: datetime
+    document_id: Optional[int] = None
+
+    class Config:
+        from_attributes = True
+
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    """Get current user from token."""
+    payload = verify_token(token)
+    if not payload:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid token"
+        )
+
+    user = db.query(User).filter(User.email == payload.get("sub")).first()
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+
+    return user
+
+
+def get_upload(upload_id: str, current_user: User, db: Session) -> UploadSession:
+    upload = db.query(UploadSession).filter(
+        UploadSession.id == upload_id,
+        UploadSession.owner_id == current_user.id
+    ).first()
+
+    if not upload:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Upload not found"
+        )
+
+    return upload
+
+
+def completed_document(upload: UploadSession) -> Document:
+    """The document of a finalized upload, unless it has been deleted since"""
+    if upload.document is None:
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="The uploaded document has been deleted"
+        )
+    return upload.document
+
+
+def offset_headers(upload: UploadSession) -> dict:
+    return {"Upload-Offset": str(upload.offset), "Upload-Length": str(upload.total_size), "Cache-Control": "no-store"}
+
+
+async def received_bytes(request: Request):
+    """Request body chunks; a dropped connection simply ends the part"""
+    try:
+        async for chunk in request.stream():
+            yield chunk
+    except ClientDisconnect:
+        return
+
+
+@router.post("/", response_model=UploadResponse, status_code=status.HTTP_201_CREATED)
+async def start_upload(
+    request: UploadCreateRequest,
+    response: Response,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Start a resumable upload, then send the file with PUT in any number of byte ranges."""
+    expire_uploads(db)
+
+    try:
+        upload = create_upload(db, current_user.id, request.filename, request.size)
+    except UploadTooLarge as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
+    except InvalidUpload as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    response.headers["Location"] = f"/api/v1/uploads/{upload.id}"
+    response.headers.update(offset_headers(upload))
+    return upload
+
+
+@router.head("/{upload_id}")
+async def get_upload_offset(
+    upload_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Bytes received so far, in the Upload-Offset header; resume from there."""
+    upload = get_upload(upload_id, current_user, db)
+    return Response(status_code=status.HTTP_200_OK, headers=offset_headers(upload))
+
+
+@router.get("/{upload_id}", response_model=UploadResponse)
+async def get_upload_status(
+    upload_id: str,
+    response: Response,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Upload progress."""
+    upload = get_upload(upload_id, current_user, db)
+    response.headers.update(offset_headers(upload))
+    return upload
+
+
+@router.put("/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def upload_part(
+    upload_id: str,
+    request: Request,
+    upload_offset: int = Header(..., alias="Upload-Offset"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Append the raw request body at Upload-Offset, which must equal the current offset."""
+    upload = get_upload(upload_id, current_user, db)
+
+    try:
+        await append_part(db, upload, upload_offset, received_bytes(request), blob_store)
+    except UploadOffsetConflict as e:
+        return Response(status_code=status.HTTP_409_CONFLICT, headers={**offset_headers(upload), "Upload-Offset": str(e.offset)})
+    except UploadTooLarge:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Part exceeds the remaining {upload.total_size - upload.offset} bytes "
+                   f"or the {settings.MAX_UPLOAD_PART_SIZE} byte part limit"
+        )
+    except InvalidUpload as e:
+        delete_upload(db, upload)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    return Response(status_code=status.HTTP_204_NO_CONTENT, headers=offset_headers(upload))
+
+
+@router.post("/{upload_id}/finalize", response_model=DocumentResponse)
+async def finalize(
+    upload_id: str,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Assemble the received parts into a document and start indexing it."""
+    upload = get_upload(upload_id, current_user, db)
+
+    if upload.status == UploadStatus.COMPLETED:
+        return completed_document(upload)
+
+    try:
+        staged = await finalize_upload(upload, blob_store)
+    except UploadIncomplete as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
+    except InvalidUpload as e:
+        delete_upload(db, upload)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    try:
+        document = complete_upload(db, upload, staged, blob_store)
+    except UploadAlreadyCompleted:
+        # A concurrent finalize of the same upload created the document
+        db.refresh(upload)
+        return completed_document(upload)
+    background_tasks.add_task(document_ingestor.ingest, document.id)
+    return document
+
+
+@router.delete("/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def cancel_upload(
+    upload_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Abandon an upload and discard the bytes received so far."""
+    upload = get_upload(upload_id, current_user, db)
+    delete_upload(db, upload)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
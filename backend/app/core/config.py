@@ -12,21 +12,125 @@ class Settings(BaseSettings):
     # Database
     DATABASE_URL: str = "sqlite:///./discera.db"
     POSTGRES_URL: Optional[str] = None
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: int = 30  # seconds to wait for a free connection
+    DB_POOL_RECYCLE: int = 1800  # seconds
+    DB_POOL_PRE_PING: bool = True
     
     # Security
     SECRET_KEY: str = "your-secret-key-change-in-production"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    METRICS_TOKEN: Optional[str] = None  # bearer token for /metrics; loopback clients only if unset
     
     # AI/ML
     OPENAI_API_KEY: Optional[str] = None
     OLLAMA_BASE_URL: str = "http://localhost:11434"
     CHROMA_DB_PATH: str = "./chroma_db"
+    CHROMA_PERSIST_DIRECTORY: str = "./chroma_db"
+    
+    # LLM resilience
+    LLM_REQUEST_TIMEOUT: float = 60.0  # seconds per attempt
+    LLM_MAX_ATTEMPTS: int = 4
+    LLM_RETRY_BASE_DELAY: float = 0.5  # seconds
+    LLM_RETRY_MAX_DELAY: float = 20.0  # seconds; longer Retry-After values fail fast
+    LLM_CIRCUIT_FAILURE_THRESHOLD: int = 5  # consecutive transient failures
+    LLM_CIRCUIT_RECOVERY_SECONDS: float = 30.0
+    LLM_HEDGING_ENABLED: bool = True
+    LLM_HEDGE_DELAY: float = 3.0  # seconds, until enough latencies are observed
+    LLM_HEDGE_MIN_DELAY: float = 0.5
+    LLM_HEDGE_WORKERS: int = 16
+    
+    # LLM rate limits (per minute) and quotas
+    LLM_RATE_LIMIT_ENABLED: bool = True
+    LLM_RATE_LIMIT_DB: Optional[str] = None  # SQLite file shared by all workers; in-process if unset
+    LLM_GLOBAL_RPM: int = 500
+    LLM_GLOBAL_TPM: int = 150000
+    LLM_USER_RPM: int = 60
+    LLM_USER_TPM: int = 40000
+    LLM_ROLE_TPM: dict = {"student": 60000, "teacher": 120000}
+    LLM_COURSE_TPM: int = 60000
+    LLM_INTERACTIVE_RESERVE: float = 0.2  # share of the global budget batch calls leave free
+    LLM_INTERACTIVE_WAIT_TIMEOUT: float = 30.0  # seconds
+    LLM_BATCH_WAIT_TIMEOUT: float = 300.0
+    
+    # LLM usage accounting
+    LLM_USAGE_FLUSH_SIZE: int = 50  # events buffered before a write
+    LLM_USAGE_FLUSH_SECONDS: float = 5.0
+    LLM_USAGE_MAX_BUFFERED: int = 10000  # events kept for a retry while the database is unavailable
+    LLM_MODEL_PRICES: dict = {  # USD per 1K prompt / completion tokens
+        "gpt-4": [0.03, 0.06],
+        "gpt-4o": [0.0025, 0.01],
+        "gpt-3.5-turbo": [0.0005, 0.0015]
+    }
+    
+    # Test generation
+    AI_GENERATION_CONCURRENCY: int = 5  # concurrent LLM calls per generation
+    AI_QUESTIONS_PER_SECTION: int = 5
+    AI_SECTION_MAX_CHARS: int = 6000
+    QUESTION_DEDUP_THRESHOLD: float = 0.9  # cosine similarity
+    GENERATION_JOB_LEASE_SECONDS: float = 120.0  # a job not renewed for this long is treated as abandoned
+    
+    # Document analysis
+    ANALYSIS_SECTION_MIN_CHARS: int = 3000
+    ANALYSIS_SECTION_MAX_CHARS: int = 8000
+    ANALYSIS_REDUCE_MAX_CHARS: int = 12000  # summaries per reduce call before reducing hierarchically
+    
+    # Question bank
+    QUESTION_BANK_ENABLED: bool = True
+    QUESTION_BANK_COLLECTION: str = "discera_questions"
+    QUESTION_BANK_REUSE_THRESHOLD: float = 0.5  # cosine similarity to a document section
+    QUESTION_BANK_MIN_ATTEMPTS: int = 5
+    QUESTION_BANK_MIN_DISCRIMINATION: float = 0.2
+    
+    # Grading
+    SHORT_ANSWER_EDIT_THRESHOLD: float = 0.85
+    SHORT_ANSWER_ACCEPT_THRESHOLD: float = 0.82
+    SHORT_ANSWER_REJECT_THRESHOLD: float = 0.55
+    SHORT_ANSWER_LLM_FALLBACK: bool = True
     
     # File Upload
     UPLOAD_DIR: str = "./uploads"
     MAX_FILE_SIZE: int = 10 * 1024 * 1024  # 10MB
-    ALLOWED_EXTENSIONS: list = [".pdf", ".doc", ".docx", ".txt"]
+    ALLOWED_EXTENSIONS: list = [".pdf", ".doc", ".docx", ".txt", ".rtf", ".odt", ".pptx"]
+    # Resumable uploads (/uploads): large files sent as a series of byte ranges
+    MAX_RESUMABLE_UPLOAD_SIZE: int = 500 * 1024 * 1024  # 500MB
+    MAX_UPLOAD_PART_SIZE: int = 64 * 1024 * 1024  # per PUT request
+    RESUMABLE_UPLOAD_EXPIRY_HOURS: int = 24
+    
+    # Document processing
+    DOCUMENT_LANGUAGE: str = "sr"  # text normalization profile: sr, hr, bs, en
+    PDF_BACKEND: str = "auto"  # auto (PDFium if installed, else PyPDF2), pdfium, pypdf2
+    PDF_TEXT_CACHE_PATH: Optional[str] = "./pdf_text_cache.db"  # SQLite file; unset to disable
+    PDF_TEXT_CACHE_MAX_FILES: int = 2000
+    # OCR of scanned PDF pages (needs tesseract, plus pypdfium2 or pdftoppm to render pages)
+    OCR_ENABLED: bool = False
+    OCR_LANGUAGES: str = "srp+srp_latn+eng"  # tesseract -l
+    OCR_WORKERS: int = 2  # pages recognized in parallel
+    OCR_DPI: int = 300
+    OCR_PAGE_TIMEOUT: float = 120.0  # seconds
+    OCR_MIN_TEXT_CHARS: int = 20  # pages with less extracted text are OCR candidates
+    # .doc, .rtf, .odt and .pptx are converted in sandboxed worker processes
+    CONVERTER_WORKERS: int = 2
+    CONVERTER_TIMEOUT: float = 60.0  # seconds per file
+    CONVERTER_MEMORY_LIMIT_MB: int = 512  # per worker
+    CONVERTER_MAX_TASKS_PER_WORKER: int = 50  # files before a worker is replaced
+    # Embedding inference: torch, or ONNX Runtime on CPU (onnx, or onnx-int8 with quantized weights).
+    # Vectors from different backends do not mix; after switching, stored chunks are only
+    # embedded again when their document is re-ingested (PUT /documents/{id}/file)
+    EMBEDDING_BACKEND: str = "torch"
+    EMBEDDING_ONNX_DIR: str = "./onnx_models"  # exported models, created on first use
+    # Document chunks are embedded by a pool of worker processes (CPU only)
+    EMBEDDING_POOL_WORKERS: int = 2  # 0 encodes in the API process
+    EMBEDDING_POOL_THREADS: int = 0  # torch threads per worker; 0 splits the cores between workers
+    EMBEDDING_POOL_BATCH_SIZE: int = 256  # texts per worker batch, coalesced across documents
+    EMBEDDING_POOL_ENCODE_BATCH: int = 32  # model forward-pass batch inside a worker
+    EMBEDDING_POOL_MAX_BACKLOG: int = 8192  # queued texts before callers wait
+    # Bulk ingestion (ingest.py): whole course archives from a directory or zip
+    BULK_INGEST_WORKERS: int = 4  # processes parsing files
+    BULK_INGEST_BATCH_CHUNKS: int = 512  # chunks embedded together and stored per transaction
+    BULK_INGEST_COMMIT_FILES: int = 100  # files registered per transaction
     
     # CORS
     CORS_ORIGINS: list = [
@@ -1,16 +1,87 @@
-from sqlalchemy import create_engine
+import time
+from sqlalchemy import create_engine, event, exc
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 from .config import settings
+from .metrics import metrics
+
+# Database URL (POSTGRES_URL takes precedence for production deployments)
+SQLALCHEMY_DATABASE_URL = settings.POSTGRES_URL or settings.DATABASE_URL
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that publishes checkout wait time and exhaustion metrics.
+
+    Wait time is measured around the public `connect()`, which is what the
+    engine calls for every connection; how long connections are held comes
+    from the pool's checkout/checkin events.
+    """
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            metrics.inc("db_pool_exhausted_total")
+            raise
+        finally:
+            metrics.observe("db_pool_checkout_wait_seconds", time.perf_counter() - start)
+
+
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    connection_record.info["checked_out_at"] = time.perf_counter()
+
+
+def _on_checkin(dbapi_connection, connection_record):
+    checked_out_at = connection_record.info.pop("checked_out_at", None)
+    if checked_out_at is not None:
+        metrics.observe("db_pool_connection_held_seconds", time.perf_counter() - checked_out_at)
+
+
+event.listen(InstrumentedQueuePool, "checkout", _on_checkout)
+event.listen(InstrumentedQueuePool, "checkin", _on_checkin)
+
+
+def pool_options() -> dict:
+    """Pool arguments for server databases, taken from settings."""
+    return {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING
+    }
+
+
+def build_engine(database_url: str):
+    """Create the SQLAlchemy engine with pool settings from configuration."""
+    if "sqlite" in database_url:
+        return create_engine(
+            database_url,
+            connect_args={"check_same_thread": False}
+        )
+
+    return create_engine(database_url, **pool_options())
+
+
+def pool_status() -> dict:
+    """Current pool occupancy, reported as gauges on each metrics snapshot."""
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return {}
+    return {
+        "db_pool_size": pool.size(),
+        "db_pool_checked_out": pool.checkedout(),
+        "db_pool_overflow": max(pool.overflow(), 0),
+        "db_pool_idle": pool.checkedin()
+    }
 
-# Database URL
-SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
 
 # Create engine
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in SQLALCHEMY_DATABASE_URL else {}
-)
+engine = build_engine(SQLALCHEMY_DATABASE_URL)
+metrics.register_collector(pool_status)
 
 # Create SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -19,10 +90,19 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
+def dialect_insert(db):
+    """The session's dialect `insert`, which supports ON CONFLICT clauses."""
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
 # Dependency to get database session
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
@@ -0,0 +1,66 @@
+"""
+Idempotent schema upgrades for databases created by earlier DISCERA versions
+
+`Base.metadata.create_all` creates missing tables but never alters existing
+ones. Columns added to existing tables are listed in ADDED_COLUMNS and are
+added at startup when a database does not have them yet.
+"""
+import logging
+from typing import List, Tuple
+
+from sqlalchemy import exc, inspect, text
+from sqlalchemy.schema import CreateColumn
+
+from .database import Base
+
+logger = logging.getLogger(__name__)
+
+# (table, column) added to existing tables; the definitions come from the models
+ADDED_COLUMNS: List[Tuple[str, str]] = [
+    ("documents", "blob_hash"),
+    ("questions", "accepted_answers"),
+    ("tests", "answer_key_version"),
+    ("test_generation_jobs", "heartbeat_at"),
+]
+
+
+def _column_ddl(column, dialect) -> str:
+    ddl = str(CreateColumn(column).compile(dialect=dialect))
+    for foreign_key in column.foreign_keys:
+        target = foreign_key.column
+        ddl += f" REFERENCES {target.table.name} ({target.name})"
+    return ddl
+
+
+def upgrade_schema(engine) -> List[str]:
+    """Add missing columns and their indexes; returns the `table.column` names added"""
+    added = []
+    for table_name, column_name in ADDED_COLUMNS:
+        table = Base.metadata.tables.get(table_name)
+        inspector = inspect(engine)
+        if table is None or not inspector.has_table(table_name):
+            continue
+        if column_name in {column["name"] for column in inspector.get_columns(table_name)}:
+            continue
+
+        column = table.c[column_name]
+        try:
+            with engine.begin() as connection:
+                connection.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {_column_ddl(column, engine.dialect)}"))
+                for index in table.indexes:
+                    if [indexed.name for indexed in index.columns] == [column_name]:
+                        index.create(connection, checkfirst=True)
+        except (exc.OperationalError, exc.ProgrammingError):
+            # Another process starting at the same time may have added it first
+            if column_name not in {column["name"] for column in inspect(engine).get_columns(table_name)}:
+                raise
+            continue
+        added.append(f"{table_name}.{column_name}")
+        logger.info(f"🛠️ Added column {table_name}.{column_name}")
+    return added
+
+
+def create_schema(engine):
+    """Create missing tables, then bring existing ones up to date"""
+    Base.metadata.create_all(bind=engine)
+    return upgrade_schema(engine)
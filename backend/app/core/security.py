@@ -1,8 +1,9 @@
+import secrets
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from fastapi import HTTPException, status
+from fastapi import HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from .config import settings
 
@@ -12,6 +13,9 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# Clients that may read /metrics when no METRICS_TOKEN is configured
+LOOPBACK_HOSTS = {"127.0.0.1", "::1", "localhost"}
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash."""
@@ -61,4 +65,15 @@ def get_current_user(token: str):
     if username is None:
         raise credentials_exception
     
-    return username 
\ No newline at end of file
+    return username 
+
+
+def require_metrics_access(request: Request):
+    """Allow /metrics for scrapers presenting METRICS_TOKEN, or local clients if none is set."""
+    if settings.METRICS_TOKEN:
+        scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+        if scheme.lower() == "bearer" and secrets.compare_digest(token, settings.METRICS_TOKEN):
+            return
+    elif request.client is not None and request.client.host in LOOPBACK_HOSTS:
+        return
+    raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Metrics are not available")
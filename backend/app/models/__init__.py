@@ -1 +1,6 @@
-# Database models 
\ No newline at end of file
+# Database models
+# User and Test refer to each other and to Document by name: import them
+# together so the mappers configure whichever model a caller imports first
+from . import blob, document, test, user
+
+__all__ = ["blob", "document", "test", "user"]
@@ -0,0 +1,64 @@
+from sqlalchemy import Column, Integer, Float, DateTime, ForeignKey
+from sqlalchemy.sql import func
+from ..core.database import Base
+
+
+class TestStatistics(Base):
+    """Running score aggregates for a test, updated on every submission"""
+    __tablename__ = "test_statistics"
+
+    test_id = Column(Integer, ForeignKey("tests.id"), primary_key=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    percentage_sum = Column(Float, nullable=False, default=0)
+    percentage_sq_sum = Column(Float, nullable=False, default=0)
+    min_percentage = Column(Integer, nullable=True)
+    max_percentage = Column(Integer, nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<TestStatistics(test_id={self.test_id}, attempts={self.attempts})>"
+
+
+class TestScoreBucket(Base):
+    """Score histogram bucket (10 percentage points wide) for a test"""
+    __tablename__ = "test_score_buckets"
+
+    test_id = Column(Integer, ForeignKey("tests.id"), primary_key=True)
+    bucket = Column(Integer, primary_key=True)  # 0 = 0-9%, ..., 9 = 90-100%
+    count = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<TestScoreBucket(test_id={self.test_id}, bucket={self.bucket}, count={self.count})>"
+
+
+class QuestionStatistics(Base):
+    """Running item-analysis aggregates for a question"""
+    __tablename__ = "question_statistics"
+
+    question_id = Column(Integer, ForeignKey("questions.id"), primary_key=True)
+    test_id = Column(Integer, ForeignKey("tests.id"), nullable=False, index=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    correct_count = Column(Integer, nullable=False, default=0)
+    # Sums of the submitting students' total percentage, for point-biserial discrimination
+    percentage_sum = Column(Float, nullable=False, default=0)
+    percentage_sq_sum = Column(Float, nullable=False, default=0)
+    correct_percentage_sum = Column(Float, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<QuestionStatistics(question_id={self.question_id}, attempts={self.attempts})>"
+
+
+class StudentStatistics(Base):
+    """Running performance aggregates for a student across all tests"""
+    __tablename__ = "student_statistics"
+
+    student_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    tests_taken = Column(Integer, nullable=False, default=0)
+    percentage_sum = Column(Float, nullable=False, default=0)
+    rolling_average = Column(Float, nullable=True)  # exponentially weighted
+    last_percentage = Column(Integer, nullable=True)
+    best_percentage = Column(Integer, nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<StudentStatistics(student_id={self.student_id}, tests_taken={self.tests_taken})>"
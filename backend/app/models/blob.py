@@ -0,0 +1,17 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy.sql import func
+from ..core.database import Base
+
+
+class Blob(Base):
+    """Uploaded file content, stored once per SHA-256 and shared by documents"""
+    __tablename__ = "blobs"
+
+    sha256 = Column(String(64), primary_key=True)
+    size = Column(Integer, nullable=False)
+    file_path = Column(String, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)  # documents pointing at this blob
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    def __repr__(self):
+        return f"<Blob(sha256='{self.sha256[:12]}', size={self.size}, ref_count={self.ref_count})>"
@@ -2,6 +2,7 @@ from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Bool
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from ..core.database import Base
+from .blob import Blob
 
 
 class Document(Base):
@@ -20,9 +21,11 @@ class Document(Base):
     
     # Foreign Keys
     owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    blob_hash = Column(String(64), ForeignKey("blobs.sha256"), nullable=True, index=True)  # shared file content
     
     # Relationships
     owner = relationship("User", back_populates="documents")
+    blob = relationship(Blob)
     
     def __repr__(self):
         return f"<Document(id={self.id}, title='{self.title}', owner_id={self.owner_id})>" 
\ No newline at end of file
@@ -0,0 +1,32 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey
+from sqlalchemy.sql import func
+from ..core.database import Base
+
+
+class SectionSummary(Base):
+    """Map-step summary of one document section, shared by identical content"""
+    __tablename__ = "section_summaries"
+
+    content_hash = Column(String(64), primary_key=True)  # SHA-256 of the section text
+    summary = Column(Text, nullable=False)  # JSON
+    model = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    def __repr__(self):
+        return f"<SectionSummary(content_hash='{self.content_hash[:12]}')>"
+
+
+class DocumentAnalysis(Base):
+    """Reduced analysis of a document, valid while its content hash matches"""
+    __tablename__ = "document_analyses"
+
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), primary_key=True)
+    content_hash = Column(String(64), nullable=False)  # SHA-256 over the section hashes
+    analysis = Column(Text, nullable=False)  # JSON
+    sections = Column(Integer, nullable=False, default=0)
+    model = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<DocumentAnalysis(document_id={self.document_id}, sections={self.sections})>"
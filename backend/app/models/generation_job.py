@@ -0,0 +1,69 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Enum
+from sqlalchemy.sql import func
+from sqlalchemy.orm import relationship
+from ..core.database import Base
+import enum
+
+
+class JobStatus(str, enum.Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class TestGenerationJob(Base):
+    __tablename__ = "test_generation_jobs"
+
+    id = Column(String, primary_key=True, index=True)  # UUID hex
+    status = Column(Enum(JobStatus), default=JobStatus.PENDING, nullable=False)
+    num_questions = Column(Integer, nullable=False)
+    difficulty = Column(String, nullable=False)
+    question_types = Column(Text, nullable=False)  # JSON list
+    sections_total = Column(Integer, default=0)
+    sections_completed = Column(Integer, default=0)
+    questions_generated = Column(Integer, default=0)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)  # renewed while a worker runs the job
+
+    # Foreign Keys
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), nullable=False)
+    test_id = Column(Integer, ForeignKey("tests.id"), nullable=True)
+
+    # Relationships
+    document = relationship("Document")
+    sections = relationship(
+        "TestGenerationJobSection",
+        back_populates="job",
+        cascade="all, delete-orphan",
+        order_by="TestGenerationJobSection.section_index"
+    )
+
+    def __repr__(self):
+        return f"<TestGenerationJob(id='{self.id}', status='{self.status}', document_id={self.document_id})>"
+
+
+class TestGenerationJobSection(Base):
+    __tablename__ = "test_generation_job_sections"
+
+    id = Column(Integer, primary_key=True, index=True)
+    section_index = Column(Integer, nullable=False)
+    title = Column(String, nullable=True)
+    content = Column(Text, nullable=False)  # excerpt sent to the LLM
+    num_questions = Column(Integer, nullable=False)
+    embedding = Column(Text, nullable=True)  # JSON list, section centroid
+    status = Column(Enum(JobStatus), default=JobStatus.PENDING, nullable=False)
+    questions = Column(Text, nullable=True)  # JSON list of validated questions
+    error = Column(Text, nullable=True)
+
+    # Foreign Keys
+    job_id = Column(String, ForeignKey("test_generation_jobs.id", ondelete="CASCADE"), nullable=False, index=True)
+
+    # Relationships
+    job = relationship("TestGenerationJob", back_populates="sections")
+
+    def __repr__(self):
+        return f"<TestGenerationJobSection(job_id='{self.job_id}', index={self.section_index}, status='{self.status}')>"
@@ -0,0 +1,53 @@
+from sqlalchemy import Column, Integer, String, DateTime, Float, Boolean, ForeignKey
+from sqlalchemy.sql import func
+from ..core.database import Base
+
+
+class LLMUsageEvent(Base):
+    """Append-only ledger entry for one LLM call (or a call avoided by a cache)"""
+    __tablename__ = "llm_usage_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+    provider = Column(String, nullable=False)
+    model = Column(String, nullable=False)
+    operation = Column(String, nullable=False)  # OpenAIService method, e.g. generate_test_questions
+    endpoint = Column(String, nullable=True)  # API feature the call was made for
+    role = Column(String, nullable=True)
+    priority = Column(String, nullable=True)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    total_tokens = Column(Integer, nullable=False, default=0)
+    latency_ms = Column(Float, nullable=False, default=0)
+    cost_usd = Column(Float, nullable=False, default=0)
+    cache_hit = Column(Boolean, nullable=False, default=False)
+    success = Column(Boolean, nullable=False, default=True)
+    error = Column(String, nullable=True)  # exception type of a failed call
+
+    # Foreign Keys
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)
+
+    def __repr__(self):
+        return f"<LLMUsageEvent(id={self.id}, operation='{self.operation}', total_tokens={self.total_tokens})>"
+
+
+class LLMUsageRollup(Base):
+    """Hourly usage totals per user, endpoint and model, updated with every flush"""
+    __tablename__ = "llm_usage_rollups"
+
+    hour = Column(DateTime(timezone=True), primary_key=True)
+    user_id = Column(Integer, primary_key=True)  # 0 for calls without a user
+    endpoint = Column(String, primary_key=True)  # "" when unknown
+    model = Column(String, primary_key=True)
+    calls = Column(Integer, nullable=False, default=0)
+    errors = Column(Integer, nullable=False, default=0)
+    cache_hits = Column(Integer, nullable=False, default=0)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    total_tokens = Column(Integer, nullable=False, default=0)
+    latency_ms_sum = Column(Float, nullable=False, default=0)
+    latency_ms_max = Column(Float, nullable=False, default=0)
+    cost_usd = Column(Float, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<LLMUsageRollup(hour={self.hour}, user_id={self.user_id}, endpoint='{self.endpoint}')>"
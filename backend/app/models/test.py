@@ -26,6 +26,7 @@ class Test(Base):
     difficulty = Column(Enum(DifficultyLevel), default=DifficultyLevel.MEDIUM)
     time_limit = Column(Integer, nullable=True)  # in minutes
     is_active = Column(Boolean, default=True)
+    answer_key_version = Column(Integer, nullable=False, default=0, server_default="0")  # bumped on key changes
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
@@ -49,6 +50,7 @@ class Question(Base):
     question_type = Column(Enum(QuestionType), nullable=False)
     correct_answer = Column(Text, nullable=False)
     options = Column(Text, nullable=True)  # JSON string for multiple choice
+    accepted_answers = Column(Text, nullable=True)  # JSON list of alternative short answers
     explanation = Column(Text, nullable=True)
     points = Column(Integer, default=1)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
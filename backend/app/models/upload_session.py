@@ -0,0 +1,60 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Enum
+from sqlalchemy.sql import func
+from sqlalchemy.orm import relationship
+from ..core.database import Base
+import enum
+
+
+class UploadStatus(str, enum.Enum):
+    UPLOADING = "uploading"
+    COMPLETED = "completed"
+
+
+class UploadSession(Base):
+    """A resumable upload that receives its file as consecutive byte ranges"""
+    __tablename__ = "upload_sessions"
+
+    id = Column(String, primary_key=True, index=True)  # UUID hex
+    filename = Column(String, nullable=False)
+    file_type = Column(String, nullable=False)
+    total_size = Column(Integer, nullable=False)
+    offset = Column(Integer, nullable=False, default=0)  # bytes received so far
+    status = Column(Enum(UploadStatus), default=UploadStatus.UPLOADING, nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    # Foreign Keys
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="SET NULL"), nullable=True)
+
+    # Relationships
+    document = relationship("Document")
+    parts = relationship(
+        "UploadPart",
+        back_populates="session",
+        cascade="all, delete-orphan",
+        order_by="UploadPart.offset"
+    )
+
+    def __repr__(self):
+        return f"<UploadSession(id='{self.id}', offset={self.offset}, total_size={self.total_size})>"
+
+
+class UploadPart(Base):
+    """One received byte range, stored as its own file until the upload is finalized"""
+    __tablename__ = "upload_parts"
+
+    id = Column(Integer, primary_key=True, index=True)
+    offset = Column(Integer, nullable=False)
+    size = Column(Integer, nullable=False)
+    file_path = Column(String, nullable=False)
+
+    # Foreign Keys
+    session_id = Column(String, ForeignKey("upload_sessions.id"), nullable=False, index=True)
+
+    # Relationships
+    session = relationship("UploadSession", back_populates="parts")
+
+    def __repr__(self):
+        return f"<UploadPart(session_id='{self.session_id}', offset={self.offset}, size={self.size})>"
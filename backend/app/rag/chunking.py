@@ -0,0 +1,196 @@
+"""
+Structure-aware chunking for DISCERA RAG System
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+# Words that end with a period without ending the sentence
+ABBREVIATIONS = {
+    "e.g", "i.e", "etc", "vs", "cf", "al", "approx", "ca", "fig", "figs", "eq", "eqs", "no", "nos", "vol",
+    "pp", "p", "ch", "sec", "dr", "mr", "mrs", "ms", "prof", "st", "jr", "sr", "inc", "ltd", "co", "dept",
+    "jan", "feb", "mar", "apr", "jun", "jul", "aug", "sep", "sept", "oct", "nov", "dec", "tj", "npr", "itd",
+}
+# A sentence ends at . ! ? or … (plus closing quotes/brackets) followed by whitespace
+SENTENCE_END = re.compile(r"[.!?…]+[\"'”’)\]]*\s+")
+SECTION_SEPARATOR = " > "
+
+
+@dataclass
+class TextBlock:
+    """A paragraph or heading extracted from a document"""
+    text: str
+    page_number: Optional[int] = None
+    heading_level: Optional[int] = None  # 1 for top-level headings; None for body text
+
+
+@dataclass
+class Chunk:
+    """A chunk produced by StructuredChunker"""
+    text: str
+    section_path: List[str] = field(default_factory=list)
+    page_number: Optional[int] = None
+    page_end: Optional[int] = None
+    length: int = 0  # in the chunker's length unit
+
+    @property
+    def section(self) -> Optional[str]:
+        return SECTION_SEPARATOR.join(self.section_path) or None
+
+
+def normalize_whitespace(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split text into sentences, keeping their punctuation.
+
+    Decimals ("3.14") never split because a boundary needs whitespace after
+    the punctuation; abbreviations ("e.g.", "Fig.") and initials ("J.") do not
+    end a sentence.
+    """
+    sentences, start = [], 0
+    for match in SENTENCE_END.finditer(text):
+        end = match.end()
+        words = text[start:match.start() + 1].split()
+        last_word = words[-1].rstrip(".").lower() if words else ""
+        if text[match.start()] == "." and (last_word in ABBREVIATIONS or (len(last_word) == 1 and last_word.isalpha())):
+            continue
+        sentence = text[start:end].strip()
+        if sentence:
+            sentences.append(sentence)
+        start = end
+    rest = text[start:].strip()
+    if rest:
+        sentences.append(rest)
+    return sentences
+
+
+class StructuredChunker:
+    """Pack sentences into chunks that respect document structure.
+
+    Headings start a new section; a chunk never spans two sections and
+    carries the heading path it belongs to. Within a section, whole
+    sentences are packed up to `chunk_size` (measured by `length_function`)
+    and each chunk repeats the last sentences of the previous one, up to
+    `chunk_overlap`. Only a single sentence longer than `chunk_size` is cut
+    mid-sentence, at word boundaries.
+
+    `batch_length_function`, when given, measures a list of texts in one
+    call (a fast tokenizer encodes a whole section at once) and is used
+    instead of calling `length_function` per sentence. `normalize` is
+    applied to every block's text and must collapse whitespace.
+    """
+
+    def __init__(
+        self,
+        chunk_size: int = 1000,
+        chunk_overlap: int = 200,
+        length_function: Callable[[str], int] = len,
+        batch_length_function: Optional[Callable[[List[str]], List[int]]] = None,
+        normalize: Callable[[str], str] = normalize_whitespace
+    ):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = min(chunk_overlap, chunk_size // 2)
+        self.length_function = length_function
+        self.batch_length_function = batch_length_function
+        self.separator_length = length_function(" ")
+        self.normalize = normalize
+
+    def measure(self, texts: List[str]) -> List[int]:
+        if not texts:
+            return []
+        if self.batch_length_function is not None:
+            return list(self.batch_length_function(texts))
+        return [self.length_function(text) for text in texts]
+
+    def chunk(self, blocks: List[TextBlock]) -> List[Chunk]:
+        chunks: List[Chunk] = []
+        path: List[str] = []
+        levels: List[int] = []
+        section: List[tuple] = []  # (sentence, page_number)
+
+        for block in blocks:
+            text = self.normalize(block.text)
+            if not text:
+                continue
+            if block.heading_level is not None:
+                chunks.extend(self._pack(section, path))
+                section = []
+                while levels and levels[-1] >= block.heading_level:
+                    levels.pop()
+                    path.pop()
+                levels.append(block.heading_level)
+                path.append(text)
+                continue
+            section.extend((sentence, block.page_number) for sentence in split_sentences(text))
+
+        chunks.extend(self._pack(section, path))
+        return chunks
+
+    def _split_long(self, sentence: str) -> List[str]:
+        pieces, current, size = [], [], 0
+        words = sentence.split()
+        for word, length in zip(words, self.measure(words)):
+            length += self.separator_length
+            if current and size + length > self.chunk_size:
+                pieces.append(" ".join(current))
+                current, size = [], 0
+            current.append(word)
+            size += length
+        if current:
+            pieces.append(" ".join(current))
+        return pieces
+
+    def _pack(self, sentences: List[tuple], path: List[str]) -> List[Chunk]:
+        # Each sentence is measured once; a chunk's length is the sum over its
+        # sentences plus a separator each (exact for characters, a close
+        # upper bound for subword tokens, which rarely merge across a space)
+        units = []
+        lengths = self.measure([sentence for sentence, _ in sentences])
+        for (sentence, page_number), length in zip(sentences, lengths):
+            if length > self.chunk_size:
+                pieces = self._split_long(sentence)
+                units.extend(
+                    (piece, page_number, piece_length)
+                    for piece, piece_length in zip(pieces, self.measure(pieces))
+                )
+            else:
+                units.append((sentence, page_number, length))
+
+        chunks, current, size = [], [], 0
+        new_units = 0  # units in `current` that are not overlap from the previous chunk
+        for unit in units:
+            if current and new_units and size + unit[2] + self.separator_length > self.chunk_size:
+                chunks.append(self._make_chunk(current, path))
+                current = self._overlap(current)
+                size = sum(length + self.separator_length for _, _, length in current)
+                new_units = 0
+                # Drop overlap that would not leave room for the next sentence
+                while current and size + unit[2] + self.separator_length > self.chunk_size:
+                    size -= current.pop(0)[2] + self.separator_length
+            current.append(unit)
+            size += unit[2] + self.separator_length
+            new_units += 1
+        if current and new_units:
+            chunks.append(self._make_chunk(current, path))
+        return chunks
+
+    def _overlap(self, units: List[tuple]) -> List[tuple]:
+        overlap, size = [], 0
+        for unit in reversed(units):
+            size += unit[2] + self.separator_length
+            if size > self.chunk_overlap:
+                break
+            overlap.insert(0, unit)
+        return overlap
+
+    def _make_chunk(self, units: List[tuple], path: List[str]) -> Chunk:
+        pages = [page for _, page, _ in units if page is not None]
+        return Chunk(
+            text=" ".join(text for text, _, _ in units),
+            section_path=list(path),
+            page_number=pages[0] if pages else None,
+            page_end=pages[-1] if pages else None,
+            length=sum(length for _, _, length in units) + self.separator_length * (len(units) - 1)
+        )
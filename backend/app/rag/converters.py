@@ -0,0 +1,528 @@
+"""
+Legacy and office format converters for DISCERA RAG System
+
+Converters run in a pool of long-lived worker processes. A worker gets a
+file path and returns the document's text blocks; it runs under memory,
+CPU and file-write limits, and one that hangs past the timeout or dies
+is killed and replaced without affecting the others. Parsing untrusted
+binary formats therefore cannot take the API process down with it.
+
+This module only imports the standard library, so workers start fast.
+"""
+import logging
+import multiprocessing
+import os
+import re
+import struct
+import threading
+import zipfile
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+from xml.etree import ElementTree
+
+try:
+    import resource
+except ImportError:  # not available on Windows; workers then run without rlimits
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# (text, heading_level, page_number) - TextBlock fields, kept as plain tuples for pickling
+Block = Tuple[str, Optional[int], Optional[int]]
+
+
+class ConversionError(Exception):
+    """Raised when a file cannot be converted to text"""
+
+
+class ConversionTimeout(ConversionError):
+    """Raised when a converter worker takes longer than the timeout"""
+
+
+# --- Word 97-2003 (.doc) ---------------------------------------------------
+
+CFB_SIGNATURE = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+CFB_END_OF_CHAIN = 0xFFFFFFFE
+# Field begin / separator / end: the code between begin and separator is dropped
+FIELD_BEGIN, FIELD_SEPARATOR, FIELD_END = "\x13", "\x14", "\x15"
+# Word control characters mapped to text; anything else below 0x20 is dropped
+WORD_CHARACTERS = str.maketrans({
+    "\x07": "\t", "\x0b": "\n", "\x0c": "\r", "\x0e": "\r", "\x1e": "-", "\x1f": "", "\xa0": " ",
+    **{chr(code): "" for code in range(0x20) if chr(code) not in "\t\n\r\x07\x0b\x0c\x0e\x1e\x1f"}
+})
+
+
+def _read_cfb_streams(data: bytes, names: Tuple[str, ...]) -> Dict[str, bytes]:
+    """Read named streams from an OLE compound file (the container of .doc files)"""
+    if not data.startswith(CFB_SIGNATURE):
+        raise ConversionError("Not an OLE compound file")
+    sector_size = 1 << struct.unpack_from("<H", data, 0x1E)[0]
+    mini_sector_size = 1 << struct.unpack_from("<H", data, 0x20)[0]
+    first_directory, mini_cutoff, first_minifat = struct.unpack_from("<I4xII", data, 0x30)
+    first_difat, difat_count = struct.unpack_from("<II", data, 0x44)
+
+    def sector(index: int) -> bytes:
+        offset = (index + 1) * sector_size
+        return data[offset:offset + sector_size]
+
+    fat_sectors = [index for index in struct.unpack_from("<109I", data, 0x4C) if index < CFB_END_OF_CHAIN]
+    next_difat = first_difat
+    for _ in range(difat_count):
+        if next_difat >= CFB_END_OF_CHAIN:
+            break
+        entries = struct.unpack(f"<{sector_size // 4}I", sector(next_difat))
+        fat_sectors.extend(index for index in entries[:-1] if index < CFB_END_OF_CHAIN)
+        next_difat = entries[-1]
+    fat = []
+    for index in fat_sectors:
+        fat.extend(struct.unpack(f"<{sector_size // 4}I", sector(index)))
+
+    def chain(start: int, table: List[int]) -> List[int]:
+        indexes = []
+        while start < CFB_END_OF_CHAIN and start < len(table) and len(indexes) <= len(table):
+            indexes.append(start)
+            start = table[start]
+        return indexes
+
+    directory = b"".join(sector(index) for index in chain(first_directory, fat))
+    entries = {}
+    for offset in range(0, len(directory) - 127, 128):
+        name_length = struct.unpack_from("<H", directory, offset + 0x40)[0]
+        name = directory[offset:offset + max(name_length - 2, 0)].decode("utf-16-le", "ignore")
+        start, size = struct.unpack_from("<II", directory, offset + 0x74)
+        entries[name] = (directory[offset + 0x42], start, size)
+
+    root = next((entry for entry in entries.values() if entry[0] == 5), None)
+    mini_stream = b"".join(sector(index) for index in chain(root[1], fat)) if root else b""
+    minifat = []
+    for index in chain(first_minifat, fat):
+        minifat.extend(struct.unpack(f"<{sector_size // 4}I", sector(index)))
+
+    streams = {}
+    for name in names:
+        if name not in entries:
+            continue
+        _, start, size = entries[name]
+        if size < mini_cutoff:
+            content = b"".join(
+                mini_stream[index * mini_sector_size:(index + 1) * mini_sector_size] for index in chain(start, minifat)
+            )
+        else:
+            content = b"".join(sector(index) for index in chain(start, fat))
+        streams[name] = content[:size]
+    return streams
+
+
+def _strip_fields(text: str) -> str:
+    """Keep field results ("Figure 3") and drop field codes ("SEQ Figure")"""
+    output, depth_codes = [], []
+    for char in text:
+        if char == FIELD_BEGIN:
+            depth_codes.append(True)
+        elif char == FIELD_SEPARATOR and depth_codes:
+            depth_codes[-1] = False
+        elif char == FIELD_END and depth_codes:
+            depth_codes.pop()
+        elif not any(depth_codes):
+            output.append(char)
+    return "".join(output)
+
+
+def convert_doc(file_path: str) -> List[Block]:
+    """Text of a Word 97-2003 document, read through its piece table"""
+    with open(file_path, "rb") as file:
+        data = file.read()
+    if data.lstrip().startswith(b"{\\rtf"):
+        return convert_rtf(file_path)  # RTF saved with a .doc name
+
+    streams = _read_cfb_streams(data, ("WordDocument", "0Table", "1Table"))
+    word = streams.get("WordDocument")
+    if not word or struct.unpack_from("<H", word, 0)[0] != 0xA5EC:
+        raise ConversionError("Not a Word document")
+    n_fib, flags = struct.unpack_from("<H6xH", word, 2)
+    if n_fib < 101:
+        raise ConversionError("Word 6/95 documents are not supported")
+    if flags & 0x0100:
+        raise ConversionError("Document is encrypted")
+    table = streams.get("1Table" if flags & 0x0200 else "0Table")
+    if table is None:
+        raise ConversionError("Word table stream is missing")
+
+    text_length = struct.unpack_from("<i", word, 0x4C)[0]  # ccpText: main document only
+    clx_offset, clx_length = struct.unpack_from("<II", word, 0x1A2)
+    clx = table[clx_offset:clx_offset + clx_length]
+    position = 0
+    while position < len(clx) and clx[position] == 0x01:  # skip property modifiers
+        position += 3 + struct.unpack_from("<H", clx, position + 1)[0]
+    if position >= len(clx) or clx[position] != 0x02:
+        raise ConversionError("Word piece table not found")
+    piece_table_length = struct.unpack_from("<I", clx, position + 1)[0]
+    pieces = (piece_table_length - 4) // 12
+    cps = struct.unpack_from(f"<{pieces + 1}i", clx, position + 5)
+    descriptors = position + 5 + (pieces + 1) * 4
+
+    parts, remaining = [], text_length
+    for index in range(pieces):
+        if remaining <= 0:
+            break
+        count = min(cps[index + 1] - cps[index], remaining)
+        fc = struct.unpack_from("<I", clx, descriptors + index * 8 + 2)[0]
+        if fc & 0x40000000:  # 8-bit Windows-1252 text
+            start = (fc & ~0x40000000) // 2
+            parts.append(word[start:start + count].decode("cp1252", "replace"))
+        else:
+            parts.append(word[fc:fc + 2 * count].decode("utf-16-le", "replace"))
+        remaining -= count
+
+    text = _strip_fields("".join(parts)).translate(WORD_CHARACTERS)
+    return [(paragraph, None, None) for paragraph in text.split("\r") if paragraph.strip()]
+
+
+# --- Rich Text Format (.rtf) ------------------------------------------------
+
+RTF_TOKEN = re.compile(
+    r"\\([a-zA-Z]{1,32})(-?\d{1,10})? ?|\\'([0-9a-fA-F]{2})|\\(.)|([{}])|[\r\n]+|([^\\{}\r\n]+)",
+    re.DOTALL
+)
+# Groups whose content is not document text
+RTF_SKIPPED = {
+    "fonttbl", "colortbl", "stylesheet", "info", "pict", "object", "header", "headerl", "headerr", "headerf",
+    "footer", "footerl", "footerr", "footerf", "themedata", "colorschememapping", "datastore", "latentstyles",
+    "listtable", "listoverridetable", "rsidtbl", "generator", "xmlnstbl", "mmathPr", "fldinst", "filetbl",
+}
+RTF_CHARACTERS = {
+    "par": "\n", "sect": "\n", "page": "\n", "row": "\n", "line": " ", "tab": "\t", "cell": "\t",
+    "emdash": "—", "endash": "–", "lquote": "‘", "rquote": "’", "ldblquote": "“", "rdblquote": "”",
+    "bullet": "•", "emspace": " ", "enspace": " ",
+}
+RTF_SYMBOLS = {"~": " ", "-": "", "_": "-", "\\": "\\", "{": "{", "}": "}", "\n": "\n", "\r": "\n"}
+
+
+def convert_rtf(file_path: str) -> List[Block]:
+    """Text of an RTF document"""
+    with open(file_path, "rb") as file:
+        source = file.read().decode("latin-1")
+    if not source.lstrip().startswith("{\\rtf"):
+        raise ConversionError("Not an RTF document")
+
+    output: List[str] = []
+    stack: List[Tuple[bool, int]] = []
+    skipped, unicode_fallback, to_skip = False, 1, 0
+    codepage, group_start = "cp1252", False
+
+    for match in RTF_TOKEN.finditer(source):
+        word, argument, hex_code, symbol, brace, text = match.groups()
+        if brace == "{":
+            stack.append((skipped, unicode_fallback))
+            group_start, to_skip = True, 0
+            continue
+        if brace == "}":
+            if stack:
+                skipped, unicode_fallback = stack.pop()
+            group_start, to_skip = False, 0
+            continue
+        starts_group, group_start = group_start, False
+
+        if symbol == "*" and starts_group:
+            skipped = True  # \* marks an optional destination this reader does not know
+            continue
+        if word in RTF_SKIPPED:
+            skipped = True
+            continue
+        if word == "ansicpg" and argument:
+            codepage = f"cp{argument}"
+            continue
+        if skipped:
+            continue
+
+        if to_skip and (hex_code or text or symbol):
+            if text and len(text) > to_skip:
+                text, to_skip = text[to_skip:], 0
+            else:
+                to_skip -= 1 if not text else len(text)
+                continue
+
+        if word == "uc" and argument:
+            unicode_fallback = int(argument)
+        elif word == "u" and argument:
+            code = int(argument)
+            output.append(chr(code + 65536 if code < 0 else code))
+            to_skip = unicode_fallback
+        elif word in RTF_CHARACTERS:
+            output.append(RTF_CHARACTERS[word])
+        elif hex_code:
+            output.append(bytes([int(hex_code, 16)]).decode(codepage, "replace"))
+        elif symbol:
+            output.append(RTF_SYMBOLS.get(symbol, ""))
+        elif text:
+            output.append(text)
+
+    return [(paragraph, None, None) for paragraph in "".join(output).split("\n") if paragraph.strip()]
+
+
+# --- OpenDocument text (.odt) ------------------------------------------------
+
+ODF_TEXT = "urn:oasis:names:tc:opendocument:xmlns:text:1.0"
+ODF_OFFICE = "urn:oasis:names:tc:opendocument:xmlns:office:1.0"
+
+
+def _odf_text(element) -> str:
+    parts = [element.text or ""]
+    for child in element:
+        tag = child.tag.rsplit("}", 1)[-1]
+        if tag == "s":
+            parts.append(" " * int(child.get(f"{{{ODF_TEXT}}}c", "1")))
+        elif tag == "tab":
+            parts.append("\t")
+        elif tag == "line-break":
+            parts.append("\n")
+        elif tag not in ("note", "annotation"):
+            parts.append(_odf_text(child))
+        parts.append(child.tail or "")
+    return "".join(parts)
+
+
+def convert_odt(file_path: str) -> List[Block]:
+    """Paragraphs and outline headings of an OpenDocument text file"""
+    try:
+        with zipfile.ZipFile(file_path) as archive:
+            root = ElementTree.fromstring(archive.read("content.xml"))
+    except (zipfile.BadZipFile, KeyError, ElementTree.ParseError) as e:
+        raise ConversionError(f"Not an OpenDocument text file: {e}")
+
+    body = root.find(f"{{{ODF_OFFICE}}}body")
+    blocks = []
+    for element in (body if body is not None else root).iter():
+        if element.tag == f"{{{ODF_TEXT}}}h":
+            level = int(element.get(f"{{{ODF_TEXT}}}outline-level", "1"))
+            blocks.append((_odf_text(element), level, None))
+        elif element.tag == f"{{{ODF_TEXT}}}p":
+            blocks.append((_odf_text(element), None, None))
+    return [block for block in blocks if block[0].strip()]
+
+
+# --- PowerPoint (.pptx) ------------------------------------------------------
+
+PRESENTATION = "http://schemas.openxmlformats.org/presentationml/2006/main"
+DRAWING = "http://schemas.openxmlformats.org/drawingml/2006/main"
+SLIDE_NAME = re.compile(r"ppt/slides/slide(\d+)\.xml$")
+
+
+def _drawing_paragraph(paragraph) -> str:
+    return "".join(
+        "\n" if element.tag == f"{{{DRAWING}}}br" else (element.text or "")
+        for element in paragraph.iter()
+        if element.tag in (f"{{{DRAWING}}}t", f"{{{DRAWING}}}br")
+    )
+
+
+def convert_pptx(file_path: str) -> List[Block]:
+    """Slide titles as headings and the text of every shape, slide by slide"""
+    try:
+        with zipfile.ZipFile(file_path) as archive:
+            slides = sorted(
+                (int(match.group(1)), name)
+                for name in archive.namelist() if (match := SLIDE_NAME.match(name))
+            )
+            roots = [(number, ElementTree.fromstring(archive.read(name))) for number, name in slides]
+    except (zipfile.BadZipFile, ElementTree.ParseError) as e:
+        raise ConversionError(f"Not a PowerPoint file: {e}")
+
+    blocks = []
+    for number, root in roots:
+        title, paragraphs = None, []
+        for shape in root.iter():
+            if shape.tag not in (f"{{{PRESENTATION}}}sp", f"{{{PRESENTATION}}}graphicFrame"):
+                continue
+            placeholder = shape.find(f".//{{{PRESENTATION}}}ph")
+            texts = [_drawing_paragraph(paragraph) for paragraph in shape.iter(f"{{{DRAWING}}}p")]
+            texts = [text for text in texts if text.strip()]
+            if placeholder is not None and placeholder.get("type") in ("title", "ctrTitle") and title is None:
+                title = " ".join(texts)
+            else:
+                paragraphs.extend(texts)
+        blocks.append((title or f"Slide {number}", 1, number))
+        blocks.extend((text, None, number) for text in paragraphs)
+    return blocks
+
+
+CONVERTERS: Dict[str, Callable[[str], List[Block]]] = {
+    ".doc": convert_doc,
+    ".rtf": convert_rtf,
+    ".odt": convert_odt,
+    ".pptx": convert_pptx,
+}
+
+
+# --- Worker pool -------------------------------------------------------------
+
+def _limit_resources(memory_limit: int):
+    if resource is None:
+        return
+    resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    resource.setrlimit(resource.RLIMIT_FSIZE, (0, 0))  # converters read, never write
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+
+
+def _limit_cpu(cpu_seconds: int):
+    """Allow the next conversion `cpu_seconds` of CPU time.
+
+    RLIMIT_CPU counts the CPU time of the worker's whole life, so the soft
+    limit is moved past what earlier conversions used; the hard limit is
+    left alone so it can be raised again for the next file.
+    """
+    if resource is None:
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    soft = int(usage.ru_utime + usage.ru_stime) + 1 + cpu_seconds
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _worker_main(conn, memory_limit: int, cpu_seconds: int):
+    """Worker loop: receive (extension, path), send back ("ok", blocks) or ("error", message)"""
+    _limit_resources(memory_limit)
+    while True:
+        try:
+            extension, file_path = conn.recv()
+        except EOFError:
+            return
+        _limit_cpu(cpu_seconds)
+        try:
+            conn.send(("ok", CONVERTERS[extension](file_path)))
+        except MemoryError:
+            conn.send(("error", "Converter ran out of memory"))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+def _start_method() -> str:
+    # forkserver workers start from a small, clean process instead of a copy
+    # of the API server (threads, model weights, open sockets)
+    return "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+
+@dataclass
+class _Worker:
+    process: multiprocessing.Process
+    conn: object
+    tasks: int = 0
+
+    def kill(self):
+        self.process.kill()
+        self.process.join(timeout=5)
+        self.conn.close()
+
+
+class ConverterPool:
+    """Convert files to text blocks in sandboxed, reusable worker processes"""
+
+    def __init__(
+        self,
+        size: int = 2,
+        timeout: float = 60.0,
+        memory_limit: int = 512 * 1024 * 1024,
+        max_tasks_per_worker: int = 50
+    ):
+        self.size = size
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self._context = multiprocessing.get_context(_start_method())
+        if self._context.get_start_method() == "forkserver":
+            self._context.set_forkserver_preload([__name__])
+        self._idle: List[_Worker] = []
+        self._running = 0
+        self._condition = threading.Condition()
+
+    def _start_worker(self) -> _Worker:
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(child_conn, self.memory_limit, int(self.timeout) + 1),
+            daemon=True,
+            name="discera-converter"
+        )
+        process.start()
+        child_conn.close()
+        return _Worker(process=process, conn=parent_conn)
+
+    def _checkout(self) -> _Worker:
+        with self._condition:
+            while not self._idle and self._running >= self.size:
+                self._condition.wait()
+            self._running += 1
+            worker = self._idle.pop() if self._idle else None
+        if worker is None or not worker.process.is_alive():
+            try:
+                worker = self._start_worker()
+            except Exception:
+                self._release(None)
+                raise
+        return worker
+
+    def _release(self, worker: Optional[_Worker]):
+        with self._condition:
+            self._running -= 1
+            if worker is not None:
+                self._idle.append(worker)
+            self._condition.notify()
+
+    def convert(self, file_path: str, extension: str) -> List[Block]:
+        extension = extension.lower()
+        if extension not in CONVERTERS:
+            raise ConversionError(f"No converter for {extension} files")
+
+        worker = self._checkout()
+        try:
+            worker.conn.send((extension, os.path.abspath(file_path)))
+            if not worker.conn.poll(self.timeout):
+                raise ConversionTimeout(f"Converting {os.path.basename(file_path)} took over {self.timeout:.0f}s")
+            status, payload = worker.conn.recv()
+        except ConversionTimeout:
+            worker.kill()
+            self._release(None)
+            raise
+        except (EOFError, OSError) as e:
+            # The worker died: killed by its CPU or memory limit, or crashed
+            worker.kill()
+            self._release(None)
+            raise ConversionError(f"Converter worker exited while converting {os.path.basename(file_path)}: {e}")
+
+        worker.tasks += 1
+        if worker.tasks >= self.max_tasks_per_worker:
+            worker.kill()
+            worker = None
+        self._release(worker)
+
+        if status != "ok":
+            raise ConversionError(payload)
+        logger.info(f"🔄 Converted {os.path.basename(file_path)}: {len(payload)} blocks")
+        return payload
+
+    def shutdown(self):
+        with self._condition:
+            workers, self._idle = self._idle, []
+        for worker in workers:
+            worker.kill()
+
+
+@lru_cache(maxsize=1)
+def get_converter_pool() -> ConverterPool:
+    """Shared converter pool; workers start on first use"""
+    from app.core.config import settings
+    return ConverterPool(
+        size=settings.CONVERTER_WORKERS,
+        timeout=settings.CONVERTER_TIMEOUT,
+        memory_limit=settings.CONVERTER_MEMORY_LIMIT_MB * 1024 * 1024,
+        max_tasks_per_worker=settings.CONVERTER_MAX_TASKS_PER_WORKER
+    )
+
+
+def shutdown_converter_pool():
+    """Stop the shared pool's workers, if it was ever started"""
+    if get_converter_pool.cache_info().currsize:
+        get_converter_pool().shutdown()
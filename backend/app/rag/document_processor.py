@@ -2,18 +2,40 @@
 Advanced Document Processing Pipeline for DISCERA RAG System
 """
 import os
+import hashlib
 import logging
-from typing import List, Dict, Any, Optional
+from typing import Callable, List, Dict, Any, Optional
 from pathlib import Path
-import PyPDF2
 from docx import Document
+from docx.text.paragraph import Paragraph
 import re
 from dataclasses import dataclass
 
 from app.core.config import settings
+from app.rag.chunking import StructuredChunker, TextBlock
+from app.rag.converters import CONVERTERS, ConverterPool, get_converter_pool
+from app.rag.normalization import TextNormalizer
+from app.rag.ocr import get_ocr_stage
+from app.rag.pdf_backends import PDFExtractor
+from app.rag.text_cache import PageTextCache
 
 logger = logging.getLogger(__name__)
 
+MARKDOWN_HEADING = re.compile(r"^\s{0,3}(#{1,6})\s+(.+?)\s*#*\s*$")
+HEADING_SIZE_RATIO = 1.15  # PDF lines this much larger than body text are headings
+MAX_HEADING_LENGTH = 120
+
+
+def document_order(chunk: Dict[str, Any]) -> tuple:
+    """Sort key putting stored chunks (`VectorStore.get_document_chunks`) back in document order"""
+    metadata = chunk.get("metadata") or {}
+    match = re.search(r"(\d+)$", str(metadata.get("chunk_id", "")))
+    return (
+        int(metadata.get("page_number") or 0),
+        int(metadata.get("chunk_index", match.group(1) if match else 0)),
+        chunk["id"]
+    )
+
 
 @dataclass
 class DocumentChunk:
@@ -28,168 +50,211 @@ class DocumentChunk:
 class DocumentProcessor:
     """Advanced document processor for multiple formats"""
     
-    def __init__(self):
-        self.supported_extensions = {'.pdf', '.docx', '.doc', '.txt'}
-        self.chunk_size = 1000  # characters
-        self.chunk_overlap = 200  # characters
+    def __init__(
+        self,
+        chunk_size: int = 1000,
+        chunk_overlap: int = 200,
+        length_function: Callable[[str], int] = len,
+        batch_length_function: Optional[Callable[[List[str]], List[int]]] = None,
+        length_unit: str = "characters"
+    ):
+        self.supported_extensions = {'.pdf', '.docx', '.txt', *CONVERTERS}
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.length_unit = length_unit
+        self.normalizer = TextNormalizer(settings.DOCUMENT_LANGUAGE)
+        self._pdf_extractor = None
+        self._converter_pool = None
+        self.chunker = StructuredChunker(
+            chunk_size, chunk_overlap, length_function, batch_length_function, normalize=self.normalizer.normalize
+        )
+    
+    @classmethod
+    def for_embedding_model(cls, embedding_service) -> "DocumentProcessor":
+        """Processor whose chunks fill, but never exceed, the embedding model's input.
+        
+        Chunk sizes are counted in the model's own tokenizer tokens, so
+        nothing is truncated by the encoder and no pass is spent on a
+        short chunk. Falls back to character sizes if the model does not
+        report a sequence limit.
+        """
+        token_limit = embedding_service.chunk_token_limit()
+        if not token_limit:
+            return cls()
+        
+        logger.info(f"✂️ Chunking to {token_limit} tokens for {embedding_service.model_name}")
+        return cls(
+            chunk_size=token_limit,
+            chunk_overlap=token_limit // 5,
+            length_function=lambda text: embedding_service.count_tokens([text])[0],
+            batch_length_function=embedding_service.count_tokens,
+            length_unit="tokens"
+        )
     
-    def process_document(self, file_path: str, file_type: str) -> List[DocumentChunk]:
-        """Process document and return chunks"""
+    def process_document(self, file_path: str, file_type: str, file_hash: Optional[str] = None) -> List[DocumentChunk]:
+        """Process document and return chunks; `file_hash` is the file's SHA-256 when already known"""
         try:
-            if file_type.lower() == '.pdf':
-                return self._process_pdf(file_path)
-            elif file_type.lower() in ['.docx', '.doc']:
-                return self._process_docx(file_path)
-            elif file_type.lower() == '.txt':
-                return self._process_txt(file_path)
-            else:
-                raise ValueError(f"Unsupported file type: {file_type}")
+            chunks = self.chunk_blocks(self.extract_blocks(file_path, file_type, file_hash))
+            logger.info(f"Processed {file_type}: {len(chunks)} chunks")
+            return self.assign_chunk_ids(chunks)
         except Exception as e:
             logger.error(f"Error processing document {file_path}: {e}")
             raise
     
-    def _process_pdf(self, file_path: str) -> List[DocumentChunk]:
-        """Process PDF document"""
-        chunks = []
-        page_number = 1
+    @staticmethod
+    def assign_chunk_ids(chunks: List[DocumentChunk]) -> List[DocumentChunk]:
+        """Give every chunk an ID derived from its content.
         
-        try:
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                
-                for page in pdf_reader.pages:
-                    text = page.extract_text()
-                    if text.strip():
-                        # Clean text
-                        text = self._clean_text(text)
-                        
-                        # Split into chunks
-                        page_chunks = self._create_chunks(text, page_number)
-                        chunks.extend(page_chunks)
-                    
-                    page_number += 1
-                
-                logger.info(f"Processed PDF: {len(chunks)} chunks from {page_number-1} pages")
-                return chunks
-                
-        except Exception as e:
-            logger.error(f"Error processing PDF {file_path}: {e}")
-            raise
+        The same text always gets the same ID, wherever it moves in the
+        document, so re-ingesting an edited file only touches the chunks
+        whose text changed and stored IDs (citations, cached sections) stay
+        valid. Repeated identical chunks are numbered in order.
+        """
+        seen: Dict[str, int] = {}
+        for index, chunk in enumerate(chunks):
+            fingerprint = hashlib.sha256(chunk.content.encode("utf-8")).hexdigest()[:16]
+            seen[fingerprint] = seen.get(fingerprint, 0) + 1
+            occurrence = seen[fingerprint]
+            chunk.chunk_id = f"c_{fingerprint}" if occurrence == 1 else f"c_{fingerprint}_{occurrence}"
+            chunk.metadata = {**(chunk.metadata or {}), "fingerprint": fingerprint, "chunk_index": index}
+        return chunks
     
-    def _process_docx(self, file_path: str) -> List[DocumentChunk]:
-        """Process DOCX document"""
-        chunks = []
-        
-        try:
-            doc = Document(file_path)
-            
-            # Extract text from paragraphs
-            text_parts = []
-            for paragraph in doc.paragraphs:
-                if paragraph.text.strip():
-                    text_parts.append(paragraph.text)
-            
-            # Extract text from tables
-            for table in doc.tables:
-                for row in table.rows:
-                    row_text = []
-                    for cell in row.cells:
-                        if cell.text.strip():
-                            row_text.append(cell.text.strip())
-                    if row_text:
-                        text_parts.append(" | ".join(row_text))
-            
-            # Combine all text
-            full_text = "\n".join(text_parts)
-            full_text = self._clean_text(full_text)
-            
-            # Create chunks
-            chunks = self._create_chunks(full_text)
-            
-            logger.info(f"Processed DOCX: {len(chunks)} chunks")
-            return chunks
-            
-        except Exception as e:
-            logger.error(f"Error processing DOCX {file_path}: {e}")
-            raise
+    def extract_blocks(self, file_path: str, file_type: str, file_hash: Optional[str] = None) -> List[TextBlock]:
+        """Read a document into paragraphs and headings, in reading order"""
+        if file_type.lower() == '.pdf':
+            return self._pdf_blocks(file_path, file_hash)
+        elif file_type.lower() == '.docx':
+            return self._docx_blocks(file_path)
+        elif file_type.lower() == '.txt':
+            return self._txt_blocks(file_path)
+        elif file_type.lower() in CONVERTERS:
+            return [
+                TextBlock(text, page_number, heading_level)
+                for text, heading_level, page_number in self.converter_pool.convert(file_path, file_type)
+            ]
+        raise ValueError(f"Unsupported file type: {file_type}")
     
-    def _process_txt(self, file_path: str) -> List[DocumentChunk]:
-        """Process TXT document"""
-        try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                text = file.read()
-            
-            text = self._clean_text(text)
-            chunks = self._create_chunks(text)
-            
-            logger.info(f"Processed TXT: {len(chunks)} chunks")
-            return chunks
-            
-        except Exception as e:
-            logger.error(f"Error processing TXT {file_path}: {e}")
-            raise
+    def chunk_blocks(self, blocks: List[TextBlock]) -> List[DocumentChunk]:
+        """Chunk extracted blocks, recording the section path of every chunk"""
+        return [
+            DocumentChunk(
+                content=chunk.text,
+                chunk_id="",
+                page_number=chunk.page_number,
+                section=chunk.section,
+                metadata={
+                    "chunk_size": len(chunk.text),
+                    "section_path": chunk.section or "",
+                    "section_depth": len(chunk.section_path),
+                    "page_end": chunk.page_end,
+                    **({"token_count": chunk.length} if self.length_unit == "tokens" else {})
+                }
+            )
+            for chunk in self.chunker.chunk(blocks)
+        ]
     
-    def _clean_text(self, text: str) -> str:
-        """Clean and normalize text"""
-        # Remove extra whitespace
-        text = re.sub(r'\s+', ' ', text)
-        
-        # Remove special characters but keep important ones
-        text = re.sub(r'[^\w\s\.\,\;\:\!\?\-\(\)\[\]\{\}]', '', text)
+    @property
+    def pdf_extractor(self) -> PDFExtractor:
+        if self._pdf_extractor is None:
+            cache = PageTextCache(settings.PDF_TEXT_CACHE_PATH, settings.PDF_TEXT_CACHE_MAX_FILES) \
+                if settings.PDF_TEXT_CACHE_PATH else None
+            self._pdf_extractor = PDFExtractor(settings.PDF_BACKEND, cache, get_ocr_stage())
+        return self._pdf_extractor
+    
+    @property
+    def converter_pool(self) -> ConverterPool:
+        if self._converter_pool is None:
+            self._converter_pool = get_converter_pool()
+        return self._converter_pool
+    
+    def _pdf_blocks(self, file_path: str, file_hash: Optional[str] = None) -> List[TextBlock]:
+        """Extract PDF text as blocks.
         
-        # Normalize quotes
-        text = text.replace('"', '"').replace('"', '"')
-        text = text.replace(''', "'").replace(''', "'")
+        Headings come from the document outline when it has one; otherwise
+        lines set noticeably larger than the body text are taken as
+        headings, ranked by font size.
+        """
+        extracted = self.pdf_extractor.extract(file_path, file_hash)
+        pages, outline = extracted.pages, extracted.outline
+        empty_pages = sum(1 for lines in pages if not lines)
+        if empty_pages and self.pdf_extractor.ocr is None:
+            logger.warning(
+                f"⚠️ {empty_pages} of {len(pages)} pages in {file_path} have no text layer; "
+                f"scanned pages are only read with OCR_ENABLED"
+            )
         
-        return text.strip()
-    
-    def _create_chunks(self, text: str, page_number: Optional[int] = None) -> List[DocumentChunk]:
-        """Create semantic chunks from text"""
-        chunks = []
+        # Body size: the size most characters are set in
+        weights: Dict[float, int] = {}
+        for lines in pages:
+            for text, size in lines:
+                weights[size] = weights.get(size, 0) + len(text)
+        body_size = max(weights, key=weights.get) if weights else 0
         
-        # Split by sentences first
-        sentences = re.split(r'[.!?]+', text)
-        sentences = [s.strip() for s in sentences if s.strip()]
+        def is_heading(text: str, size: float) -> bool:
+            return (
+                body_size > 0 and size >= body_size * HEADING_SIZE_RATIO
+                and len(text) <= MAX_HEADING_LENGTH and any(c.isalpha() for c in text)
+            )
         
-        current_chunk = ""
-        chunk_id = 0
+        heading_sizes = sorted({size for lines in pages for text, size in lines if is_heading(text, size)}, reverse=True)
+        blocks = []
+        for index, lines in enumerate(pages):
+            page_number = index + 1
+            blocks.extend(TextBlock(title, page_number, level) for level, title in outline.get(index, []))
+            paragraph = []
+            for text, size in lines:
+                if not outline and is_heading(text, size):
+                    blocks.append(TextBlock("\n".join(paragraph), page_number))
+                    blocks.append(TextBlock(text, page_number, heading_sizes.index(size) + 1))
+                    paragraph = []
+                else:
+                    paragraph.append(text)
+            blocks.append(TextBlock("\n".join(paragraph), page_number))
         
-        for sentence in sentences:
-            # If adding this sentence would exceed chunk size
-            if len(current_chunk) + len(sentence) > self.chunk_size and current_chunk:
-                # Save current chunk
-                chunk = DocumentChunk(
-                    content=current_chunk.strip(),
-                    chunk_id=f"chunk_{chunk_id}",
-                    page_number=page_number,
-                    metadata={
-                        "chunk_size": len(current_chunk),
-                        "sentence_count": current_chunk.count('.') + 1
-                    }
-                )
-                chunks.append(chunk)
-                
-                # Start new chunk with overlap
-                overlap_text = current_chunk[-self.chunk_overlap:] if self.chunk_overlap > 0 else ""
-                current_chunk = overlap_text + " " + sentence
-                chunk_id += 1
+        logger.info(
+            f"Extracted PDF with {extracted.backend}: {len(pages)} pages, "
+            f"{sum(b.heading_level is not None for b in blocks)} headings"
+        )
+        return blocks
+    
+    def _docx_blocks(self, file_path: str) -> List[TextBlock]:
+        """Extract DOCX paragraphs and tables in order, using heading styles"""
+        doc = Document(file_path)
+        blocks = []
+        for item in doc.iter_inner_content():
+            if isinstance(item, Paragraph):
+                style = item.style.name if item.style is not None else ""
+                match = re.match(r"Heading (\d)", style)
+                level = int(match.group(1)) if match else (0 if style == "Title" else None)
+                blocks.append(TextBlock(item.text, heading_level=level))
             else:
-                current_chunk += " " + sentence
+                for row in item.rows:
+                    row_text = [cell.text.strip() for cell in row.cells if cell.text.strip()]
+                    if row_text:
+                        blocks.append(TextBlock(" | ".join(row_text) + "."))
         
-        # Add final chunk
-        if current_chunk.strip():
-            chunk = DocumentChunk(
-                content=current_chunk.strip(),
-                chunk_id=f"chunk_{chunk_id}",
-                page_number=page_number,
-                metadata={
-                    "chunk_size": len(current_chunk),
-                    "sentence_count": current_chunk.count('.') + 1
-                }
-            )
-            chunks.append(chunk)
+        logger.info(f"Extracted DOCX: {len(blocks)} blocks")
+        return blocks
+    
+    def _txt_blocks(self, file_path: str) -> List[TextBlock]:
+        """Extract TXT paragraphs; Markdown-style `#` lines are headings"""
+        with open(file_path, 'r', encoding='utf-8') as file:
+            text = file.read()
         
-        return chunks
+        blocks, paragraph = [], []
+        for line in text.splitlines():
+            heading = MARKDOWN_HEADING.match(line)
+            if heading or not line.strip():
+                blocks.append(TextBlock("\n".join(paragraph)))
+                paragraph = []
+                if heading:
+                    blocks.append(TextBlock(heading.group(2), heading_level=len(heading.group(1))))
+            else:
+                paragraph.append(line)
+        blocks.append(TextBlock("\n".join(paragraph)))
+        
+        logger.info(f"Extracted TXT: {len(blocks)} blocks")
+        return blocks
     
     def get_document_summary(self, chunks: List[DocumentChunk]) -> Dict[str, Any]:
         """Generate document summary from chunks"""
@@ -0,0 +1,341 @@
+"""
+Multi-process document embedding for DISCERA RAG System
+"""
+import functools
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+Encoder = Callable[[List[str]], np.ndarray]
+
+
+class EmbeddingPoolError(Exception):
+    """Raised when a worker fails, dies or times out while encoding a batch"""
+
+
+def load_sentence_transformer(model_name: str, threads: int, batch_size: int, backend: str = "torch") -> Encoder:
+    """Worker-side loader: the model on CPU, limited to its share of the cores"""
+    import torch
+
+    torch.set_num_threads(threads)
+    if backend == "torch":
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(model_name, device="cpu")
+    else:
+        from app.core.config import settings
+        from app.rag.onnx_backend import load_onnx_encoder
+        model = load_onnx_encoder(model_name, backend, settings.EMBEDDING_ONNX_DIR, threads)
+    return functools.partial(model.encode, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False)
+
+
+def _worker_main(conn, loader: Callable[[], Encoder]):
+    """Worker loop: load the model once, then receive text lists and send back arrays"""
+    try:
+        encode = loader()
+    except Exception as e:
+        conn.send(("error", f"Could not load the embedding model: {type(e).__name__}: {e}"))
+        return
+    conn.send(("ready", None))
+    while True:
+        try:
+            texts = conn.recv()
+        except EOFError:
+            return
+        try:
+            conn.send(("ok", np.asarray(encode(texts), dtype=np.float32)))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+@dataclass
+class _Worker:
+    process: multiprocessing.Process
+    conn: object
+
+    def kill(self):
+        self.process.kill()
+        self.process.join(timeout=5)
+        self.conn.close()
+
+
+class _Request:
+    """One caller's texts; filled in by one or more batches"""
+
+    def __init__(self, texts: List[str], pieces: int):
+        self.texts = texts
+        self.future: Future = Future()
+        self.parts: Dict[int, np.ndarray] = {}
+        self.remaining = pieces
+
+
+class EmbeddingPool:
+    """Encode texts in worker processes that each own a copy of the model.
+
+    Callers submit lists of texts and get a Future. Queued texts from
+    different callers (documents ingested concurrently) are coalesced
+    into batches of up to `batch_size`, and each batch goes to the next
+    idle worker. Workers are limited to `threads` torch threads each, so
+    the pool uses a fixed share of the cores and leaves the request
+    process alone. At most `max_backlog` texts wait in the queue;
+    `submit` blocks beyond that, so a large ingest is paced by the
+    workers instead of piling up in memory.
+
+    Each worker loads its own model copy: workers start through the
+    forkserver, since forking a process with torch threads running is not
+    safe, so weights cannot be shared copy-on-write.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[], Encoder],
+        workers: int = 2,
+        batch_size: int = 256,
+        max_backlog: int = 8192,
+        max_wait: float = 0.02,
+        timeout: float = 300.0,
+        startup_timeout: float = 300.0
+    ):
+        self.loader = loader
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_backlog = max_backlog
+        self.max_wait = max_wait
+        self.timeout = timeout
+        self.startup_timeout = startup_timeout
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        self._context = multiprocessing.get_context(method)
+        self._pieces: Deque[Tuple[_Request, int, int]] = deque()
+        self._backlog = 0  # texts queued, not yet taken by a worker
+        self._busy = 0
+        self._condition = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._closed = False
+
+    def _start_worker(self) -> _Worker:
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker_main, args=(child_conn, self.loader), daemon=True, name="discera-embedder"
+        )
+        process.start()
+        child_conn.close()
+        worker = _Worker(process=process, conn=parent_conn)
+        try:
+            if not parent_conn.poll(self.startup_timeout):
+                raise EmbeddingPoolError(f"Embedding worker did not start within {self.startup_timeout:.0f}s")
+            status, payload = parent_conn.recv()
+        except (EOFError, OSError) as e:
+            worker.kill()
+            raise EmbeddingPoolError(f"Embedding worker exited during startup: {e}")
+        except EmbeddingPoolError:
+            worker.kill()
+            raise
+        if status != "ready":
+            worker.kill()
+            raise EmbeddingPoolError(payload)
+        return worker
+
+    def _ensure_started(self):
+        if self._threads:
+            return
+        self._threads = [
+            threading.Thread(target=self._serve, name=f"embedding-pool-{slot}", daemon=True)
+            for slot in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"🧠 Embedding pool started with {self.workers} workers")
+
+    def submit(self, texts: List[str]) -> Future:
+        """Queue texts for encoding; the Future resolves to an (n, dim) float32 array"""
+        texts = list(texts)
+        spans = [(start, min(start + self.batch_size, len(texts))) for start in range(0, len(texts), self.batch_size)]
+        request = _Request(texts, len(spans))
+        if not texts:
+            request.future.set_result(np.zeros((0, 0), dtype=np.float32))
+            return request.future
+
+        with self._condition:
+            if self._closed:
+                raise EmbeddingPoolError("Embedding pool is shut down")
+            self._ensure_started()
+            # A request larger than the whole backlog still goes in once the queue is empty
+            while self._backlog and self._backlog + len(texts) > self.max_backlog and not self._closed:
+                self._condition.wait()
+            if self._closed:
+                raise EmbeddingPoolError("Embedding pool is shut down")
+            self._pieces.extend((request, start, end) for start, end in spans)
+            self._backlog += len(texts)
+            self._condition.notify_all()
+        return request.future
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        return self.submit(texts).result()
+
+    def _next_batch(self) -> Optional[List[Tuple[_Request, int, int]]]:
+        """Wait for work; give late requests `max_wait` to join a batch that is not full"""
+        with self._condition:
+            while True:
+                while not self._pieces and not self._closed:
+                    self._condition.wait()
+                if not self._pieces:
+                    return None
+                deadline = time.monotonic() + self.max_wait
+                while self._backlog < self.batch_size and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                # Another worker may have taken the queue meanwhile
+                if self._pieces:
+                    break
+
+            batch, size = [], 0
+            while self._pieces:
+                request, start, end = self._pieces[0]
+                if batch and size + end - start > self.batch_size:
+                    break
+                self._pieces.popleft()
+                batch.append((request, start, end))
+                size += end - start
+            self._backlog -= size
+            self._busy += 1
+            self._condition.notify_all()
+        metrics.observe("embedding_pool_batch_texts", size, buckets=(1, 8, 32, 64, 128, 256, 512, 1024))
+        return batch
+
+    def _serve(self):
+        """One worker's dispatch loop; restarts the worker after it fails"""
+        worker: Optional[_Worker] = None
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                break
+            texts = [text for request, start, end in batch for text in request.texts[start:end]]
+            started = time.monotonic()
+            try:
+                if worker is None:
+                    worker = self._start_worker()
+                worker.conn.send(texts)
+                if not worker.conn.poll(self.timeout):
+                    worker.kill()
+                    worker = None
+                    raise EmbeddingPoolError(f"Encoding {len(texts)} texts took over {self.timeout:.0f}s")
+                status, payload = worker.conn.recv()
+            except (EOFError, OSError) as e:
+                # The worker died (e.g. the OOM killer) or could not be forked
+                if worker is not None:
+                    worker.kill()
+                    worker = None
+                error = EmbeddingPoolError(f"Embedding worker exited: {e}")
+            except EmbeddingPoolError as e:
+                error = e
+            except Exception as e:
+                # Never let the dispatch thread die with callers waiting on it
+                if worker is not None:
+                    worker.kill()
+                    worker = None
+                error = EmbeddingPoolError(f"{type(e).__name__}: {e}")
+            else:
+                error = None if status == "ok" else EmbeddingPoolError(payload)
+            if error is not None:
+                metrics.inc("embedding_pool_failures_total")
+                logger.error(f"❌ Embedding worker failed on {len(texts)} texts: {error}")
+                self._finish(batch, error=error)
+                continue
+            metrics.observe("embedding_pool_batch_seconds", time.monotonic() - started)
+            metrics.inc("embedding_pool_texts_total", len(texts))
+            self._finish(batch, result=payload)
+        if worker is not None:
+            worker.kill()
+
+    def _finish(self, batch, result: Optional[np.ndarray] = None, error: Optional[Exception] = None):
+        completed = []
+        with self._condition:
+            self._busy -= 1
+            offset = 0
+            for request, start, end in batch:
+                if error is None:
+                    request.parts[start] = result[offset:offset + end - start]
+                offset += end - start
+                request.remaining -= 1
+                if error is not None and not request.future.done():
+                    completed.append((request, None))
+                elif request.remaining == 0 and not request.future.done():
+                    completed.append((request, np.concatenate([request.parts[key] for key in sorted(request.parts)])))
+        # Resolve outside the lock: callbacks may submit again
+        for request, array in completed:
+            if array is None:
+                request.future.set_exception(error)
+            else:
+                request.future.set_result(array)
+
+    def stats(self) -> Dict[str, float]:
+        with self._condition:
+            return {"embedding_pool_backlog": self._backlog, "embedding_pool_busy_workers": self._busy}
+
+    def shutdown(self):
+        with self._condition:
+            self._closed = True
+            pieces, self._pieces = list(self._pieces), deque()
+            self._backlog = 0
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=10)
+        self._threads = []
+        for request, _, _ in pieces:
+            if not request.future.done():
+                request.future.set_exception(EmbeddingPoolError("Embedding pool is shut down"))
+
+
+_shared_pools: Dict[Tuple[str, str], EmbeddingPool] = {}
+_shared_pools_lock = threading.Lock()
+
+
+def get_embedding_pool(model_name: str, backend: str = "torch") -> Optional[EmbeddingPool]:
+    """Shared pool for document embeddings, or None when it is disabled.
+
+    One pool is kept per process: asking for another model or backend
+    shuts down the pool it replaces, so its workers do not linger.
+    """
+    from app.core.config import settings
+    if settings.EMBEDDING_POOL_WORKERS <= 0:
+        return None
+    key = (model_name, backend)
+    with _shared_pools_lock:
+        pool = _shared_pools.get(key)
+        if pool is not None:
+            return pool
+        replaced = [_shared_pools.pop(other) for other in list(_shared_pools)]
+        workers = settings.EMBEDDING_POOL_WORKERS
+        threads = settings.EMBEDDING_POOL_THREADS or max(1, (os.cpu_count() or 1) // workers)
+        pool = EmbeddingPool(
+            functools.partial(load_sentence_transformer, model_name, threads, settings.EMBEDDING_POOL_ENCODE_BATCH, backend),
+            workers=workers,
+            batch_size=settings.EMBEDDING_POOL_BATCH_SIZE,
+            max_backlog=settings.EMBEDDING_POOL_MAX_BACKLOG
+        )
+        metrics.register_collector(pool.stats)
+        _shared_pools[key] = pool
+    for old in replaced:
+        old.shutdown()
+    return pool
+
+
+def shutdown_embedding_pools():
+    """Stop the worker processes of every shared pool"""
+    with _shared_pools_lock:
+        pools = [_shared_pools.pop(key) for key in list(_shared_pools)]
+    for pool in pools:
+        pool.shutdown()
@@ -2,6 +2,7 @@
 Advanced Embedding Service for DISCERA RAG System
 """
 import logging
+from functools import lru_cache
 from typing import List, Dict, Any, Optional
 import numpy as np
 from sentence_transformers import SentenceTransformer
@@ -9,6 +10,8 @@ import torch
 
 from app.core.config import settings
 from app.rag.document_processor import DocumentChunk
+from app.rag.embedding_pool import EmbeddingPool, get_embedding_pool
+from app.rag.onnx_backend import BACKENDS, load_onnx_encoder
 
 logger = logging.getLogger(__name__)
 
@@ -16,17 +19,30 @@ logger = logging.getLogger(__name__)
 class EmbeddingService:
     """Advanced embedding service using Sentence Transformers"""
     
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
+    def __init__(
+        self,
+        model_name: str = "all-MiniLM-L6-v2",
+        pool: Optional[EmbeddingPool] = None,
+        backend: Optional[str] = None
+    ):
         """Initialize embedding service"""
         self.model_name = model_name
         self.model = None
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.pool = pool
+        self.backend = backend or settings.EMBEDDING_BACKEND
+        if self.backend not in BACKENDS:
+            raise ValueError(f"Unknown embedding backend: {self.backend}")
+        # ONNX Runtime is the CPU inference path
+        self.device = "cuda" if self.backend == "torch" and torch.cuda.is_available() else "cpu"
         
-        logger.info(f"Initializing embedding service with model: {model_name}")
+        logger.info(f"Initializing embedding service with model: {model_name} ({self.backend})")
         logger.info(f"Using device: {self.device}")
         
         try:
-            self.model = SentenceTransformer(model_name, device=self.device)
+            if self.backend == "torch":
+                self.model = SentenceTransformer(model_name, device=self.device)
+            else:
+                self.model = load_onnx_encoder(model_name, self.backend, settings.EMBEDDING_ONNX_DIR)
             logger.info("✅ Embedding model loaded successfully")
         except Exception as e:
             logger.error(f"❌ Failed to load embedding model: {e}")
@@ -42,15 +58,19 @@ class EmbeddingService:
             texts = [chunk.content for chunk in chunks]
             
             # Generate embeddings
-            embeddings = self.model.encode(
-                texts,
-                convert_to_tensor=True,
-                show_progress_bar=True,
-                batch_size=32
-            )
-            
-            # Convert to numpy for storage
-            embeddings_np = embeddings.cpu().numpy()
+            if self.pool is not None:
+                # Worker processes, batched with other documents' chunks
+                embeddings_np = self.pool.encode(texts)
+            else:
+                embeddings = self.model.encode(
+                    texts,
+                    convert_to_tensor=True,
+                    show_progress_bar=True,
+                    batch_size=32
+                )
+                
+                # Convert to numpy for storage
+                embeddings_np = embeddings.cpu().numpy()
             
             # Create results with metadata
             results = []
@@ -64,6 +84,8 @@ class EmbeddingService:
                         "page_number": chunk.page_number,
                         "section": chunk.section,
                         "chunk_size": len(chunk.content),
+                        # Vectors from different backends are not interchangeable
+                        "embedding_backend": self.backend,
                         **(chunk.metadata if chunk.metadata else {})
                     }
                 }
@@ -91,6 +113,45 @@ class EmbeddingService:
             logger.error(f"❌ Error generating query embedding: {e}")
             raise
     
+    def encode_texts(self, texts: List[str], batch_size: int = 64) -> np.ndarray:
+        """Encode raw texts in one call and return L2-normalised embeddings"""
+        if not texts:
+            return np.zeros((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+        
+        try:
+            return self.model.encode(
+                texts,
+                batch_size=batch_size,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False
+            )
+            
+        except Exception as e:
+            logger.error(f"❌ Error encoding texts: {e}")
+            raise
+    
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        """Token counts for many texts, from one batched fast-tokenizer call"""
+        if not texts:
+            return []
+        encoded = self.model.tokenizer(
+            texts,
+            add_special_tokens=False,
+            return_attention_mask=False,
+            return_token_type_ids=False,
+            verbose=False
+        )
+        return [len(ids) for ids in encoded["input_ids"]]
+    
+    def chunk_token_limit(self) -> Optional[int]:
+        """Largest text, in tokens, the model embeds without truncation"""
+        max_seq_length = getattr(self.model, 'max_seq_length', None)
+        tokenizer = getattr(self.model, 'tokenizer', None)
+        if not max_seq_length or tokenizer is None:
+            return None
+        return max_seq_length - tokenizer.num_special_tokens_to_add()
+    
     def calculate_similarity(self, embedding1: np.ndarray, embedding2: np.ndarray) -> float:
         """Calculate cosine similarity between two embeddings"""
         try:
@@ -139,7 +200,22 @@ class EmbeddingService:
         return {
             "model_name": self.model_name,
             "device": self.device,
+            "backend": self.backend,
             "max_seq_length": self.model.max_seq_length if hasattr(self.model, 'max_seq_length') else None,
             "embedding_dimension": self.model.get_sentence_embedding_dimension(),
+            "pool_workers": self.pool.workers if self.pool is not None else 0,
             "model_info": str(self.model)
-        } 
\ No newline at end of file
+        } 
+
+
+@lru_cache(maxsize=1)
+def get_embedding_service() -> EmbeddingService:
+    """Shared embedding service, so the model is loaded once per process.
+    
+    On CPU, document chunks are encoded by the embedding pool; queries
+    stay in this process.
+    """
+    service = EmbeddingService()
+    if service.device == "cpu":
+        service.pool = get_embedding_pool(service.model_name, service.backend)
+    return service
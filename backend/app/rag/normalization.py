@@ -0,0 +1,92 @@
+"""
+Text normalization for DISCERA RAG System
+"""
+import re
+import unicodedata
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+# Invisible characters that PDF and Word extraction leave inside words
+INVISIBLE = "\u00ad\u200b\u200c\u200d\u2060\ufeff"
+# Unicode spaces and line separators that str.split() does not all treat as whitespace
+SPACES = "\u00a0\u1680" + "".join(chr(code) for code in range(0x2000, 0x200b)) + "\u2028\u2029\u202f\u205f\u3000"
+# Typographic ligatures emitted by PDF text extraction
+LIGATURES = {"ﬀ": "ff", "ﬁ": "fi", "ﬂ": "fl", "ﬃ": "ffi", "ﬄ": "ffl", "ﬅ": "st", "ﬆ": "st"}
+# Single-character Latin digraphs used in Serbian, Croatian and Bosnian text
+DIGRAPHS = {"Ǆ": "DŽ", "ǅ": "Dž", "ǆ": "dž", "Ǉ": "LJ", "ǈ": "Lj", "ǉ": "lj", "Ǌ": "NJ", "ǋ": "Nj", "ǌ": "nj"}
+QUOTES = {"„": '"', "“": '"', "”": '"', "«": '"', "»": '"', "‚": "'", "‘": "'", "’": "'", "‹": "'", "›": "'"}
+
+# A word broken across lines with a hyphen: "infor-\nmacija"
+# (no lookbehind for the preceding letter, so the engine can scan for "-")
+LINE_BREAK_HYPHEN = re.compile(r"-[ \t]*\r?\n\s*(\w)")
+
+
+@dataclass(frozen=True)
+class NormalizationProfile:
+    """Per-language normalization options"""
+    expand_digraphs: bool = False
+    fold_quotes: bool = False
+    dehyphenate: bool = True
+
+
+LANGUAGE_PROFILES: Dict[str, NormalizationProfile] = {
+    "sr": NormalizationProfile(expand_digraphs=True),
+    "hr": NormalizationProfile(expand_digraphs=True),
+    "bs": NormalizationProfile(expand_digraphs=True),
+    "en": NormalizationProfile(fold_quotes=True),
+}
+
+
+class TextNormalizer:
+    """Normalize extracted text without losing content.
+
+    Letters in any script, diacritics and punctuation are kept. The text
+    is composed to NFC (so "č" from a PDF that stores "c" + caron matches
+    "č" typed elsewhere). A single precompiled character class then finds
+    the characters to replace: invisible characters are dropped, Unicode
+    spaces become plain ones and ligatures (plus the profile's digraphs
+    and quotes) are expanded. Words hyphenated across line breaks are
+    rejoined, and runs of whitespace collapse to a single space.
+
+    Every step is one C-level scan that does nothing on text without
+    matches, which is most of it; a `str.translate` table would instead
+    look up every character.
+    """
+
+    def __init__(self, language: str = "sr", profile: Optional[NormalizationProfile] = None):
+        self.language = language
+        self.profile = profile or LANGUAGE_PROFILES.get(language, NormalizationProfile())
+
+        replacements = {char: "" for char in INVISIBLE}
+        replacements.update({char: " " for char in SPACES})
+        replacements.update(LIGATURES)
+        if self.profile.expand_digraphs:
+            replacements.update(DIGRAPHS)
+        if self.profile.fold_quotes:
+            replacements.update(QUOTES)
+        # Control characters other than whitespace
+        replacements.update({chr(code): "" for code in range(32) if chr(code) not in "\t\n\r\x0b\x0c"})
+        self._replacements = replacements
+        self._pattern = re.compile("[" + "".join(re.escape(char) for char in replacements) + "]")
+
+    def normalize(self, text: str) -> str:
+        if not text:
+            return ""
+        if not text.isascii():
+            text = unicodedata.normalize("NFC", text)
+        text = self._pattern.sub(self._replace, text)
+        if self.profile.dehyphenate and "-" in text:
+            text = LINE_BREAK_HYPHEN.sub(self._rejoin, text)
+        return " ".join(text.split())
+
+    def _replace(self, match: re.Match) -> str:
+        return self._replacements[match.group()]
+
+    @staticmethod
+    def _rejoin(match: re.Match) -> str:
+        # Only a letter followed by a lowercase continuation is a broken
+        # word; "COVID-\n19" or "Novi Sad-\nBeograd" keep their hyphen
+        start, after = match.start(), match.group(1)
+        if start and match.string[start - 1].isalpha() and after.islower():
+            return after
+        return f"-{after}"
@@ -0,0 +1,328 @@
+"""
+OCR stage for scanned PDFs in DISCERA RAG System
+
+Pages whose text layer is (nearly) empty but that carry images are
+rendered and recognized with Tesseract. Pages are processed in a bounded
+pool of worker processes: PDFium is not thread-safe, and each worker runs
+one single-threaded Tesseract at a time, so the pool size is the number
+of cores OCR may use. Results are cached by the hash of the rendered
+page image.
+"""
+import hashlib
+import importlib.util
+import logging
+import math
+import multiprocessing
+import os
+import shutil
+import signal
+import subprocess
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import PyPDF2
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.rag.text_cache import PageTextCache
+
+logger = logging.getLogger(__name__)
+
+
+class OCRError(Exception):
+    """Raised when a page cannot be rendered or recognized"""
+
+
+class TesseractEngine:
+    """Tesseract command-line OCR; reads a PGM image from stdin"""
+
+    def __init__(self, languages: str = "srp+srp_latn+eng", binary: str = "tesseract", timeout: float = 120.0):
+        self.languages = languages
+        self.binary = binary
+        self.timeout = timeout
+
+    def available(self) -> bool:
+        return shutil.which(self.binary) is not None
+
+    @property
+    def cache_key(self) -> str:
+        return f"tesseract:{self.languages}"
+
+    def recognize(self, image: bytes) -> str:
+        try:
+            result = subprocess.run(
+                [self.binary, "stdin", "stdout", "-l", self.languages, "--psm", "3"],
+                input=image,
+                capture_output=True,
+                timeout=self.timeout,
+                # Parallelism comes from the page pool; Tesseract's own OpenMP
+                # threads would only oversubscribe the cores
+                env={**os.environ, "OMP_THREAD_LIMIT": "1"}
+            )
+        except subprocess.TimeoutExpired:
+            raise OCRError(f"Tesseract took over {self.timeout:.0f}s")
+        if result.returncode != 0:
+            raise OCRError(result.stderr.decode("utf-8", "replace").strip() or "Tesseract failed")
+        return result.stdout.decode("utf-8", "replace")
+
+
+class PageRenderer:
+    """Render one PDF page to an 8-bit grayscale PGM image"""
+
+    def __init__(self, dpi: int = 300, timeout: float = 60.0):
+        self.dpi = dpi
+        self.timeout = timeout
+
+    def available(self) -> bool:
+        return importlib.util.find_spec("pypdfium2") is not None or shutil.which("pdftoppm") is not None
+
+    def render(self, file_path: str, page_index: int) -> bytes:
+        if importlib.util.find_spec("pypdfium2") is not None:
+            return self._render_pdfium(file_path, page_index)
+        try:
+            result = subprocess.run(
+                ["pdftoppm", "-r", str(self.dpi), "-gray", "-f", str(page_index + 1), "-l", str(page_index + 1), file_path],
+                capture_output=True,
+                timeout=self.timeout
+            )
+        except subprocess.TimeoutExpired:
+            raise OCRError(f"Rendering page {page_index + 1} took over {self.timeout:.0f}s")
+        if result.returncode != 0 or not result.stdout:
+            raise OCRError(result.stderr.decode("utf-8", "replace").strip() or "pdftoppm failed")
+        return result.stdout
+
+    def _render_pdfium(self, file_path: str, page_index: int) -> bytes:
+        import pypdfium2 as pdfium
+
+        # PDFium cannot be interrupted from Python; in a worker process an
+        # unhandled SIGALRM ends the worker, and the stage starts a new pool
+        in_worker = multiprocessing.parent_process() is not None
+        if in_worker:
+            signal.signal(signal.SIGALRM, signal.SIG_DFL)
+            signal.alarm(math.ceil(self.timeout))
+        pdf = pdfium.PdfDocument(file_path)
+        try:
+            page = pdf[page_index]
+            bitmap = page.render(scale=self.dpi / 72, grayscale=True)
+            width, height, stride = bitmap.width, bitmap.height, bitmap.stride
+            data = bytes(bitmap.buffer)
+            page.close()
+        finally:
+            pdf.close()
+            if in_worker:
+                signal.alarm(0)
+        rows = data if stride == width else b"".join(data[y * stride:y * stride + width] for y in range(height))
+        return f"P5\n{width} {height}\n255\n".encode("ascii") + rows
+
+
+_worker_caches: Dict[str, PageTextCache] = {}
+
+
+def _ocr_page(
+    file_path: str,
+    page_index: int,
+    renderer: PageRenderer,
+    engine: TesseractEngine,
+    cache_path: Optional[str]
+) -> Tuple[int, str, bool]:
+    """Worker: render, look the image up in the cache, recognize if needed.
+
+    Returns (page_index, text, served_from_cache).
+    """
+    image = renderer.render(file_path, page_index)
+    page_hash = hashlib.sha256(image).hexdigest()
+    cache = None
+    if cache_path:
+        cache = _worker_caches.get(cache_path)
+        if cache is None:
+            cache = _worker_caches[cache_path] = PageTextCache(cache_path)
+        cached = cache.get_ocr(page_hash, engine.cache_key)
+        if cached is not None:
+            return page_index, cached, True
+
+    text = engine.recognize(image)
+    if cache:
+        cache.put_ocr(page_hash, engine.cache_key, text)
+    return page_index, text, False
+
+
+def _has_images(resources, depth: int = 0) -> bool:
+    """Whether page resources include an image, directly or inside a form"""
+    xobjects = resources.get("/XObject") if resources else None
+    if not xobjects:
+        return False
+    for xobject in xobjects.get_object().values():
+        xobject = xobject.get_object()
+        subtype = xobject.get("/Subtype")
+        if subtype == "/Image":
+            return True
+        if subtype == "/Form" and depth < 3 and _has_images(xobject.get("/Resources"), depth + 1):
+            return True
+    return False
+
+
+@dataclass
+class OCRReport:
+    """OCR work done for one document"""
+    pages: int = 0
+    cache_hits: int = 0
+    failed: int = 0
+    seconds: float = 0.0
+
+    @property
+    def pages_per_second(self) -> float:
+        return self.pages / self.seconds if self.seconds > 0 else 0.0
+
+
+class OCRStage:
+    """Fill in the text of image-only PDF pages by OCR"""
+
+    def __init__(
+        self,
+        engine: TesseractEngine,
+        renderer: Optional[PageRenderer] = None,
+        workers: int = 2,
+        min_text_chars: int = 20,
+        cache_path: Optional[str] = None
+    ):
+        self.engine = engine
+        self.renderer = renderer or PageRenderer()
+        self.workers = workers
+        self.min_text_chars = min_text_chars
+        self.cache_path = cache_path
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def cache_key(self) -> str:
+        return self.engine.cache_key
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context(method)
+                )
+            return self._executor
+
+    @property
+    def page_timeout(self) -> float:
+        """Longest a single page may take to render and recognize"""
+        return getattr(self.renderer, "timeout", 60.0) + getattr(self.engine, "timeout", 120.0)
+
+    def _reset(self, executor: ProcessPoolExecutor):
+        """Drop a broken or stuck pool; the next page starts a fresh one"""
+        with self._lock:
+            if self._executor is not executor:
+                return  # another thread already replaced it
+            self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+        logger.warning("⚠️ OCR worker pool restarted after a worker crashed or hung")
+
+    def _submit(self, file_path: str, index: int):
+        executor = self.executor
+        try:
+            return executor, executor.submit(_ocr_page, file_path, index, self.renderer, self.engine, self.cache_path)
+        except BrokenProcessPool:
+            # A worker died (a crash in PDFium on a malformed scan); start a fresh pool
+            self._reset(executor)
+            executor = self.executor
+            return executor, executor.submit(_ocr_page, file_path, index, self.renderer, self.engine, self.cache_path)
+
+    def image_only_pages(self, file_path: str, pages: List[List[Tuple[str, float]]]) -> List[int]:
+        """Pages with almost no extracted text that contain images"""
+        candidates = [
+            index for index, lines in enumerate(pages)
+            if sum(len(text) for text, _ in lines) < self.min_text_chars
+        ]
+        if not candidates:
+            return []
+        with open(file_path, 'rb') as file:
+            pdf_reader = PyPDF2.PdfReader(file)
+            return [index for index in candidates if _has_images(pdf_reader.pages[index].get("/Resources"))]
+
+    def fill(self, file_path: str, pages: List[List[Tuple[str, float]]]) -> OCRReport:
+        """OCR the image-only pages of `pages` in place"""
+        report = OCRReport()
+        try:
+            indexes = self.image_only_pages(file_path, pages)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not inspect {file_path} for scanned pages: {e}")
+            return report
+        if not indexes:
+            return report
+
+        started = time.monotonic()
+        submitted = [self._submit(file_path, index) for index in indexes]
+        # Pages queue behind each other in the pool, so the budget covers every round
+        deadline = started + math.ceil(len(indexes) / self.workers) * self.page_timeout
+        broken = set()
+        for index, (executor, future) in zip(indexes, submitted):
+            try:
+                _, text, cached = future.result(timeout=max(deadline - time.monotonic(), 0.0))
+            except (BrokenProcessPool, FutureTimeoutError) as e:
+                logger.warning(f"⚠️ OCR failed for page {index + 1} of {file_path}: {e or 'timed out'}")
+                report.failed += 1
+                broken.add(executor)
+                continue
+            except Exception as e:
+                logger.warning(f"⚠️ OCR failed for page {index + 1} of {file_path}: {e}")
+                report.failed += 1
+                continue
+            pages[index] = [(line.strip(), 0.0) for line in text.splitlines() if line.strip()]
+            report.pages += 1
+            report.cache_hits += cached
+        report.seconds = time.monotonic() - started
+        for executor in broken:
+            self._reset(executor)
+
+        metrics.inc("ocr_pages_total", report.pages - report.cache_hits, source="engine")
+        metrics.inc("ocr_pages_total", report.cache_hits, source="cache")
+        metrics.inc("ocr_pages_failed_total", report.failed)
+        metrics.observe("ocr_document_seconds", report.seconds)
+        if report.pages:
+            metrics.observe("ocr_pages_per_second", report.pages_per_second, buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 50))
+        logger.info(
+            f"🔎 OCR {os.path.basename(file_path)}: {report.pages} pages ({report.cache_hits} cached, "
+            f"{report.failed} failed) in {report.seconds:.1f}s, {report.pages_per_second:.2f} pages/s"
+        )
+        return report
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+@lru_cache(maxsize=1)
+def get_ocr_stage() -> Optional[OCRStage]:
+    """Shared OCR stage, or None when OCR is disabled or Tesseract is missing"""
+    if not settings.OCR_ENABLED:
+        return None
+    engine = TesseractEngine(settings.OCR_LANGUAGES, timeout=settings.OCR_PAGE_TIMEOUT)
+    renderer = PageRenderer(settings.OCR_DPI)
+    if not engine.available() or not renderer.available():
+        logger.warning("⚠️ OCR is enabled but tesseract or a PDF renderer (pypdfium2, pdftoppm) is missing")
+        return None
+    return OCRStage(
+        engine,
+        renderer,
+        workers=settings.OCR_WORKERS,
+        min_text_chars=settings.OCR_MIN_TEXT_CHARS,
+        cache_path=settings.PDF_TEXT_CACHE_PATH
+    )
+
+
+def shutdown_ocr_stage():
+    """Stop the shared OCR stage's worker processes, if it was ever created"""
+    if get_ocr_stage.cache_info().currsize:
+        stage = get_ocr_stage()
+        if stage is not None:
+            stage.shutdown()
@@ -0,0 +1,261 @@
+"""
+ONNX Runtime inference for the embedding model in DISCERA RAG System
+
+The sentence-transformers pipeline (transformer, pooling, optional
+normalization) is exported once: the transformer to ONNX, optionally
+with dynamic int8 weight quantization, with the tokenizer and pooling
+settings saved next to it. Later starts load only the tokenizer and the
+ONNX file and never build the PyTorch model.
+"""
+import fcntl
+import json
+import logging
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+MODEL_FILES = {"onnx": "model.onnx", "onnx-int8": "model.int8.onnx"}
+PIPELINE_FILE = "pipeline.json"
+POOLING_MODES = ("mean", "cls", "max")
+# Lowest cosine similarity to the torch embedding accepted at export
+MIN_COSINE = {"onnx": 0.9999, "onnx-int8": 0.98}
+VALIDATION_TEXTS = [
+    "Fotosinteza je proces u kojem biljke pretvaraju svetlosnu energiju u hemijsku.",
+    "Ćelijska membrana reguliše šta ulazi u ćeliju.",
+    "Фотосинтеза се одвија у хлоропластима.",
+    "Mitosis produces two genetically identical daughter cells.",
+    "Enzimi",
+    "Koeficijent iznosi 3,14; vidi tabelu 2 i rezultate u poglavlju o metabolizmu ugljenih hidrata, "
+    "gde su opisani glikoliza, Krebsov ciklus i oksidativna fosforilacija.",
+]
+
+
+class OnnxExportError(Exception):
+    """Raised when a model cannot be exported or its ONNX output drifts from torch"""
+
+
+def model_dir(root: str, model_name: str) -> str:
+    return os.path.join(root, model_name.replace("/", "--"))
+
+
+@contextmanager
+def export_lock(target_dir: str) -> Iterator[None]:
+    """Serialize exports of one model across threads and processes"""
+    os.makedirs(os.path.dirname(os.path.abspath(target_dir)), exist_ok=True)
+    with open(f"{os.path.abspath(target_dir)}.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _pipeline_settings(model) -> Dict[str, Any]:
+    """Pooling and normalization of a SentenceTransformer, if it is one this module can run"""
+    names = [type(module).__name__ for module in model]
+    if names not in (["Transformer", "Pooling"], ["Transformer", "Pooling", "Normalize"]):
+        raise OnnxExportError(f"Unsupported sentence-transformers pipeline: {' -> '.join(names)}")
+    pooling = model[1].get_config_dict()["pooling_mode"]
+    if pooling not in POOLING_MODES:
+        raise OnnxExportError(f"Unsupported pooling mode: {pooling}")
+    return {
+        "pooling": pooling,
+        "normalize": names[-1] == "Normalize",
+        "max_seq_length": model.max_seq_length,
+        "dimension": model.get_sentence_embedding_dimension()
+    }
+
+
+def min_cosine(reference: np.ndarray, candidate: np.ndarray) -> float:
+    """Smallest row-wise cosine similarity between two embedding matrices"""
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    return float(np.min(np.sum(reference * candidate, axis=1)))
+
+
+def export_model(model, target_dir: str, quantize: bool = False, opset: int = 17) -> Dict[str, Any]:
+    """Export a SentenceTransformer to `target_dir` and check it against torch.
+
+    Writes model.onnx (and model.int8.onnx with `quantize`), the tokenizer
+    and pipeline.json. Everything is built in a scratch directory and then
+    moved into `target_dir` file by file, each with an atomic rename and
+    the model files last, so a loader that finds a model file also finds
+    what it needs next to it. A variant that is not exported again is left
+    in place. Callers that may race (load_onnx_encoder) hold export_lock.
+    """
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    pipeline = _pipeline_settings(model)
+    transformer = model[0].auto_model.eval()
+    tokenizer = model.tokenizer
+
+    # Inputs of different lengths, so the attention mask is traced with padding
+    sample = tokenizer(VALIDATION_TEXTS[:2], padding=True, truncation=True,
+                       max_length=pipeline["max_seq_length"], return_tensors="pt")
+    input_names = list(sample.keys())
+
+    class LastHiddenState(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.transformer = transformer
+
+        def forward(self, *inputs):
+            return self.transformer(**dict(zip(input_names, inputs))).last_hidden_state
+
+    parent = os.path.dirname(os.path.abspath(target_dir))
+    os.makedirs(parent, exist_ok=True)
+    work_dir = tempfile.mkdtemp(dir=parent, prefix=".export-")
+    try:
+        with torch.no_grad():
+            torch.onnx.export(
+                LastHiddenState().eval(),
+                tuple(sample[name] for name in input_names),
+                os.path.join(work_dir, MODEL_FILES["onnx"]),
+                input_names=input_names,
+                output_names=["last_hidden_state"],
+                dynamic_axes={name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]},
+                opset_version=opset,
+                dynamo=False
+            )
+        variants = ["onnx"]
+        if quantize:
+            quantize_dynamic(
+                os.path.join(work_dir, MODEL_FILES["onnx"]),
+                os.path.join(work_dir, MODEL_FILES["onnx-int8"]),
+                weight_type=QuantType.QInt8
+            )
+            variants.append("onnx-int8")
+        tokenizer.save_pretrained(work_dir)
+        with open(os.path.join(work_dir, PIPELINE_FILE), "w") as f:
+            json.dump(pipeline, f)
+
+        reference = model.encode(VALIDATION_TEXTS, convert_to_numpy=True, show_progress_bar=False)
+        pipeline["min_cosine"] = {}
+        for variant in variants:
+            similarity = min_cosine(reference, OnnxSentenceEncoder(work_dir, variant).encode(VALIDATION_TEXTS))
+            if similarity < MIN_COSINE[variant]:
+                raise OnnxExportError(
+                    f"{variant} embeddings differ from torch: cosine {similarity:.5f} < {MIN_COSINE[variant]}"
+                )
+            pipeline["min_cosine"][variant] = similarity
+        previous = os.path.join(target_dir, PIPELINE_FILE)
+        if os.path.exists(previous):
+            with open(previous) as f:
+                # Keep the validation result of a variant exported earlier
+                pipeline["min_cosine"] = {**json.load(f).get("min_cosine", {}), **pipeline["min_cosine"]}
+        with open(os.path.join(work_dir, PIPELINE_FILE), "w") as f:
+            json.dump(pipeline, f)
+
+        os.makedirs(target_dir, exist_ok=True)
+        model_files = set(MODEL_FILES.values())
+        for name in sorted(os.listdir(work_dir), key=lambda name: name in model_files):
+            os.replace(os.path.join(work_dir, name), os.path.join(target_dir, name))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    logger.info(f"📦 Exported embedding model to {target_dir} (cosine vs torch: {pipeline['min_cosine']})")
+    return pipeline
+
+
+class OnnxSentenceEncoder:
+    """An exported embedding model run with ONNX Runtime on CPU.
+
+    Provides the parts of the SentenceTransformer interface that
+    EmbeddingService uses: `encode`, `tokenizer`, `max_seq_length` and
+    `get_sentence_embedding_dimension`.
+    """
+
+    def __init__(self, path: str, backend: str = "onnx", threads: int = 0):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        with open(os.path.join(path, PIPELINE_FILE)) as f:
+            pipeline = json.load(f)
+        self.backend = backend
+        self.pooling = pipeline["pooling"]
+        self.normalize = pipeline["normalize"]
+        self.max_seq_length = pipeline["max_seq_length"]
+        self.dimension = pipeline["dimension"]
+        self.tokenizer = AutoTokenizer.from_pretrained(path)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(
+            os.path.join(path, MODEL_FILES[backend]), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def _pool(self, hidden: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        if self.pooling == "cls":
+            return hidden[:, 0]
+        mask = attention_mask[:, :, None].astype(hidden.dtype)
+        if self.pooling == "max":
+            return np.where(mask > 0, hidden, np.finfo(hidden.dtype).min).max(axis=1)
+        return (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def encode(
+        self,
+        sentences: Union[str, List[str]],
+        batch_size: int = 32,
+        convert_to_numpy: bool = True,
+        convert_to_tensor: bool = False,
+        normalize_embeddings: bool = False,
+        show_progress_bar: bool = False,
+        **kwargs
+    ):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        embeddings = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        # Similar lengths share a batch, so little time is spent on padding
+        order = sorted(range(len(texts)), key=lambda index: -len(texts[index]))
+        for start in range(0, len(order), batch_size):
+            indexes = order[start:start + batch_size]
+            encoded = self.tokenizer(
+                [texts[index] for index in indexes],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np"
+            )
+            feeds = {
+                name: encoded[name].astype(np.int64) if name in encoded else np.zeros_like(encoded["input_ids"],
+                                                                                            dtype=np.int64)
+                for name in self.input_names
+            }
+            hidden = self.session.run(None, feeds)[0]
+            embeddings[indexes] = self._pool(hidden, encoded["attention_mask"])
+
+        if self.normalize or normalize_embeddings:
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        if convert_to_tensor:
+            import torch
+            embeddings = torch.from_numpy(embeddings)
+        return embeddings[0] if single else embeddings
+
+
+def load_onnx_encoder(model_name: str, backend: str, root: str, threads: int = 0) -> OnnxSentenceEncoder:
+    """The ONNX encoder for a model, exporting it on first use"""
+    if backend not in MODEL_FILES:
+        raise ValueError(f"Unknown ONNX backend: {backend}")
+    path = model_dir(root, model_name)
+    if not os.path.exists(os.path.join(path, MODEL_FILES[backend])):
+        # Workers starting together export once; the others wait and load the result
+        with export_lock(path):
+            if not os.path.exists(os.path.join(path, MODEL_FILES[backend])):
+                from sentence_transformers import SentenceTransformer
+
+                logger.info(f"📦 Exporting {model_name} to ONNX ({backend}), once")
+                export_model(SentenceTransformer(model_name, device="cpu"), path, quantize=backend == "onnx-int8")
+    return OnnxSentenceEncoder(path, backend, threads)
@@ -0,0 +1,243 @@
+"""
+PDF text extraction backends for DISCERA RAG System
+"""
+import hashlib
+import importlib.util
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import PyPDF2
+
+from app.rag.ocr import OCRReport, OCRStage
+from app.rag.text_cache import PageTextCache
+
+logger = logging.getLogger(__name__)
+
+Line = Tuple[str, float]  # text, font size in points (0 when unknown)
+
+
+@dataclass
+class PDFText:
+    """Text lines per page, plus outline entries as {page_index: [(level, title)]}"""
+    pages: List[List[Line]]
+    outline: Dict[int, List[Tuple[int, str]]] = field(default_factory=dict)
+    backend: str = ""
+    ocr: Optional[OCRReport] = None
+
+
+class PDFBackend:
+    """Turns a PDF file into PDFText.
+
+    `version` is part of the cache key: bump it when a backend's output
+    changes so cached text is re-extracted.
+    """
+    name = ""
+    version = 1
+
+    @classmethod
+    def available(cls) -> bool:
+        return True
+
+    @property
+    def cache_key(self) -> str:
+        return f"{self.name}:{self.version}"
+
+    def extract(self, file_path: str) -> PDFText:
+        raise NotImplementedError
+
+
+class PyPDF2Backend(PDFBackend):
+    """Pure-Python extraction; always available"""
+    name = "pypdf2"
+
+    def extract(self, file_path: str) -> PDFText:
+        with open(file_path, 'rb') as file:
+            pdf_reader = PyPDF2.PdfReader(file)
+            return PDFText(
+                pages=[self._lines(page) for page in pdf_reader.pages],
+                outline=self._outline(pdf_reader),
+                backend=self.name
+            )
+
+    @staticmethod
+    def _outline(pdf_reader: PyPDF2.PdfReader) -> Dict[int, List[Tuple[int, str]]]:
+        entries: Dict[int, List[Tuple[int, str]]] = {}
+
+        def walk(items, level):
+            for item in items:
+                if isinstance(item, list):
+                    walk(item, level + 1)
+                    continue
+                try:
+                    page_index = pdf_reader.get_destination_page_number(item)
+                except Exception:
+                    continue
+                if page_index is not None and page_index >= 0 and item.title:
+                    entries.setdefault(page_index, []).append((level, str(item.title)))
+
+        try:
+            walk(pdf_reader.outline, 1)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not read PDF outline: {e}")
+        return entries
+
+    @staticmethod
+    def _lines(page) -> List[Line]:
+        """Text lines of a page with the largest font size used on each"""
+        lines, parts, size = [], [], 0.0
+
+        def visit(text, cm, tm, font_dict, font_size):
+            nonlocal parts, size
+            scale = abs(tm[3] * cm[3]) or 1.0
+            pieces = text.split("\n")
+            for i, piece in enumerate(pieces):
+                if i:
+                    lines.append((" ".join(parts), size))
+                    parts, size = [], 0.0
+                if piece.strip():
+                    parts.append(piece.strip())
+                    size = max(size, round(font_size * scale, 1))
+
+        try:
+            page.extract_text(visitor_text=visit)
+            lines.append((" ".join(parts), size))
+        except Exception:
+            lines = [(line, 0.0) for line in (page.extract_text() or "").split("\n")]
+        return [(text, size) for text, size in lines if text.strip()]
+
+
+class PdfiumBackend(PDFBackend):
+    """PDFium (Chrome's PDF engine) through pypdfium2: native, much faster
+    than PyPDF2, and better at reading order and spacing"""
+    name = "pdfium"
+
+    @classmethod
+    def available(cls) -> bool:
+        return importlib.util.find_spec("pypdfium2") is not None
+
+    def extract(self, file_path: str) -> PDFText:
+        import pypdfium2 as pdfium
+        import pypdfium2.raw as pdfium_c
+
+        pdf = pdfium.PdfDocument(file_path)
+        try:
+            pages = []
+            for index in range(len(pdf)):
+                page = pdf[index]
+                textpage = page.get_textpage()
+                try:
+                    pages.append(self._lines(textpage, pdfium_c))
+                finally:
+                    textpage.close()
+                    page.close()
+
+            outline: Dict[int, List[Tuple[int, str]]] = {}
+            for item in pdf.get_toc():
+                if item.page_index is not None and item.title:
+                    outline.setdefault(item.page_index, []).append((item.level + 1, item.title))
+            return PDFText(pages=pages, outline=outline, backend=self.name)
+        finally:
+            pdf.close()
+
+    @staticmethod
+    def _lines(textpage, pdfium_c) -> List[Line]:
+        """Text lines of a page with the font size of each line's first character.
+
+        Font sizes are looked up by PDFium character index. A character
+        outside the BMP is one Python character but may take two PDFium
+        indexes (a UTF-16 surrogate pair), so offsets are converted rather
+        than used as they are.
+        """
+        text = textpage.get_text_range()
+        char_count = textpage.count_chars()
+        if char_count == len(text):
+            width = len
+        else:
+            def width(part: str) -> int:
+                return len(part.encode("utf-16-le")) // 2
+
+        lines, index = [], 0
+        for raw_line in text.splitlines(keepends=True):
+            stripped = raw_line.strip()
+            if stripped:
+                first = index + width(raw_line[:len(raw_line) - len(raw_line.lstrip())])
+                size = pdfium_c.FPDFText_GetFontSize(textpage.raw, first) if first < char_count else 0.0
+                lines.append((stripped, round(size, 1)))
+            index += width(raw_line)
+        return lines
+
+
+BACKENDS = {backend.name: backend for backend in (PdfiumBackend, PyPDF2Backend)}
+
+
+def file_sha256(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class PDFExtractor:
+    """Extract PDFs with the preferred backend, falling back per file.
+
+    `backend="auto"` prefers PDFium when installed and falls back to
+    PyPDF2 for any file it cannot read; a named backend is tried first,
+    with the others as fallbacks. With an OCR stage, image-only pages are
+    recognized before caching. Results are cached per file hash and page,
+    so a file is parsed once however often it is re-chunked.
+    """
+
+    def __init__(
+        self,
+        backend: str = "auto",
+        cache: Optional[PageTextCache] = None,
+        ocr: Optional[OCRStage] = None
+    ):
+        if backend != "auto" and backend not in BACKENDS:
+            raise ValueError(f"Unknown PDF backend: {backend}")
+        preferred = [BACKENDS[backend]] if backend != "auto" else []
+        self.backends = [
+            backend_class() for backend_class in preferred + [b for b in BACKENDS.values() if b not in preferred]
+            if backend_class.available()
+        ]
+        self.cache = cache
+        self.ocr = ocr
+
+    def _cache_key(self, backend: PDFBackend) -> str:
+        return f"{backend.cache_key}+{self.ocr.cache_key}" if self.ocr else backend.cache_key
+
+    def extract(self, file_path: str, file_hash: Optional[str] = None) -> PDFText:
+        """Text of a PDF; `file_hash` is its SHA-256 when the caller already knows it"""
+        if self.cache and file_hash is None:
+            file_hash = file_sha256(file_path)
+        if self.cache:
+            for backend in self.backends:
+                cached = self.cache.get(file_hash, self._cache_key(backend))
+                if cached:
+                    logger.info(f"📦 PDF text cache hit ({backend.name}) for {file_path}")
+                    return PDFText(pages=cached[0], outline=cached[1], backend=backend.name)
+
+        result, error = None, None
+        for position, backend in enumerate(self.backends):
+            try:
+                result = backend.extract(file_path)
+            except Exception as e:
+                logger.warning(f"⚠️ {backend.name} could not read {file_path}: {e}")
+                error = e
+                continue
+            # A backend that finds no text at all may be failing on this file's fonts
+            if any(result.pages) or position == len(self.backends) - 1:
+                break
+            logger.warning(f"⚠️ {backend.name} found no text in {file_path}, trying the next backend")
+        if result is None:
+            raise error or ValueError(f"No PDF backend available for {file_path}")
+
+        if self.ocr:
+            result.ocr = self.ocr.fill(file_path, result.pages)
+        # Pages OCR could not read are left empty; caching them would never retry
+        if self.cache and not (result.ocr and result.ocr.failed):
+            backend = next(backend for backend in self.backends if backend.name == result.backend)
+            self.cache.put(file_hash, self._cache_key(backend), result.pages, result.outline)
+        return result
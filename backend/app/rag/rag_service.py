@@ -2,12 +2,13 @@
 Main RAG Service for DISCERA - Orchestrates all RAG components
 """
 import logging
+from functools import lru_cache
 from typing import List, Dict, Any, Optional
 import numpy as np
 import uuid
 
 from app.rag.document_processor import DocumentProcessor, DocumentChunk
-from app.rag.embedding_service import EmbeddingService
+from app.rag.embedding_service import get_embedding_service
 from app.rag.vector_store import VectorStore
 
 logger = logging.getLogger(__name__)
@@ -18,8 +19,8 @@ class RAGService:
     
     def __init__(self):
         """Initialize RAG service with all components"""
-        self.document_processor = DocumentProcessor()
-        self.embedding_service = EmbeddingService()
+        self.embedding_service = get_embedding_service()
+        self.document_processor = DocumentProcessor.for_embedding_model(self.embedding_service)
         self.vector_store = VectorStore()
         
         logger.info("✅ RAG Service initialized with all components")
@@ -70,6 +71,94 @@ class RAGService:
             logger.error(f"❌ Error processing document: {e}")
             raise
     
+    def reingest_document(
+        self,
+        file_path: str,
+        file_type: str,
+        document_id: str,
+        metadata: Optional[Dict[str, Any]] = None,
+        file_hash: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Bring a document's stored chunks in line with its (new) file.
+
+        Chunk IDs are content fingerprints, so the diff against the vector
+        store is a set comparison: only added chunks are embedded, kept
+        chunks get their position, section and document metadata rewritten, and
+        chunks that no longer occur are deleted. Kept chunks embedded by a
+        different EMBEDDING_BACKEND are embedded again. For a document with
+        no stored chunks this is a full ingest.
+        """
+        logger.info(f"🔄 Re-ingesting document: {file_path}")
+        chunks = self.document_processor.process_document(file_path, file_type, file_hash)
+        stored = {
+            chunk["id"]: chunk["metadata"]
+            for chunk in self.vector_store.get_document_chunks(document_id, include_embeddings=False)
+        }
+
+        prefix = f"{document_id}_"
+        current = {f"{prefix}{chunk.chunk_id}": chunk for chunk in chunks}
+        # Chunks stored before the backend was recorded came from torch
+        backend = self.embedding_service.backend
+        stale = [
+            chunk_id for chunk_id, previous in stored.items()
+            if chunk_id in current and previous.get("embedding_backend", "torch") != backend
+        ]
+        for chunk_id in stale:
+            del stored[chunk_id]
+        added = [chunk for chunk_id, chunk in current.items() if chunk_id not in stored]
+        removed = [chunk_id for chunk_id in stored if chunk_id not in current]
+        # Document-level fields (title, file type) may have changed with the file
+        document_fields = {key: value for key, value in (metadata or {}).items() if value is not None}
+        moved = 0
+        updated_ids, updated_metadata = [], []
+        for chunk_id, chunk in current.items():
+            previous = stored.get(chunk_id)
+            if previous is None:
+                continue
+            position = {"chunk_index": chunk.metadata["chunk_index"]}
+            if chunk.page_number is not None:
+                position["page_number"] = chunk.page_number
+            moved += any(previous.get(key) != value for key, value in position.items())
+            # A renamed heading keeps the chunk text, and so the ID, but not the section
+            structure = {
+                "section": chunk.section,
+                **{key: chunk.metadata.get(key) for key in ("section_path", "section_depth", "page_end")}
+            }
+            current_metadata = {
+                key: value
+                for key, value in {**previous, **document_fields, **position, **structure}.items()
+                if value is not None
+            }
+            if current_metadata != previous:
+                updated_ids.append(chunk_id)
+                updated_metadata.append(current_metadata)
+
+        if added:
+            embeddings = self.embedding_service.generate_embeddings(added)
+            # Upsert, so re-embedded chunks replace their stale vectors under the same IDs
+            self.vector_store.upsert_documents([(document_id, embeddings, metadata)])
+        self.vector_store.update_metadata(updated_ids, updated_metadata)
+        self.vector_store.delete_chunks(removed)
+
+        summary = self.document_processor.get_document_summary(chunks)
+        summary.update({
+            "document_id": document_id,
+            "file_path": file_path,
+            "file_type": file_type,
+            "chunks_added": len(added),
+            "chunks_removed": len(removed),
+            "chunks_moved": moved,
+            "chunks_updated": len(updated_ids),
+            "chunks_reembedded": len(stale),
+            "chunks_unchanged": len(current) - len(added),
+            "embeddings_generated": len(added)
+        })
+        logger.info(
+            f"✅ Re-ingested document {document_id}: {len(added)} added, "
+            f"{len(removed)} removed, {len(current) - len(added)} kept"
+        )
+        return summary
+
     def search_documents(
         self, 
         query: str, 
@@ -160,7 +249,8 @@ class RAGService:
             processor_info = {
                 "supported_extensions": list(self.document_processor.supported_extensions),
                 "chunk_size": self.document_processor.chunk_size,
-                "chunk_overlap": self.document_processor.chunk_overlap
+                "chunk_overlap": self.document_processor.chunk_overlap,
+                "chunk_unit": self.document_processor.length_unit
             }
             
             return {
@@ -184,4 +274,10 @@ class RAGService:
             
         except Exception as e:
             logger.error(f"❌ Error resetting RAG system: {e}")
-            return False 
\ No newline at end of file
+            return False 
+
+
+@lru_cache(maxsize=1)
+def get_rag_service() -> RAGService:
+    """Shared RAG service, created on first use"""
+    return RAGService()
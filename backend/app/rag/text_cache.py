@@ -0,0 +1,140 @@
+"""
+Per-page extracted text cache for DISCERA RAG System
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class PageTextCache:
+    """Extracted PDF pages stored in one SQLite file, keyed by file hash and page.
+
+    Entries are per extraction backend (name and version), so a backend
+    change never serves stale text. The least recently used files are
+    dropped once more than `max_files` are cached.
+
+    OCR results are kept separately, keyed by the hash of the rendered
+    page image, so a scanned page is recognized once even when it shows
+    up again in another file.
+    """
+
+    def __init__(self, path: str, max_files: int = 2000, max_ocr_pages: int = 100000):
+        self.path = path
+        self.max_files = max_files
+        self.max_ocr_pages = max_ocr_pages
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS pdf_files "
+            "(file_hash TEXT NOT NULL, backend TEXT NOT NULL, page_count INTEGER NOT NULL, "
+            "outline TEXT NOT NULL, used REAL NOT NULL, PRIMARY KEY (file_hash, backend))"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS pdf_pages "
+            "(file_hash TEXT NOT NULL, backend TEXT NOT NULL, page_index INTEGER NOT NULL, "
+            "lines TEXT NOT NULL, PRIMARY KEY (file_hash, backend, page_index))"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS ocr_pages "
+            "(page_hash TEXT NOT NULL, engine TEXT NOT NULL, text TEXT NOT NULL, used REAL NOT NULL, "
+            "PRIMARY KEY (page_hash, engine))"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, file_hash: str, backend: str) -> Optional[Tuple[List[List[Tuple[str, float]]], Dict[int, List[tuple]]]]:
+        """Cached (pages, outline) for a file, or None"""
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT page_count, outline FROM pdf_files WHERE file_hash = ? AND backend = ?", (file_hash, backend)
+        ).fetchone()
+        if row is None:
+            return None
+
+        page_count, outline = row
+        pages = [
+            [tuple(line) for line in json.loads(lines)]
+            for (lines,) in conn.execute(
+                "SELECT lines FROM pdf_pages WHERE file_hash = ? AND backend = ? ORDER BY page_index",
+                (file_hash, backend)
+            )
+        ]
+        if len(pages) != page_count:
+            return None
+        conn.execute(
+            "UPDATE pdf_files SET used = ? WHERE file_hash = ? AND backend = ?", (time.time(), file_hash, backend)
+        )
+        return pages, {int(page): [tuple(entry) for entry in entries] for page, entries in json.loads(outline).items()}
+
+    def put(
+        self,
+        file_hash: str,
+        backend: str,
+        pages: List[List[Tuple[str, float]]],
+        outline: Dict[int, List[tuple]]
+    ):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM pdf_pages WHERE file_hash = ? AND backend = ?", (file_hash, backend))
+            conn.executemany(
+                "INSERT INTO pdf_pages (file_hash, backend, page_index, lines) VALUES (?, ?, ?, ?)",
+                [(file_hash, backend, index, json.dumps(lines, ensure_ascii=False)) for index, lines in enumerate(pages)]
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO pdf_files (file_hash, backend, page_count, outline, used) VALUES (?, ?, ?, ?, ?)",
+                (file_hash, backend, len(pages), json.dumps(outline, ensure_ascii=False), time.time())
+            )
+            self._evict(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def get_ocr(self, page_hash: str, engine: str) -> Optional[str]:
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT text FROM ocr_pages WHERE page_hash = ? AND engine = ?", (page_hash, engine)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE ocr_pages SET used = ? WHERE page_hash = ? AND engine = ?", (time.time(), page_hash, engine))
+        return row[0]
+
+    def put_ocr(self, page_hash: str, engine: str, text: str):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO ocr_pages (page_hash, engine, text, used) VALUES (?, ?, ?, ?)",
+                (page_hash, engine, text, time.time())
+            )
+            conn.execute(
+                "DELETE FROM ocr_pages WHERE rowid IN "
+                "(SELECT rowid FROM ocr_pages ORDER BY used DESC LIMIT -1 OFFSET ?)", (self.max_ocr_pages,)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _evict(self, conn: sqlite3.Connection):
+        stale = conn.execute(
+            "SELECT file_hash, backend FROM pdf_files ORDER BY used DESC LIMIT -1 OFFSET ?", (self.max_files,)
+        ).fetchall()
+        for file_hash, backend in stale:
+            conn.execute("DELETE FROM pdf_pages WHERE file_hash = ? AND backend = ?", (file_hash, backend))
+            conn.execute("DELETE FROM pdf_files WHERE file_hash = ? AND backend = ?", (file_hash, backend))
+        if stale:
+            logger.info(f"🧹 Evicted {len(stale)} files from the PDF text cache")
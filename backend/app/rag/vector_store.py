@@ -2,7 +2,7 @@
 Vector Store Service using ChromaDB for DISCERA RAG System
 """
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import chromadb
 from chromadb.config import Settings
 import numpy as np
@@ -17,9 +17,17 @@ logger = logging.getLogger(__name__)
 class VectorStore:
     """ChromaDB vector store service"""
     
-    def __init__(self, collection_name: str = "discera_documents"):
+    def __init__(
+        self,
+        collection_name: str = "discera_documents",
+        description: str = "DISCERA Document Embeddings",
+        space: Optional[str] = None
+    ):
         """Initialize ChromaDB vector store"""
         self.collection_name = collection_name
+        self.collection_metadata = {"description": description}
+        if space:
+            self.collection_metadata["hnsw:space"] = space
         self.client = None
         self.collection = None
         
@@ -36,7 +44,7 @@ class VectorStore:
             # Get or create collection
             self.collection = self.client.get_or_create_collection(
                 name=collection_name,
-                metadata={"description": "DISCERA Document Embeddings"}
+                metadata=self.collection_metadata
             )
             
             logger.info(f"✅ ChromaDB initialized: {collection_name}")
@@ -46,6 +54,49 @@ class VectorStore:
             logger.error(f"❌ Failed to initialize ChromaDB: {e}")
             raise
     
+    @staticmethod
+    def _chunk_records(
+        embeddings: List[Dict[str, Any]],
+        document_id: str,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> Tuple[List[str], List[str], List[List[float]], List[Dict[str, Any]]]:
+        """ChromaDB ids, documents, embeddings and metadatas for one document's chunks"""
+        ids = []
+        documents = []
+        embeddings_list = []
+        metadatas = []
+        
+        for embedding_data in embeddings:
+            # Generate unique ID
+            chunk_id = f"{document_id}_{embedding_data['chunk_id']}"
+            ids.append(chunk_id)
+            
+            # Add document content
+            documents.append(embedding_data['content'])
+            
+            # Add embedding
+            embeddings_list.append(embedding_data['embedding'])
+            
+            # Add metadata (ensure all values are strings, ints, or floats)
+            chunk_metadata = {
+                "document_id": str(document_id),
+                "chunk_id": str(embedding_data['chunk_id']),
+                "embedding_dim": int(embedding_data['embedding_dim'])
+            }
+            
+            # Add optional metadata with proper type conversion
+            for extra in (embedding_data['metadata'], metadata):
+                for key, value in (extra or {}).items():
+                    if value is not None:
+                        if isinstance(value, (int, float, str, bool)):
+                            chunk_metadata[str(key)] = value
+                        else:
+                            chunk_metadata[str(key)] = str(value)
+            
+            metadatas.append(chunk_metadata)
+        
+        return ids, documents, embeddings_list, metadatas
+    
     def add_documents(
         self, 
         embeddings: List[Dict[str, Any]], 
@@ -59,47 +110,7 @@ class VectorStore:
                 return False
             
             # Prepare data for ChromaDB
-            ids = []
-            documents = []
-            embeddings_list = []
-            metadatas = []
-            
-            for embedding_data in embeddings:
-                # Generate unique ID
-                chunk_id = f"{document_id}_{embedding_data['chunk_id']}"
-                ids.append(chunk_id)
-                
-                # Add document content
-                documents.append(embedding_data['content'])
-                
-                # Add embedding
-                embeddings_list.append(embedding_data['embedding'])
-                
-                # Add metadata (ensure all values are strings, ints, or floats)
-                chunk_metadata = {
-                    "document_id": str(document_id),
-                    "chunk_id": str(embedding_data['chunk_id']),
-                    "embedding_dim": int(embedding_data['embedding_dim'])
-                }
-                
-                # Add optional metadata with proper type conversion
-                if embedding_data['metadata']:
-                    for key, value in embedding_data['metadata'].items():
-                        if value is not None:
-                            if isinstance(value, (int, float, str, bool)):
-                                chunk_metadata[str(key)] = value
-                            else:
-                                chunk_metadata[str(key)] = str(value)
-                
-                if metadata:
-                    for key, value in metadata.items():
-                        if value is not None:
-                            if isinstance(value, (int, float, str, bool)):
-                                chunk_metadata[str(key)] = value
-                            else:
-                                chunk_metadata[str(key)] = str(value)
-                
-                metadatas.append(chunk_metadata)
+            ids, documents, embeddings_list, metadatas = self._chunk_records(embeddings, document_id, metadata)
             
             # Add to collection
             self.collection.add(
@@ -116,6 +127,26 @@ class VectorStore:
             logger.error(f"❌ Error adding documents to vector store: {e}")
             return False
     
+    def upsert_documents(
+        self,
+        documents: List[Tuple[str, List[Dict[str, Any]], Optional[Dict[str, Any]]]]
+    ) -> int:
+        """Write the chunks of many (document_id, embeddings, metadata) in one call.
+        
+        Chunks already stored under the same id are replaced, so writing a
+        batch again after an interrupted run does not duplicate anything.
+        Returns the number of chunks written.
+        """
+        ids, texts, embeddings_list, metadatas = [], [], [], []
+        for document_id, embeddings, metadata in documents:
+            records = self._chunk_records(embeddings, document_id, metadata)
+            for target, values in zip((ids, texts, embeddings_list, metadatas), records):
+                target.extend(values)
+        if ids:
+            self.upsert_vectors(ids=ids, embeddings=embeddings_list, documents=texts, metadatas=metadatas)
+            logger.info(f"✅ Upserted {len(ids)} chunks for {len(documents)} documents")
+        return len(ids)
+    
     def search(
         self, 
         query_embedding: np.ndarray, 
@@ -154,6 +185,108 @@ class VectorStore:
             logger.error(f"❌ Error searching vector store: {e}")
             return []
     
+    def upsert_vectors(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        documents: List[str],
+        metadatas: List[Dict[str, Any]]
+    ):
+        """Insert or replace vectors by id"""
+        self.collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+    
+    def query_vectors(
+        self,
+        embeddings: List[List[float]],
+        n_results: int = 10,
+        where: Optional[Dict[str, Any]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """Nearest neighbours for several query vectors in one call"""
+        if not embeddings or not self.collection.count():
+            return [[] for _ in embeddings]
+        
+        results = self.collection.query(
+            query_embeddings=embeddings,
+            n_results=n_results,
+            where=where,
+            include=["metadatas", "distances"]
+        )
+        
+        return [
+            [
+                {
+                    "id": result_id,
+                    "metadata": results['metadatas'][q][i],
+                    "similarity": 1 - results['distances'][q][i]
+                }
+                for i, result_id in enumerate(results['ids'][q])
+            ]
+            for q in range(len(embeddings))
+        ]
+    
+    def get_document_chunks(self, document_id: str, include_embeddings: bool = True) -> List[Dict[str, Any]]:
+        """Get all stored chunks for a document"""
+        try:
+            include = ["documents", "metadatas"]
+            if include_embeddings:
+                include.append("embeddings")
+            
+            results = self.collection.get(
+                where={"document_id": str(document_id)},
+                include=include
+            )
+            
+            chunks = []
+            for i, chunk_id in enumerate(results['ids']):
+                chunk = {
+                    "id": chunk_id,
+                    "content": results['documents'][i],
+                    "metadata": results['metadatas'][i]
+                }
+                if include_embeddings:
+                    chunk["embedding"] = results['embeddings'][i]
+                chunks.append(chunk)
+            
+            return chunks
+            
+        except Exception as e:
+            logger.error(f"❌ Error getting chunks for document {document_id}: {e}")
+            return []
+    
+    def update_metadata(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        """Replace the metadata of stored chunks without touching their embeddings"""
+        if ids:
+            self.collection.update(ids=ids, metadatas=metadatas)
+
+    def delete_chunks(self, ids: List[str]):
+        """Delete chunks by id"""
+        if ids:
+            self.collection.delete(ids=ids)
+
+    def copy_document(
+        self,
+        source_document_id: str,
+        document_id: str,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> int:
+        """Store another document's chunks and embeddings under a new document id"""
+        chunks = self.get_document_chunks(source_document_id)
+        if not chunks:
+            return 0
+
+        prefix = f"{source_document_id}_"
+        self.upsert_vectors(
+            ids=[f"{document_id}_{chunk['id'][len(prefix):]}" for chunk in chunks],
+            embeddings=[chunk["embedding"] for chunk in chunks],
+            documents=[chunk["content"] for chunk in chunks],
+            metadatas=[
+                {**chunk["metadata"], **(metadata or {}), "document_id": str(document_id)}
+                for chunk in chunks
+            ]
+        )
+        logger.info(f"♻️ Copied {len(chunks)} chunks from document {source_document_id} to {document_id}")
+        return len(chunks)
+
     def delete_document(self, document_id: str) -> bool:
         """Delete all chunks for a specific document"""
         try:
@@ -200,7 +333,7 @@ class VectorStore:
             self.client.delete_collection(self.collection_name)
             self.collection = self.client.create_collection(
                 name=self.collection_name,
-                metadata={"description": "DISCERA Document Embeddings"}
+                metadata=self.collection_metadata
             )
             logger.info(f"✅ Reset collection: {self.collection_name}")
             return True
@@ -0,0 +1,362 @@
+"""
+Incrementally maintained test and student analytics for DISCERA
+"""
+import logging
+import math
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import bindparam, case, insert, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.database import dialect_insert
+from app.models.analytics import TestStatistics, TestScoreBucket, QuestionStatistics, StudentStatistics
+from app.models.test import Question, TestResult, TestAnswer
+
+logger = logging.getLogger(__name__)
+
+HISTOGRAM_BUCKETS = 10
+ROLLING_ALPHA = 0.3  # weight of the newest result in the student's rolling average
+
+_tests = TestStatistics.__table__
+_buckets = TestScoreBucket.__table__
+_questions = QuestionStatistics.__table__
+_students = StudentStatistics.__table__
+
+# (test_id, question_ids) combinations whose summary rows are known to exist
+_seeded: Set[Tuple[int, Tuple[int, ...]]] = set()
+_seeded_lock = threading.Lock()
+
+
+def score_bucket(percentage: int) -> int:
+    """Histogram bucket for a percentage (100% falls into the top bucket)"""
+    return min(max(int(percentage), 0) // 10, HISTOGRAM_BUCKETS - 1)
+
+
+def _seed_test_rows(db: Session, test_id: int, question_ids: Sequence[int]):
+    """Create zeroed summary rows for a test and its questions if missing.
+
+    Inserts skip rows that already exist, so rows another worker seeds
+    concurrently are kept and only the missing ones are added. The key is
+    cached only once every row is confirmed to exist.
+    """
+    seed_key = (test_id, tuple(question_ids))
+    if seed_key in _seeded:
+        return
+
+    insert = dialect_insert(db)
+    db.execute(insert(_tests).values(
+        test_id=test_id, attempts=0, percentage_sum=0, percentage_sq_sum=0
+    ).on_conflict_do_nothing(index_elements=[_tests.c.test_id]))
+    db.execute(insert(_buckets).values([
+        {"test_id": test_id, "bucket": bucket, "count": 0}
+        for bucket in range(HISTOGRAM_BUCKETS)
+    ]).on_conflict_do_nothing(index_elements=[_buckets.c.test_id, _buckets.c.bucket]))
+    if question_ids:
+        db.execute(insert(_questions).values([
+            {
+                "question_id": question_id, "test_id": test_id, "attempts": 0, "correct_count": 0,
+                "percentage_sum": 0, "percentage_sq_sum": 0, "correct_percentage_sum": 0
+            }
+            for question_id in question_ids
+        ]).on_conflict_do_nothing(index_elements=[_questions.c.question_id]))
+
+    seeded_questions = db.query(QuestionStatistics.question_id).filter(
+        QuestionStatistics.question_id.in_(list(question_ids))
+    ).count() if question_ids else 0
+    test_seeded = db.query(TestStatistics.test_id).filter(TestStatistics.test_id == test_id).first() is not None
+    if not test_seeded or seeded_questions != len(set(question_ids)):
+        logger.warning(f"Summary rows for test {test_id} are incomplete; seeding again on the next submission")
+        return
+
+    with _seeded_lock:
+        _seeded.add(seed_key)
+
+
+def _forget_seeded(test_id: int):
+    with _seeded_lock:
+        for seed_key in [key for key in _seeded if key[0] == test_id]:
+            _seeded.discard(seed_key)
+
+
+def record_submission(
+    db: Session,
+    test_id: int,
+    student_id: int,
+    percentage: int,
+    question_ids: Sequence[int],
+    correct: Sequence[bool]
+):
+    """Fold one graded submission into the summary tables.
+
+    Runs inside the caller's transaction using relative `col = col + x`
+    updates, so concurrent submissions never overwrite each other's counts.
+    The updated rows stay locked until the caller commits, so submissions
+    to the same test queue on them briefly: call this last, just before
+    the commit.
+    """
+    _seed_test_rows(db, test_id, question_ids)
+
+    test_update = update(_tests).where(_tests.c.test_id == test_id).values(
+        attempts=_tests.c.attempts + 1,
+        percentage_sum=_tests.c.percentage_sum + percentage,
+        percentage_sq_sum=_tests.c.percentage_sq_sum + percentage * percentage,
+        min_percentage=case(
+            ((_tests.c.min_percentage.is_(None)) | (_tests.c.min_percentage > percentage), percentage),
+            else_=_tests.c.min_percentage
+        ),
+        max_percentage=case(
+            ((_tests.c.max_percentage.is_(None)) | (_tests.c.max_percentage < percentage), percentage),
+            else_=_tests.c.max_percentage
+        )
+    )
+    if db.execute(test_update).rowcount == 0:
+        # Summary rows disappeared (e.g. database reset): seed again and retry
+        _forget_seeded(test_id)
+        _seed_test_rows(db, test_id, question_ids)
+        db.execute(test_update)
+
+    db.execute(
+        update(_buckets).where(
+            (_buckets.c.test_id == test_id) & (_buckets.c.bucket == score_bucket(percentage))
+        ).values(count=_buckets.c.count + 1)
+    )
+
+    if question_ids:
+        db.execute(
+            update(_questions).where(_questions.c.question_id == bindparam("qid")).values(
+                attempts=_questions.c.attempts + 1,
+                correct_count=_questions.c.correct_count + bindparam("correct_inc"),
+                percentage_sum=_questions.c.percentage_sum + percentage,
+                percentage_sq_sum=_questions.c.percentage_sq_sum + percentage * percentage,
+                correct_percentage_sum=_questions.c.correct_percentage_sum + bindparam("correct_pct")
+            ),
+            [
+                {"qid": question_id, "correct_inc": int(ok), "correct_pct": percentage if ok else 0}
+                for question_id, ok in zip(question_ids, correct)
+            ]
+        )
+
+    _record_student_result(db, student_id, percentage)
+
+
+def _record_student_result(db: Session, student_id: int, percentage: int):
+    student_update = update(_students).where(_students.c.student_id == student_id).values(
+        tests_taken=_students.c.tests_taken + 1,
+        percentage_sum=_students.c.percentage_sum + percentage,
+        rolling_average=case(
+            (_students.c.rolling_average.is_(None), float(percentage)),
+            else_=_students.c.rolling_average + ROLLING_ALPHA * (percentage - _students.c.rolling_average)
+        ),
+        last_percentage=percentage,
+        best_percentage=case(
+            ((_students.c.best_percentage.is_(None)) | (_students.c.best_percentage < percentage), percentage),
+            else_=_students.c.best_percentage
+        )
+    )
+    if db.execute(student_update).rowcount:
+        return
+
+    try:
+        with db.begin_nested():
+            db.execute(insert(_students), [{
+                "student_id": student_id, "tests_taken": 1, "percentage_sum": percentage,
+                "rolling_average": float(percentage), "last_percentage": percentage,
+                "best_percentage": percentage
+            }])
+    except IntegrityError:
+        db.execute(student_update)
+
+
+def rebuild_test_statistics(db: Session, test_id: int):
+    """Recompute a test's summary rows (and its students') from stored results.
+
+    Used after bulk re-grading or to backfill tests submitted before the
+    summary tables existed.
+    """
+    results = db.query(
+        TestResult.id, TestResult.student_id, TestResult.percentage
+    ).filter(TestResult.test_id == test_id).all()
+    percentage_by_result = {result.id: result.percentage for result in results}
+    question_ids = [
+        question_id for (question_id,) in
+        db.query(Question.id).filter(Question.test_id == test_id).order_by(Question.id).all()
+    ]
+
+    db.query(TestScoreBucket).filter(TestScoreBucket.test_id == test_id).delete(synchronize_session=False)
+    db.query(QuestionStatistics).filter(QuestionStatistics.test_id == test_id).delete(synchronize_session=False)
+    db.query(TestStatistics).filter(TestStatistics.test_id == test_id).delete(synchronize_session=False)
+    _forget_seeded(test_id)
+
+    percentages = [result.percentage for result in results]
+    db.execute(insert(_tests), [{
+        "test_id": test_id,
+        "attempts": len(percentages),
+        "percentage_sum": sum(percentages),
+        "percentage_sq_sum": sum(p * p for p in percentages),
+        "min_percentage": min(percentages) if percentages else None,
+        "max_percentage": max(percentages) if percentages else None
+    }])
+
+    bucket_counts = [0] * HISTOGRAM_BUCKETS
+    for percentage in percentages:
+        bucket_counts[score_bucket(percentage)] += 1
+    db.execute(insert(_buckets), [
+        {"test_id": test_id, "bucket": bucket, "count": count}
+        for bucket, count in enumerate(bucket_counts)
+    ])
+
+    question_rows = {
+        question_id: {
+            "question_id": question_id, "test_id": test_id, "attempts": 0, "correct_count": 0,
+            "percentage_sum": 0, "percentage_sq_sum": 0, "correct_percentage_sum": 0
+        }
+        for question_id in question_ids
+    }
+    answers = db.query(
+        TestAnswer.question_id, TestAnswer.test_result_id, TestAnswer.is_correct
+    ).filter(TestAnswer.test_result_id.in_(list(percentage_by_result))).all() if results else []
+    for answer in answers:
+        row = question_rows.get(answer.question_id)
+        if row is None:
+            continue
+        percentage = percentage_by_result[answer.test_result_id]
+        row["attempts"] += 1
+        row["percentage_sum"] += percentage
+        row["percentage_sq_sum"] += percentage * percentage
+        if answer.is_correct:
+            row["correct_count"] += 1
+            row["correct_percentage_sum"] += percentage
+    if question_rows:
+        db.execute(insert(_questions), list(question_rows.values()))
+
+    rebuild_student_statistics(db, {result.student_id for result in results})
+    db.commit()
+    logger.info(f"Rebuilt analytics for test {test_id}: {len(results)} results")
+
+
+def rebuild_student_statistics(db: Session, student_ids: Iterable[int]):
+    """Recompute student summary rows from all of their results (no commit)"""
+    for student_id in student_ids:
+        percentages = [
+            percentage for (percentage,) in
+            db.query(TestResult.percentage).filter(TestResult.student_id == student_id)
+            .order_by(TestResult.completed_at, TestResult.id).all()
+        ]
+        db.query(StudentStatistics).filter(StudentStatistics.student_id == student_id).delete(
+            synchronize_session=False
+        )
+        if not percentages:
+            continue
+
+        rolling_average = float(percentages[0])
+        for percentage in percentages[1:]:
+            rolling_average += ROLLING_ALPHA * (percentage - rolling_average)
+
+        db.execute(insert(_students), [{
+            "student_id": student_id,
+            "tests_taken": len(percentages),
+            "percentage_sum": sum(percentages),
+            "rolling_average": rolling_average,
+            "last_percentage": percentages[-1],
+            "best_percentage": max(percentages)
+        }])
+
+
+def _mean_and_std(count: int, total: float, sq_total: float) -> Tuple[Optional[float], Optional[float]]:
+    if not count:
+        return None, None
+    mean = total / count
+    variance = max(sq_total / count - mean * mean, 0.0)
+    return mean, math.sqrt(variance)
+
+
+def get_test_summary(db: Session, test_id: int) -> Dict[str, Any]:
+    """Score distribution for a test, read from the summary tables"""
+    stats = db.query(TestStatistics).filter(TestStatistics.test_id == test_id).first()
+    buckets = db.query(TestScoreBucket.bucket, TestScoreBucket.count).filter(
+        TestScoreBucket.test_id == test_id
+    ).order_by(TestScoreBucket.bucket).all()
+
+    attempts = stats.attempts if stats else 0
+    mean, std = _mean_and_std(attempts, stats.percentage_sum, stats.percentage_sq_sum) if stats else (None, None)
+    counts = {bucket.bucket: bucket.count for bucket in buckets}
+
+    return {
+        "test_id": test_id,
+        "attempts": attempts,
+        "average_percentage": mean,
+        "std_percentage": std,
+        "min_percentage": stats.min_percentage if stats else None,
+        "max_percentage": stats.max_percentage if stats else None,
+        "histogram": [
+            {
+                "range": f"{bucket * 10}-{bucket * 10 + 9 if bucket < HISTOGRAM_BUCKETS - 1 else 100}",
+                "count": counts.get(bucket, 0)
+            }
+            for bucket in range(HISTOGRAM_BUCKETS)
+        ]
+    }
+
+
+def get_question_summaries(db: Session, test_id: int) -> List[Dict[str, Any]]:
+    """Per-question difficulty and discrimination, read from the summary tables.
+
+    Difficulty is the share of correct answers; discrimination is the
+    point-biserial correlation between answering correctly and the total score.
+    """
+    rows = db.query(QuestionStatistics).filter(
+        QuestionStatistics.test_id == test_id
+    ).order_by(QuestionStatistics.question_id).all()
+
+    return [_question_summary(row) for row in rows]
+
+
+def get_question_quality(db: Session, question_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+    """Item-analysis summaries for the given questions, keyed by question id"""
+    question_ids = list(question_ids)
+    if not question_ids:
+        return {}
+    rows = db.query(QuestionStatistics).filter(QuestionStatistics.question_id.in_(question_ids)).all()
+    return {row.question_id: _question_summary(row) for row in rows}
+
+
+def _question_summary(row: QuestionStatistics) -> Dict[str, Any]:
+    difficulty = row.correct_count / row.attempts if row.attempts else None
+    discrimination = None
+    mean, std = _mean_and_std(row.attempts, row.percentage_sum, row.percentage_sq_sum)
+    if difficulty is not None and 0 < difficulty < 1 and std:
+        correct_mean = row.correct_percentage_sum / row.correct_count
+        discrimination = (correct_mean - mean) / std * math.sqrt(difficulty / (1 - difficulty))
+
+    return {
+        "question_id": row.question_id,
+        "attempts": row.attempts,
+        "correct_count": row.correct_count,
+        "difficulty": difficulty,
+        "discrimination": discrimination
+    }
+
+
+def get_student_summary(db: Session, student_id: int) -> Dict[str, Any]:
+    """Rolling performance for a student, read from the summary table"""
+    stats = db.query(StudentStatistics).filter(StudentStatistics.student_id == student_id).first()
+    if not stats:
+        return {
+            "student_id": student_id,
+            "tests_taken": 0,
+            "average_percentage": None,
+            "rolling_average": None,
+            "last_percentage": None,
+            "best_percentage": None
+        }
+
+    return {
+        "student_id": student_id,
+        "tests_taken": stats.tests_taken,
+        "average_percentage": stats.percentage_sum / stats.tests_taken if stats.tests_taken else None,
+        "rolling_average": stats.rolling_average,
+        "last_percentage": stats.last_percentage,
+        "best_percentage": stats.best_percentage
+    }
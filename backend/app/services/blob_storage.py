@@ -0,0 +1,227 @@
+"""
+Content-addressed, deduplicated upload storage for DISCERA
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import BinaryIO, List, Optional
+
+from sqlalchemy import delete, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import dialect_insert
+from app.core.metrics import metrics
+from app.models.blob import Blob
+
+logger = logging.getLogger(__name__)
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class UploadTooLarge(Exception):
+    """Raised as soon as an upload grows past its size limit"""
+
+    def __init__(self, max_size: int):
+        super().__init__(f"File too large. Maximum size: {max_size} bytes")
+        self.max_size = max_size
+
+
+@dataclass
+class StagedBlob:
+    """An upload written to a temp file and hashed, not yet published"""
+    sha256: str
+    size: int
+    temp_path: str
+
+
+class BlobStore:
+    """Files named by the SHA-256 of their content under `<root>/blobs`.
+
+    Uploads are hashed while they are copied to a temp file in the same
+    directory tree and then renamed into place, so a blob path either does
+    not exist or holds the complete content. Identical uploads map to the
+    same path and are stored once.
+    """
+
+    def __init__(self, root: str = settings.UPLOAD_DIR):
+        self.root = os.path.join(root, "blobs")
+        self.temp_dir = os.path.join(self.root, "tmp")
+
+    def path_for(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def stage(self, source: BinaryIO) -> StagedBlob:
+        """Copy a stream to a temp file, hashing it on the way"""
+        os.makedirs(self.temp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, temp_path = tempfile.mkstemp(dir=self.temp_dir)
+        try:
+            with os.fdopen(fd, "wb") as target:
+                while True:
+                    data = source.read(COPY_CHUNK_SIZE)
+                    if not data:
+                        break
+                    digest.update(data)
+                    target.write(data)
+                    size += len(data)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        return StagedBlob(sha256=digest.hexdigest(), size=size, temp_path=temp_path)
+
+    def publish(self, staged: StagedBlob) -> str:
+        """Move a staged upload to its content address; returns the blob path"""
+        path = self.path_for(staged.sha256)
+        if os.path.exists(path):
+            os.unlink(staged.temp_path)
+            metrics.inc("blob_dedup_hits_total")
+            metrics.inc("blob_dedup_bytes_saved_total", staged.size)
+            return path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Atomic on one filesystem; a concurrent identical upload writes the same bytes
+        os.replace(staged.temp_path, path)
+        return path
+
+    def discard(self, staged: StagedBlob):
+        if os.path.exists(staged.temp_path):
+            os.unlink(staged.temp_path)
+
+    def delete(self, sha256: str):
+        try:
+            os.remove(self.path_for(sha256))
+        except FileNotFoundError:
+            pass
+
+
+class BlobWriter:
+    """Stage an upload from an async stream without blocking the event loop.
+
+    Data is hashed and counted as it arrives and the size limit is enforced
+    before anything past it is written. Disk writes are batched to
+    COPY_CHUNK_SIZE and run in a worker thread.
+    """
+
+    def __init__(self, store: BlobStore, max_size: Optional[int] = None):
+        self.store = store
+        self.max_size = max_size
+        self.size = 0
+        self._digest = hashlib.sha256()
+        self._pending: List[bytes] = []
+        self._pending_size = 0
+        self._file = None
+        self._temp_path: Optional[str] = None
+
+    def _open(self):
+        os.makedirs(self.store.temp_dir, exist_ok=True)
+        fd, self._temp_path = tempfile.mkstemp(dir=self.store.temp_dir)
+        self._file = os.fdopen(fd, "wb")
+
+    async def write(self, data: bytes):
+        if not data:
+            return
+        self.size += len(data)
+        if self.max_size is not None and self.size > self.max_size:
+            raise UploadTooLarge(self.max_size)
+        self._digest.update(data)
+        self._pending.append(data)
+        self._pending_size += len(data)
+        if self._pending_size >= COPY_CHUNK_SIZE:
+            await self._flush()
+
+    async def _flush(self):
+        if self._file is None:
+            await asyncio.to_thread(self._open)
+        data, self._pending, self._pending_size = b"".join(self._pending), [], 0
+        if data:
+            await asyncio.to_thread(self._file.write, data)
+
+    async def finish(self) -> StagedBlob:
+        """Write what is left and close the temp file"""
+        try:
+            await self._flush()
+            await asyncio.to_thread(self._file.close)
+        except BaseException:
+            await self.abort()
+            raise
+        return StagedBlob(sha256=self._digest.hexdigest(), size=self.size, temp_path=self._temp_path)
+
+    async def abort(self):
+        """Drop the partial upload"""
+        self._pending = []
+        if self._file is not None:
+            file, temp_path, self._file = self._file, self._temp_path, None
+
+            def remove():
+                file.close()
+                if os.path.exists(temp_path):
+                    os.unlink(temp_path)
+
+            await asyncio.to_thread(remove)
+
+
+def acquire_blob(db: Session, staged: StagedBlob, store: Optional[BlobStore] = None) -> Blob:
+    """Take a reference to a staged upload's blob and publish it (not committed).
+
+    The reference is taken first: the blob's row is then locked until the
+    caller commits, so delete_unreferenced_blob cannot remove the file
+    between publishing and committing.
+    """
+    store = store or blob_store
+    insert = dialect_insert(db)
+    statement = insert(Blob).values(
+        sha256=staged.sha256, size=staged.size, file_path=store.path_for(staged.sha256), ref_count=1
+    )
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[Blob.sha256],
+        set_={"ref_count": Blob.ref_count + 1}
+    ))
+    store.publish(staged)
+    return db.get(Blob, staged.sha256, populate_existing=True)
+
+
+def release_blob(db: Session, sha256: Optional[str]) -> bool:
+    """Drop one reference (not committed). True when it was the last one.
+
+    The caller deletes the file with `BlobStore.delete` after committing.
+    """
+    if not sha256:
+        return False
+    db.execute(update(Blob).where(Blob.sha256 == sha256).values(ref_count=Blob.ref_count - 1))
+    blob = db.get(Blob, sha256, populate_existing=True)
+    if blob is None or blob.ref_count > 0:
+        return False
+    db.delete(blob)
+    return True
+
+
+
+def delete_unreferenced_blob(db: Session, sha256: str, store: Optional[BlobStore] = None) -> bool:
+    """Delete a blob's file unless a document references it again (commits).
+
+    A placeholder row is inserted for the check, which holds the same row
+    lock acquire_blob takes: an upload of the same content either commits
+    its reference first, and the file is kept, or waits and publishes the
+    file again afterwards. True when the file was deleted.
+    """
+    store = store or blob_store
+    insert = dialect_insert(db)
+    placeholder = insert(Blob).values(sha256=sha256, size=0, file_path=store.path_for(sha256), ref_count=0)
+    try:
+        if db.execute(placeholder.on_conflict_do_nothing(index_elements=[Blob.sha256])).rowcount != 1:
+            db.rollback()
+            return False
+        store.delete(sha256)
+        db.execute(delete(Blob).where(Blob.sha256 == sha256))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return True
+
+
+blob_store = BlobStore()
@@ -0,0 +1,369 @@
+"""
+Bulk ingestion of course archives (directories or zip files) for DISCERA
+"""
+import functools
+import logging
+import multiprocessing
+import os
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import asdict, dataclass, field
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.models.document import Document
+from app.rag.chunking import TextBlock
+from app.rag.document_processor import DocumentChunk, DocumentProcessor
+from app.services.blob_storage import BlobStore, StagedBlob, blob_store
+from app.services.document_ingest import DocumentIngestor, add_document
+from app.services.upload_stream import SNIFF_BYTES, content_matches_extension
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SourceFile:
+    """One file of a course archive"""
+    name: str  # path inside the directory or zip, with / separators
+    size: int
+    open: Callable[[], BinaryIO]
+
+    @property
+    def extension(self) -> str:
+        return os.path.splitext(self.name)[1].lower()
+
+
+def iter_source_files(path: str) -> Iterator[SourceFile]:
+    """Files of a directory tree or zip archive in a stable order, hidden files skipped"""
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+            for filename in sorted(files):
+                if filename.startswith("."):
+                    continue
+                full_path = os.path.join(root, filename)
+                yield SourceFile(
+                    os.path.relpath(full_path, path).replace(os.sep, "/"),
+                    os.path.getsize(full_path),
+                    functools.partial(open, full_path, "rb")
+                )
+    elif zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for info in sorted(archive.infolist(), key=lambda info: info.filename):
+                parts = info.filename.split("/")
+                if info.is_dir() or any(part.startswith(".") or part == "__MACOSX" for part in parts):
+                    continue
+                # Reads stop at the declared size, so file_size bounds what is staged
+                yield SourceFile(info.filename, info.file_size, functools.partial(archive.open, info))
+    else:
+        raise ValueError(f"{path} is neither a directory nor a zip archive")
+
+
+@dataclass
+class BulkIngestReport:
+    """Outcome and throughput of one bulk ingestion run"""
+    files: int = 0  # files found in the source
+    ingested: int = 0  # parsed, embedded and stored
+    reused: int = 0  # same content already indexed; chunks copied
+    skipped: int = 0  # ingested by an earlier run
+    rejected: int = 0  # unsupported type, too large or not what the extension claims
+    failed: int = 0  # left unprocessed; a new run retries them
+    chunks: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+    errors: List[Tuple[str, str]] = field(default_factory=list)
+
+    @property
+    def files_per_second(self) -> float:
+        return (self.ingested + self.reused) / self.seconds if self.seconds > 0 else 0.0
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.chunks / self.seconds if self.seconds > 0 else 0.0
+
+    @property
+    def megabytes_per_second(self) -> float:
+        return self.bytes / (1024 * 1024) / self.seconds if self.seconds > 0 else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            **asdict(self),
+            "files_per_second": round(self.files_per_second, 2),
+            "chunks_per_second": round(self.chunks_per_second, 2),
+            "megabytes_per_second": round(self.megabytes_per_second, 2)
+        }
+
+
+_worker_processor: Optional[DocumentProcessor] = None
+
+
+def _init_worker():
+    global _worker_processor
+    _worker_processor = DocumentProcessor()
+
+
+def _extract_blocks(file_path: str, file_type: str, file_hash: Optional[str] = None) -> List[TextBlock]:
+    """Worker: parse one file; chunking needs the embedding tokenizer and runs in the parent"""
+    return _worker_processor.extract_blocks(file_path, file_type, file_hash)
+
+
+@dataclass
+class _Pending:
+    document_id: int
+    name: str
+    blob_hash: str
+    metadata: Dict[str, Any]
+    chunks: List[DocumentChunk] = field(default_factory=list)
+
+
+class BulkIngestor(DocumentIngestor):
+    """Ingest a whole directory or zip of course material.
+
+    Files are staged into the blob store and registered as documents in
+    batched transactions, then parsed in a pool of worker processes.
+    Parsed chunks from many documents are embedded together and written
+    to the vector store and the documents table in one transaction per
+    `batch_chunks` chunks.
+
+    The documents table is the checkpoint: a document is marked processed
+    only after its chunks are stored, so a rerun after a crash or failure
+    skips what is done, picks up the registered but unprocessed documents
+    and rewrites their chunks idempotently (chunk IDs are content
+    fingerprints).
+    """
+
+    def __init__(
+        self,
+        rag_service=None,
+        session_factory=None,
+        store: Optional[BlobStore] = None,
+        workers: Optional[int] = None,
+        batch_chunks: Optional[int] = None,
+        commit_files: Optional[int] = None,
+        max_file_size: Optional[int] = None
+    ):
+        super().__init__(rag_service, session_factory)
+        self.store = store or blob_store
+        self.workers = workers or settings.BULK_INGEST_WORKERS
+        self.batch_chunks = batch_chunks or settings.BULK_INGEST_BATCH_CHUNKS
+        self.commit_files = commit_files or settings.BULK_INGEST_COMMIT_FILES
+        self.max_file_size = max_file_size or settings.MAX_FILE_SIZE
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        return ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context(method), initializer=_init_worker
+        )
+
+    def run(self, source: str, owner_id: int) -> BulkIngestReport:
+        """Ingest every supported file under `source` for one owner"""
+        report = BulkIngestReport()
+        started = time.monotonic()
+        db = self.session_factory()
+        self._executor = self._new_executor()
+        pending: List[_Pending] = []
+        duplicates: List[Tuple[int, int, str, Dict[str, Any]]] = []
+        inflight: Dict[Future, _Pending] = {}
+        staged_batch: List[Tuple[SourceFile, StagedBlob]] = []
+        try:
+            for source_file in iter_source_files(source):
+                report.files += 1
+                staged = self._stage(source_file, report)
+                if staged is not None:
+                    staged_batch.append((source_file, staged))
+                if len(staged_batch) >= self.commit_files:
+                    self._dispatch(db, staged_batch, owner_id, report, pending, duplicates, inflight)
+                    staged_batch = []
+            self._dispatch(db, staged_batch, owner_id, report, pending, duplicates, inflight)
+
+            while inflight:
+                self._collect(db, report, pending, inflight)
+            self._flush(db, report, pending)
+            self._copy_duplicates(db, report, duplicates)
+        finally:
+            for _, staged in staged_batch:
+                self.store.discard(staged)
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+            db.close()
+
+        report.seconds = time.monotonic() - started
+        metrics.observe("bulk_ingest_files_per_second", report.files_per_second, buckets=(0.1, 0.5, 1, 2, 5, 10, 50))
+        logger.info(
+            f"📚 Bulk ingest of {source}: {report.ingested} ingested, {report.reused} reused, "
+            f"{report.skipped} already done, {report.rejected} rejected, {report.failed} failed; "
+            f"{report.chunks} chunks in {report.seconds:.1f}s ({report.files_per_second:.2f} files/s, "
+            f"{report.chunks_per_second:.1f} chunks/s)"
+        )
+        return report
+
+    def _reject(self, report: BulkIngestReport, name: str, reason: str, status: str = "rejected"):
+        setattr(report, status, getattr(report, status) + 1)
+        report.errors.append((name, reason))
+        metrics.inc("bulk_ingest_files_total", status=status)
+        logger.warning(f"⚠️ {name}: {reason}")
+
+    def _stage(self, source_file: SourceFile, report: BulkIngestReport) -> Optional[StagedBlob]:
+        """Copy a file into the blob store, checking its type and size"""
+        processor = self.rag_service.document_processor
+        extension = source_file.extension
+        if extension not in settings.ALLOWED_EXTENSIONS or extension not in processor.supported_extensions:
+            self._reject(report, source_file.name, f"unsupported file type {extension or '(none)'}")
+            return None
+        if source_file.size > self.max_file_size:
+            self._reject(report, source_file.name, f"larger than {self.max_file_size} bytes")
+            return None
+
+        try:
+            with source_file.open() as stream:
+                staged = self.store.stage(stream)
+            with open(staged.temp_path, "rb") as f:
+                head = f.read(SNIFF_BYTES)
+        except (OSError, zipfile.BadZipFile) as e:
+            self._reject(report, source_file.name, f"could not read: {e}", status="failed")
+            return None
+        if not content_matches_extension(head, extension, complete=staged.size <= SNIFF_BYTES):
+            self.store.discard(staged)
+            self._reject(report, source_file.name, f"content is not a valid {extension} file")
+            return None
+        report.bytes += staged.size
+        return staged
+
+    def _dispatch(
+        self,
+        db: Session,
+        staged_batch: List[Tuple[SourceFile, StagedBlob]],
+        owner_id: int,
+        report: BulkIngestReport,
+        pending: List[_Pending],
+        duplicates: List[Tuple[int, int, str, Dict[str, Any]]],
+        inflight: Dict[Future, _Pending]
+    ):
+        """Register a batch of staged files in one transaction and queue the new ones for parsing"""
+        if not staged_batch:
+            return
+        queued: List[Tuple[Document, Optional[int]]] = []
+        parsing = {item.blob_hash: item.document_id for item in [*pending, *inflight.values()]}
+        try:
+            for source_file, staged in staged_batch:
+                document = db.query(Document).filter(
+                    Document.owner_id == owner_id,
+                    Document.filename == source_file.name,
+                    Document.blob_hash == staged.sha256
+                ).first()
+                if document is not None:
+                    # Registered by an earlier run: its blob reference is already held
+                    self.store.discard(staged)
+                    if document.is_processed:
+                        report.skipped += 1
+                        metrics.inc("bulk_ingest_files_total", status="skipped")
+                        continue
+                else:
+                    document = add_document(db, staged, source_file.name, source_file.extension, owner_id, self.store)
+
+                source = self.find_processed_copy(db, document)
+                source_id = source.id if source is not None else parsing.get(document.blob_hash)
+                if source_id is None:
+                    parsing[document.blob_hash] = document.id
+                queued.append((document, source_id))
+            db.commit()
+        except Exception:
+            db.rollback()
+            for _, staged in staged_batch:
+                self.store.discard(staged)
+            raise
+
+        for document, source_id in queued:
+            metadata = self._chunk_metadata(document)
+            if source_id is not None:
+                # Same content as a document indexed earlier or parsed in this run
+                duplicates.append((document.id, source_id, document.filename, metadata))
+                continue
+            while len(inflight) >= self.workers * 2:
+                self._collect(db, report, pending, inflight)
+            item = _Pending(document.id, document.filename, document.blob_hash, metadata)
+            inflight[self._submit(document.file_path, document.file_type, document.blob_hash)] = item
+
+    def _submit(self, file_path: str, file_type: str, file_hash: Optional[str] = None) -> Future:
+        try:
+            return self._executor.submit(_extract_blocks, file_path, file_type, file_hash)
+        except BrokenProcessPool:
+            # A worker died (out of memory, crash in a native parser); start a fresh pool
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = self._new_executor()
+            return self._executor.submit(_extract_blocks, file_path, file_type, file_hash)
+
+    def _collect(self, db: Session, report: BulkIngestReport, pending: List[_Pending], inflight: Dict[Future, _Pending]):
+        """Chunk the files that finished parsing; flush once enough chunks are waiting"""
+        done, _ = wait(list(inflight), return_when=FIRST_COMPLETED)
+        processor = self.rag_service.document_processor
+        for future in done:
+            item = inflight.pop(future)
+            try:
+                item.chunks = processor.assign_chunk_ids(processor.chunk_blocks(future.result()))
+            except Exception as e:
+                self._reject(report, item.name, f"could not be parsed: {e}", status="failed")
+                continue
+            pending.append(item)
+        if sum(len(item.chunks) for item in pending) >= self.batch_chunks:
+            self._flush(db, report, pending)
+
+    def _flush(self, db: Session, report: BulkIngestReport, pending: List[_Pending]):
+        """Embed the waiting documents' chunks together and store them in one transaction"""
+        if not pending:
+            return
+        batch = pending[:]
+        pending.clear()
+        chunks = [chunk for item in batch for chunk in item.chunks]
+        started = time.monotonic()
+        try:
+            embeddings = self.rag_service.embedding_service.generate_embeddings(chunks)
+            documents, offset = [], 0
+            for item in batch:
+                documents.append((str(item.document_id), embeddings[offset:offset + len(item.chunks)], item.metadata))
+                offset += len(item.chunks)
+            self.rag_service.vector_store.upsert_documents(documents)
+            db.execute(
+                update(Document).where(Document.id.in_([item.document_id for item in batch])).values(is_processed=True)
+            )
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            for item in batch:
+                self._reject(report, item.name, f"could not be embedded or stored: {e}", status="failed")
+            return
+
+        report.ingested += len(batch)
+        report.chunks += len(chunks)
+        metrics.inc("bulk_ingest_files_total", len(batch), status="ingested")
+        metrics.inc("document_ingest_chunks_embedded_total", len(chunks))
+        metrics.observe("bulk_ingest_batch_seconds", time.monotonic() - started)
+        logger.info(f"💾 Stored {len(chunks)} chunks of {len(batch)} documents")
+
+    def _copy_duplicates(self, db: Session, report: BulkIngestReport, duplicates: List[Tuple[int, int, str, Dict[str, Any]]]):
+        """Give documents with already indexed content a copy of those chunks"""
+        copied_ids = []
+        for document_id, source_id, name, metadata in duplicates:
+            try:
+                copied = self.rag_service.vector_store.copy_document(str(source_id), str(document_id), metadata)
+            except Exception as e:
+                copied, error = 0, str(e)
+            else:
+                error = "the document with the same content was not ingested"
+            if not copied:
+                self._reject(report, name, f"could not reuse chunks: {error}", status="failed")
+                continue
+            copied_ids.append(document_id)
+            report.chunks += copied
+        if copied_ids:
+            db.execute(update(Document).where(Document.id.in_(copied_ids)).values(is_processed=True))
+            db.commit()
+            report.reused += len(copied_ids)
+            metrics.inc("bulk_ingest_files_total", len(copied_ids), status="reused")
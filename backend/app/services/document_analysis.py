@@ -0,0 +1,259 @@
+"""
+Map-reduce document analysis for DISCERA
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import math
+from typing import Any, Dict, List
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.document_analysis import DocumentAnalysis, SectionSummary
+from app.models.test import DifficultyLevel
+from app.rag.document_processor import document_order
+from app.services.llm_usage import usage_recorder
+
+logger = logging.getLogger(__name__)
+
+WORDS_PER_MINUTE = 200
+# A chunk whose hash is divisible by this ends a section once the minimum size is reached
+SECTION_BOUNDARY_MODULUS = 3
+
+
+class DocumentAnalysisError(Exception):
+    """Raised when a document cannot be analyzed"""
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def split_sections(texts: List[str]) -> List[str]:
+    """Group consecutive chunk texts into sections for the map step.
+
+    Boundaries depend on chunk content rather than on running offsets, so an
+    edit early in a document only changes the sections around the edit and
+    every other section keeps its hash (and its cached summary).
+    """
+    sections, current, length = [], [], 0
+    for text in texts:
+        current.append(text)
+        length += len(text)
+        at_boundary = int(_sha256(text)[:8], 16) % SECTION_BOUNDARY_MODULUS == 0
+        if length >= settings.ANALYSIS_SECTION_MAX_CHARS or (
+                length >= settings.ANALYSIS_SECTION_MIN_CHARS and at_boundary):
+            sections.append("\n\n".join(current))
+            current, length = [], 0
+    if current:
+        sections.append("\n\n".join(current))
+    return sections
+
+
+def _string_list(value: Any) -> List[str]:
+    if not isinstance(value, list):
+        return []
+    return [str(item).strip() for item in value if str(item).strip()]
+
+
+def _analysis_payload(data: Any) -> Dict[str, Any]:
+    """Keep only the expected fields of a model response, with safe types"""
+    data = data if isinstance(data, dict) else {}
+    difficulty = str(data.get("difficulty_level") or "").strip().lower()
+    return {
+        "summary": str(data.get("summary") or "").strip(),
+        "key_concepts": _string_list(data.get("key_concepts")),
+        "topics": _string_list(data.get("topics")),
+        "difficulty_level": difficulty if difficulty in {level.value for level in DifficultyLevel} else "medium",
+        "learning_objectives": _string_list(data.get("learning_objectives"))
+    }
+
+
+def delete_document_analysis(db: Session, document_id: int):
+    """Remove a document's stored analysis in the caller's transaction; section summaries stay shared"""
+    db.query(DocumentAnalysis).filter(DocumentAnalysis.document_id == document_id).delete(synchronize_session=False)
+
+
+class DocumentAnalyzer:
+    """Analyze documents of any length with a map-reduce over their chunks.
+
+    Sections are summarized concurrently (capped by a semaphore) and the
+    summaries are combined, hierarchically when they do not fit one request.
+    Section summaries are cached by content hash and the final analysis by a
+    hash over all section hashes, so repeating an analysis is free and a
+    changed document only re-summarizes the sections that changed.
+    """
+
+    def __init__(self, rag_service=None, ai_service=None, concurrency: int = settings.AI_GENERATION_CONCURRENCY):
+        self._rag_service = rag_service
+        self._ai_service = ai_service
+        self.concurrency = max(1, concurrency)
+
+    @property
+    def rag_service(self):
+        if self._rag_service is None:
+            from app.rag.rag_service import get_rag_service
+            self._rag_service = get_rag_service()
+        return self._rag_service
+
+    @property
+    def ai_service(self):
+        if self._ai_service is None:
+            from app.ai.openai_service import OpenAIService
+            self._ai_service = OpenAIService()
+        return self._ai_service
+
+    def load_texts(self, document) -> List[str]:
+        """Chunk texts in document order, from the vector store or the file itself"""
+        chunks = self.rag_service.vector_store.get_document_chunks(str(document.id), include_embeddings=False)
+        if chunks:
+            chunks.sort(key=document_order)
+            return [chunk["content"] for chunk in chunks]
+
+        try:
+            chunks = self.rag_service.document_processor.process_document(
+                document.file_path, document.file_type, document.blob_hash
+            )
+            return [chunk.content for chunk in chunks]
+        except Exception as e:
+            raise DocumentAnalysisError(f"Could not read document: {e}")
+
+    async def summarize_sections(self, sections: Dict[str, str]) -> Dict[str, Any]:
+        """Map step: summarize sections concurrently.
+
+        Returns a summary, or the exception that prevented it, per section hash.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def summarize(content: str) -> Dict[str, Any]:
+            async with semaphore:
+                result = await asyncio.to_thread(self.ai_service.summarize_section, content)
+            if not result["success"]:
+                raise DocumentAnalysisError(result.get("error", "summarization failed"))
+            return _analysis_payload(result.get("data"))
+
+        results = await asyncio.gather(
+            *(summarize(content) for content in sections.values()),
+            return_exceptions=True
+        )
+        return dict(zip(sections, results))
+
+    async def reduce(self, summaries: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Reduce step: combine summaries, in groups when they are too large for one call"""
+        while len(summaries) > 1:
+            groups, group, size = [], [], 0
+            for summary in summaries:
+                summary_size = len(json.dumps(summary, ensure_ascii=False))
+                if group and size + summary_size > settings.ANALYSIS_REDUCE_MAX_CHARS:
+                    groups.append(group)
+                    group, size = [], 0
+                group.append(summary)
+                size += summary_size
+            groups.append(group)
+            if len(groups) == 1:
+                break
+
+            semaphore = asyncio.Semaphore(self.concurrency)
+
+            async def combine(group: List[Dict[str, Any]]) -> Dict[str, Any]:
+                if len(group) == 1:
+                    return group[0]
+                async with semaphore:
+                    return await self._combine(group)
+
+            summaries = await asyncio.gather(*(combine(group) for group in groups))
+
+        return await self._combine(summaries)
+
+    async def _combine(self, summaries: List[Dict[str, Any]]) -> Dict[str, Any]:
+        result = await asyncio.to_thread(self.ai_service.combine_summaries, summaries)
+        if not result["success"]:
+            raise DocumentAnalysisError(result.get("error", "combining summaries failed"))
+        return _analysis_payload(result.get("data"))
+
+    async def analyze(self, db: Session, document, refresh: bool = False) -> Dict[str, Any]:
+        """Analyze a document, reusing every cached result that is still valid"""
+        texts = await asyncio.to_thread(self.load_texts, document)
+        sections = split_sections([text for text in texts if text.strip()])
+        if not sections:
+            raise DocumentAnalysisError("Document has no extractable text")
+
+        hashes = [_sha256(section) for section in sections]
+        document_hash = _sha256("".join(hashes))
+
+        cached = db.query(DocumentAnalysis).filter(DocumentAnalysis.document_id == document.id).first()
+        if cached and cached.content_hash == document_hash and not refresh:
+            self._record_cache_hits("analyze_document", 1)
+            return {**json.loads(cached.analysis), "cached": True, "sections_recomputed": 0}
+
+        if not self.ai_service.is_available():
+            raise DocumentAnalysisError("AI service is not configured")
+
+        stored = {}
+        if not refresh:
+            stored = {
+                row.content_hash: json.loads(row.summary)
+                for row in db.query(SectionSummary).filter(SectionSummary.content_hash.in_(set(hashes))).all()
+            }
+        missing = {content_hash: section for content_hash, section in zip(hashes, sections) if content_hash not in stored}
+        self._record_cache_hits("summarize_section", len(set(hashes)) - len(missing))
+
+        summarized = await self.summarize_sections(missing)
+        failed = [result for result in summarized.values() if isinstance(result, Exception)]
+        # Keep finished summaries even if other sections failed; a retry only redoes the failures
+        for content_hash, summary in summarized.items():
+            if not isinstance(summary, Exception):
+                db.merge(SectionSummary(
+                    content_hash=content_hash,
+                    summary=json.dumps(summary, ensure_ascii=False),
+                    model=getattr(self.ai_service, "model", None)
+                ))
+                stored[content_hash] = summary
+        self._commit(db)
+        if failed:
+            raise DocumentAnalysisError(f"{len(failed)} of {len(missing)} sections failed: {failed[0]}")
+
+        analysis = await self.reduce([stored[content_hash] for content_hash in hashes])
+        # Chunks overlap, so the word count is an upper bound
+        words = sum(len(section.split()) for section in sections)
+        analysis.update({
+            "sections": len(sections),
+            "word_count": words,
+            "estimated_reading_time": f"{max(1, math.ceil(words / WORDS_PER_MINUTE))} minutes"
+        })
+
+        db.merge(DocumentAnalysis(
+            document_id=document.id,
+            content_hash=document_hash,
+            analysis=json.dumps(analysis, ensure_ascii=False),
+            sections=len(sections),
+            model=getattr(self.ai_service, "model", None)
+        ))
+        self._commit(db)
+
+        logger.info(f"✅ Analyzed document {document.id}: {len(missing)}/{len(sections)} sections summarized")
+        return {**analysis, "cached": False, "sections_recomputed": len(missing)}
+
+    def _record_cache_hits(self, operation: str, count: int):
+        """Ledger entries for LLM calls that a cached result made unnecessary"""
+        for _ in range(count):
+            usage_recorder.record(
+                provider="openai",
+                model=getattr(self.ai_service, "model", "unknown"),
+                operation=operation,
+                cache_hit=True
+            )
+
+    @staticmethod
+    def _commit(db: Session):
+        try:
+            db.commit()
+        except IntegrityError:
+            # A concurrent analysis stored the same rows first
+            db.rollback()
+
+
+document_analyzer = DocumentAnalyzer()
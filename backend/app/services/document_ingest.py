@@ -0,0 +1,158 @@
+"""
+Background ingestion of uploaded documents into the RAG index for DISCERA
+"""
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.core.metrics import metrics
+from app.models.document import Document
+from app.services.blob_storage import BlobStore, StagedBlob, acquire_blob, blob_store
+
+logger = logging.getLogger(__name__)
+
+
+def add_document(
+    db: Session,
+    staged: StagedBlob,
+    filename: str,
+    file_type: str,
+    owner_id: int,
+    store: Optional[BlobStore] = None
+) -> Document:
+    """Publish a staged upload as a shared blob and add a document for it (not committed)"""
+    blob = acquire_blob(db, staged, store or blob_store)
+    document = Document(
+        title=filename,
+        filename=filename,
+        file_path=blob.file_path,
+        file_size=staged.size,
+        file_type=file_type,
+        owner_id=owner_id,
+        blob_hash=blob.sha256
+    )
+    db.add(document)
+    db.flush()
+    return document
+
+
+class DocumentIngestor:
+    """Parse, chunk and embed uploaded documents.
+
+    Documents that share a blob (the same file uploaded again) reuse the
+    chunks and embeddings of an already processed copy instead of being
+    parsed and embedded a second time. Ingests of the same blob are
+    serialized in this process so a burst of identical uploads pays once.
+    """
+
+    def __init__(self, rag_service=None, session_factory=None):
+        self._rag_service = rag_service
+        self._session_factory = session_factory
+        self._locks_guard = threading.Lock()
+        # blob hash -> [lock, ingests holding or waiting for it]; removed when unused
+        self._blob_locks: Dict[str, List[Any]] = {}
+
+    @property
+    def rag_service(self):
+        if self._rag_service is None:
+            from app.rag.rag_service import get_rag_service
+            self._rag_service = get_rag_service()
+        return self._rag_service
+
+    @property
+    def session_factory(self):
+        if self._session_factory is None:
+            from app.core.database import SessionLocal
+            self._session_factory = SessionLocal
+        return self._session_factory
+
+    @contextmanager
+    def _blob_lock(self, blob_hash: Optional[str]) -> Iterator[None]:
+        key = blob_hash or ""
+        with self._locks_guard:
+            entry = self._blob_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._locks_guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._blob_locks[key]
+
+    @staticmethod
+    def _chunk_metadata(document: Document) -> Dict[str, Any]:
+        return {"user_id": document.owner_id, "title": document.title, "file_type": document.file_type}
+
+    def ingest(self, document_id: int) -> Dict[str, Any]:
+        """Index one document; safe to run from a background task"""
+        db = self.session_factory()
+        try:
+            document = db.get(Document, document_id)
+            if document is None:
+                return {"document_id": document_id, "status": "missing"}
+
+            with self._blob_lock(document.blob_hash):
+                result = self._ingest(db, document)
+            document.is_processed = True
+            db.commit()
+            return result
+        except Exception as e:
+            db.rollback()
+            metrics.inc("document_ingest_failures_total")
+            logger.error(f"❌ Error ingesting document {document_id}: {e}")
+            return {"document_id": document_id, "status": "failed", "error": str(e)}
+        finally:
+            db.close()
+
+    def _ingest(self, db: Session, document: Document) -> Dict[str, Any]:
+        # A fresh upload of known content copies the indexed chunks; a
+        # re-upload is diffed against the document's own chunks instead
+        source = None if document.is_processed else self.find_processed_copy(db, document)
+        if source is not None:
+            copied = self.rag_service.vector_store.copy_document(
+                str(source.id), str(document.id), self._chunk_metadata(document)
+            )
+            if copied:
+                document.content = source.content
+                metrics.inc("document_ingest_total", reused="true")
+                return {"document_id": document.id, "status": "reused", "source_document_id": source.id,
+                        "chunks": copied}
+
+        summary = self.rag_service.reingest_document(
+            file_path=document.file_path,
+            file_type=document.file_type,
+            document_id=str(document.id),
+            metadata=self._chunk_metadata(document),
+            file_hash=document.blob_hash
+        )
+        metrics.inc("document_ingest_total", reused="false")
+        metrics.inc("document_ingest_chunks_embedded_total", summary["chunks_added"])
+        return {
+            "document_id": document.id,
+            "status": "processed",
+            "chunks": summary["total_chunks"],
+            **{key: summary[key] for key in ("chunks_added", "chunks_removed", "chunks_moved", "chunks_unchanged")}
+        }
+
+    def delete(self, document_id: int) -> bool:
+        """Remove a deleted document's chunks from the index"""
+        return self.rag_service.delete_document(str(document_id))
+
+    @staticmethod
+    def find_processed_copy(db: Session, document: Document) -> Optional[Document]:
+        """Another processed document with the same content"""
+        if not document.blob_hash:
+            return None
+        return db.query(Document).filter(
+            Document.blob_hash == document.blob_hash,
+            Document.id != document.id,
+            Document.is_processed == True
+        ).order_by(Document.id).first()
+
+
+document_ingestor = DocumentIngestor()
@@ -0,0 +1,322 @@
+"""
+Background test generation jobs for DISCERA
+"""
+import asyncio
+import json
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import and_, or_, update
+from sqlalchemy.orm import Session
+
+from app.ai.rate_limiter import BATCH, llm_call_context
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.generation_job import JobStatus, TestGenerationJob, TestGenerationJobSection
+from app.models.test import DifficultyLevel
+from app.models.user import User
+from app.services.test_generation import (
+    GeneratedQuestion, SectionPlan, TestGenerationError, TestGenerationPipeline, test_generation_pipeline
+)
+
+logger = logging.getLogger(__name__)
+
+
+def create_job(
+    db: Session,
+    owner_id: int,
+    document_id: int,
+    num_questions: int,
+    question_types: List[str],
+    difficulty: str,
+    pipeline: TestGenerationPipeline = test_generation_pipeline
+) -> TestGenerationJob:
+    """Validate a generation request and persist it as a pending job"""
+    question_types, difficulty_level = pipeline.validate_request(question_types, difficulty)
+
+    job = TestGenerationJob(
+        id=uuid.uuid4().hex,
+        owner_id=owner_id,
+        document_id=document_id,
+        num_questions=num_questions,
+        question_types=json.dumps(question_types),
+        difficulty=difficulty_level.value,
+        status=JobStatus.PENDING
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _as_utc(value: datetime) -> datetime:
+    # SQLite hands back naive UTC timestamps, Postgres aware ones
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+def lease_expired(job: TestGenerationJob, now: Optional[datetime] = None) -> bool:
+    """True when no worker has renewed the job within GENERATION_JOB_LEASE_SECONDS"""
+    seen = [_as_utc(value) for value in (job.heartbeat_at, job.updated_at, job.created_at) if value is not None]
+    if not seen:
+        return True
+    now = now or _utcnow()
+    return max(seen) < now - timedelta(seconds=settings.GENERATION_JOB_LEASE_SECONDS)
+
+
+def can_resume(job: TestGenerationJob) -> bool:
+    """Failed jobs, and pending or running jobs whose worker went away, can resume.
+
+    Liveness comes from the job's heartbeat in the database, so it holds
+    across worker processes: a pending job whose background task was lost
+    in a restart, or a running job whose worker died, stops renewing its
+    lease and becomes resumable once the lease runs out.
+    """
+    if job.status == JobStatus.FAILED:
+        return True
+    return job.status in (JobStatus.PENDING, JobStatus.RUNNING) and lease_expired(job)
+
+
+def claim_job(db: Session, job_id: str) -> bool:
+    """Atomically mark a job as running in this worker.
+
+    Fails when another worker holds a live lease on it, so a job resumed
+    twice, or from two processes, is only executed once.
+    """
+    now = _utcnow()
+    claimed = db.execute(
+        update(TestGenerationJob)
+        .where(
+            TestGenerationJob.id == job_id,
+            or_(
+                TestGenerationJob.status.in_([JobStatus.PENDING, JobStatus.FAILED]),
+                and_(
+                    TestGenerationJob.status == JobStatus.RUNNING,
+                    or_(
+                        TestGenerationJob.heartbeat_at.is_(None),
+                        TestGenerationJob.heartbeat_at < now - timedelta(seconds=settings.GENERATION_JOB_LEASE_SECONDS)
+                    )
+                )
+            )
+        )
+        .values(status=JobStatus.RUNNING, error=None, heartbeat_at=now)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    return claimed == 1
+
+
+def _renew_lease(job_id: str, session_factory):
+    db = session_factory()
+    try:
+        db.execute(
+            update(TestGenerationJob)
+            .where(TestGenerationJob.id == job_id, TestGenerationJob.status == JobStatus.RUNNING)
+            .values(heartbeat_at=_utcnow())
+        )
+        db.commit()
+    except Exception as e:
+        logger.warning(f"⚠️ Could not renew the lease of job {job_id}: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+async def _keep_lease(job_id: str, session_factory):
+    """Renew the job's heartbeat until cancelled"""
+    interval = settings.GENERATION_JOB_LEASE_SECONDS / 3
+    while True:
+        await asyncio.sleep(interval)
+        await asyncio.to_thread(_renew_lease, job_id, session_factory)
+
+
+def delete_document_jobs(db: Session, document_id: int):
+    """Remove a document's generation jobs with their sections, in the caller's transaction"""
+    for job in db.query(TestGenerationJob).filter(TestGenerationJob.document_id == document_id).all():
+        db.delete(job)
+
+
+def job_progress(job: TestGenerationJob) -> Dict[str, Any]:
+    """Serializable progress snapshot of a job"""
+    return {
+        "job_id": job.id,
+        "status": job.status.value,
+        "sections_total": job.sections_total or 0,
+        "sections_completed": job.sections_completed or 0,
+        "questions_generated": job.questions_generated or 0,
+        "test_id": job.test_id,
+        "error": job.error
+    }
+
+
+def _plan_sections(
+    db: Session,
+    job: TestGenerationJob,
+    pipeline: TestGenerationPipeline
+) -> List[TestGenerationJobSection]:
+    """Plan sections once; a resumed job keeps its original plan"""
+    if job.sections:
+        return list(job.sections)
+
+    plans = pipeline.plan_sections(job.document_id, job.num_questions)
+    reused = pipeline.reuse_questions(db, plans, job.owner_id, json.loads(job.question_types))
+    job.sections = [
+        TestGenerationJobSection(
+            section_index=plan.index,
+            title=plan.title,
+            content=plan.content,
+            num_questions=plan.num_questions,
+            embedding=json.dumps(plan.embedding) if plan.embedding is not None else None,
+            # Reused questions are stored up front; the LLM only fills the shortfall
+            questions=_dump_questions(reused.get(plan.index, [])),
+            status=JobStatus.COMPLETED if plan.num_questions <= 0 else JobStatus.PENDING
+        )
+        for plan in plans
+    ]
+    job.sections_total = len(plans)
+    job.sections_completed = sum(1 for plan in plans if plan.num_questions <= 0)
+    job.questions_generated = sum(len(questions) for questions in reused.values())
+    db.commit()
+    return list(job.sections)
+
+
+def _section_plan(section: TestGenerationJobSection) -> SectionPlan:
+    return SectionPlan(
+        index=section.section_index,
+        title=section.title or "",
+        content=section.content,
+        num_questions=section.num_questions,
+        embedding=json.loads(section.embedding) if section.embedding else None
+    )
+
+
+def _dump_questions(questions: List[GeneratedQuestion]) -> str:
+    return json.dumps([q.model_dump(mode="json") for q in questions], ensure_ascii=False)
+
+
+def _section_questions(section: TestGenerationJobSection) -> List[GeneratedQuestion]:
+    return [GeneratedQuestion.model_validate(item) for item in json.loads(section.questions or "[]")]
+
+
+async def run_job(job_id: str, pipeline: TestGenerationPipeline = test_generation_pipeline, session_factory=SessionLocal):
+    """Execute (or resume) a job.
+
+    Sections that already completed are skipped, so a resumed job only repeats
+    the LLM calls that failed. Each section's questions are committed as soon
+    as they arrive. LLM calls are metered against the job owner's quota in
+    the batch lane.
+    """
+    db = session_factory()
+    try:
+        owner = db.query(User.id, User.role).join(
+            TestGenerationJob, TestGenerationJob.owner_id == User.id
+        ).filter(TestGenerationJob.id == job_id).first()
+    finally:
+        db.close()
+
+    with llm_call_context(
+        user_id=owner.id if owner else None,
+        role=owner.role if owner else None,
+        priority=BATCH,
+        endpoint="ai.generate_test_job"
+    ):
+        await _execute_job(job_id, pipeline, session_factory)
+
+
+async def _execute_job(job_id: str, pipeline: TestGenerationPipeline, session_factory):
+    db = session_factory()
+    lease = None
+    try:
+        if not claim_job(db, job_id):
+            logger.info(f"Test generation job {job_id} is missing or already running elsewhere")
+            return
+        lease = asyncio.create_task(_keep_lease(job_id, session_factory))
+        job = db.query(TestGenerationJob).filter(TestGenerationJob.id == job_id).one()
+
+        try:
+            # Retrieval and question bank lookups block; keep the loop free for the lease
+            sections = await asyncio.to_thread(_plan_sections, db, job, pipeline)
+        except TestGenerationError as e:
+            job.status = JobStatus.FAILED
+            job.error = str(e)
+            db.commit()
+            return
+
+        question_types = json.loads(job.question_types)
+        difficulty = job.difficulty
+        pending = [section for section in sections if section.status != JobStatus.COMPLETED]
+        semaphore = asyncio.Semaphore(pipeline.concurrency)
+
+        async def generate(section: TestGenerationJobSection):
+            try:
+                questions = await pipeline.generate_section(
+                    _section_plan(section), question_types, difficulty, semaphore
+                )
+            except Exception as e:
+                section.status = JobStatus.FAILED
+                section.error = str(e)
+                db.commit()
+                return
+
+            section.questions = _dump_questions(_section_questions(section) + questions)
+            section.status = JobStatus.COMPLETED
+            section.error = None
+            job.sections_completed = (job.sections_completed or 0) + 1
+            job.questions_generated = (job.questions_generated or 0) + len(questions)
+            db.commit()
+
+        # Database writes happen on the event loop thread only; LLM calls run in worker threads
+        await asyncio.gather(*(generate(section) for section in pending))
+
+        failed = [section for section in sections if section.status != JobStatus.COMPLETED]
+        if failed:
+            job.status = JobStatus.FAILED
+            job.error = f"{len(failed)} of {len(sections)} sections failed; resume the job to retry them"
+            db.commit()
+            return
+
+        try:
+            questions = await asyncio.to_thread(
+                pipeline.finalize_questions,
+                [_section_questions(section) for section in sections],
+                job.num_questions
+            )
+        except TestGenerationError as e:
+            job.status = JobStatus.FAILED
+            job.error = str(e)
+            db.commit()
+            return
+
+        def complete_job(test):
+            # Committed together with the test, so a crash cannot create it twice
+            job.test_id = test.id
+            job.status = JobStatus.COMPLETED
+
+        test, rows = pipeline.save_test(
+            db,
+            creator_id=job.owner_id,
+            title=f"Test generated from {job.document.title}",
+            difficulty=DifficultyLevel(job.difficulty),
+            questions=questions,
+            before_commit=complete_job
+        )
+        logger.info(f"✅ Test generation job {job_id} completed: test {test.id}")
+        await pipeline.index_questions(rows, job.owner_id, DifficultyLevel(job.difficulty))
+
+    except Exception as e:
+        logger.error(f"❌ Test generation job {job_id} failed: {e}")
+        db.rollback()
+        job = db.query(TestGenerationJob).filter(TestGenerationJob.id == job_id).first()
+        if job:
+            job.status = JobStatus.FAILED
+            job.error = str(e)
+            db.commit()
+    finally:
+        if lease is not None:
+            lease.cancel()
+        db.close()
@@ -0,0 +1,395 @@
+"""
+Grading services for DISCERA tests
+"""
+import json
+import logging
+import threading
+from array import array
+from dataclasses import dataclass
+from itertools import compress
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import event, inspect, update
+from sqlalchemy.orm import Session, object_session
+
+from app.models.test import Test, Question, QuestionType, TestResult, TestAnswer
+from app.services.short_answer_grading import ShortAnswerGrader, ShortAnswerItem, normalize_short_answer
+
+logger = logging.getLogger(__name__)
+
+
+TRUE_FALSE_ALIASES = {
+    "true": "true", "t": "true", "yes": "true", "da": "true", "tačno": "true", "tacno": "true",
+    "false": "false", "f": "false", "no": "false", "ne": "false", "netačno": "false", "netacno": "false",
+}
+
+
+def normalize_answer(answer: Any) -> str:
+    """Case-fold and collapse whitespace in an answer"""
+    if answer is None:
+        return ""
+    return " ".join(str(answer).casefold().split())
+
+
+def _parse_options(options: Optional[str]) -> List[str]:
+    if not options:
+        return []
+    try:
+        parsed = json.loads(options)
+    except (TypeError, ValueError):
+        return []
+    return [str(option) for option in parsed] if isinstance(parsed, list) else []
+
+
+def _option_index_map(options: List[str]) -> Dict[str, int]:
+    """Map normalised option text and option letter (a, b, c...) to option index"""
+    index_map = {}
+    for i, option in enumerate(options):
+        index_map.setdefault(normalize_answer(option), i)
+    for i in range(min(len(options), 26)):
+        index_map.setdefault(chr(ord("a") + i), i)
+    return index_map
+
+
+@dataclass
+class GradedSubmission:
+    """Per-question grading outcome for one submission"""
+    answers: List[str]
+    correct: List[bool]
+    points_earned: List[int]
+    score: int
+    total_points: int
+
+    @property
+    def percentage(self) -> int:
+        return int((self.score / self.total_points) * 100) if self.total_points > 0 else 0
+
+
+class CompiledAnswerKey:
+    """Answer key for a whole test, normalised once for repeated grading.
+
+    Questions are stored column-wise in question order: normalised answers,
+    points in an array, and option-index maps for multiple choice questions.
+    """
+
+    def __init__(self, test_id: int, is_active: bool, questions: List[Any], version: int = 0):
+        self.test_id = test_id
+        self.is_active = is_active
+        self.version = version
+        self.question_ids: Tuple[int, ...] = tuple(q.id for q in questions)
+        self.question_keys: Tuple[str, ...] = tuple(str(q.id) for q in questions)
+        self.position: Dict[int, int] = {qid: i for i, qid in enumerate(self.question_ids)}
+        self.question_types: Tuple[QuestionType, ...] = tuple(q.question_type for q in questions)
+        self.points = array("i", (q.points or 0 for q in questions))
+        self.total_points = sum(self.points)
+        self.option_maps: Dict[int, Dict[str, int]] = {}
+        self.correct_options: Dict[int, int] = {}
+        self.accepted_variants: Dict[int, Tuple[str, ...]] = {}
+        self.question_texts: Dict[int, str] = {}
+
+        answers = []
+        for i, question in enumerate(questions):
+            answer = normalize_answer(question.correct_answer)
+            if question.question_type == QuestionType.TRUE_FALSE:
+                answer = TRUE_FALSE_ALIASES.get(answer, answer)
+            elif question.question_type == QuestionType.MULTIPLE_CHOICE:
+                index_map = _option_index_map(_parse_options(question.options))
+                if answer in index_map:
+                    self.option_maps[i] = index_map
+                    self.correct_options[i] = index_map[answer]
+            elif question.question_type == QuestionType.SHORT_ANSWER:
+                variants = [question.correct_answer] + _parse_options(question.accepted_answers)
+                self.accepted_variants[i] = tuple(dict.fromkeys(
+                    v for v in map(normalize_short_answer, variants) if v
+                ))
+                self.question_texts[i] = question.question_text
+            answers.append(answer)
+        self.answers: Tuple[str, ...] = tuple(answers)
+
+    def __len__(self) -> int:
+        return len(self.question_ids)
+
+    def is_correct(self, position: int, answer: str) -> bool:
+        """Check a normalised answer against the key for one question"""
+        option_map = self.option_maps.get(position)
+        if option_map is not None:
+            return option_map.get(answer) == self.correct_options[position]
+        variants = self.accepted_variants.get(position)
+        if variants is not None:
+            return normalize_short_answer(answer) in variants
+        if self.question_types[position] == QuestionType.TRUE_FALSE:
+            answer = TRUE_FALSE_ALIASES.get(answer, answer)
+        return answer == self.answers[position]
+
+    def short_answer_item(self, position: int, answer: str) -> ShortAnswerItem:
+        """Build a short answer grading item for one question"""
+        return ShortAnswerItem(
+            answer=answer,
+            accepted=self.accepted_variants[position],
+            question=self.question_texts.get(position, "")
+        )
+
+    def grade(
+        self,
+        submitted: Dict[Any, Any],
+        short_answer_grader: Optional[ShortAnswerGrader] = None
+    ) -> GradedSubmission:
+        """Grade a `{question_id: answer}` mapping in one pass over the key"""
+        raw_answers = [
+            "" if submitted.get(key) is None else str(submitted.get(key))
+            for key in self.question_keys
+        ]
+        return self.grade_answers(raw_answers, short_answer_grader)
+
+    def grade_answers(
+        self,
+        raw_answers: List[str],
+        short_answer_grader: Optional[ShortAnswerGrader] = None
+    ) -> GradedSubmission:
+        """Grade answers given in question order.
+
+        Short answers that fail the exact check are graded together in one
+        `short_answer_grader` batch when a grader is given.
+        """
+        correct = list(map(self.is_correct, range(len(self)), map(normalize_answer, raw_answers)))
+        if short_answer_grader is not None:
+            pending = [i for i in self.accepted_variants if not correct[i] and raw_answers[i].strip()]
+            if pending:
+                verdicts = short_answer_grader.grade_batch(
+                    [self.short_answer_item(i, raw_answers[i]) for i in pending]
+                )
+                for i, verdict in zip(pending, verdicts):
+                    correct[i] = verdict.is_correct
+        points_earned = [points if ok else 0 for points, ok in zip(self.points, correct)]
+        return GradedSubmission(
+            answers=raw_answers,
+            correct=correct,
+            points_earned=points_earned,
+            score=sum(compress(self.points, correct)),
+            total_points=self.total_points
+        )
+
+
+class AnswerKeyCache:
+    """Process-wide cache of compiled per-test answer keys.
+
+    Every change to a `Test` or one of its `Question` rows made through the
+    ORM bumps `tests.answer_key_version` in the same transaction. `get()`
+    reads that version with one primary-key lookup and recompiles when the
+    cached key is from another version, so edits committed by other worker
+    processes are picked up on the next submission. Bulk `query.update()`
+    calls bypass ORM events and must call `bump_answer_key_version()`.
+    """
+
+    def __init__(self):
+        self._keys: Dict[int, CompiledAnswerKey] = {}
+        self._lock = threading.Lock()
+        self._generation = 0  # advanced by every local invalidation
+
+    def get(self, db: Session, test_id: int) -> Optional[CompiledAnswerKey]:
+        """Return the compiled answer key for a test, building it if needed"""
+        current = db.query(Test.answer_key_version).filter(Test.id == test_id).first()
+        if current is None:
+            return None
+        with self._lock:
+            key = self._keys.get(test_id)
+            generation = self._generation
+        if key is not None and key.version == current.answer_key_version:
+            return key
+
+        key = self._compile(db, test_id)
+        if key is not None:
+            with self._lock:
+                # An invalidation that landed during the compile may have made this key stale
+                if self._generation == generation:
+                    self._keys[test_id] = key
+        return key
+
+    def invalidate(self, test_id: int):
+        """Drop the cached key for a test"""
+        with self._lock:
+            self._generation += 1
+            self._keys.pop(test_id, None)
+
+    def clear(self):
+        """Drop all cached keys"""
+        with self._lock:
+            self._generation += 1
+            self._keys.clear()
+
+    def _compile(self, db: Session, test_id: int) -> Optional[CompiledAnswerKey]:
+        # Version first: the questions read below are at least as new as it
+        test = db.query(Test.id, Test.is_active, Test.answer_key_version).filter(Test.id == test_id).first()
+        if not test:
+            return None
+
+        questions = db.query(
+            Question.id,
+            Question.question_type,
+            Question.correct_answer,
+            Question.options,
+            Question.accepted_answers,
+            Question.question_text,
+            Question.points
+        ).filter(Question.test_id == test_id).order_by(Question.id).all()
+
+        logger.info(f"Compiled answer key for test {test_id} (version {test.answer_key_version}): "
+                    f"{len(questions)} questions")
+        return CompiledAnswerKey(test_id, bool(test.is_active), questions, test.answer_key_version)
+
+
+answer_key_cache = AnswerKeyCache()
+
+
+def _pending_invalidations(target) -> Optional[Set[int]]:
+    session = object_session(target)
+    if session is None:
+        return None
+    return session.info.setdefault("answer_key_invalidations", set())
+
+
+def bump_answer_key_version(connection, test_id: int):
+    """Mark a test's answer key as changed for every process, in the caller's transaction"""
+    connection.execute(
+        update(Test).where(Test.id == test_id).values(answer_key_version=Test.answer_key_version + 1)
+    )
+
+
+def _invalidate_test(target, test_id: Optional[int], connection=None):
+    if test_id is None:
+        return
+    if connection is not None:
+        bump_answer_key_version(connection, test_id)
+    answer_key_cache.invalidate(test_id)
+    # Invalidate again on commit so a concurrent reload cannot cache uncommitted state
+    pending = _pending_invalidations(target)
+    if pending is not None:
+        pending.add(test_id)
+
+
+@event.listens_for(Question, "after_insert")
+@event.listens_for(Question, "after_update")
+@event.listens_for(Question, "after_delete")
+def _on_question_change(mapper, connection, target):
+    _invalidate_test(target, target.test_id, connection)
+    for previous_test_id in inspect(target).attrs.test_id.history.deleted or ():
+        _invalidate_test(target, previous_test_id, connection)
+
+
+@event.listens_for(Test, "after_update")
+def _on_test_update(mapper, connection, target):
+    _invalidate_test(target, target.id, connection)
+
+
+@event.listens_for(Test, "after_delete")
+def _on_test_delete(mapper, connection, target):
+    _invalidate_test(target, target.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _on_commit(session):
+    pending = session.info.pop("answer_key_invalidations", None)
+    for test_id in pending or ():
+        answer_key_cache.invalidate(test_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _on_rollback(session):
+    # A key compiled from the rolled-back state carries a version that may be reused
+    pending = session.info.pop("answer_key_invalidations", None)
+    for test_id in pending or ():
+        answer_key_cache.invalidate(test_id)
+
+
+def regrade_test(
+    db: Session,
+    test_id: int,
+    short_answer_grader: Optional[ShortAnswerGrader] = None
+) -> Dict[str, int]:
+    """Re-grade every stored answer for a test against its current key.
+
+    Used after an answer key is corrected. Short answers from all submissions
+    are graded in a single batch; changed `TestAnswer` rows and all
+    `TestResult` totals are written back with bulk updates in one transaction.
+    """
+    answer_key_cache.invalidate(test_id)
+    key = answer_key_cache.get(db, test_id)
+    if key is None:
+        raise ValueError(f"Test {test_id} not found")
+
+    rows = db.query(
+        TestAnswer.id,
+        TestAnswer.test_result_id,
+        TestAnswer.question_id,
+        TestAnswer.answer_text,
+        TestAnswer.is_correct,
+        TestAnswer.points_earned
+    ).join(TestResult, TestAnswer.test_result_id == TestResult.id).filter(
+        TestResult.test_id == test_id
+    ).all()
+
+    # Question removed from the test -> position None, the answer no longer scores
+    positions = [key.position.get(row.question_id) for row in rows]
+    correct = [
+        position is not None and key.is_correct(position, normalize_answer(row.answer_text))
+        for row, position in zip(rows, positions)
+    ]
+
+    if short_answer_grader is not None:
+        pending = [
+            i for i, (row, position) in enumerate(zip(rows, positions))
+            if position in key.accepted_variants and not correct[i] and row.answer_text.strip()
+        ]
+        if pending:
+            verdicts = short_answer_grader.grade_batch(
+                [key.short_answer_item(positions[i], rows[i].answer_text) for i in pending]
+            )
+            for i, verdict in zip(pending, verdicts):
+                correct[i] = verdict.is_correct
+
+    answer_updates = []
+    scores: Dict[int, int] = {}
+    for row, position, is_correct in zip(rows, positions, correct):
+        points_earned = key.points[position] if is_correct else 0
+        scores[row.test_result_id] = scores.get(row.test_result_id, 0) + points_earned
+
+        if is_correct != row.is_correct or points_earned != row.points_earned:
+            answer_updates.append({
+                "id": row.id,
+                "is_correct": is_correct,
+                "points_earned": points_earned
+            })
+    result_ids = [
+        result_id for (result_id,) in
+        db.query(TestResult.id).filter(TestResult.test_id == test_id).all()
+    ]
+    total_points = key.total_points
+    result_updates = [
+        {
+            "id": result_id,
+            "score": scores.get(result_id, 0),
+            "total_points": total_points,
+            "percentage": int((scores.get(result_id, 0) / total_points) * 100) if total_points > 0 else 0
+        }
+        for result_id in result_ids
+    ]
+
+    try:
+        if answer_updates:
+            db.execute(update(TestAnswer), answer_updates)
+        if result_updates:
+            db.execute(update(TestResult), result_updates)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    logger.info(
+        f"Re-graded test {test_id}: {len(rows)} answers, "
+        f"{len(answer_updates)} changed, {len(result_updates)} results updated"
+    )
+    return {
+        "answers_checked": len(rows),
+        "answers_changed": len(answer_updates),
+        "results_updated": len(result_updates)
+    }
@@ -0,0 +1,238 @@
+"""
+LLM usage ledger and hourly rollups for DISCERA
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import case, func, insert
+from sqlalchemy.orm import Session
+
+from app.ai.rate_limiter import LLMCallContext, current_llm_context
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.models.llm_usage import LLMUsageEvent, LLMUsageRollup
+
+logger = logging.getLogger(__name__)
+
+_events = LLMUsageEvent.__table__
+_rollups = LLMUsageRollup.__table__
+
+ROLLUP_KEY = ("hour", "user_id", "endpoint", "model")
+ROLLUP_SUMS = ("calls", "errors", "cache_hits", "prompt_tokens", "completion_tokens",
+               "total_tokens", "latency_ms_sum", "cost_usd")
+GROUP_COLUMNS = {
+    "endpoint": LLMUsageRollup.endpoint,
+    "user": LLMUsageRollup.user_id,
+    "model": LLMUsageRollup.model,
+    "hour": LLMUsageRollup.hour
+}
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """USD cost from LLM_MODEL_PRICES (per 1K prompt and completion tokens)"""
+    prompt_price, completion_price = settings.LLM_MODEL_PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+
+
+def _rollup_upsert(db: Session, rows: List[Dict[str, Any]]):
+    """Add rows to the rollup table with one atomic INSERT ... ON CONFLICT DO UPDATE"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+
+    statement = dialect_insert(_rollups).values(rows)
+    excluded = statement.excluded
+    updates = {name: _rollups.c[name] + excluded[name] for name in ROLLUP_SUMS}
+    updates["latency_ms_max"] = case(
+        (excluded.latency_ms_max > _rollups.c.latency_ms_max, excluded.latency_ms_max),
+        else_=_rollups.c.latency_ms_max
+    )
+    db.execute(statement.on_conflict_do_update(index_elements=list(ROLLUP_KEY), set_=updates))
+
+
+class UsageRecorder:
+    """Buffers usage events and writes them in batches.
+
+    A flush appends the events to the ledger and folds them into the hourly
+    rollups in the same transaction, so the rollups always match the ledger.
+    Events of a failed write go back into the buffer for the next flush, and
+    whatever is buffered is written at interpreter exit. Recording never
+    raises: usage accounting must not fail an LLM call.
+    """
+
+    def __init__(
+        self,
+        session_factory=None,
+        flush_size: int = settings.LLM_USAGE_FLUSH_SIZE,
+        flush_interval: float = settings.LLM_USAGE_FLUSH_SECONDS,
+        background: bool = True,
+        max_buffered: int = settings.LLM_USAGE_MAX_BUFFERED
+    ):
+        self._session_factory = session_factory
+        self.flush_size = max(1, flush_size)
+        self.flush_interval = flush_interval
+        self.background = background
+        self.max_buffered = max(self.flush_size, max_buffered)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._buffer: List[Dict[str, Any]] = []
+        self._flusher: Optional[threading.Thread] = None
+        self._failing = False  # while writes fail, only the periodic flush retries
+
+    @property
+    def session_factory(self):
+        if self._session_factory is None:
+            from app.core.database import SessionLocal
+            self._session_factory = SessionLocal
+        return self._session_factory
+
+    def record(
+        self,
+        provider: str,
+        model: str,
+        operation: str,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        latency_ms: float = 0.0,
+        cache_hit: bool = False,
+        success: bool = True,
+        error: Optional[str] = None,
+        context: Optional[LLMCallContext] = None
+    ):
+        """Queue one usage event, attributed to the current LLM call context"""
+        context = context or current_llm_context()
+        event = {
+            "created_at": datetime.now(timezone.utc),
+            "provider": provider,
+            "model": model,
+            "operation": operation,
+            "endpoint": context.endpoint,
+            "user_id": context.user_id,
+            "role": context.role,
+            "priority": context.priority,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "latency_ms": latency_ms,
+            "cost_usd": estimate_cost(model, prompt_tokens, completion_tokens),
+            "cache_hit": cache_hit,
+            "success": success,
+            "error": error
+        }
+        metrics.inc("llm_tokens_total", prompt_tokens + completion_tokens, model=model, operation=operation)
+
+        with self._lock:
+            self._buffer.append(event)
+            full = len(self._buffer) >= self.flush_size and not (self._failing and self.background)
+            if self.background and self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_periodically, name="llm-usage", daemon=True)
+                self._flusher.start()
+                # The flusher is a daemon thread; write the last batch on the way out
+                atexit.register(self.flush)
+        if full:
+            self.flush()
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self) -> int:
+        """Write buffered events and update the rollups; returns the number written"""
+        with self._flush_lock:
+            with self._lock:
+                events, self._buffer = self._buffer, []
+            if not events:
+                return 0
+
+            rollups: Dict[tuple, Dict[str, Any]] = defaultdict(lambda: {
+                **{name: 0 for name in ROLLUP_SUMS}, "latency_ms_max": 0.0
+            })
+            for event in events:
+                key = (
+                    event["created_at"].replace(minute=0, second=0, microsecond=0),
+                    event["user_id"] or 0,
+                    event["endpoint"] or "",
+                    event["model"]
+                )
+                row = rollups[key]
+                row["calls"] += 1
+                row["errors"] += 0 if event["success"] else 1
+                row["cache_hits"] += 1 if event["cache_hit"] else 0
+                for name in ("prompt_tokens", "completion_tokens", "total_tokens", "cost_usd"):
+                    row[name] += event[name]
+                row["latency_ms_sum"] += event["latency_ms"]
+                row["latency_ms_max"] = max(row["latency_ms_max"], event["latency_ms"])
+
+            db = self.session_factory()
+            try:
+                db.execute(insert(_events), events)
+                _rollup_upsert(db, [dict(zip(ROLLUP_KEY, key), **row) for key, row in rollups.items()])
+                db.commit()
+                self._failing = False
+            except Exception as e:
+                db.rollback()
+                self._failing = True
+                self._requeue(events)
+                logger.error(f"❌ Failed to write {len(events)} LLM usage events, will retry: {e}")
+                return 0
+            finally:
+                db.close()
+            return len(events)
+
+    def _requeue(self, events: List[Dict[str, Any]]):
+        """Put unwritten events back ahead of newer ones, dropping the oldest past max_buffered"""
+        with self._lock:
+            self._buffer[:0] = events
+            overflow = len(self._buffer) - self.max_buffered
+            if overflow > 0:
+                del self._buffer[:overflow]
+        if overflow > 0:
+            metrics.inc("llm_usage_dropped_total", overflow)
+            logger.error(f"❌ Dropped {overflow} LLM usage events; the buffer is full")
+
+
+def get_usage_summary(db: Session, group_by: str = "endpoint", since_hours: int = 24) -> List[Dict[str, Any]]:
+    """Usage totals from the rollups, grouped by endpoint, user, model or hour"""
+    column = GROUP_COLUMNS[group_by]
+    since = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0) - timedelta(hours=since_hours)
+    rows = db.query(
+        column.label("key"),
+        func.sum(LLMUsageRollup.calls).label("calls"),
+        func.sum(LLMUsageRollup.errors).label("errors"),
+        func.sum(LLMUsageRollup.cache_hits).label("cache_hits"),
+        func.sum(LLMUsageRollup.prompt_tokens).label("prompt_tokens"),
+        func.sum(LLMUsageRollup.completion_tokens).label("completion_tokens"),
+        func.sum(LLMUsageRollup.total_tokens).label("total_tokens"),
+        func.sum(LLMUsageRollup.latency_ms_sum).label("latency_ms_sum"),
+        func.max(LLMUsageRollup.latency_ms_max).label("latency_ms_max"),
+        func.sum(LLMUsageRollup.cost_usd).label("cost_usd")
+    ).filter(LLMUsageRollup.hour >= since).group_by(column).order_by(
+        func.sum(LLMUsageRollup.total_tokens).desc()
+    ).all()
+
+    return [
+        {
+            group_by: row.key,
+            "calls": row.calls,
+            "errors": row.errors,
+            "cache_hits": row.cache_hits,
+            "prompt_tokens": row.prompt_tokens,
+            "completion_tokens": row.completion_tokens,
+            "total_tokens": row.total_tokens,
+            "avg_latency_ms": row.latency_ms_sum / row.calls if row.calls else 0.0,
+            "max_latency_ms": row.latency_ms_max,
+            "cost_usd": round(row.cost_usd, 6)
+        }
+        for row in rows
+    ]
+
+
+usage_recorder = UsageRecorder()
@@ -0,0 +1,237 @@
+"""
+Embedding-indexed question bank for DISCERA
+"""
+import json
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.test import Test, Question
+from app.services.analytics import get_question_quality
+
+logger = logging.getLogger(__name__)
+
+# Items answered correctly by fewer or more students than this tell little apart
+MIN_ITEM_DIFFICULTY = 0.2
+MAX_ITEM_DIFFICULTY = 0.9
+REINDEX_BATCH_SIZE = 256
+
+
+def _vector_id(question_id: int) -> str:
+    return f"question_{question_id}"
+
+
+class QuestionBank:
+    """Every stored question, embedded into its own cosine-space collection.
+
+    A question that is a near-duplicate of an earlier question by the same
+    teacher is indexed with `duplicate_of` pointing at the original, so only
+    canonical questions are offered for reuse. Reuse looks up questions close
+    to a document section and keeps those whose item statistics show they
+    work: enough attempts, moderate difficulty and positive discrimination.
+    """
+
+    def __init__(self, vector_store=None, embedding_service=None):
+        self._vector_store = vector_store
+        self._embedding_service = embedding_service
+
+    @property
+    def vector_store(self):
+        if self._vector_store is None:
+            from app.rag.vector_store import VectorStore
+            self._vector_store = VectorStore(
+                collection_name=settings.QUESTION_BANK_COLLECTION,
+                description="DISCERA Question Bank",
+                space="cosine"
+            )
+        return self._vector_store
+
+    @property
+    def embedding_service(self):
+        if self._embedding_service is None:
+            from app.rag.embedding_service import get_embedding_service
+            self._embedding_service = get_embedding_service()
+        return self._embedding_service
+
+    def add_questions(self, questions: Sequence[Dict[str, Any]]) -> Dict[int, int]:
+        """Index questions, detecting near-duplicates against the bank.
+
+        Each item needs `id`, `question_text`, `question_type`, `test_id`,
+        `creator_id` and `difficulty`. Returns {question_id: duplicate_of}
+        for the questions that repeat an existing one.
+        """
+        if not questions:
+            return {}
+
+        vectors = self.embedding_service.encode_texts([q["question_text"] for q in questions])
+        neighbours: List[List[Dict[str, Any]]] = [[] for _ in questions]
+        for creator_id in {q["creator_id"] for q in questions}:
+            positions = [i for i, q in enumerate(questions) if q["creator_id"] == creator_id]
+            results = self.vector_store.query_vectors(
+                vectors[positions].tolist(),
+                n_results=1,
+                where={"$and": [{"creator_id": int(creator_id)}, {"canonical": True}]}
+            )
+            for i, result in zip(positions, results):
+                neighbours[i] = result
+
+        duplicates: Dict[int, int] = {}
+        canonical: List[int] = []
+        metadatas = []
+        for i, question in enumerate(questions):
+            duplicate_of = None
+            for match in neighbours[i]:
+                if match["similarity"] >= settings.QUESTION_DEDUP_THRESHOLD:
+                    duplicate_of = int(match["metadata"]["question_id"])
+            if duplicate_of is None:
+                # Earlier questions of the same batch are not in the index yet
+                for j in canonical:
+                    if (questions[j]["creator_id"] == question["creator_id"]
+                            and float(vectors[j] @ vectors[i]) >= settings.QUESTION_DEDUP_THRESHOLD):
+                        duplicate_of = int(questions[j]["id"])
+                        break
+            if duplicate_of is None:
+                canonical.append(i)
+            else:
+                duplicates[int(question["id"])] = duplicate_of
+
+            metadatas.append({
+                "question_id": int(question["id"]),
+                "test_id": int(question["test_id"]),
+                "creator_id": int(question["creator_id"]),
+                "question_type": str(getattr(question["question_type"], "value", question["question_type"])),
+                "difficulty": str(getattr(question["difficulty"], "value", question["difficulty"] or "")),
+                "canonical": duplicate_of is None,
+                "duplicate_of": duplicate_of if duplicate_of is not None else -1
+            })
+
+        self.vector_store.upsert_vectors(
+            ids=[_vector_id(q["id"]) for q in questions],
+            embeddings=vectors.tolist(),
+            documents=[q["question_text"] for q in questions],
+            metadatas=metadatas
+        )
+        logger.info(f"✅ Indexed {len(questions)} questions ({len(duplicates)} near-duplicates)")
+        return duplicates
+
+    def index_saved_questions(
+        self,
+        rows: Sequence[Dict[str, Any]],
+        creator_id: int,
+        difficulty: Any
+    ) -> Dict[int, int]:
+        """Index rows just inserted for a test; failures never undo the insert"""
+        try:
+            return self.add_questions([
+                {**row, "creator_id": creator_id, "difficulty": difficulty}
+                for row in rows if row.get("id") is not None
+            ])
+        except Exception as e:
+            logger.warning(f"⚠️ Question bank indexing skipped: {e}")
+            return {}
+
+    def is_reusable(self, quality: Optional[Dict[str, Any]]) -> bool:
+        """Whether item statistics show the question discriminates well"""
+        if not quality or quality["attempts"] < settings.QUESTION_BANK_MIN_ATTEMPTS:
+            return False
+        difficulty, discrimination = quality["difficulty"], quality["discrimination"]
+        if difficulty is None or not MIN_ITEM_DIFFICULTY <= difficulty <= MAX_ITEM_DIFFICULTY:
+            return False
+        return discrimination is not None and discrimination >= settings.QUESTION_BANK_MIN_DISCRIMINATION
+
+    def find_reusable(
+        self,
+        db: Session,
+        embeddings: Sequence[Optional[List[float]]],
+        creator_id: int,
+        question_types: List[str],
+        limits: Sequence[int],
+        exclude_ids: Iterable[int] = ()
+    ) -> List[List[Question]]:
+        """Pick proven questions close to each section embedding.
+
+        Returns up to `limits[i]` questions for `embeddings[i]`; a question is
+        used at most once across all sections.
+        """
+        picked: List[List[Question]] = [[] for _ in embeddings]
+        queries = [i for i, embedding in enumerate(embeddings) if embedding is not None and limits[i] > 0]
+        if not queries:
+            return picked
+
+        where = {"$and": [
+            {"creator_id": creator_id},
+            {"canonical": True},
+            {"question_type": {"$in": list(question_types)}}
+        ]}
+        matches = self.vector_store.query_vectors(
+            [list(embeddings[i]) for i in queries],
+            n_results=max(limits[i] for i in queries) * 4,
+            where=where
+        )
+
+        candidate_ids = {
+            int(match["metadata"]["question_id"])
+            for section_matches in matches for match in section_matches
+            if match["similarity"] >= settings.QUESTION_BANK_REUSE_THRESHOLD
+        }
+        quality = get_question_quality(db, candidate_ids)
+        candidate_ids = {question_id for question_id in candidate_ids if self.is_reusable(quality.get(question_id))}
+        # Questions removed since they were indexed are simply skipped
+        rows = {
+            question.id: question
+            for question in db.query(Question).filter(Question.id.in_(candidate_ids)).all()
+        } if candidate_ids else {}
+
+        used: Set[int] = set(exclude_ids)
+        for position, section_matches in zip(queries, matches):
+            for match in section_matches:
+                question_id = int(match["metadata"]["question_id"])
+                if len(picked[position]) >= limits[position]:
+                    break
+                if match["similarity"] < settings.QUESTION_BANK_REUSE_THRESHOLD:
+                    break
+                if question_id in used or question_id not in rows:
+                    continue
+                used.add(question_id)
+                picked[position].append(rows[question_id])
+        return picked
+
+    def reindex(self, db: Session) -> Dict[str, int]:
+        """Rebuild the bank from every stored question, oldest first"""
+        if not self.vector_store.reset_collection():
+            raise RuntimeError("Could not reset the question bank collection")
+
+        indexed, duplicates, last_id = 0, 0, 0
+        while True:
+            batch = db.query(
+                Question.id, Question.question_text, Question.question_type, Question.test_id,
+                Test.creator_id, Test.difficulty
+            ).join(Test, Test.id == Question.test_id).filter(
+                Question.id > last_id
+            ).order_by(Question.id).limit(REINDEX_BATCH_SIZE).all()
+            if not batch:
+                break
+            duplicates += len(self.add_questions([row._asdict() for row in batch]))
+            indexed += len(batch)
+            last_id = batch[-1].id
+
+        logger.info(f"✅ Question bank rebuilt: {indexed} questions")
+        return {"indexed": indexed, "duplicates": duplicates}
+
+
+def question_from_bank(question: Question) -> Dict[str, Any]:
+    """Stored question as a `GeneratedQuestion` payload"""
+    return {
+        "question": question.question_text,
+        "type": question.question_type,
+        "correct_answer": question.correct_answer,
+        "options": json.loads(question.options) if question.options else None,
+        "accepted_answers": json.loads(question.accepted_answers) if question.accepted_answers else None,
+        "explanation": question.explanation,
+        "source_question_id": question.id
+    }
+
+
+question_bank = QuestionBank()
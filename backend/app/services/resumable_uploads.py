@@ -0,0 +1,249 @@
+"""
+Resumable (tus-style) uploads for large course materials in DISCERA
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, List
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.models.document import Document
+from app.models.upload_session import UploadPart, UploadSession, UploadStatus
+from app.services.blob_storage import COPY_CHUNK_SIZE, BlobStore, BlobWriter, StagedBlob, UploadTooLarge
+from app.services.document_ingest import add_document
+from app.services.upload_stream import SNIFF_BYTES, InvalidUpload, content_matches_extension
+
+logger = logging.getLogger(__name__)
+
+
+class UploadOffsetConflict(Exception):
+    """Raised when a byte range does not start at the upload's current offset"""
+
+    def __init__(self, offset: int):
+        super().__init__(f"Upload is at offset {offset}")
+        self.offset = offset
+
+
+class UploadIncomplete(Exception):
+    """Raised when finalizing an upload that has not received every byte"""
+
+
+class UploadAlreadyCompleted(Exception):
+    """Raised when another request finalized the upload first"""
+
+
+def create_upload(db: Session, owner_id: int, filename: str, total_size: int) -> UploadSession:
+    """Start a resumable upload; raises InvalidUpload or UploadTooLarge"""
+    filename = os.path.basename(filename)
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in settings.ALLOWED_EXTENSIONS:
+        raise InvalidUpload(f"File type not allowed. Allowed types: {settings.ALLOWED_EXTENSIONS}")
+    if total_size <= 0:
+        raise InvalidUpload("Upload size must be positive")
+    if total_size > settings.MAX_RESUMABLE_UPLOAD_SIZE:
+        raise UploadTooLarge(settings.MAX_RESUMABLE_UPLOAD_SIZE)
+
+    session = UploadSession(
+        id=uuid.uuid4().hex,
+        filename=filename,
+        file_type=extension,
+        total_size=total_size,
+        offset=0,
+        owner_id=owner_id,
+        expires_at=datetime.now(timezone.utc) + timedelta(hours=settings.RESUMABLE_UPLOAD_EXPIRY_HOURS)
+    )
+    db.add(session)
+    db.commit()
+    db.refresh(session)
+    return session
+
+
+def _remove_files(paths: List[str]):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def delete_upload(db: Session, session: UploadSession):
+    """Drop an upload and every part it has received"""
+    paths = [part.file_path for part in session.parts]
+    db.delete(session)
+    db.commit()
+    _remove_files(paths)
+
+
+def expire_uploads(db: Session) -> int:
+    """Delete unfinished uploads past their expiry time"""
+    expired = db.query(UploadSession).filter(
+        UploadSession.status == UploadStatus.UPLOADING,
+        UploadSession.expires_at < datetime.now(timezone.utc)
+    ).all()
+    for session in expired:
+        delete_upload(db, session)
+    if expired:
+        logger.info(f"♻️ Removed {len(expired)} expired uploads")
+    return len(expired)
+
+
+async def append_part(
+    db: Session,
+    session: UploadSession,
+    offset: int,
+    body: AsyncIterator[bytes],
+    store: BlobStore
+) -> int:
+    """Store the bytes of `body` at `offset`; returns the new offset.
+
+    Whatever arrives is kept, so a client that loses its connection mid-part
+    asks for the offset and continues from there. Raises
+    UploadOffsetConflict, UploadTooLarge or InvalidUpload.
+    """
+    if session.status != UploadStatus.UPLOADING or offset != session.offset:
+        raise UploadOffsetConflict(session.offset)
+
+    remaining = session.total_size - offset
+    writer = BlobWriter(store, max_size=min(remaining, settings.MAX_UPLOAD_PART_SIZE))
+    try:
+        async for chunk in body:
+            await writer.write(chunk)
+        staged = await writer.finish()
+    except BaseException:
+        await writer.abort()
+        raise
+    if staged.size == 0:
+        os.unlink(staged.temp_path)
+        return offset
+
+    if offset == 0 and staged.size >= SNIFF_BYTES:
+        with open(staged.temp_path, "rb") as f:
+            head = f.read(SNIFF_BYTES)
+        if not content_matches_extension(head, session.file_type):
+            os.unlink(staged.temp_path)
+            raise InvalidUpload(f"File content does not match its {session.file_type} extension")
+
+    # Only one of two concurrent writers of the same range may advance the offset
+    result = db.execute(
+        update(UploadSession)
+        .where(UploadSession.id == session.id, UploadSession.offset == offset,
+               UploadSession.status == UploadStatus.UPLOADING)
+        .values(offset=offset + staged.size)
+    )
+    if result.rowcount != 1:
+        db.rollback()
+        os.unlink(staged.temp_path)
+        db.refresh(session)
+        raise UploadOffsetConflict(session.offset)
+    db.add(UploadPart(session_id=session.id, offset=offset, size=staged.size, file_path=staged.temp_path))
+    db.commit()
+    db.refresh(session)
+    metrics.inc("upload_bytes_received_total", staged.size)
+    return session.offset
+
+
+def _copy_range(source, target, size: int):
+    """Append `size` bytes of one file to another inside the kernel when possible"""
+    copied = 0
+    if hasattr(os, "copy_file_range"):
+        try:
+            while copied < size:
+                written = os.copy_file_range(source.fileno(), target.fileno(), size - copied)
+                if written == 0:
+                    break
+                copied += written
+            return
+        except OSError:
+            # Not supported for these files; fall back to a buffered copy of the rest
+            source.seek(copied)
+            target.seek(0, os.SEEK_END)
+    shutil.copyfileobj(source, target, COPY_CHUNK_SIZE)
+
+
+def assemble_parts(parts: List[UploadPart], store: BlobStore) -> StagedBlob:
+    """Concatenate parts into one staged file and hash it.
+
+    The parts themselves are left untouched, so a finalize that fails
+    part-way can simply be retried.
+    """
+    os.makedirs(store.temp_dir, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=store.temp_dir)
+    try:
+        with os.fdopen(fd, "wb") as target:
+            for part in parts:
+                with open(part.file_path, "rb") as source:
+                    _copy_range(source, target, part.size)
+
+        digest = hashlib.sha256()
+        size = 0
+        with open(temp_path, "rb") as f:
+            while True:
+                data = f.read(COPY_CHUNK_SIZE)
+                if not data:
+                    break
+                digest.update(data)
+                size += len(data)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    return StagedBlob(sha256=digest.hexdigest(), size=size, temp_path=temp_path)
+
+
+async def finalize_upload(session: UploadSession, store: BlobStore) -> StagedBlob:
+    """Assemble a fully received upload; raises UploadIncomplete or InvalidUpload"""
+    parts = list(session.parts)
+    expected = 0
+    for part in parts:
+        if part.offset != expected:
+            raise UploadIncomplete(f"Missing bytes at offset {expected}")
+        expected += part.size
+    if expected != session.total_size:
+        raise UploadIncomplete(f"Received {expected} of {session.total_size} bytes")
+
+    staged = await asyncio.to_thread(assemble_parts, parts, store)
+    with open(staged.temp_path, "rb") as f:
+        head = f.read(SNIFF_BYTES)
+    if staged.size != session.total_size or not content_matches_extension(
+            head, session.file_type, complete=staged.size < SNIFF_BYTES):
+        store.discard(staged)
+        raise InvalidUpload(f"File content does not match its {session.file_type} extension")
+    return staged
+
+
+def complete_upload(db: Session, session: UploadSession, staged: StagedBlob, store: BlobStore) -> Document:
+    """Turn an assembled upload into a document and drop its parts.
+
+    Raises UploadAlreadyCompleted when a concurrent finalize got there first.
+    """
+    paths = [part.file_path for part in session.parts]
+    try:
+        # Of two concurrent finalize requests only one may create the document
+        result = db.execute(
+            update(UploadSession)
+            .where(UploadSession.id == session.id, UploadSession.status == UploadStatus.UPLOADING)
+            .values(status=UploadStatus.COMPLETED)
+        )
+        if result.rowcount != 1:
+            raise UploadAlreadyCompleted(session.id)
+        document = add_document(db, staged, session.filename, session.file_type, session.owner_id, store)
+        session.document_id = document.id
+        session.parts.clear()
+        db.commit()
+    except Exception:
+        db.rollback()
+        store.discard(staged)
+        raise
+    db.refresh(session)
+    db.refresh(document)
+    _remove_files(paths)
+    metrics.inc("resumable_uploads_completed_total")
+    return document
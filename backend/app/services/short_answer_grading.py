@@ -0,0 +1,183 @@
+"""
+Short answer grading engine for DISCERA tests
+"""
+import logging
+import re
+import threading
+import unicodedata
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+NUMBER_PATTERN = re.compile(r"^[-+]?\d+(?:[.,]\d+)?$")
+
+
+def normalize_short_answer(answer: str) -> str:
+    """Unicode-normalise, case-fold and drop punctuation from a short answer"""
+    if not answer:
+        return ""
+    text = unicodedata.normalize("NFKC", str(answer)).casefold()
+    text = "".join(" " if unicodedata.category(ch).startswith("P") and ch not in ".,-" else ch for ch in text)
+    return " ".join(text.split()).strip(" .,-")
+
+
+def levenshtein_ratio(a: str, b: str) -> float:
+    """Similarity in [0, 1] based on Levenshtein edit distance"""
+    if a == b:
+        return 1.0
+    if not a or not b:
+        return 0.0
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b)
+            ))
+        previous = current
+    return 1.0 - previous[-1] / len(a)
+
+
+@dataclass
+class ShortAnswerItem:
+    """One student answer together with its normalised accepted answers"""
+    answer: str
+    accepted: Tuple[str, ...]
+    question: str = ""
+
+
+@dataclass
+class ShortAnswerVerdict:
+    """Grading decision and the stage that made it"""
+    is_correct: bool
+    method: str
+    score: float = 0.0
+
+
+class ShortAnswerGrader:
+    """Staged short answer grader.
+
+    Stages run from cheapest to most expensive and each one only sees what the
+    previous stages could not decide: normalised exact match, edit distance,
+    one batched embedding similarity pass, and an LLM judge for answers whose
+    similarity falls between the reject and accept thresholds.
+    """
+
+    def __init__(
+        self,
+        embedding_service=None,
+        ai_service=None,
+        edit_threshold: float = settings.SHORT_ANSWER_EDIT_THRESHOLD,
+        accept_threshold: float = settings.SHORT_ANSWER_ACCEPT_THRESHOLD,
+        reject_threshold: float = settings.SHORT_ANSWER_REJECT_THRESHOLD,
+        use_llm: bool = settings.SHORT_ANSWER_LLM_FALLBACK
+    ):
+        self._embedding_service = embedding_service
+        self._ai_service = ai_service
+        self._lock = threading.Lock()
+        self.edit_threshold = edit_threshold
+        self.accept_threshold = accept_threshold
+        self.reject_threshold = reject_threshold
+        self.use_llm = use_llm
+
+    @property
+    def embedding_service(self):
+        """Embedding service, loaded on first use (None if unavailable)"""
+        if self._embedding_service is None:
+            with self._lock:
+                if self._embedding_service is None:
+                    try:
+                        from app.rag.embedding_service import get_embedding_service
+                        self._embedding_service = get_embedding_service()
+                    except Exception as e:
+                        logger.warning(f"⚠️ Embedding similarity disabled for short answers: {e}")
+                        self._embedding_service = False
+        return self._embedding_service or None
+
+    @property
+    def ai_service(self):
+        """LLM service used for borderline answers (None if unavailable)"""
+        if self._ai_service is None:
+            from app.ai.openai_service import OpenAIService
+            self._ai_service = OpenAIService()
+        return self._ai_service if self._ai_service.is_available() else None
+
+    def grade_batch(self, items: List[ShortAnswerItem]) -> List[ShortAnswerVerdict]:
+        """Grade many short answers, using at most one encode and one LLM call"""
+        verdicts: List[Optional[ShortAnswerVerdict]] = [None] * len(items)
+        normalized = [normalize_short_answer(item.answer) for item in items]
+
+        # Stage 1 + 2: exact and edit-distance matching
+        semantic_candidates = []
+        for i, (item, answer) in enumerate(zip(items, normalized)):
+            if not answer:
+                verdicts[i] = ShortAnswerVerdict(False, "empty")
+                continue
+            if not item.accepted:
+                # The key normalised to nothing (e.g. only punctuation): nothing can match it
+                verdicts[i] = ShortAnswerVerdict(False, "no_key")
+                continue
+            if answer in item.accepted:
+                verdicts[i] = ShortAnswerVerdict(True, "exact", 1.0)
+                continue
+            if any(NUMBER_PATTERN.match(key) for key in item.accepted):
+                # Numeric keys must match exactly: "41" is close to "42" by every metric
+                verdicts[i] = ShortAnswerVerdict(False, "numeric")
+                continue
+
+            best_ratio = max((levenshtein_ratio(answer, key) for key in item.accepted if len(key) >= 4), default=0.0)
+            if best_ratio >= self.edit_threshold:
+                verdicts[i] = ShortAnswerVerdict(True, "edit_distance", best_ratio)
+            else:
+                semantic_candidates.append(i)
+
+        # Stage 3: one batched embedding pass over all remaining answers and keys
+        borderline = []
+        if semantic_candidates and self.embedding_service is not None:
+            texts = []
+            text_index = {}
+            for i in semantic_candidates:
+                for text in (normalized[i],) + items[i].accepted:
+                    if text not in text_index:
+                        text_index[text] = len(texts)
+                        texts.append(text)
+
+            embeddings = self.embedding_service.encode_texts(texts)
+            for i in semantic_candidates:
+                answer_vector = embeddings[text_index[normalized[i]]]
+                similarity = max(
+                    float(embeddings[text_index[key]] @ answer_vector) for key in items[i].accepted
+                )
+                if similarity >= self.accept_threshold:
+                    verdicts[i] = ShortAnswerVerdict(True, "embedding", similarity)
+                elif similarity < self.reject_threshold:
+                    verdicts[i] = ShortAnswerVerdict(False, "embedding", similarity)
+                else:
+                    verdicts[i] = ShortAnswerVerdict(False, "borderline", similarity)
+                    borderline.append(i)
+
+        # Stage 4: LLM judge for borderline answers only
+        if borderline and self.use_llm and self.ai_service is not None:
+            result = self.ai_service.grade_short_answers([
+                {
+                    "question": items[i].question,
+                    "accepted_answers": list(items[i].accepted),
+                    "student_answer": items[i].answer
+                }
+                for i in borderline
+            ])
+            if result["success"]:
+                for i, is_correct in zip(borderline, result["verdicts"]):
+                    verdicts[i] = ShortAnswerVerdict(is_correct, "llm", verdicts[i].score)
+
+        return [verdict or ShortAnswerVerdict(False, "no_match") for verdict in verdicts]
+
+
+short_answer_grader = ShortAnswerGrader()
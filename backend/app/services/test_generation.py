@@ -0,0 +1,442 @@
+"""
+AI test generation pipeline for DISCERA
+"""
+import asyncio
+import json
+import logging
+import math
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from pydantic import BaseModel, ValidationError, field_validator, model_validator
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.test import Test, Question, QuestionType, DifficultyLevel
+from app.rag.document_processor import document_order
+from app.services.grading import normalize_answer
+from app.services.question_bank import question_from_bank
+
+logger = logging.getLogger(__name__)
+
+
+class TestGenerationError(Exception):
+    """Raised when a test cannot be generated for a document"""
+
+
+class TestGenerationRequestError(TestGenerationError):
+    """Raised when a generation request itself is invalid"""
+
+
+class GeneratedQuestion(BaseModel):
+    """Schema every LLM-generated question must satisfy"""
+    question: str
+    type: QuestionType
+    correct_answer: str
+    options: Optional[List[str]] = None
+    accepted_answers: Optional[List[str]] = None
+    explanation: Optional[str] = None
+    difficulty: Optional[DifficultyLevel] = None
+    source_question_id: Optional[int] = None  # set when reused from the question bank
+
+    @field_validator("question", "correct_answer", mode="before")
+    @classmethod
+    def _strip_text(cls, value: Any) -> str:
+        text = str(value).strip()
+        if not text:
+            raise ValueError("must not be empty")
+        return text
+
+    @field_validator("difficulty", mode="before")
+    @classmethod
+    def _lenient_difficulty(cls, value: Any) -> Optional[str]:
+        value = str(value).strip().lower() if value else None
+        return value if value in {level.value for level in DifficultyLevel} else None
+
+    @model_validator(mode="after")
+    def _check_answer(self) -> "GeneratedQuestion":
+        if self.type == QuestionType.MULTIPLE_CHOICE:
+            options = [str(option).strip() for option in self.options or [] if str(option).strip()]
+            if len(options) < 2:
+                raise ValueError("multiple choice question needs at least two options")
+            normalized = [normalize_answer(option) for option in options]
+            answer = normalize_answer(self.correct_answer)
+            if answer not in normalized:
+                # Accept an option letter and store the option text instead
+                letter_index = ord(answer) - ord("a") if len(answer) == 1 else -1
+                if not 0 <= letter_index < len(options):
+                    raise ValueError("correct answer is not one of the options")
+                self.correct_answer = options[letter_index]
+            self.options = options
+        elif self.type == QuestionType.TRUE_FALSE:
+            answer = normalize_answer(self.correct_answer)
+            if answer not in ("true", "false"):
+                raise ValueError("true/false answer must be True or False")
+            self.correct_answer = answer.capitalize()
+            self.options = None
+        else:
+            self.options = None
+        return self
+
+
+@dataclass
+class SectionPlan:
+    """A slice of the document that gets its own LLM call"""
+    index: int
+    title: str
+    content: str
+    num_questions: int
+    embedding: Optional[List[float]] = None
+    chunk_ids: List[str] = field(default_factory=list)
+
+
+class TestGenerationPipeline:
+    """Generate a test from a processed document.
+
+    The document's chunks are split into sections, a representative excerpt
+    is picked per section and proven questions from the question bank are
+    reused where they match a section. The remaining questions are generated
+    by sending sections to the LLM concurrently (capped by a semaphore),
+    every question is validated against `GeneratedQuestion`, near-duplicates
+    are dropped by embedding similarity and the result is bulk-inserted as a
+    `Test` with its `Question` rows, which are then added to the bank.
+    """
+
+    def __init__(
+        self,
+        rag_service=None,
+        ai_service=None,
+        question_bank=None,
+        concurrency: int = settings.AI_GENERATION_CONCURRENCY
+    ):
+        self._rag_service = rag_service
+        self._ai_service = ai_service
+        self._question_bank = question_bank
+        self.concurrency = max(1, concurrency)
+
+    @property
+    def rag_service(self):
+        if self._rag_service is None:
+            from app.rag.rag_service import get_rag_service
+            self._rag_service = get_rag_service()
+        return self._rag_service
+
+    @property
+    def ai_service(self):
+        if self._ai_service is None:
+            from app.ai.openai_service import OpenAIService
+            self._ai_service = OpenAIService()
+        return self._ai_service
+
+    @property
+    def question_bank(self):
+        if self._question_bank is None:
+            from app.services.question_bank import question_bank
+            self._question_bank = question_bank
+        return self._question_bank
+
+    def validate_request(self, question_types: List[str], difficulty: str) -> Tuple[List[str], DifficultyLevel]:
+        """Check a generation request before any LLM call is made"""
+        question_types = [t for t in question_types if t in {qt.value for qt in QuestionType}]
+        if not question_types:
+            raise TestGenerationRequestError("No supported question types requested")
+        try:
+            difficulty_level = DifficultyLevel(difficulty)
+        except ValueError:
+            raise TestGenerationRequestError(f"Unknown difficulty: {difficulty}")
+        if not self.ai_service.is_available():
+            raise TestGenerationError("AI service is not configured")
+        return question_types, difficulty_level
+
+    def plan_sections(self, document_id: int, num_questions: int) -> List[SectionPlan]:
+        """Split a document's chunks into sections and pick representative excerpts"""
+        chunks = self.rag_service.vector_store.get_document_chunks(str(document_id))
+        if not chunks:
+            raise TestGenerationError("Document has no indexed content")
+
+        chunks.sort(key=document_order)
+        per_section = max(1, settings.AI_QUESTIONS_PER_SECTION)
+        num_sections = max(1, min(math.ceil(num_questions / per_section), len(chunks)))
+
+        # Contiguous groups keep each section on one topic of the document
+        groups = [list(group) for group in np.array_split(np.arange(len(chunks)), num_sections)]
+        base, extra = divmod(num_questions, num_sections)
+
+        sections = []
+        for index, group in enumerate(groups):
+            group_chunks = [chunks[i] for i in group]
+            embeddings = np.array([chunk["embedding"] for chunk in group_chunks], dtype=np.float32)
+            centroid = embeddings.mean(axis=0)
+            norms = np.linalg.norm(embeddings, axis=1) * (np.linalg.norm(centroid) or 1.0)
+            similarity = embeddings @ centroid / np.where(norms == 0, 1.0, norms)
+
+            # Most representative chunks first, until the section budget is used
+            selected, length = [], 0
+            for i in np.argsort(-similarity):
+                content = group_chunks[i]["content"]
+                if selected and length + len(content) > settings.AI_SECTION_MAX_CHARS:
+                    break
+                selected.append(int(i))
+                length += len(content)
+            selected.sort()
+
+            metadata = group_chunks[selected[0]].get("metadata") or {}
+            sections.append(SectionPlan(
+                index=index,
+                title=str(metadata.get("section") or f"Part {index + 1}"),
+                content="\n\n".join(group_chunks[i]["content"] for i in selected),
+                num_questions=base + (1 if index < extra else 0),
+                embedding=centroid.tolist(),
+                chunk_ids=[group_chunks[i]["id"] for i in selected]
+            ))
+
+        return [section for section in sections if section.num_questions > 0]
+
+    def reuse_questions(
+        self,
+        db: Session,
+        sections: List[SectionPlan],
+        creator_id: int,
+        question_types: List[str]
+    ) -> Dict[int, List[GeneratedQuestion]]:
+        """Take questions from the bank for each section.
+
+        Every reused question lowers the section's `num_questions`, so only
+        the shortfall is requested from the LLM.
+        """
+        if not settings.QUESTION_BANK_ENABLED:
+            return {}
+        try:
+            picked = self.question_bank.find_reusable(
+                db,
+                [section.embedding for section in sections],
+                creator_id,
+                question_types,
+                [section.num_questions for section in sections]
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Question bank lookup skipped: {e}")
+            return {}
+
+        reused = {}
+        for section, questions in zip(sections, picked):
+            valid = []
+            for question in questions:
+                try:
+                    valid.append(GeneratedQuestion.model_validate(question_from_bank(question)))
+                except ValidationError:
+                    continue
+            if valid:
+                reused[section.index] = valid
+                section.num_questions -= len(valid)
+
+        total = sum(len(questions) for questions in reused.values())
+        if total:
+            logger.info(f"♻️ Reused {total} questions from the question bank")
+        return reused
+
+    async def generate_section(
+        self,
+        section: SectionPlan,
+        question_types: List[str],
+        difficulty: str,
+        semaphore: asyncio.Semaphore
+    ) -> List[GeneratedQuestion]:
+        """Generate and validate questions for one section"""
+        async with semaphore:
+            result = await asyncio.to_thread(
+                self.ai_service.generate_test_questions,
+                section.content,
+                section.num_questions,
+                question_types,
+                difficulty
+            )
+
+        if not result["success"]:
+            raise TestGenerationError(f"Section {section.index + 1}: {result.get('error', 'generation failed')}")
+
+        data = result.get("data") or {}
+        raw_questions = data.get("questions", []) if isinstance(data, dict) else []
+        questions = []
+        for raw_question in raw_questions:
+            try:
+                question = GeneratedQuestion.model_validate(raw_question)
+            except ValidationError as e:
+                logger.warning(f"⚠️ Dropping invalid generated question in section {section.index + 1}: {e.errors()[0]['msg']}")
+                continue
+            if question.type.value in question_types:
+                questions.append(question)
+
+        logger.info(f"Section {section.index + 1}: {len(questions)}/{section.num_questions} valid questions")
+        return questions[:section.num_questions]
+
+    async def generate_sections(
+        self,
+        sections: List[SectionPlan],
+        question_types: List[str],
+        difficulty: str,
+        on_section_complete: Optional[Callable[[SectionPlan, List[GeneratedQuestion]], Awaitable[None]]] = None
+    ) -> Dict[int, List[GeneratedQuestion]]:
+        """Generate all sections concurrently; returns questions per section index"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run(section: SectionPlan):
+            questions = await self.generate_section(section, question_types, difficulty, semaphore)
+            if on_section_complete is not None:
+                await on_section_complete(section, questions)
+            return section.index, questions
+
+        results = await asyncio.gather(*(run(section) for section in sections), return_exceptions=True)
+
+        generated = {}
+        errors = []
+        for result in results:
+            if isinstance(result, Exception):
+                errors.append(result)
+            else:
+                generated[result[0]] = result[1]
+
+        if errors and not generated:
+            raise TestGenerationError(str(errors[0]))
+        for error in errors:
+            logger.warning(f"⚠️ Section generation failed: {error}")
+        return generated
+
+    def deduplicate(self, questions: List[GeneratedQuestion]) -> List[GeneratedQuestion]:
+        """Drop questions that are near-duplicates of an earlier question"""
+        if len(questions) < 2:
+            return questions
+
+        # Exact duplicates never need an embedding; the first occurrence wins
+        seen = set()
+        unique = []
+        for question in questions:
+            key = normalize_answer(question.question)
+            if key not in seen:
+                seen.add(key)
+                unique.append(question)
+
+        try:
+            vectors = self.rag_service.embedding_service.encode_texts([q.question for q in unique])
+        except Exception as e:
+            logger.warning(f"⚠️ Embedding deduplication skipped: {e}")
+            return unique
+
+        kept: List[int] = []
+        for i in range(len(unique)):
+            if kept and float(np.max(vectors[kept] @ vectors[i])) >= settings.QUESTION_DEDUP_THRESHOLD:
+                continue
+            kept.append(i)
+
+        if len(kept) < len(questions):
+            logger.info(f"Removed {len(questions) - len(kept)} duplicate questions")
+        return [unique[i] for i in kept]
+
+    def finalize_questions(
+        self,
+        section_questions: List[List[GeneratedQuestion]],
+        num_questions: int
+    ) -> List[GeneratedQuestion]:
+        """Merge per-section questions in document order and deduplicate them"""
+        questions = [question for questions in section_questions for question in questions]
+        questions = self.deduplicate(questions)[:num_questions]
+        if not questions:
+            raise TestGenerationError("The AI service did not return any valid questions")
+        return questions
+
+    def save_test(
+        self,
+        db: Session,
+        creator_id: int,
+        title: str,
+        difficulty: DifficultyLevel,
+        questions: List[GeneratedQuestion],
+        description: Optional[str] = None,
+        before_commit: Optional[Callable[[Test], None]] = None
+    ) -> Tuple[Test, List[Dict[str, Any]]]:
+        """Insert the test and all of its questions in one transaction"""
+        test = Test(
+            title=title,
+            description=description,
+            difficulty=difficulty,
+            creator_id=creator_id
+        )
+        rows = []
+        try:
+            db.add(test)
+            db.flush()
+            rows = [
+                {
+                    "test_id": test.id,
+                    "question_text": question.question,
+                    "question_type": question.type,
+                    "correct_answer": question.correct_answer,
+                    "options": json.dumps(question.options, ensure_ascii=False) if question.options else None,
+                    "accepted_answers": (
+                        json.dumps(question.accepted_answers, ensure_ascii=False) if question.accepted_answers else None
+                    ),
+                    "explanation": question.explanation,
+                    "points": 1
+                }
+                for question in questions
+            ]
+            if rows:
+                question_ids = db.scalars(
+                    insert(Question).returning(Question.id, sort_by_parameter_order=True), rows
+                ).all()
+                for row, question_id in zip(rows, question_ids):
+                    row["id"] = question_id
+            if before_commit is not None:
+                before_commit(test)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+        return test, rows
+
+    async def index_questions(self, rows: List[Dict[str, Any]], creator_id: int, difficulty: DifficultyLevel):
+        """Add saved questions to the question bank off the event loop"""
+        if settings.QUESTION_BANK_ENABLED and rows:
+            await asyncio.to_thread(self.question_bank.index_saved_questions, rows, creator_id, difficulty)
+
+    async def run(
+        self,
+        db: Session,
+        document,
+        creator_id: int,
+        num_questions: int,
+        question_types: List[str],
+        difficulty: str
+    ) -> Tuple[Test, List[Dict[str, Any]]]:
+        """Plan, generate, deduplicate and store a test for a document"""
+        question_types, difficulty_level = self.validate_request(question_types, difficulty)
+
+        # Retrieval, question bank lookups and embedding run off the event loop
+        sections = await asyncio.to_thread(self.plan_sections, document.id, num_questions)
+        reused = await asyncio.to_thread(self.reuse_questions, db, sections, creator_id, question_types)
+        generated = await self.generate_sections(
+            [section for section in sections if section.num_questions > 0],
+            question_types,
+            difficulty_level.value
+        )
+        questions = await asyncio.to_thread(
+            self.finalize_questions,
+            [reused.get(section.index, []) + generated.get(section.index, []) for section in sections],
+            num_questions
+        )
+
+        test, rows = self.save_test(
+            db,
+            creator_id=creator_id,
+            title=f"Test generated from {document.title}",
+            difficulty=difficulty_level,
+            questions=questions
+        )
+        await self.index_questions(rows, creator_id, difficulty_level)
+        return test, rows
+
+
+test_generation_pipeline = TestGenerationPipeline()
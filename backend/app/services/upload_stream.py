@@ -0,0 +1,158 @@
+"""
+Streaming multipart upload receiver for DISCERA
+"""
+import codecs
+import os
+from dataclasses import dataclass
+from typing import AsyncIterator, List, Optional, Sequence
+
+from multipart.multipart import MultipartParser, parse_options_header
+
+from app.services.blob_storage import BlobStore, BlobWriter, StagedBlob, UploadTooLarge
+
+# Leading bytes of each accepted format; .txt is checked for being UTF-8 instead
+MAGIC_NUMBERS = {
+    ".pdf": (b"%PDF-",),
+    ".docx": (b"PK\x03\x04",),
+    # Word also saves RTF under a .doc name
+    ".doc": (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", b"{\\rtf"),
+    ".rtf": (b"{\\rtf",),
+    ".odt": (b"PK\x03\x04",),
+    ".pptx": (b"PK\x03\x04",),
+}
+SNIFF_BYTES = 4096
+# Multipart framing and the other form fields around the file
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class InvalidUpload(Exception):
+    """Raised when the request is not an acceptable file upload"""
+
+
+@dataclass
+class ReceivedUpload:
+    filename: str
+    extension: str
+    blob: StagedBlob
+
+
+def content_matches_extension(head: bytes, extension: str, complete: bool = False) -> bool:
+    """Whether the first bytes of a file look like its extension claims"""
+    if extension in MAGIC_NUMBERS:
+        return head.startswith(MAGIC_NUMBERS[extension])
+    if extension == ".txt":
+        if b"\x00" in head:
+            return False
+        try:
+            # A multi-byte character may be cut at the end of an incomplete head
+            codecs.getincrementaldecoder("utf-8")().decode(head, final=complete)
+        except UnicodeDecodeError:
+            return False
+        return True
+    return False
+
+
+class _FilePart:
+    """Collects the `file` part of a multipart body while it is parsed"""
+
+    def __init__(self, allowed_extensions: Sequence[str]):
+        self.allowed_extensions = allowed_extensions
+        self.headers = {}
+        self._field = b""
+        self._value = b""
+        self.in_file = False
+        self.filename: Optional[str] = None
+        self.extension: Optional[str] = None
+        self.chunks: List[bytes] = []
+        self.error: Optional[str] = None
+
+    def callbacks(self):
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+        }
+
+    def on_part_begin(self):
+        self.headers, self._field, self._value = {}, b"", b""
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._value += data[start:end]
+
+    def on_header_end(self):
+        self.headers[self._field.lower()] = self._value
+        self._field, self._value = b"", b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self.headers.get(b"content-disposition", b""))
+        if options.get(b"name") != b"file" or self.filename is not None:
+            return
+        self.filename = os.path.basename(options.get(b"filename", b"").decode("utf-8", "replace"))
+        self.extension = os.path.splitext(self.filename)[1].lower()
+        if self.extension not in self.allowed_extensions:
+            self.error = f"File type not allowed. Allowed types: {self.allowed_extensions}"
+        self.in_file = True
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self.in_file:
+            self.chunks.append(data[start:end])
+
+    def on_part_end(self):
+        self.in_file = False
+
+
+async def receive_upload(
+    content_type: str,
+    content_length: Optional[str],
+    body: AsyncIterator[bytes],
+    store: BlobStore,
+    max_size: int,
+    allowed_extensions: Sequence[str]
+) -> ReceivedUpload:
+    """Stream the `file` field of a multipart body into a staged blob.
+
+    The file is never buffered in memory or spooled by the framework: it
+    is hashed, size-checked and type-checked as it arrives and written to
+    a temp file in the blob store. Raises UploadTooLarge or InvalidUpload.
+    """
+    if content_length and content_length.isdigit() and int(content_length) > max_size + MULTIPART_OVERHEAD:
+        raise UploadTooLarge(max_size)
+
+    media_type, params = parse_options_header(content_type or "")
+    if media_type != b"multipart/form-data" or b"boundary" not in params:
+        raise InvalidUpload("Expected a multipart/form-data upload")
+
+    part = _FilePart(allowed_extensions)
+    parser = MultipartParser(params[b"boundary"], part.callbacks())
+    writer = BlobWriter(store, max_size)
+    head = b""
+    try:
+        async for chunk in body:
+            parser.write(chunk)
+            if part.error:
+                raise InvalidUpload(part.error)
+            for data in part.chunks:
+                if len(head) < SNIFF_BYTES:
+                    head += data[:SNIFF_BYTES - len(head)]
+                    if len(head) >= SNIFF_BYTES and not content_matches_extension(head, part.extension):
+                        raise InvalidUpload(f"File content does not match its {part.extension} extension")
+                await writer.write(data)
+            part.chunks.clear()
+        parser.finalize()
+
+        if part.filename is None:
+            raise InvalidUpload("No file in upload")
+        if len(head) < SNIFF_BYTES and not content_matches_extension(head, part.extension, complete=True):
+            raise InvalidUpload(f"File content does not match its {part.extension} extension")
+        staged = await writer.finish()
+    except BaseException:
+        await writer.abort()
+        raise
+    return ReceivedUpload(filename=part.filename, extension=part.extension, blob=staged)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Benchmark embedding inference backends: torch, ONNX Runtime and int8 ONNX
+
+Reports startup time (loading the model in a fresh process, after the
+one-time ONNX export), encoding throughput on synthetic course chunks,
+and the cosine similarity of each backend's embeddings to torch's.
+Run from backend/: python benchmarks/bench_embedding_backends.py
+"""
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.rag.onnx_backend import MIN_COSINE, load_onnx_encoder, min_cosine
+
+SAMPLES = [
+    "Fotosinteza je proces u kojem biljke pretvaraju svetlosnu energiju u hemijsku.",
+    "Ćelijska membrana reguliše šta ulazi u ćeliju, a šta izlazi iz nje.",
+    "Фотосинтеза се одвија у хлоропластима, уз учешће хлорофила.",
+    "Prema Osnovama biologije (2. izd., str. 14), enzimi ubrzavaju reakcije.",
+    "Učenici treba da razumeju razliku između mitoze i mejoze.",
+    "Mitochondria produce most of the cell's supply of adenosine triphosphate.",
+]
+
+LOAD_SNIPPET = """
+import sys, time
+sys.path.insert(0, {backend_dir!r})
+started = time.perf_counter()
+if {backend!r} == "torch":
+    import torch
+    torch.set_num_threads({threads})
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer({model!r}, device="cpu")
+else:
+    from app.rag.onnx_backend import load_onnx_encoder
+    model = load_onnx_encoder({model!r}, {backend!r}, {onnx_dir!r}, {threads})
+model.encode(["warm up"])
+print(time.perf_counter() - started)
+"""
+
+
+def build_chunks(count: int, seed: int = 42):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(SAMPLES) for _ in range(rng.randint(2, 8))) for _ in range(count)]
+
+
+def startup_seconds(backend: str, model: str, onnx_dir: str, threads: int) -> float:
+    """Time to a first embedding in a fresh interpreter"""
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    snippet = LOAD_SNIPPET.format(
+        backend_dir=backend_dir, backend=backend, model=model, onnx_dir=onnx_dir, threads=threads
+    )
+    result = subprocess.run([sys.executable, "-c", snippet], capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--onnx-dir", default=os.path.join(tempfile.gettempdir(), "discera-onnx-bench"))
+    args = parser.parse_args()
+
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    torch.set_num_threads(args.threads)
+    chunks = build_chunks(args.chunks)
+    models = {"torch": SentenceTransformer(args.model, device="cpu")}
+    for backend in ("onnx", "onnx-int8"):
+        started = time.perf_counter()
+        models[backend] = load_onnx_encoder(args.model, backend, args.onnx_dir, args.threads)
+        print(f"{backend}: export/load {time.perf_counter() - started:.1f}s (export happens once)")
+
+    print(f"\n{args.chunks} chunks, batch size {args.batch_size}, {args.threads} threads\n")
+    print(f"{'backend':<10} {'startup s':>10} {'chunks/s':>10} {'speedup':>8} {'min cos':>9} {'mean cos':>9}")
+    reference, baseline = None, None
+    for backend, model in models.items():
+        model.encode(chunks[:args.batch_size], batch_size=args.batch_size)
+        started = time.perf_counter()
+        embeddings = model.encode(chunks, batch_size=args.batch_size, convert_to_numpy=True)
+        throughput = len(chunks) / (time.perf_counter() - started)
+        if reference is None:
+            reference, baseline = embeddings, throughput
+        normed = embeddings / (embeddings ** 2).sum(axis=1, keepdims=True) ** 0.5
+        reference_normed = reference / (reference ** 2).sum(axis=1, keepdims=True) ** 0.5
+        mean_cosine = float((normed * reference_normed).sum(axis=1).mean())
+        startup = startup_seconds(backend, args.model, args.onnx_dir, args.threads)
+        print(
+            f"{backend:<10} {startup:>10.2f} {throughput:>10.1f} {throughput / baseline:>7.2f}x "
+            f"{min_cosine(reference, embeddings):>9.5f} {mean_cosine:>9.5f}"
+        )
+    print(f"\nAccepted at export: min cosine >= {MIN_COSINE}")
+
+
+if __name__ == "__main__":
+    main()
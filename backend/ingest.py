@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Bulk-ingest a directory or zip archive of course material
+
+    python ingest.py materijali/biologija.zip --owner nastavnik@skola.rs
+    python ingest.py materijali/ --owner nastavnik@skola.rs --workers 8 --report report.json
+
+Files become documents of the owner, exactly as if they had been uploaded.
+Running the same command again after an interruption or failure resumes:
+documents already ingested are skipped and the rest are processed.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.config import settings
+from app.core.database import SessionLocal, engine
+from app.core.migrations import create_schema
+from app.models.user import User
+from app.services.bulk_ingest import BulkIngestor
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Ingest a directory or zip of course material")
+    parser.add_argument("source", help="directory or .zip archive")
+    parser.add_argument("--owner", required=True, help="email of the user who will own the documents")
+    parser.add_argument("--workers", type=int, default=settings.BULK_INGEST_WORKERS, help="parsing processes")
+    parser.add_argument("--batch-chunks", type=int, default=settings.BULK_INGEST_BATCH_CHUNKS,
+                        help="chunks embedded and stored together")
+    parser.add_argument("--max-file-size", type=int, default=settings.MAX_FILE_SIZE, help="bytes")
+    parser.add_argument("--report", help="also write the report as JSON to this file")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    create_schema(engine)
+
+    db = SessionLocal()
+    try:
+        owner = db.query(User).filter(User.email == args.owner).first()
+    finally:
+        db.close()
+    if owner is None:
+        print(f"No user with email {args.owner}", file=sys.stderr)
+        return 2
+
+    ingestor = BulkIngestor(workers=args.workers, batch_chunks=args.batch_chunks, max_file_size=args.max_file_size)
+    report = ingestor.run(args.source, owner.id)
+
+    print(f"\n📚 {args.source}")
+    print(f"   files:     {report.files}")
+    print(f"   ingested:  {report.ingested}")
+    print(f"   reused:    {report.reused}  (same content already indexed)")
+    print(f"   skipped:   {report.skipped}  (done by an earlier run)")
+    print(f"   rejected:  {report.rejected}")
+    print(f"   failed:    {report.failed}")
+    print(f"   chunks:    {report.chunks}")
+    print(
+        f"   {report.seconds:.1f}s: {report.files_per_second:.2f} files/s, "
+        f"{report.chunks_per_second:.1f} chunks/s, {report.megabytes_per_second:.2f} MB/s"
+    )
+    for name, error in report.errors:
+        print(f"   ⚠️ {name}: {error}")
+    if report.failed:
+        print("   Run the same command again to retry the failed files.")
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report.as_dict(), f, ensure_ascii=False, indent=2)
+    return 1 if report.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
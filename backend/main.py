@@ -1,4 +1,5 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import os
@@ -8,22 +9,41 @@ import sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from app.core.config import settings
-from app.core.database import engine, Base
-from app.api.v1 import auth, users, documents, tests, ai
+from app.core.database import engine
+from app.core.migrations import create_schema
+from app.core.metrics import metrics
+from app.core.security import require_metrics_access
+from app.api.v1 import auth, users, documents, uploads, tests, ai, analytics
+from app.rag.converters import shutdown_converter_pool
+from app.rag.embedding_pool import shutdown_embedding_pools
+from app.rag.ocr import shutdown_ocr_stage
+from app.services.llm_usage import usage_recorder
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+# Create database tables and add columns missing from older databases
+create_schema(engine)
 
 # Create uploads directory
 os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Stop worker processes and write buffered usage events before exiting or reloading
+    shutdown_converter_pool()
+    shutdown_ocr_stage()
+    shutdown_embedding_pools()
+    usage_recorder.flush()
+
+
 # Create FastAPI app
 app = FastAPI(
     title=settings.APP_NAME,
     version=settings.APP_VERSION,
     description="Digital Intelligent System for Comprehensive Exam Review & Assessment",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -42,8 +62,10 @@ app.mount("/uploads", StaticFiles(directory=settings.UPLOAD_DIR), name="uploads"
 app.include_router(auth.router, prefix="/api/v1/auth", tags=["Authentication"])
 app.include_router(users.router, prefix="/api/v1/users", tags=["Users"])
 app.include_router(documents.router, prefix="/api/v1/documents", tags=["Documents"])
+app.include_router(uploads.router, prefix="/api/v1/uploads", tags=["Uploads"])
 app.include_router(tests.router, prefix="/api/v1/tests", tags=["Tests"])
 app.include_router(ai.router, prefix="/api/v1/ai", tags=["AI"])
+app.include_router(analytics.router, prefix="/api/v1/analytics", tags=["Analytics"])
 
 
 @app.get("/")
@@ -60,6 +82,11 @@ async def health_check():
     return {"status": "healthy", "app": settings.APP_NAME}
 
 
+@app.get("/metrics", include_in_schema=False, dependencies=[Depends(require_metrics_access)])
+async def get_metrics():
+    return metrics.snapshot()
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+Test the AI test generation pipeline
+"""
+import asyncio
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import numpy as np
+
+from fastapi import HTTPException
+from sqlalchemy import update
+from sqlalchemy.orm import sessionmaker
+
+from app.models.document import Document
+from app.models.generation_job import JobStatus, TestGenerationJob, TestGenerationJobSection
+from app.models.analytics import QuestionStatistics
+from app.models.test import Test, Question
+from app.models.user import UserRole
+from app.services.generation_jobs import create_job, can_resume, claim_job, delete_document_jobs, run_job
+from app.services.question_bank import QuestionBank
+from app.api.v1 import ai as ai_api
+from app.services.test_generation import GeneratedQuestion, TestGenerationPipeline
+from test_grading import create_session, create_test_fixture
+
+
+class FakeVectorStore:
+    """Vector store holding one document with four chunks on two topics"""
+
+    def get_document_chunks(self, document_id, include_embeddings=True):
+        # Same space as FakeEmbeddingService: cell, planet, pick, bias
+        topics = [[1.0, 0.0, 0.0, 0.1], [1.0, 0.1, 0.0, 0.1], [0.0, 1.0, 0.0, 0.1], [0.1, 1.0, 0.0, 0.1]]
+        return [
+            {
+                "id": f"{document_id}_chunk_{i}",
+                "content": f"Chunk {i} about topic {i // 2}",
+                "metadata": {"chunk_id": f"chunk_{i}", "page_number": 1},
+                "embedding": embedding
+            }
+            for i, embedding in enumerate(topics)
+        ]
+
+
+class FakeEmbeddingService:
+    """Embeds questions by the keywords they mention"""
+
+    keywords = ["cell", "planet", "pick"]
+
+    def encode_texts(self, texts):
+        vectors = np.array([[float(word in t.lower()) for word in self.keywords] + [0.1] for t in texts])
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def matches_where(metadata, where):
+    """Evaluate the subset of Chroma filters the question bank uses"""
+    if "$and" in where:
+        return all(matches_where(metadata, clause) for clause in where["$and"])
+    key, condition = next(iter(where.items()))
+    if isinstance(condition, dict):
+        return metadata.get(key) in condition["$in"]
+    return metadata.get(key) == condition
+
+
+class FakeBankStore:
+    """Brute-force in-memory stand-in for the question bank collection"""
+
+    def __init__(self):
+        self.items = {}
+
+    def upsert_vectors(self, ids, embeddings, documents, metadatas):
+        for item_id, embedding, metadata in zip(ids, embeddings, metadatas):
+            self.items[item_id] = (np.array(embedding), metadata)
+
+    def query_vectors(self, embeddings, n_results=10, where=None):
+        results = []
+        for embedding in embeddings:
+            query = np.array(embedding) / np.linalg.norm(embedding)
+            matches = [
+                {"id": item_id, "metadata": metadata, "similarity": float(vector @ query / np.linalg.norm(vector))}
+                for item_id, (vector, metadata) in self.items.items()
+                if where is None or matches_where(metadata, where)
+            ]
+            results.append(sorted(matches, key=lambda m: -m["similarity"])[:n_results])
+        return results
+
+    def reset_collection(self):
+        self.items.clear()
+        return True
+
+
+def create_pipeline(ai_service, bank_store=None):
+    """Pipeline wired to fakes, with a question bank over `bank_store`"""
+    embedding_service = FakeEmbeddingService()
+    rag_service = SimpleNamespace(vector_store=FakeVectorStore(), embedding_service=embedding_service)
+    bank = QuestionBank(vector_store=bank_store or FakeBankStore(), embedding_service=embedding_service)
+    return TestGenerationPipeline(rag_service=rag_service, ai_service=ai_service, question_bank=bank, concurrency=2)
+
+
+class FakeAIService:
+    """Returns canned questions and records concurrency"""
+
+    def __init__(self):
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def is_available(self):
+        return True
+
+    def generate_test_questions(self, content, num_questions, question_types, difficulty):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(0.05)
+        with self.lock:
+            self.active -= 1
+
+        topic = "cell" if "topic 0" in content else "planet"
+        return {"success": True, "data": {"questions": [
+            {"question": f"What is a {topic}?", "type": "short_answer", "correct_answer": topic},
+            {"question": f"What is a {topic} exactly?", "type": "short_answer", "correct_answer": topic},
+            {"question": f"Is a {topic} round?", "type": "true_false", "correct_answer": "yes"},
+            {"question": f"Pick the {topic}", "type": "multiple_choice",
+             "options": ["sun", topic], "correct_answer": "B"},
+        ]}}
+
+
+def test_generation_pipeline():
+    """Sections are generated concurrently, validated, deduplicated and stored"""
+    print("🧪 Testing AI test generation pipeline:")
+    db = create_session()
+    student, _, _ = create_test_fixture(db)
+    ai_service = FakeAIService()
+    pipeline = create_pipeline(ai_service)
+
+    document = SimpleNamespace(id=7, title="Science")
+    test, rows = asyncio.run(pipeline.run(
+        db, document, creator_id=student.id, num_questions=8,
+        question_types=["short_answer", "true_false", "multiple_choice"], difficulty="medium"
+    ))
+
+    assert ai_service.max_active == 2
+    # Invalid true/false answers are dropped, near-duplicate questions are merged
+    texts = [row["question_text"] for row in rows]
+    assert "Is a cell round?" not in texts
+    assert len([t for t in texts if t.startswith("What is a cell")]) == 1
+    stored = db.query(Question).filter(Question.test_id == test.id).all()
+    assert len(stored) == len(rows) == 4
+    choice = next(q for q in stored if q.question_text == "Pick the planet")
+    assert choice.correct_answer == "planet"
+    print(f"✅ Generated {len(rows)} questions with at most {ai_service.max_active} concurrent LLM calls")
+
+
+def test_invalid_request_is_client_error():
+    """Bad generation parameters are a 400, not an upstream failure"""
+    db = create_session()
+    student, _, _ = create_test_fixture(db)
+    document = Document(title="Science", filename="science.txt", file_path="science.txt",
+                        file_size=1, file_type="txt", owner_id=student.id, is_processed=True)
+    db.add(document)
+    db.commit()
+    student.role = UserRole.TEACHER
+
+    original = ai_api.test_generation_pipeline
+    ai_api.test_generation_pipeline = create_pipeline(FakeAIService())
+    try:
+        for difficulty, question_types in [("impossible", ["short_answer"]), ("easy", ["essay"])]:
+            request = ai_api.TestGenerationRequest(document_id=document.id, difficulty=difficulty,
+                                                   question_types=question_types)
+            try:
+                asyncio.run(ai_api.generate_test(request, current_user=student, db=db))
+                assert False, "invalid request accepted"
+            except HTTPException as e:
+                assert e.status_code == 400
+    finally:
+        ai_api.test_generation_pipeline = original
+
+
+def test_deduplicate_keeps_document_order():
+    """The first occurrence of a duplicate is kept, in its original position"""
+    pipeline = create_pipeline(FakeAIService())
+    questions = [
+        GeneratedQuestion.model_validate({"question": text, "type": "short_answer", "correct_answer": answer})
+        for text, answer in [("What is a cell?", "first"), ("Pick the planet", "planet"), ("what is a  CELL?", "last")]
+    ]
+    kept = pipeline.deduplicate(questions)
+    assert [q.question for q in kept] == ["What is a cell?", "Pick the planet"]
+    assert kept[0].correct_answer == "first"
+
+
+class FlakyAIService(FakeAIService):
+    """Fails every call for the planet topic until `healthy` is set"""
+
+    def __init__(self):
+        super().__init__()
+        self.healthy = False
+        self.calls = []
+
+    def generate_test_questions(self, content, num_questions, question_types, difficulty):
+        self.calls.append(content)
+        if not self.healthy and "topic 1" in content:
+            return {"success": False, "error": "rate limited"}
+        return super().generate_test_questions(content, num_questions, question_types, difficulty)
+
+
+def test_generation_job_resume():
+    """A failed job keeps finished sections and only retries the failed ones"""
+    print("🧪 Testing resumable generation jobs:")
+    db = create_session()
+    student, _, _ = create_test_fixture(db)
+    document = Document(title="Science", filename="science.txt", file_path="science.txt",
+                        file_size=1, file_type="txt", owner_id=student.id, is_processed=True)
+    db.add(document)
+    db.commit()
+
+    ai_service = FlakyAIService()
+    pipeline = create_pipeline(ai_service)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=db.get_bind())
+
+    job = create_job(db, owner_id=student.id, document_id=document.id, num_questions=8,
+                     question_types=["short_answer", "multiple_choice"], difficulty="easy", pipeline=pipeline)
+    asyncio.run(run_job(job.id, pipeline=pipeline, session_factory=session_factory))
+
+    db.expire_all()
+    job = db.query(TestGenerationJob).filter(TestGenerationJob.id == job.id).one()
+    assert job.status == JobStatus.FAILED and can_resume(job)
+    assert job.sections_total == 2 and job.sections_completed == 1
+    assert job.test_id is None
+    print(f"✅ Partial failure recorded: {job.error}")
+
+    ai_service.healthy = True
+    ai_service.calls.clear()
+    asyncio.run(run_job(job.id, pipeline=pipeline, session_factory=session_factory))
+
+    db.expire_all()
+    job = db.query(TestGenerationJob).filter(TestGenerationJob.id == job.id).one()
+    assert job.status == JobStatus.COMPLETED and not can_resume(job)
+    assert len(ai_service.calls) == 1 and "topic 1" in ai_service.calls[0]
+    test = db.query(Test).filter(Test.id == job.test_id).one()
+    assert test.difficulty.value == "easy"
+    assert db.query(Question).filter(Question.test_id == test.id).count() == 4
+    assert job.questions_generated == 6  # before near-duplicates were merged
+    print("✅ Resume re-ran only the failed section and saved the test")
+
+
+def test_generation_job_lease():
+    """Liveness comes from the heartbeat in the database, not from the process"""
+    db = create_session()
+    student, _, _ = create_test_fixture(db)
+    document = Document(title="Science", filename="science.txt", file_path="science.txt",
+                        file_size=1, file_type="txt", owner_id=student.id, is_processed=True)
+    db.add(document)
+    db.commit()
+    job = create_job(db, owner_id=student.id, document_id=document.id, num_questions=4,
+                     question_types=["short_answer"], difficulty="easy", pipeline=create_pipeline(FakeAIService()))
+    long_ago = datetime.now(timezone.utc) - timedelta(hours=1)
+
+    # A fresh pending job belongs to its background task; one whose task was lost can resume
+    assert not can_resume(job)
+    db.execute(update(TestGenerationJob).where(TestGenerationJob.id == job.id).values(
+        created_at=long_ago, updated_at=long_ago
+    ))
+    db.commit()
+    db.refresh(job)
+    assert can_resume(job)
+
+    # Only one worker can claim a job while its lease is live
+    assert claim_job(db, job.id)
+    assert not claim_job(db, job.id)
+    db.refresh(job)
+    assert job.status == JobStatus.RUNNING and not can_resume(job)
+
+    # The worker died: its heartbeat stops and another worker may take over
+    db.execute(update(TestGenerationJob).where(TestGenerationJob.id == job.id).values(
+        heartbeat_at=long_ago, updated_at=long_ago
+    ))
+    db.commit()
+    db.refresh(job)
+    assert can_resume(job)
+    assert claim_job(db, job.id)
+
+    # Deleting the document removes its jobs and their sections
+    job.sections = [TestGenerationJobSection(section_index=0, content="text", num_questions=1)]
+    db.commit()
+    delete_document_jobs(db, document.id)
+    db.delete(document)
+    db.commit()
+    assert db.query(TestGenerationJob).count() == 0
+    assert db.query(TestGenerationJobSection).count() == 0
+
+
+def test_question_bank_reuse():
+    """Proven bank questions replace LLM calls; duplicates are not reindexed as canonical"""
+    print("🧪 Testing question bank reuse:")
+    db = create_session()
+    student, _, _ = create_test_fixture(db)
+    bank_store = FakeBankStore()
+    ai_service = FakeAIService()
+    pipeline = create_pipeline(ai_service, bank_store)
+    document = SimpleNamespace(id=7, title="Science")
+    request = dict(creator_id=student.id, num_questions=6,
+                   question_types=["short_answer", "multiple_choice"], difficulty="medium")
+
+    first, rows = asyncio.run(pipeline.run(db, document, **request))
+    assert len(bank_store.items) == len(rows) == 4
+    assert all(metadata["canonical"] for _, metadata in bank_store.items.values())
+
+    # Only the cell questions have item statistics good enough to reuse
+    for row in rows:
+        if "cell" in row["question_text"].lower():
+            db.add(QuestionStatistics(question_id=row["id"], test_id=first.id, attempts=10, correct_count=6,
+                                      percentage_sum=600, percentage_sq_sum=40000, correct_percentage_sum=420))
+    db.commit()
+
+    calls = []
+    original = ai_service.generate_test_questions
+    ai_service.generate_test_questions = lambda content, n, *args: calls.append((content, n)) or original(content, n, *args)
+    second, second_rows = asyncio.run(pipeline.run(db, document, **request))
+
+    # Two of the three cell questions came from the bank, only the shortfall was requested
+    assert sorted((content[:7], n) for content, n in calls) == [("Chunk 0", 1), ("Chunk 2", 3)]
+    texts = sorted(row["question_text"] for row in second_rows)
+    assert texts == sorted(row["question_text"] for row in rows)
+    # The copies are indexed as duplicates of the originals
+    copies = [bank_store.items[f"question_{row['id']}"][1] for row in second_rows]
+    assert sum(not metadata["canonical"] for metadata in copies) == 4
+    print("✅ Reused 2 bank questions and generated only the remaining ones")
+
+    # Plus the fixture's two questions, which embed identically without any keyword
+    assert pipeline.question_bank.reindex(db) == {"indexed": 10, "duplicates": 5}
+    print("✅ Reindex rebuilt the bank with the same duplicate links")
+
+
+if __name__ == "__main__":
+    test_generation_pipeline()
+    test_invalid_request_is_client_error()
+    test_deduplicate_keeps_document_order()
+    test_generation_job_resume()
+    test_generation_job_lease()
+    test_question_bank_reuse()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Test materialised test and student analytics
+"""
+import asyncio
+
+from app.models.analytics import TestScoreBucket
+from app.models.user import User, UserRole
+from app.services.grading import answer_key_cache
+from app.services.analytics import (
+    get_test_summary, get_question_summaries, get_student_summary, rebuild_test_statistics
+)
+from app.api.v1.tests import submit_test
+from test_grading import create_session, create_test_fixture
+
+
+def submit_all(db, test, questions, students_answers):
+    """Submit one answer sheet per (student, answers) pair"""
+    for student, answers in students_answers:
+        asyncio.run(submit_test(
+            test_id=test.id,
+            answers={str(q.id): answer for q, answer in zip(questions, answers)},
+            current_user=student,
+            db=db
+        ))
+
+
+def test_incremental_analytics():
+    """Summary tables are updated on every submission"""
+    print("🧪 Testing incremental analytics:")
+    answer_key_cache.clear()
+    db = create_session()
+    student, test, questions = create_test_fixture(db)
+    other = User(email="other@test.com", username="other", full_name="Other",
+                 hashed_password="x", role=UserRole.STUDENT)
+    db.add(other)
+    db.commit()
+
+    submit_all(db, test, questions, [
+        (student, ["4", "true"]),   # 100%
+        (other, ["5", "true"]),     # 33%
+        (student, ["4", "false"]),  # 66%
+    ])
+
+    summary = get_test_summary(db, test.id)
+    assert summary["attempts"] == 3
+    assert summary["min_percentage"] == 33
+    assert summary["max_percentage"] == 100
+    assert [bucket["count"] for bucket in summary["histogram"]][3] == 1
+    assert summary["histogram"][9]["count"] == 1
+
+    by_question = {row["question_id"]: row for row in get_question_summaries(db, test.id)}
+    assert abs(by_question[questions[0].id]["difficulty"] - 2 / 3) < 1e-9
+    assert by_question[questions[0].id]["discrimination"] > 0
+
+    student_summary = get_student_summary(db, student.id)
+    assert student_summary["tests_taken"] == 2
+    assert student_summary["best_percentage"] == 100
+    assert student_summary["last_percentage"] == 66
+    print("✅ Test, question and student summaries maintained incrementally")
+
+    rebuild_test_statistics(db, test.id)
+    assert get_test_summary(db, test.id) == summary
+    assert {row["question_id"]: row for row in get_question_summaries(db, test.id)} == by_question
+    assert get_student_summary(db, student.id) == student_summary
+    print("✅ Rebuild from stored results matches incremental state")
+
+
+def test_partially_seeded_rows():
+    """Rows another worker seeded first are kept and the missing ones are still created"""
+    answer_key_cache.clear()
+    db = create_session()
+    student, test, questions = create_test_fixture(db)
+    # Another worker got as far as the histogram before this one started
+    db.add_all([TestScoreBucket(test_id=test.id, bucket=bucket, count=0) for bucket in range(10)])
+    db.commit()
+
+    submit_all(db, test, questions, [(student, ["4", "true"]), (student, ["5", "true"])])
+
+    assert get_test_summary(db, test.id)["attempts"] == 2
+    assert [row["attempts"] for row in get_question_summaries(db, test.id)] == [2, 2]
+
+
+if __name__ == "__main__":
+    test_incremental_analytics()
+    test_partially_seeded_rows()
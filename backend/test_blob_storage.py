@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Test content-addressed upload storage and reuse of processed duplicates
+"""
+import asyncio
+import hashlib
+import io
+import os
+import tempfile
+from types import SimpleNamespace
+
+from sqlalchemy.orm import sessionmaker
+
+from app.models.blob import Blob
+from app.models.document import Document
+from app.services.blob_storage import BlobStore, UploadTooLarge, acquire_blob, delete_unreferenced_blob, release_blob
+from app.services.document_ingest import DocumentIngestor
+from app.services.upload_stream import InvalidUpload, receive_upload
+from test_grading import create_session, create_test_fixture
+
+
+class FakeRAGService:
+    """Counts real processing runs and keeps chunks per document id"""
+
+    def __init__(self):
+        self.processed = 0
+        self.chunks = {}
+        self.vector_store = SimpleNamespace(copy_document=self.copy_document)
+
+    def reingest_document(self, file_path, file_type, document_id, metadata=None, file_hash=None):
+        self.processed += 1
+        with open(file_path) as f:
+            self.chunks[document_id] = [f.read()]
+        return {"total_chunks": 1, "chunks_added": 1, "chunks_removed": 0, "chunks_moved": 0,
+                "chunks_unchanged": 0}
+
+    def copy_document(self, source_document_id, document_id, metadata=None):
+        self.chunks[document_id] = list(self.chunks.get(source_document_id, []))
+        return len(self.chunks[document_id])
+
+
+def upload(db, store, owner_id, content):
+    staged = store.stage(io.BytesIO(content))
+    blob = acquire_blob(db, staged, store)
+    document = Document(title="notes.txt", filename="notes.txt", file_path=blob.file_path,
+                        file_size=staged.size, file_type=".txt", owner_id=owner_id, blob_hash=blob.sha256)
+    db.add(document)
+    db.commit()
+    return document
+
+
+def test_duplicate_uploads_share_blob():
+    """Identical uploads are stored and processed once"""
+    print("🧪 Testing deduplicated uploads:")
+    db = create_session()
+    student, test, _ = create_test_fixture(db)
+    store = BlobStore(tempfile.mkdtemp())
+    rag_service = FakeRAGService()
+    ingestor = DocumentIngestor(rag_service=rag_service, session_factory=sessionmaker(bind=db.get_bind()))
+
+    content = b"Photosynthesis turns light into chemical energy. " * 100
+    first = upload(db, store, test.creator_id, content)
+    second = upload(db, store, student.id, content)
+    other = upload(db, store, student.id, b"Something else entirely.")
+
+    assert first.file_path == second.file_path != other.file_path
+    assert len(os.listdir(os.path.dirname(first.file_path))) == 1
+    assert db.get(Blob, first.blob_hash).ref_count == 2
+    assert os.listdir(store.temp_dir) == []
+
+    assert ingestor.ingest(first.id)["status"] == "processed"
+    result = ingestor.ingest(second.id)
+    assert (result["status"], result["source_document_id"]) == ("reused", first.id)
+    assert ingestor.ingest(other.id)["status"] == "processed"
+    assert rag_service.processed == 2
+    assert rag_service.chunks[str(second.id)] == rag_service.chunks[str(first.id)]
+    # Per-blob ingest locks do not outlive the ingests that used them
+    assert ingestor._blob_locks == {}
+
+    # The file stays until its last document is gone
+    assert not release_blob(db, first.blob_hash)
+    db.commit()
+    assert os.path.exists(first.file_path)
+    assert release_blob(db, second.blob_hash)
+    db.commit()
+    assert db.get(Blob, first.blob_hash) is None
+    # The same content uploaded again before the file was removed keeps it
+    again = upload(db, store, student.id, content)
+    assert not delete_unreferenced_blob(db, again.blob_hash, store)
+    assert os.path.exists(first.file_path) and db.get(Blob, again.blob_hash).ref_count == 1
+    assert release_blob(db, again.blob_hash)
+    db.commit()
+    assert delete_unreferenced_blob(db, again.blob_hash, store)
+    assert not os.path.exists(first.file_path) and db.get(Blob, again.blob_hash) is None
+    print("✅ Two uploads, one blob, one processing run")
+
+
+def multipart_body(filename, content, boundary="discera-boundary"):
+    return (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        "Content-Type: application/octet-stream\r\n\r\n"
+    ).encode() + content + f"\r\n--{boundary}--\r\n".encode()
+
+
+def stream_upload(store, filename, content, max_size=100_000, chunk_size=1000):
+    """Feed a multipart body in small chunks; returns (result or exception, bytes consumed)"""
+    body = multipart_body(filename, content)
+    consumed = 0
+
+    async def chunks():
+        nonlocal consumed
+        for i in range(0, len(body), chunk_size):
+            consumed += len(body[i:i + chunk_size])
+            yield body[i:i + chunk_size]
+
+    async def receive():
+        return await receive_upload(
+            content_type="multipart/form-data; boundary=discera-boundary",
+            content_length=None,
+            body=chunks(),
+            store=store,
+            max_size=max_size,
+            allowed_extensions=[".pdf", ".txt"]
+        )
+
+    try:
+        return asyncio.run(receive()), consumed
+    except (UploadTooLarge, InvalidUpload) as e:
+        return e, consumed
+
+
+def test_streaming_upload_checks():
+    """Size and type are enforced while the upload streams in"""
+    print("🧪 Testing streaming uploads:")
+    store = BlobStore(tempfile.mkdtemp())
+    pdf = b"%PDF-1.7\n" + os.urandom(20_000)
+
+    upload, _ = stream_upload(store, "lecture.pdf", pdf)
+    assert (upload.filename, upload.extension, upload.blob.size) == ("lecture.pdf", ".pdf", len(pdf))
+    assert upload.blob.sha256 == hashlib.sha256(pdf).hexdigest()
+    with open(upload.blob.temp_path, "rb") as f:
+        assert f.read() == pdf
+    store.discard(upload.blob)
+
+    # Rejected after the limit, long before the whole 500 KB body is read
+    error, consumed = stream_upload(store, "huge.pdf", b"%PDF-1.7\n" + b"0" * 500_000, max_size=50_000)
+    assert isinstance(error, UploadTooLarge)
+    assert consumed < 60_000
+
+    error, _ = stream_upload(store, "fake.pdf", b"MZ" + b"\x00" * 10_000)
+    assert isinstance(error, InvalidUpload)
+    error, _ = stream_upload(store, "notes.exe", b"text")
+    assert isinstance(error, InvalidUpload)
+    text = "Zellatmung – kurz erklärt".encode()
+    upload, _ = stream_upload(store, "notes.txt", text, chunk_size=13)
+    assert upload.blob.size == len(text)
+
+    store.discard(upload.blob)
+    assert os.listdir(store.temp_dir) == []
+    print("✅ Oversized and mislabelled uploads rejected mid-stream")
+
+
+if __name__ == "__main__":
+    test_duplicate_uploads_share_blob()
+    test_streaming_upload_checks()
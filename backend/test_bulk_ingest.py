@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Test bulk ingestion of course archives, including resuming after a failure
+"""
+import os
+import tempfile
+import zipfile
+
+from sqlalchemy.orm import sessionmaker
+
+from app.models.document import Document
+from app.rag.document_processor import DocumentProcessor
+from app.services.blob_storage import BlobStore
+from app.services.bulk_ingest import BulkIngestor
+from test_grading import create_session, create_test_fixture
+
+
+class FlakyEmbeddingService:
+    """Counts embedding calls; raises while `failing` is set"""
+
+    def __init__(self):
+        self.calls = 0
+        self.failing = False
+
+    def generate_embeddings(self, chunks):
+        if self.failing:
+            raise RuntimeError("embedding model ran out of memory")
+        self.calls += 1
+        return [
+            {"chunk_id": chunk.chunk_id, "content": chunk.content, "embedding": [0.0, 1.0], "embedding_dim": 2,
+             "metadata": {"page_number": chunk.page_number, **chunk.metadata}}
+            for chunk in chunks
+        ]
+
+
+class MemoryVectorStore:
+    """The parts of VectorStore that bulk ingestion uses, backed by a dict"""
+
+    def __init__(self):
+        self.items = {}
+
+    def upsert_documents(self, documents):
+        for document_id, embeddings, metadata in documents:
+            for data in embeddings:
+                self.items[f"{document_id}_{data['chunk_id']}"] = (
+                    data["content"], {**(metadata or {}), "document_id": document_id}
+                )
+        return sum(len(embeddings) for _, embeddings, _ in documents)
+
+    def copy_document(self, source_document_id, document_id, metadata=None):
+        prefix = f"{source_document_id}_"
+        copies = {
+            f"{document_id}_{chunk_id[len(prefix):]}": (content, {**chunk_metadata, **(metadata or {}),
+                                                                  "document_id": document_id})
+            for chunk_id, (content, chunk_metadata) in self.items.items() if chunk_id.startswith(prefix)
+        }
+        self.items.update(copies)
+        return len(copies)
+
+    def chunk_count(self, document_id):
+        return sum(1 for chunk_id in self.items if chunk_id.startswith(f"{document_id}_"))
+
+
+class FakeRAGService:
+    def __init__(self):
+        self.document_processor = DocumentProcessor(chunk_size=300, chunk_overlap=50)
+        self.embedding_service = FlakyEmbeddingService()
+        self.vector_store = MemoryVectorStore()
+
+
+def lecture(topic):
+    return " ".join(f"Lecture sentence {i} about {topic} explains one more detail." for i in range(30))
+
+
+def write_course(root):
+    files = {
+        "week1/intro.txt": lecture("cells"),
+        "week1/membranes.txt": lecture("membranes"),
+        "week2/intro-copy.txt": lecture("cells"),
+        "week2/scan.pdf": "not really a PDF",
+        "week2/photo.jpg": "binary image",
+        ".DS_Store": "finder metadata",
+    }
+    for name, content in files.items():
+        path = os.path.join(root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+
+
+def test_bulk_ingest_resumes_after_failure():
+    """A failed run leaves documents unprocessed; rerunning finishes them and skips what is done"""
+    print("🧪 Testing bulk ingestion:")
+    db = create_session()
+    student, test, _ = create_test_fixture(db)
+    course = tempfile.mkdtemp()
+    write_course(course)
+    rag_service = FakeRAGService()
+    ingestor = BulkIngestor(
+        rag_service=rag_service,
+        session_factory=sessionmaker(bind=db.get_bind()),
+        store=BlobStore(tempfile.mkdtemp()),
+        workers=2,
+        batch_chunks=10000,
+        commit_files=2
+    )
+
+    rag_service.embedding_service.failing = True
+    first = ingestor.run(course, test.creator_id)
+    assert (first.files, first.rejected, first.ingested) == (5, 2, 0)
+    # Both parsed files fail to embed, and the copy of intro.txt has nothing to copy from
+    assert first.failed == 3
+    assert db.query(Document).filter(Document.is_processed == False).count() == 3
+    assert {name for name, _ in first.errors} >= {"week2/scan.pdf", "week2/photo.jpg"}
+
+    rag_service.embedding_service.failing = False
+    second = ingestor.run(course, test.creator_id)
+    assert (second.ingested, second.reused, second.skipped, second.failed) == (2, 1, 0, 0)
+    # Chunks of both documents were embedded in one call
+    assert rag_service.embedding_service.calls == 1
+    assert db.query(Document).count() == 3
+    documents = {document.filename: document for document in db.query(Document)}
+    assert all(document.is_processed for document in documents.values())
+    intro, copy = documents["week1/intro.txt"], documents["week2/intro-copy.txt"]
+    assert intro.blob_hash == copy.blob_hash
+    assert rag_service.vector_store.chunk_count(intro.id) == rag_service.vector_store.chunk_count(copy.id) > 1
+    assert second.chunks == len(rag_service.vector_store.items)
+    assert second.files_per_second > 0 and second.as_dict()["chunks_per_second"] > 0
+
+    third = ingestor.run(course, test.creator_id)
+    assert (third.ingested, third.reused, third.skipped) == (0, 0, 3)
+    assert rag_service.embedding_service.calls == 1
+
+    # The same material zipped for another teacher is reused, not embedded again
+    archive = os.path.join(tempfile.mkdtemp(), "course.zip")
+    with zipfile.ZipFile(archive, "w") as zf:
+        for name in ("week1/intro.txt", "week1/membranes.txt"):
+            zf.write(os.path.join(course, name), name)
+        zf.writestr("__MACOSX/week1/._intro.txt", "resource fork")
+    zipped = ingestor.run(archive, student.id)
+    assert (zipped.files, zipped.ingested, zipped.reused) == (2, 0, 2)
+    assert rag_service.embedding_service.calls == 1
+    print(f"✅ {second.ingested} ingested, {second.reused} reused, {second.chunks} chunks")
+
+
+if __name__ == "__main__":
+    test_bulk_ingest_resumes_after_failure()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Test structure-aware chunking: sentence boundaries and section paths
+"""
+import os
+import tempfile
+from types import SimpleNamespace
+
+from docx import Document
+from PyPDF2 import PdfWriter
+from PyPDF2.generic import DecodedStreamObject, DictionaryObject, NameObject, NumberObject
+from tokenizers import Tokenizer, models, pre_tokenizers, processors
+from transformers import PreTrainedTokenizerFast
+
+from app.rag.chunking import StructuredChunker, TextBlock, split_sentences
+from app.rag.document_processor import DocumentProcessor
+from app.rag.embedding_service import EmbeddingService
+from app.rag.pdf_backends import PDFExtractor
+
+
+def write_pdf(path, pages, image_pages=()):
+    """PDF whose pages are raw content streams set in Helvetica; `image_pages` also get an image, like scans"""
+    writer = PdfWriter()
+    font = writer._add_object(DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica")
+    }))
+    image = DecodedStreamObject()
+    image.set_data(b"\x80")
+    image.update({
+        NameObject("/Type"): NameObject("/XObject"), NameObject("/Subtype"): NameObject("/Image"),
+        NameObject("/Width"): NumberObject(1), NameObject("/Height"): NumberObject(1),
+        NameObject("/ColorSpace"): NameObject("/DeviceGray"), NameObject("/BitsPerComponent"): NumberObject(8)
+    })
+    image = writer._add_object(image)
+    for index, content in enumerate(pages):
+        writer.add_blank_page(612, 792)
+        page = writer.pages[-1]
+        resources = DictionaryObject({NameObject("/Font"): DictionaryObject({NameObject("/F1"): font})})
+        if index in image_pages:
+            resources[NameObject("/XObject")] = DictionaryObject({NameObject("/Im0"): image})
+            content += b" q 612 0 0 792 0 0 cm /Im0 Do Q"
+        page[NameObject("/Resources")] = resources
+        stream = DecodedStreamObject()
+        stream.set_data(content)
+        page[NameObject("/Contents")] = writer._add_object(stream)
+    with open(path, "wb") as f:
+        writer.write(f)
+
+
+def create_embedding_service(max_seq_length):
+    """EmbeddingService around a word-level BERT-style tokenizer, without loading a model"""
+    tokenizer = Tokenizer(models.WordLevel({"[UNK]": 0, "[CLS]": 1, "[SEP]": 2}, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    tokenizer.post_processor = processors.TemplateProcessing(
+        single="[CLS] $A [SEP]", special_tokens=[("[CLS]", 1), ("[SEP]", 2)]
+    )
+    service = EmbeddingService.__new__(EmbeddingService)
+    service.model_name = "word-level-test"
+    service.model = SimpleNamespace(
+        max_seq_length=max_seq_length,
+        tokenizer=PreTrainedTokenizerFast(tokenizer_object=tokenizer, unk_token="[UNK]", cls_token="[CLS]", sep_token="[SEP]")
+    )
+    return service
+
+
+def test_sentence_boundaries():
+    """Abbreviations, initials and decimals do not end a sentence; punctuation is kept"""
+    print("🧪 Testing sentence splitting:")
+    sentences = split_sentences("Dr. Smith measured 3.14 m, e.g. in Fig. 2. J. Doe agreed! Did it work? Yes.")
+    assert sentences == ["Dr. Smith measured 3.14 m, e.g. in Fig. 2.", "J. Doe agreed!", "Did it work?", "Yes."]
+
+    chunker = StructuredChunker(chunk_size=100, chunk_overlap=30)
+    chunks = chunker.chunk([TextBlock("One two three. " * 20)])
+    assert all(len(chunk.text) <= 100 and chunk.text.endswith(".") for chunk in chunks)
+    # Consecutive chunks share their boundary sentences
+    assert chunks[1].text.startswith(chunks[0].text[-29:])
+    print(f"✅ {len(sentences)} sentences, {len(chunks)} chunks")
+
+
+def test_docx_sections():
+    """DOCX heading styles become section paths on every chunk"""
+    print("🧪 Testing DOCX section paths:")
+    path = os.path.join(tempfile.mkdtemp(), "biology.docx")
+    doc = Document()
+    doc.add_heading("Biology", 0)
+    doc.add_heading("Cells", 1)
+    doc.add_paragraph("Cells are the basic unit of life. " * 40)
+    doc.add_heading("Membranes", 2)
+    doc.add_paragraph("The membrane controls what enters the cell.")
+    doc.add_heading("Genetics", 1)
+    doc.add_paragraph("Genes are inherited.")
+    doc.save(path)
+
+    chunks = DocumentProcessor().process_document(path, ".docx")
+    sections = [chunk.section for chunk in chunks]
+    assert sections[0] == "Biology > Cells" and len(set(sections[:-2])) == 1
+    assert sections[-2:] == ["Biology > Cells > Membranes", "Biology > Genetics"]
+    assert chunks[-1].metadata["section_path"] == "Biology > Genetics"
+    assert all(len(chunk.content) <= 1000 for chunk in chunks)
+    print(f"✅ {len(chunks)} chunks in {len(set(sections))} sections")
+
+
+def test_pdf_font_size_headings():
+    """Without an outline, larger PDF text is taken as headings"""
+    print("🧪 Testing PDF headings from font sizes:")
+    path = os.path.join(tempfile.mkdtemp(), "notes.pdf")
+    write_pdf(path, [
+        b"BT /F1 20 Tf 72 720 Td (Photosynthesis) Tj ET "
+        b"BT /F1 11 Tf 72 690 Td (Plants turn light into sugar. The process) Tj 0 -14 Td (needs water.) Tj ET",
+        b"BT /F1 11 Tf 72 720 Td (Chlorophyll absorbs light.) Tj ET "
+        b"BT /F1 20 Tf 72 690 Td (Respiration) Tj ET "
+        b"BT /F1 11 Tf 72 660 Td (Cells release energy from sugar.) Tj ET"
+    ])
+
+    processor = DocumentProcessor()
+    processor._pdf_extractor = PDFExtractor("pypdf2")
+    chunks = processor.process_document(path, ".pdf")
+    assert [(chunk.section, chunk.page_number, chunk.metadata["page_end"]) for chunk in chunks] == [
+        ("Photosynthesis", 1, 2), ("Respiration", 2, 2)
+    ]
+    assert chunks[0].content == "Plants turn light into sugar. The process needs water. Chlorophyll absorbs light."
+    print(f"✅ {len(chunks)} chunks: {[chunk.section for chunk in chunks]}")
+
+
+def test_token_sized_chunks():
+    """Chunks are sized in tokenizer tokens to fit the model input, measured in batches"""
+    print("🧪 Testing token-sized chunks:")
+    embedding_service = create_embedding_service(max_seq_length=64)
+    calls = []
+    count_tokens = embedding_service.count_tokens
+    embedding_service.count_tokens = lambda texts: calls.append(len(texts)) or count_tokens(texts)
+
+    processor = DocumentProcessor.for_embedding_model(embedding_service)
+    assert (processor.chunk_size, processor.chunk_overlap, processor.length_unit) == (62, 12, "tokens")
+
+    # "Sentence 12, on cells." is six tokens: the words and the punctuation
+    path = os.path.join(tempfile.mkdtemp(), "notes.txt")
+    with open(path, "w") as f:
+        f.write(" ".join(f"Sentence {i}, on cells." for i in range(100)))
+    calls.clear()
+    chunks = processor.process_document(path, ".txt")
+
+    assert calls[0] == 100  # every sentence of the section in one tokenizer call
+    assert all(chunk.metadata["token_count"] == 60 for chunk in chunks[:-1])
+    assert count_tokens([chunk.content for chunk in chunks]) == [chunk.metadata["token_count"] for chunk in chunks]
+    assert len(chunks) == 13  # 10 sentences, then 8 new ones per chunk after 2 repeated
+    print(f"✅ {len(chunks)} chunks of at most {processor.chunk_size} tokens")
+
+
+if __name__ == "__main__":
+    test_sentence_boundaries()
+    test_docx_sections()
+    test_pdf_font_size_headings()
+    test_token_sized_chunks()
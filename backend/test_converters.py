@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Test legacy and office format conversion in the sandboxed converter pool
+"""
+import os
+import struct
+import tempfile
+import time
+import zipfile
+
+from app.rag.converters import ConversionError, ConversionTimeout, ConverterPool
+from app.rag.document_processor import DocumentProcessor
+
+
+def write_doc(path, pieces):
+    """Minimal Word 97 file: a FIB, a piece table and the text pieces (str for 8-bit, bytes for UTF-16)"""
+    text_offset, word, cps, descriptors = 1024, bytearray(4096), [0], b""
+    for piece in pieces:
+        if isinstance(piece, str):
+            data, fc, length = piece.encode("cp1252"), (text_offset * 2) | 0x40000000, len(piece)
+        else:
+            data, fc, length = piece, text_offset, len(piece) // 2
+        word[text_offset:text_offset + len(data)] = data
+        descriptors += struct.pack("<HIH", 0, fc, 0)
+        cps.append(cps[-1] + length)
+        text_offset += len(data)
+    clx = b"\x02" + struct.pack("<I", len(cps) * 4 + len(descriptors)) + struct.pack(f"<{len(cps)}i", *cps) + descriptors
+    table = clx.ljust(4096, b"\x00")
+    struct.pack_into("<HH6xH", word, 0, 0xA5EC, 0xC1, 0x0200)  # fWhichTblStm: 1Table
+    struct.pack_into("<i", word, 0x4C, cps[-1])
+    struct.pack_into("<II", word, 0x1A2, 0, len(clx))
+
+    def entry(name, kind, start, size, child=0xFFFFFFFF, right=0xFFFFFFFF):
+        encoded = (name + "\x00").encode("utf-16-le")
+        return (
+            encoded.ljust(64, b"\x00") + struct.pack("<HBBIII", len(encoded), kind, 1, 0xFFFFFFFF, right, child)
+            + b"\x00" * 36 + struct.pack("<III", start, size, 0)
+        )
+
+    word_sectors, table_sectors = len(word) // 512, len(table) // 512
+    fat = [0xFFFFFFFD, 0xFFFFFFFE]
+    for first, count in ((2, word_sectors), (2 + word_sectors, table_sectors)):
+        fat.extend(list(range(first + 1, first + count)) + [0xFFFFFFFE])
+    header = bytearray(512)
+    header[:8] = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+    struct.pack_into("<HHHHH", header, 0x18, 0x3E, 3, 0xFFFE, 9, 6)
+    struct.pack_into("<IIIIIIIII", header, 0x28, 0, 1, 1, 0, 4096, 0xFFFFFFFE, 0, 0xFFFFFFFE, 0)
+    struct.pack_into("<109I", header, 0x4C, 0, *([0xFFFFFFFF] * 108))
+    directory = (
+        entry("Root Entry", 5, 0xFFFFFFFE, 0, child=1) + entry("WordDocument", 2, 2, len(word), right=2)
+        + entry("1Table", 2, 2 + word_sectors, len(table))
+    ).ljust(512, b"\x00")
+    fat_sector = struct.pack(f"<{len(fat)}I", *fat).ljust(512, b"\xff")
+    with open(path, "wb") as f:
+        f.write(bytes(header) + fat_sector + directory + bytes(word) + table)
+
+
+def write_zip(path, files):
+    with zipfile.ZipFile(path, "w") as archive:
+        for name, content in files.items():
+            archive.writestr(name, content)
+
+
+def write_fixtures(directory):
+    paths = {extension: os.path.join(directory, f"lecture{extension}") for extension in (".doc", ".rtf", ".odt", ".pptx")}
+    write_doc(paths[".doc"], [
+        "Osnove biologije\r\x13 SEQ Slika \x14Slika 1\x15 prikazuje ",
+        "ćeliju i njene delove.\r".encode("utf-16-le"),
+    ])
+    with open(paths[".rtf"], "w") as f:
+        f.write(
+            r"{\rtf1\ansi\ansicpg1250\deff0{\fonttbl{\f0 Arial;}}{\*\generator Writer;}"
+            r"\pard Mitoza je deoba \'e6elije.\par \u1035?\u1077?\u1083?\u1080?\u1112?\u1072? \ldblquote deli\rdblquote .\par}"
+        )
+    text, office = "urn:oasis:names:tc:opendocument:xmlns:text:1.0", "urn:oasis:names:tc:opendocument:xmlns:office:1.0"
+    write_zip(paths[".odt"], {"content.xml": (
+        f'<office:document-content xmlns:office="{office}" xmlns:text="{text}"><office:body><office:text>'
+        '<text:h text:outline-level="1">Genetika</text:h><text:p>Geni se<text:s/>nasleđuju.</text:p>'
+        '<text:h text:outline-level="2">DNK</text:h><text:p>Dvostruka spirala.</text:p>'
+        '</office:text></office:body></office:document-content>'
+    )})
+    presentation, drawing = "http://schemas.openxmlformats.org/presentationml/2006/main", \
+        "http://schemas.openxmlformats.org/drawingml/2006/main"
+
+    def slide(title, body):
+        return (
+            f'<p:sld xmlns:p="{presentation}" xmlns:a="{drawing}"><p:cSld><p:spTree>'
+            f'<p:sp><p:nvSpPr><p:nvPr><p:ph type="title"/></p:nvPr></p:nvSpPr><p:txBody><a:p><a:r><a:t>{title}</a:t></a:r></a:p></p:txBody></p:sp>'
+            f'<p:sp><p:nvSpPr><p:nvPr/></p:nvSpPr><p:txBody><a:p><a:r><a:t>{body}</a:t></a:r></a:p></p:txBody></p:sp>'
+            '</p:spTree></p:cSld></p:sld>'
+        )
+    write_zip(paths[".pptx"], {
+        "ppt/slides/slide2.xml": slide("Mejoza", "Nastaju gamete."),
+        "ppt/slides/slide1.xml": slide("Mitoza", "Nastaju dve ćelije."),
+    })
+    return paths
+
+
+def test_formats_convert_to_blocks():
+    """.doc, .rtf, .odt and .pptx files are read into blocks in worker processes"""
+    print("🧪 Testing format conversion:")
+    paths = write_fixtures(tempfile.mkdtemp())
+    pool = ConverterPool(size=2, timeout=30)
+    try:
+        assert pool.convert(paths[".doc"], ".doc") == [
+            ("Osnove biologije", None, None), ("Slika 1 prikazuje ćeliju i njene delove.", None, None)
+        ]
+        assert pool.convert(paths[".rtf"], ".rtf") == [
+            ("Mitoza je deoba ćelije.", None, None), ("Ћелија “deli”.", None, None)
+        ]
+        assert pool.convert(paths[".odt"], ".odt") == [
+            ("Genetika", 1, None), ("Geni se nasleđuju.", None, None), ("DNK", 2, None), ("Dvostruka spirala.", None, None)
+        ]
+        assert pool.convert(paths[".pptx"], ".pptx") == [
+            ("Mitoza", 1, 1), ("Nastaju dve ćelije.", None, 1), ("Mejoza", 1, 2), ("Nastaju gamete.", None, 2)
+        ]
+        # Workers are reused rather than started per file
+        assert len(pool._idle) <= 2
+
+        processor = DocumentProcessor()
+        processor._converter_pool = pool
+        chunks = processor.process_document(paths[".odt"], ".odt")
+        assert [chunk.section for chunk in chunks] == ["Genetika", "Genetika > DNK"]
+    finally:
+        pool.shutdown()
+    print("✅ 4 formats converted")
+
+
+def test_bad_files_fail_in_isolation():
+    """A corrupt file fails its conversion only; a hung conversion is killed at the timeout"""
+    print("🧪 Testing converter isolation:")
+    directory = tempfile.mkdtemp()
+    broken = os.path.join(directory, "broken.doc")
+    with open(broken, "wb") as f:
+        f.write(b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1" + b"\x00" * 100)
+    pool = ConverterPool(size=1, timeout=1)
+    try:
+        try:
+            pool.convert(broken, ".doc")
+            assert False, "converted a corrupt file"
+        except ConversionError:
+            pass
+
+        # A FIFO never delivers data, so reading it blocks like a converter stuck in a loop
+        fifo = os.path.join(directory, "stuck.rtf")
+        os.mkfifo(fifo)
+        started = time.monotonic()
+        try:
+            pool.convert(fifo, ".rtf")
+            assert False, "a stuck conversion returned"
+        except ConversionTimeout:
+            pass
+        assert time.monotonic() - started < 5
+
+        paths = write_fixtures(directory)
+        assert pool.convert(paths[".odt"], ".odt")[0] == ("Genetika", 1, None)
+    finally:
+        pool.shutdown()
+    print("✅ Failures contained")
+
+
+def test_cpu_limit_applies_per_file():
+    """A reused worker gets the full CPU budget for every file, not for its lifetime"""
+    path = os.path.join(tempfile.mkdtemp(), "long.rtf")
+    with open(path, "w") as f:
+        f.write("{\\rtf1\\ansi " + "".join(
+            f"{{\\pard Paragraf {i} o fotosintezi i \\b hloroplastima\\b0 .\\par}}\n" for i in range(60000)
+        ) + "}")
+    pool = ConverterPool(size=1, timeout=2)
+    try:
+        # Each file takes about half a second of CPU: together well past one budget
+        for _ in range(8):
+            assert len(pool.convert(path, ".rtf")) == 60000
+    finally:
+        pool.shutdown()
+
+
+if __name__ == "__main__":
+    test_formats_convert_to_blocks()
+    test_bad_files_fail_in_isolation()
+    test_cpu_limit_applies_per_file()
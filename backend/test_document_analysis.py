@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Test map-reduce document analysis and its caches
+"""
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+from app.core.config import settings
+from app.models.document_analysis import DocumentAnalysis, SectionSummary
+from app.services.document_analysis import DocumentAnalyzer, delete_document_analysis, split_sections
+from test_grading import create_session
+
+
+class FakeVectorStore:
+    """Serves a mutable list of chunk texts for one document"""
+
+    def __init__(self, texts):
+        self.texts = texts
+
+    def get_document_chunks(self, document_id, include_embeddings=True):
+        return [
+            {"id": f"{document_id}_chunk_{i}", "content": text, "metadata": {"chunk_id": f"chunk_{i}"}}
+            for i, text in enumerate(self.texts)
+        ]
+
+
+class FakeAIService:
+    """Summarizes by echoing the first word of a section and records calls"""
+
+    model = "fake"
+
+    def __init__(self):
+        self.summarized = []
+        self.combined = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def is_available(self):
+        return True
+
+    def summarize_section(self, content):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            self.summarized.append(content)
+        time.sleep(0.02)
+        with self.lock:
+            self.active -= 1
+        return {"success": True, "data": {
+            "summary": content.split()[0], "key_concepts": [content.split()[0]],
+            "topics": ["biology"], "difficulty_level": "Hard"
+        }}
+
+    def combine_summaries(self, summaries):
+        self.combined.append(len(summaries))
+        concepts = [concept for summary in summaries for concept in summary["key_concepts"]]
+        return {"success": True, "data": {
+            "summary": " ".join(summary["summary"] for summary in summaries),
+            "key_concepts": concepts, "topics": ["biology"], "difficulty_level": "hard",
+            "learning_objectives": ["Explain cells"]
+        }}
+
+
+def test_document_analysis_cache():
+    """Repeated analyses are free and edits only re-summarize changed sections"""
+    print("🧪 Testing document analysis:")
+    original = (settings.ANALYSIS_SECTION_MIN_CHARS, settings.ANALYSIS_SECTION_MAX_CHARS,
+                settings.ANALYSIS_REDUCE_MAX_CHARS)
+    settings.ANALYSIS_SECTION_MIN_CHARS, settings.ANALYSIS_SECTION_MAX_CHARS = 100, 200
+    settings.ANALYSIS_REDUCE_MAX_CHARS = 600
+    try:
+        db = create_session()
+        texts = [f"part{i} " + "cells divide and grow " * 4 for i in range(40)]
+        ai_service = FakeAIService()
+        rag_service = SimpleNamespace(vector_store=FakeVectorStore(texts))
+        analyzer = DocumentAnalyzer(rag_service=rag_service, ai_service=ai_service, concurrency=3)
+        document = SimpleNamespace(id=1, file_path="unused", file_type=".txt")
+        sections = split_sections(texts)
+
+        first = asyncio.run(analyzer.analyze(db, document))
+        assert not first["cached"] and first["sections"] == len(sections) > 5
+        assert len(ai_service.summarized) == len(sections)
+        assert ai_service.max_active == 3
+        # Too many summaries for one request: reduced in groups, then once more
+        assert len(ai_service.combined) > 1 and max(ai_service.combined) < len(sections)
+        assert first["key_concepts"][0] == "part0" and first["difficulty_level"] == "hard"
+        print(f"✅ {len(sections)} sections summarized with {len(ai_service.combined)} reduce calls")
+
+        calls = len(ai_service.summarized)
+        second = asyncio.run(analyzer.analyze(db, document))
+        assert second["cached"] and len(ai_service.summarized) == calls
+        assert {k: v for k, v in second.items() if k not in ("cached", "sections_recomputed")} == \
+            {k: v for k, v in first.items() if k not in ("cached", "sections_recomputed")}
+        print("✅ Unchanged document served from the analysis cache")
+
+        texts[25] = "edited " + texts[25]
+        third = asyncio.run(analyzer.analyze(db, document))
+        assert not third["cached"]
+        assert 1 <= third["sections_recomputed"] <= 2
+        assert len(ai_service.summarized) == calls + third["sections_recomputed"]
+        print(f"✅ Edit re-summarized {third['sections_recomputed']} of {third['sections']} sections")
+
+        # Deleting the document drops its analysis; section summaries stay for other documents
+        summaries = db.query(SectionSummary).count()
+        delete_document_analysis(db, document.id)
+        db.commit()
+        assert db.query(DocumentAnalysis).filter(DocumentAnalysis.document_id == document.id).count() == 0
+        assert db.query(SectionSummary).count() == summaries
+    finally:
+        (settings.ANALYSIS_SECTION_MIN_CHARS, settings.ANALYSIS_SECTION_MAX_CHARS,
+         settings.ANALYSIS_REDUCE_MAX_CHARS) = original
+
+
+if __name__ == "__main__":
+    test_document_analysis_cache()
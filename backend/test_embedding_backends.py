@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Test the ONNX Runtime embedding backend against the torch path
+"""
+import json
+import os
+import tempfile
+
+import numpy as np
+import torch
+from sentence_transformers import SentenceTransformer
+from sentence_transformers.sentence_transformer.modules import Normalize, Pooling, Transformer
+from tokenizers import Tokenizer, models, pre_tokenizers, processors
+from transformers import BertConfig, BertModel, PreTrainedTokenizerFast
+
+from app.rag.document_processor import DocumentChunk
+from app.rag.embedding_service import EmbeddingService
+from app.rag.onnx_backend import MIN_COSINE, MODEL_FILES, PIPELINE_FILE, OnnxSentenceEncoder, export_model, min_cosine
+
+TEXTS = [
+    "the cell membrane is a barrier",
+    "plants turn light into energy",
+    "energy",
+    "the membrane of the cell lets water in and keeps the rest of the cell together " * 4,
+    "unknown words still get a vector",
+]
+
+
+def create_small_model(pooling="mean"):
+    """A randomly initialised BERT pipeline, so the test needs no download"""
+    words = ["[PAD]", "[UNK]", "[CLS]", "[SEP]"] + sorted(set(" ".join(TEXTS).split()))
+    tokenizer = Tokenizer(models.WordLevel({word: i for i, word in enumerate(words)}, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    tokenizer.post_processor = processors.TemplateProcessing(
+        single="[CLS] $A [SEP]", special_tokens=[("[CLS]", 2), ("[SEP]", 3)]
+    )
+    path = tempfile.mkdtemp()
+    PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer, pad_token="[PAD]", unk_token="[UNK]", cls_token="[CLS]", sep_token="[SEP]"
+    ).save_pretrained(path)
+    torch.manual_seed(0)
+    BertModel(BertConfig(
+        vocab_size=len(words), hidden_size=64, num_hidden_layers=2, num_attention_heads=4,
+        intermediate_size=128, max_position_embeddings=64
+    )).save_pretrained(path)
+    return SentenceTransformer(
+        modules=[Transformer(path, max_seq_length=32), Pooling(64, pooling), Normalize()], device="cpu"
+    )
+
+
+def test_onnx_matches_torch():
+    """fp32 and int8 ONNX embeddings stay within the cosine tolerance of torch"""
+    print("🧪 Testing ONNX embedding backend:")
+    model = create_small_model()
+    path = os.path.join(tempfile.mkdtemp(), "small-model")
+    exported = export_model(model, path, quantize=True)
+    assert set(exported["min_cosine"]) == {"onnx", "onnx-int8"}
+
+    reference = model.encode(TEXTS, convert_to_numpy=True)
+    for backend in ("onnx", "onnx-int8"):
+        encoder = OnnxSentenceEncoder(path, backend)
+        embeddings = encoder.encode(TEXTS, batch_size=2)
+        assert embeddings.shape == reference.shape
+        similarity = min_cosine(reference, embeddings)
+        assert similarity >= MIN_COSINE[backend], (backend, similarity)
+        print(f"✅ {backend}: min cosine {similarity:.5f}")
+    assert np.allclose(np.linalg.norm(embeddings, axis=1), 1.0, atol=1e-5)
+
+    # Exporting fp32 again leaves the quantized variant in place
+    export_model(model, path)
+    assert os.path.exists(os.path.join(path, MODEL_FILES["onnx-int8"]))
+    with open(os.path.join(path, PIPELINE_FILE)) as f:
+        assert set(json.load(f)["min_cosine"]) == {"onnx", "onnx-int8"}
+    assert not [name for name in os.listdir(os.path.dirname(path)) if name.startswith(".export-")]
+
+
+def test_cls_pooling_and_service_interface():
+    """EmbeddingService works unchanged on top of the ONNX encoder"""
+    model = create_small_model(pooling="cls")
+    path = os.path.join(tempfile.mkdtemp(), "small-model")
+    export_model(model, path)
+
+    service = EmbeddingService.__new__(EmbeddingService)
+    service.model = OnnxSentenceEncoder(path)
+    service.backend = "onnx"
+    service.pool = None
+    assert service.chunk_token_limit() == 30
+    assert service.count_tokens(["the cell membrane", ""]) == [3, 0]
+
+    chunks = [DocumentChunk(content=text, chunk_id=f"c_{i}", metadata={}) for i, text in enumerate(TEXTS)]
+    results = service.generate_embeddings(chunks)
+    assert min_cosine(model.encode(TEXTS), np.array([result["embedding"] for result in results])) >= MIN_COSINE["onnx"]
+    assert {result["metadata"]["embedding_backend"] for result in results} == {"onnx"}
+    assert service.encode_texts(TEXTS[:2]).shape == (2, 64)
+    assert service.generate_query_embedding("light").shape == (64,)
+
+
+if __name__ == "__main__":
+    test_onnx_matches_torch()
+    test_cls_pooling_and_service_interface()
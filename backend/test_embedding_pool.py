@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Test the multi-process embedding pool: coalescing, ordering, backpressure and worker failures
+"""
+import functools
+import os
+import threading
+import time
+
+import numpy as np
+
+from app.core.metrics import metrics
+from app.rag.document_processor import DocumentChunk
+from app.rag.embedding_pool import EmbeddingPool, EmbeddingPoolError, get_embedding_pool, shutdown_embedding_pools
+from app.rag.embedding_service import EmbeddingService
+
+
+def vector(text):
+    """Deterministic stand-in for a sentence embedding"""
+    return np.array([len(text), sum(map(ord, text)) % 997, text.count(" "), 1.0], dtype=np.float32)
+
+
+def encode(texts, delay=0.0):
+    if "crash" in texts:
+        os._exit(1)
+    if "fail" in texts:
+        raise ValueError("bad input")
+    time.sleep(delay)
+    return np.stack([vector(text) for text in texts])
+
+
+def load_fake_encoder(delay=0.0):
+    """Worker-side loader, in place of load_sentence_transformer"""
+    return lambda texts: encode(texts, delay)
+
+
+def batch_count():
+    histogram = metrics.snapshot()["histograms"].get("embedding_pool_batch_texts")
+    return histogram["count"] if histogram else 0
+
+
+def test_requests_are_coalesced_and_ordered():
+    """Small concurrent requests share worker batches and each gets its own rows back, in order"""
+    print("🧪 Testing embedding pool coalescing:")
+    pool = EmbeddingPool(load_fake_encoder, workers=2, batch_size=64, max_wait=0.2)
+    try:
+        pool.encode(["warm up"])
+        requests = [[f"document {d} chunk {c} text" for c in range(5)] for d in range(20)]
+        batches = batch_count()
+        futures = [None] * len(requests)
+
+        def submit(index):
+            futures[index] = pool.submit(requests[index])
+
+        threads = [threading.Thread(target=submit, args=(i,)) for i in range(len(requests))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for texts, future in zip(requests, futures):
+            assert np.array_equal(future.result(timeout=60), np.stack([vector(text) for text in texts]))
+        coalesced = batch_count() - batches
+        assert coalesced < len(requests)
+
+        # A request larger than a batch is split across workers and put back together
+        texts = [f"chunk {i} " + "word " * (i % 7) for i in range(1000)]
+        assert np.array_equal(pool.encode(texts), np.stack([vector(text) for text in texts]))
+    finally:
+        pool.shutdown()
+    print(f"✅ 20 requests encoded in {coalesced} batches")
+
+
+def test_backlog_is_bounded():
+    """Submitters wait while the queue is full"""
+    pool = EmbeddingPool(functools.partial(load_fake_encoder, 0.05), workers=1, batch_size=20, max_backlog=60, max_wait=0)
+    try:
+        futures = []
+        for i in range(10):
+            futures.append(pool.submit([f"text {i}-{j}" for j in range(20)]))
+            assert pool.stats()["embedding_pool_backlog"] <= 60
+        assert all(len(future.result(timeout=60)) == 20 for future in futures)
+    finally:
+        pool.shutdown()
+
+
+def test_worker_failures():
+    """An error fails only its batch; a dead worker is replaced"""
+    pool = EmbeddingPool(load_fake_encoder, workers=1, batch_size=8, max_wait=0)
+    try:
+        for bad in ("fail", "crash"):
+            try:
+                pool.encode(["fine", bad])
+                assert False, "expected EmbeddingPoolError"
+            except EmbeddingPoolError as e:
+                assert ("bad input" in str(e)) == (bad == "fail")
+            assert np.array_equal(pool.encode(["fine"]), vector("fine")[None, :])
+    finally:
+        pool.shutdown()
+
+
+class UnforkableContext:
+    """Multiprocessing context whose processes fail to start, as when fork hits EAGAIN"""
+
+    def __init__(self, context):
+        self.Pipe = context.Pipe
+
+    def Process(self, **kwargs):
+        class FailingProcess:
+            def start(self):
+                raise OSError(11, "Resource temporarily unavailable")
+        return FailingProcess()
+
+
+def test_worker_start_failure():
+    """A worker that cannot be started fails the batch instead of hanging its callers"""
+    pool = EmbeddingPool(load_fake_encoder, workers=1, batch_size=8, max_wait=0)
+    pool._context = UnforkableContext(pool._context)
+    try:
+        for _ in range(2):
+            try:
+                pool.submit(["fine"]).result(timeout=10)
+                assert False, "expected EmbeddingPoolError"
+            except EmbeddingPoolError as e:
+                assert "Resource temporarily unavailable" in str(e)
+        assert pool.stats()["embedding_pool_busy_workers"] == 0
+    finally:
+        pool.shutdown()
+
+
+def test_shared_pool_is_replaced():
+    """Asking for another model shuts down the shared pool it replaces"""
+    try:
+        first = get_embedding_pool("model-a")
+        assert get_embedding_pool("model-a") is first
+        second = get_embedding_pool("model-b")
+        assert second is not first and first._closed and not second._closed
+    finally:
+        shutdown_embedding_pools()
+    assert second._closed
+
+
+def test_embedding_service_uses_pool():
+    pool = EmbeddingPool(load_fake_encoder, workers=1)
+    service = EmbeddingService.__new__(EmbeddingService)
+    service.pool = pool
+    service.backend = "torch"
+    try:
+        chunks = [DocumentChunk(content=f"Chunk {i}.", chunk_id=f"c_{i}", metadata={}) for i in range(3)]
+        results = service.generate_embeddings(chunks)
+        assert [r["embedding"] for r in results] == [vector(chunk.content).tolist() for chunk in chunks]
+        assert results[0]["embedding_dim"] == 4
+    finally:
+        pool.shutdown()
+
+
+if __name__ == "__main__":
+    test_requests_are_coalesced_and_ordered()
+    test_backlog_is_bounded()
+    test_worker_failures()
+    test_worker_start_failure()
+    test_shared_pool_is_replaced()
+    test_embedding_service_uses_pool()
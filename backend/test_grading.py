@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Test test submission and grading
+"""
+import asyncio
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.core.database import Base
+from app.models.user import User, UserRole
+from app.models.test import Test, Question, TestResult, TestAnswer, QuestionType
+from app.services.grading import AnswerKeyCache, answer_key_cache, regrade_test
+from app.services.short_answer_grading import ShortAnswerGrader, ShortAnswerItem
+from app.api.v1.tests import submit_test
+
+
+def create_session():
+    """Create an isolated in-memory database session"""
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+
+def create_test_fixture(db):
+    """Create a teacher, a student and a small active test"""
+    teacher = User(email="teacher@test.com", username="teacher", full_name="Teacher",
+                   hashed_password="x", role=UserRole.TEACHER)
+    student = User(email="student@test.com", username="student", full_name="Student",
+                   hashed_password="x", role=UserRole.STUDENT)
+    db.add_all([teacher, student])
+    db.flush()
+
+    test = Test(title="Grading test", creator_id=teacher.id, is_active=True)
+    db.add(test)
+    db.flush()
+
+    questions = [
+        Question(test_id=test.id, question_text="2 + 2?", question_type=QuestionType.SHORT_ANSWER,
+                 correct_answer="4", points=2),
+        Question(test_id=test.id, question_text="Sky is blue", question_type=QuestionType.TRUE_FALSE,
+                 correct_answer="True", points=1),
+    ]
+    db.add_all(questions)
+    db.commit()
+    return student, test, questions
+
+
+def test_submission_grading():
+    """Submission is graded and stored in one transaction"""
+    print("🧪 Testing test submission grading:")
+    answer_key_cache.clear()
+    db = create_session()
+    student, test, questions = create_test_fixture(db)
+
+    result = asyncio.run(submit_test(
+        test_id=test.id,
+        answers={str(questions[0].id): " 4 ", str(questions[1].id): "false"},
+        current_user=student,
+        db=db
+    ))
+
+    assert result["score"] == 2
+    assert result["total_points"] == 3
+    assert result["percentage"] == 66
+    assert db.query(TestResult).count() == 1
+    stored = db.query(TestAnswer).filter(TestAnswer.test_result_id == result["test_result_id"]).all()
+    assert len(stored) == 2
+    assert sum(answer.points_earned for answer in stored) == 2
+    print("✅ Submission graded and persisted")
+
+
+def test_answer_key_invalidation():
+    """Changing a question drops the cached answer key"""
+    print("🧪 Testing answer key cache invalidation:")
+    answer_key_cache.clear()
+    db = create_session()
+    student, test, questions = create_test_fixture(db)
+
+    first_key = answer_key_cache.get(db, test.id)
+    assert answer_key_cache.get(db, test.id) is first_key
+
+    questions[0].correct_answer = "four"
+    db.commit()
+
+    second_key = answer_key_cache.get(db, test.id)
+    assert second_key is not first_key
+    assert second_key.answers[0] == "four"
+    print("✅ Answer key reloaded after question change")
+
+
+def test_answer_key_version_across_processes():
+    """A cache that saw no ORM event (another worker) still recompiles after an edit"""
+    db = create_session()
+    student, test, questions = create_test_fixture(db)
+    other_worker = AnswerKeyCache()
+
+    stale = other_worker.get(db, test.id)
+    assert other_worker.get(db, test.id) is stale
+    questions[1].correct_answer = "true"
+    db.commit()
+
+    fresh = other_worker.get(db, test.id)
+    assert fresh.version > stale.version
+    assert fresh.answers[1] == "true"
+
+
+def test_invalidation_during_compile_is_not_cached():
+    """A key compiled while an invalidation lands is returned but not stored"""
+    db = create_session()
+    student, test, questions = create_test_fixture(db)
+
+    class RacingCache(AnswerKeyCache):
+        def _compile(self, db, test_id):
+            key = super()._compile(db, test_id)
+            self.invalidate(test_id)  # e.g. a question edit committed meanwhile
+            return key
+
+    cache = RacingCache()
+    assert cache.get(db, test.id) is not None
+    assert test.id not in cache._keys
+
+
+def test_multiple_choice_option_map():
+    """Multiple choice answers match by option text or option letter"""
+    print("🧪 Testing multiple choice option maps:")
+    answer_key_cache.clear()
+    db = create_session()
+    student, test, questions = create_test_fixture(db)
+    mc = Question(test_id=test.id, question_text="Capital of Serbia?",
+                  question_type=QuestionType.MULTIPLE_CHOICE,
+                  options='["Novi Sad", "Beograd", "Niš"]', correct_answer="Beograd", points=1)
+    db.add(mc)
+    db.commit()
+
+    key = answer_key_cache.get(db, test.id)
+    position = key.position[mc.id]
+    assert key.is_correct(position, "b")
+    assert key.is_correct(position, "beograd")
+    assert not key.is_correct(position, "a")
+    print("✅ Option letters and option text both resolve to the correct option")
+
+
+def test_bulk_regrade():
+    """Correcting a key re-grades historical answers"""
+    print("🧪 Testing bulk re-grade:")
+    answer_key_cache.clear()
+    db = create_session()
+    student, test, questions = create_test_fixture(db)
+
+    result = asyncio.run(submit_test(
+        test_id=test.id,
+        answers={str(questions[0].id): "four", str(questions[1].id): "true"},
+        current_user=student,
+        db=db
+    ))
+    assert result["score"] == 1
+
+    questions[0].correct_answer = "Four"
+    db.commit()
+    summary = regrade_test(db, test.id)
+
+    assert summary["answers_changed"] == 1
+    stored = db.query(TestResult).filter(TestResult.id == result["test_result_id"]).one()
+    assert stored.score == 3
+    assert stored.percentage == 100
+    print("✅ Historical results re-graded in bulk")
+
+
+class KeywordEmbeddingService:
+    """Deterministic stand-in for EmbeddingService: one dimension per keyword"""
+
+    keywords = ["photosynthesis", "light", "plants", "energy", "war"]
+
+    def __init__(self):
+        self.calls = 0
+
+    def encode_texts(self, texts):
+        import numpy as np
+        self.calls += 1
+        vectors = np.array([[float(word in text) for word in self.keywords] + [0.1] for text in texts])
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_short_answer_stages():
+    """Short answers go through exact, edit distance and one batched embedding pass"""
+    print("🧪 Testing short answer grading stages:")
+    embeddings = KeywordEmbeddingService()
+    grader = ShortAnswerGrader(embedding_service=embeddings, use_llm=False)
+    accepted = ("plants turn light into energy",)
+
+    verdicts = grader.grade_batch([
+        ShortAnswerItem("Plants turn light into energy!", accepted),
+        ShortAnswerItem("plants trun light into enrgy", accepted),
+        ShortAnswerItem("energy from light, made by plants", accepted),
+        ShortAnswerItem("the war", accepted),
+        ShortAnswerItem("41", ("42",)),
+        ShortAnswerItem("", accepted),
+    ])
+
+    assert [v.method for v in verdicts] == ["exact", "edit_distance", "embedding", "embedding", "numeric", "empty"]
+    assert [v.is_correct for v in verdicts] == [True, True, True, False, False, False]
+    assert embeddings.calls == 1
+    print("✅ Short answers graded with a single encode call")
+
+
+def test_short_answer_without_key():
+    """A short answer key that normalises to nothing marks answers wrong instead of failing"""
+    answer_key_cache.clear()
+    db = create_session()
+    student, test, questions = create_test_fixture(db)
+    questions[0].correct_answer = "?!"
+    db.commit()
+
+    grader = ShortAnswerGrader(embedding_service=KeywordEmbeddingService(), use_llm=False)
+    assert grader.grade_batch([ShortAnswerItem("plants", ())])[0].method == "no_key"
+
+    result = asyncio.run(submit_test(
+        test_id=test.id,
+        answers={str(questions[0].id): "four", str(questions[1].id): "true"},
+        current_user=student,
+        db=db
+    ))
+    assert result["score"] == 1
+
+
+if __name__ == "__main__":
+    test_submission_grading()
+    test_answer_key_invalidation()
+    test_answer_key_version_across_processes()
+    test_invalidation_during_compile_is_not_cached()
+    test_multiple_choice_option_map()
+    test_bulk_regrade()
+    test_short_answer_stages()
+    test_short_answer_without_key()
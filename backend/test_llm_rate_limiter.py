@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Test token-bucket rate limiting and LLM quotas
+"""
+import asyncio
+import os
+import tempfile
+
+from app.ai.rate_limiter import (
+    BATCH, INTERACTIVE, LLMCallContext, LLMRateLimiter, MemoryBucketStore, RateLimitExceeded,
+    SQLiteBucketStore, current_llm_context, llm_call_context
+)
+from app.core.config import settings
+
+LIMITS = dict(
+    LLM_GLOBAL_RPM=100, LLM_GLOBAL_TPM=10000, LLM_USER_RPM=100, LLM_USER_TPM=3000,
+    LLM_ROLE_TPM={"student": 5000}, LLM_COURSE_TPM=10000, LLM_INTERACTIVE_RESERVE=0.2
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def with_limits(test):
+    """Run a test with small, known limits"""
+    def run():
+        original = {name: getattr(settings, name) for name in LIMITS}
+        for name, value in LIMITS.items():
+            setattr(settings, name, value)
+        try:
+            test()
+        finally:
+            for name, value in original.items():
+                setattr(settings, name, value)
+    run.__name__ = test.__name__
+    run.__doc__ = test.__doc__
+    return run
+
+
+def rejected(limiter, tokens, context):
+    try:
+        limiter.acquire(tokens, context, timeout=0)
+    except RateLimitExceeded as e:
+        return e.scope
+    return None
+
+
+@with_limits
+def test_user_and_role_quotas():
+    """Per-user and per-role token quotas reject instead of queueing"""
+    print("🧪 Testing LLM quotas:")
+    clock = FakeClock()
+    limiter = LLMRateLimiter(store=MemoryBucketStore(clock))
+    alice = LLMCallContext(user_id=1, role="student")
+    bob = LLMCallContext(user_id=2, role="student")
+
+    lease = limiter.acquire(2500, alice, timeout=0)
+    assert rejected(limiter, 1000, alice) == "user:1:tokens"
+    # The call used fewer tokens than estimated; the difference is returned
+    limiter.settle(lease, 1500)
+    assert rejected(limiter, 1000, alice) is None
+
+    # Alice and Bob share the student role's budget
+    assert rejected(limiter, 3000, bob) == "role:student:tokens"
+    clock.now += 30  # half a minute refills half of every bucket
+    assert rejected(limiter, 3000, bob) is None
+    print("✅ User and role quotas enforced and settled with real usage")
+
+
+@with_limits
+def test_batch_lane_leaves_reserve():
+    """Batch calls stop at the interactive reserve of the global budget"""
+    print("🧪 Testing priority lanes:")
+    limiter = LLMRateLimiter(store=MemoryBucketStore(FakeClock()))
+    batch = LLMCallContext(priority=BATCH)
+    interactive = LLMCallContext(priority=INTERACTIVE)
+
+    for _ in range(4):
+        limiter.acquire(2000, batch, timeout=0)
+    assert rejected(limiter, 1, batch) == "global"
+    assert rejected(limiter, 1500, interactive) is None
+    print("✅ Interactive calls still admitted once batch work hits the reserve")
+
+
+@with_limits
+def test_batch_yields_only_to_global_waiters():
+    """A student throttled by their own quota does not hold up batch work"""
+    print("🧪 Testing batch yielding:")
+    limiter = LLMRateLimiter(store=MemoryBucketStore())
+    student = LLMCallContext(user_id=1, priority=INTERACTIVE)
+    batch = LLMCallContext(priority=BATCH)
+
+    async def scenario():
+        limiter.acquire(3000, student, timeout=0)
+        # Waits on its own user bucket, on the event loop without blocking it
+        throttled = asyncio.create_task(limiter.acquire_async(1000, student, timeout=60))
+        await asyncio.sleep(0.1)
+        assert limiter._interactive_blocked == 0
+        await limiter.acquire_async(100, batch, timeout=0.5)
+        throttled.cancel()
+
+        limiter.acquire(settings.LLM_GLOBAL_TPM - 3100, LLMCallContext(), timeout=0)
+        starved = asyncio.create_task(limiter.acquire_async(5000, LLMCallContext(), timeout=60))
+        await asyncio.sleep(0.1)
+        assert limiter._interactive_blocked == 1
+        try:
+            await limiter.acquire_async(1, batch, timeout=0.3)
+            raise AssertionError("Batch work should yield to an interactive caller waiting on the global budget")
+        except RateLimitExceeded as e:
+            assert e.scope == "global"
+        starved.cancel()
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+    assert limiter._interactive_blocked == 0
+    print("✅ Batch calls wait only for interactive callers short of global budget")
+
+
+@with_limits
+def test_shared_sqlite_buckets():
+    """Two workers sharing a SQLite file draw from the same buckets"""
+    print("🧪 Testing shared SQLite buckets:")
+    path = os.path.join(tempfile.mkdtemp(), "buckets.db")
+    clock = FakeClock()
+    worker_a = LLMRateLimiter(store=SQLiteBucketStore(path, clock=clock))
+    worker_b = LLMRateLimiter(store=SQLiteBucketStore(path, clock=clock))
+    context = LLMCallContext(user_id=7)
+
+    worker_a.acquire(2000, context, timeout=0)
+    assert rejected(worker_b, 2000, context) == "user:7:tokens"
+    clock.now += 20
+    assert rejected(worker_b, 2000, context) is None
+    print("✅ Quota consumed on one worker is visible to the other")
+
+
+def test_call_context():
+    """The context follows calls into worker threads"""
+    async def attributed():
+        with llm_call_context(user_id=3, role="teacher", priority=BATCH):
+            return await asyncio.to_thread(current_llm_context)
+
+    context = asyncio.run(attributed())
+    assert (context.user_id, context.role, context.priority) == (3, "teacher", BATCH)
+    assert current_llm_context().user_id is None
+
+
+if __name__ == "__main__":
+    test_user_and_role_quotas()
+    test_batch_lane_leaves_reserve()
+    test_batch_yields_only_to_global_waiters()
+    test_shared_sqlite_buckets()
+    test_call_context()
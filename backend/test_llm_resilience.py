@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Test retries, circuit breaking and hedging around LLM calls
+"""
+import threading
+import time
+from types import SimpleNamespace
+
+from app.ai.resilience import (
+    CircuitBreaker, CircuitOpenError, RetryPolicy, call_with_retries, get_circuit_breaker, hedged_call
+)
+
+
+class ProviderError(Exception):
+    """Looks like an openai.APIStatusError"""
+
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers=headers or {})
+
+
+def failing(errors, result="ok"):
+    """Request that raises the given errors in turn, then succeeds"""
+    errors = list(errors)
+    calls = []
+
+    def request():
+        calls.append(time.monotonic())
+        if errors:
+            raise errors.pop(0)
+        return result
+    return request, calls
+
+
+def test_retries_honour_retry_after():
+    """429s are retried with the provider's Retry-After; 400s are not retried"""
+    print("🧪 Testing LLM retries:")
+    delays = []
+    request, calls = failing([ProviderError(429, {"retry-after": "2"}), ProviderError(503)])
+    policy = RetryPolicy(max_attempts=4, base_delay=0.1, max_delay=5)
+
+    assert call_with_retries(request, provider="test-retry", policy=policy, sleep=delays.append) == "ok"
+    assert len(calls) == 3
+    assert delays[0] >= 2 and 0 <= delays[1] <= 0.2
+
+    request, calls = failing([ProviderError(400)])
+    try:
+        call_with_retries(request, provider="test-retry", policy=policy, sleep=delays.append)
+        assert False, "client errors must not be retried"
+    except ProviderError:
+        assert len(calls) == 1
+
+    # A Retry-After beyond the allowed delay gives up instead of waiting
+    request, calls = failing([ProviderError(429, {"retry-after": "120"})])
+    try:
+        call_with_retries(request, provider="test-retry", policy=policy, sleep=delays.append)
+        assert False, "expected the rate limit error"
+    except ProviderError:
+        assert len(calls) == 1
+    print("✅ Transient errors retried with backoff, client errors raised at once")
+
+
+def test_circuit_breaker():
+    """Consecutive failures open the circuit; a successful probe closes it"""
+    print("🧪 Testing circuit breaker:")
+    now = [0.0]
+    breaker = CircuitBreaker("test-circuit", failure_threshold=3, recovery_timeout=10, clock=lambda: now[0])
+    for _ in range(3):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    try:
+        breaker.before_call()
+        assert False, "open circuit must reject calls"
+    except CircuitOpenError as e:
+        assert e.retry_in == 10
+
+    now[0] = 10.0
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.before_call()  # the probe
+    try:
+        breaker.before_call()
+        assert False, "only one probe may run while half open"
+    except CircuitOpenError:
+        pass
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    print("✅ Circuit opens, rejects fast and recovers through a single probe")
+
+    # Through call_with_retries, an outage stops hitting the provider
+    outage = get_circuit_breaker("test-outage")
+    outage.failure_threshold = 2
+    request, calls = failing([ProviderError(500)] * 10)
+    policy = RetryPolicy(max_attempts=5, base_delay=0, max_delay=1)
+    try:
+        call_with_retries(request, provider="test-outage", policy=policy, sleep=lambda _: None)
+        assert False, "expected the circuit to open"
+    except CircuitOpenError:
+        assert len(calls) == 2
+    print("✅ Retries stop as soon as the circuit opens")
+
+
+def test_hedged_call():
+    """A slow first attempt is raced by a backup request"""
+    print("🧪 Testing hedged requests:")
+    lock = threading.Lock()
+    attempts = []
+
+    def request():
+        with lock:
+            attempts.append(len(attempts))
+            slow = len(attempts) == 1
+        time.sleep(1.0 if slow else 0.01)
+        return "slow" if slow else "fast"
+
+    start = time.monotonic()
+    assert hedged_call(request, provider="test-hedge", hedge_delay=0.5) == "fast"
+    elapsed = time.monotonic() - start
+    assert len(attempts) == 2 and elapsed < 0.9
+    print(f"✅ Backup request answered after {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    test_retries_honour_retry_after()
+    test_circuit_breaker()
+    test_hedged_call()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Test the LLM usage ledger and hourly rollups
+"""
+from sqlalchemy.orm import sessionmaker
+
+from app.ai.rate_limiter import llm_call_context
+from app.core.config import settings
+from app.models.llm_usage import LLMUsageEvent, LLMUsageRollup
+from app.services.llm_usage import UsageRecorder, get_usage_summary
+from test_grading import create_session, create_test_fixture
+
+
+def test_usage_rollups():
+    """Flushed events land in the ledger and are folded into hourly rollups"""
+    print("🧪 Testing LLM usage accounting:")
+    db = create_session()
+    student, test, _ = create_test_fixture(db)
+    teacher = test.creator
+    db.commit()
+
+    original_prices = settings.LLM_MODEL_PRICES
+    settings.LLM_MODEL_PRICES = {"gpt-4": (0.03, 0.06)}
+    try:
+        recorder = UsageRecorder(session_factory=sessionmaker(bind=db.get_bind()), flush_size=100, background=False)
+        with llm_call_context(user_id=student.id, role=student.role, endpoint="tests.submit"):
+            recorder.record("openai", "gpt-4", "grade_short_answers", prompt_tokens=1000,
+                            completion_tokens=500, latency_ms=800)
+            recorder.record("openai", "gpt-4", "grade_short_answers", latency_ms=50,
+                            success=False, error="APITimeoutError")
+        assert recorder.flush() == 2
+
+        with llm_call_context(user_id=teacher.id, role=teacher.role, endpoint="ai.generate_test"):
+            recorder.record("openai", "gpt-4", "generate_test_questions", prompt_tokens=2000,
+                            completion_tokens=1000, latency_ms=1200)
+        # Outside any call context: no user, no endpoint
+        recorder.record("openai", "gpt-4", "analyze_document", cache_hit=True)
+        with llm_call_context(user_id=student.id, role=student.role, endpoint="tests.submit"):
+            recorder.record("openai", "gpt-4", "grade_short_answers", prompt_tokens=1000,
+                            completion_tokens=500, latency_ms=400)
+        assert recorder.flush() == 3
+        assert recorder.flush() == 0
+    finally:
+        settings.LLM_MODEL_PRICES = original_prices
+
+    assert db.query(LLMUsageEvent).count() == 5
+    submit = db.query(LLMUsageRollup).filter(LLMUsageRollup.endpoint == "tests.submit").one()
+    # The second flush added to the row written by the first one
+    assert (submit.calls, submit.errors, submit.total_tokens) == (3, 1, 3000)
+    assert submit.latency_ms_max == 800
+    assert abs(submit.cost_usd - 0.12) < 1e-9
+
+    by_endpoint = {row["endpoint"]: row for row in get_usage_summary(db, group_by="endpoint")}
+    assert set(by_endpoint) == {"tests.submit", "ai.generate_test", ""}
+    assert by_endpoint["ai.generate_test"]["cost_usd"] == 0.12
+    assert by_endpoint[""]["cache_hits"] == 1
+
+    by_user = {row["user"]: row for row in get_usage_summary(db, group_by="user")}
+    assert by_user[student.id]["calls"] == 3
+    assert by_user[teacher.id]["prompt_tokens"] == 2000
+    print(f"✅ {len(by_endpoint)} endpoints and {len(by_user)} users accounted")
+
+
+class FailingSessions:
+    """A session factory whose first `failures` sessions cannot write"""
+
+    def __init__(self, session_factory, failures):
+        self.session_factory = session_factory
+        self.failures = failures
+
+    def __call__(self):
+        session = self.session_factory()
+        if self.failures:
+            self.failures -= 1
+            def fail(*args, **kwargs):
+                raise RuntimeError("database is unavailable")
+            session.execute = fail
+        return session
+
+
+def test_failed_flush_keeps_events():
+    """Events of a failed write are retried; past the buffer limit the oldest are dropped"""
+    db = create_session()
+    factory = FailingSessions(sessionmaker(bind=db.get_bind()), failures=2)
+    recorder = UsageRecorder(session_factory=factory, flush_size=2, background=False, max_buffered=2)
+    for operation in ("a", "b", "c", "d"):
+        recorder.record("openai", "gpt-4", operation)
+
+    # Writes of [a, b] and [a, b, c] failed and a was pushed out; [b, c, d] went through
+    assert factory.failures == 0 and recorder.flush() == 0
+    assert [event.operation for event in db.query(LLMUsageEvent).order_by(LLMUsageEvent.id)] == ["b", "c", "d"]
+
+
+if __name__ == "__main__":
+    test_usage_rollups()
+    test_failed_flush_keeps_events()
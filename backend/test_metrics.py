@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Test the database pool configuration and the /metrics endpoint
+"""
+import os
+import tempfile
+
+from fastapi import HTTPException, Request
+from sqlalchemy import create_engine, exc, text
+
+from app.core.config import settings
+from app.core.database import InstrumentedQueuePool, build_engine, pool_options
+from app.core.metrics import metrics
+from app.core.security import require_metrics_access
+
+
+def test_pool_options_follow_settings():
+    """Server databases get the instrumented pool sized from settings; SQLite keeps its default"""
+    options = pool_options()
+    assert options["poolclass"] is InstrumentedQueuePool
+    assert options["pool_size"] == settings.DB_POOL_SIZE
+    assert options["max_overflow"] == settings.DB_MAX_OVERFLOW
+    assert options["pool_timeout"] == settings.DB_POOL_TIMEOUT
+    assert options["pool_recycle"] == settings.DB_POOL_RECYCLE
+    assert options["pool_pre_ping"] == settings.DB_POOL_PRE_PING
+    assert not isinstance(build_engine("sqlite://").pool, InstrumentedQueuePool)
+
+
+def test_pool_wait_and_exhaustion_metrics():
+    """Checkouts are timed, a starved pool is counted and held connections are measured"""
+    print("🧪 Testing pool metrics:")
+    metrics.reset()
+    path = os.path.join(tempfile.mkdtemp(), "pool.db")
+    engine = create_engine(
+        f"sqlite:///{path}", poolclass=InstrumentedQueuePool, pool_size=1, max_overflow=0, pool_timeout=0.2
+    )
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+        try:
+            engine.connect()
+            raise AssertionError("The second checkout should time out")
+        except exc.TimeoutError:
+            pass
+
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"]["db_pool_exhausted_total"] == 1
+    assert snapshot["histograms"]["db_pool_checkout_wait_seconds"]["count"] == 2
+    assert snapshot["histograms"]["db_pool_checkout_wait_seconds"]["max"] >= 0.2
+    assert snapshot["histograms"]["db_pool_connection_held_seconds"]["count"] == 1
+    engine.dispose()
+    print("✅ Wait time, exhaustion and hold time recorded")
+
+
+def request(client_host, authorization=None):
+    headers = [(b"authorization", authorization.encode())] if authorization else []
+    return Request({"type": "http", "headers": headers, "client": (client_host, 50000)})
+
+
+def allowed(request) -> bool:
+    try:
+        require_metrics_access(request)
+        return True
+    except HTTPException as e:
+        assert e.status_code == 403
+        return False
+
+
+def test_metrics_endpoint_access():
+    """Metrics need the configured bearer token; without one only local clients get them"""
+    original_token = settings.METRICS_TOKEN
+    try:
+        settings.METRICS_TOKEN = None
+        assert allowed(request("127.0.0.1"))
+        assert allowed(request("::1"))
+        assert not allowed(request("203.0.113.7"))
+
+        settings.METRICS_TOKEN = "scrape-secret"
+        assert not allowed(request("127.0.0.1"))
+        assert not allowed(request("203.0.113.7", "Bearer wrong"))
+        assert not allowed(request("203.0.113.7", "Basic scrape-secret"))
+        assert allowed(request("203.0.113.7", "Bearer scrape-secret"))
+    finally:
+        settings.METRICS_TOKEN = original_token
+
+
+if __name__ == "__main__":
+    test_pool_options_follow_settings()
+    test_pool_wait_and_exhaustion_metrics()
+    test_metrics_endpoint_access()
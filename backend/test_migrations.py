@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Test the startup schema upgrade for databases created by earlier versions
+"""
+import os
+import tempfile
+
+from sqlalchemy import create_engine, inspect, text
+
+from app.core.migrations import create_schema, upgrade_schema
+from app.models.document import Document
+from app.models.test import Question, Test
+from app.models.user import User
+
+
+def create_old_database():
+    """documents, questions and tests without the columns added later"""
+    engine = create_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'old.db')}")
+    with engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE documents (id INTEGER PRIMARY KEY, title VARCHAR NOT NULL, "
+            "file_path VARCHAR NOT NULL, owner_id INTEGER NOT NULL)"
+        ))
+        connection.execute(text(
+            "CREATE TABLE questions (id INTEGER PRIMARY KEY, question_text TEXT NOT NULL, "
+            "question_type VARCHAR(15) NOT NULL, correct_answer TEXT NOT NULL, options TEXT, "
+            "test_id INTEGER NOT NULL)"
+        ))
+        connection.execute(text(
+            "CREATE TABLE tests (id INTEGER PRIMARY KEY, title VARCHAR NOT NULL, is_active BOOLEAN, "
+            "creator_id INTEGER NOT NULL)"
+        ))
+        connection.execute(text("INSERT INTO tests (title, is_active, creator_id) VALUES ('Geography', 1, 1)"))
+        connection.execute(text(
+            "INSERT INTO questions (question_text, question_type, correct_answer, test_id) "
+            "VALUES ('Capital of France?', 'SHORT_ANSWER', 'Paris', 1)"
+        ))
+    return engine
+
+
+def test_upgrade_adds_missing_columns_once():
+    """Missing columns and their indexes are added; a second run changes nothing"""
+    print("🧪 Testing schema upgrade:")
+    engine = create_old_database()
+    added = upgrade_schema(engine)
+    # Tables the old database never had are left to create_all
+    assert added == ["documents.blob_hash", "questions.accepted_answers", "tests.answer_key_version"]
+
+    inspector = inspect(engine)
+    for table_name, column_name in (name.split(".") for name in added):
+        assert column_name in {column["name"] for column in inspector.get_columns(table_name)}
+    assert "ix_documents_blob_hash" in {index["name"] for index in inspector.get_indexes("documents")}
+    with engine.connect() as connection:
+        row = connection.execute(text("SELECT correct_answer, accepted_answers FROM questions")).one()
+        version = connection.execute(text("SELECT answer_key_version FROM tests")).scalar_one()
+    assert tuple(row) == ("Paris", None)
+    assert version == 0
+
+    assert upgrade_schema(engine) == []
+    print("✅ Old database upgraded, second run is a no-op")
+
+
+def test_new_database_needs_no_upgrade():
+    """A database created from the current models already has every column"""
+    engine = create_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'new.db')}")
+    assert create_schema(engine) == []
+    tables = set(inspect(engine).get_table_names())
+    assert {Document.__tablename__, Question.__tablename__, Test.__tablename__, User.__tablename__} <= tables
+
+
+if __name__ == "__main__":
+    test_upgrade_adds_missing_columns_once()
+    test_new_database_needs_no_upgrade()
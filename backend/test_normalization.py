@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Test text normalization of extracted document text
+"""
+from app.rag.normalization import TextNormalizer
+
+
+def test_serbian_text_is_preserved():
+    """Cyrillic, diacritics and typographic punctuation survive normalization"""
+    print("🧪 Testing Serbian text normalization:")
+    normalizer = TextNormalizer("sr")
+    text = "Ђорђе каже: „Ћелија је основна јединица живота” – učenik, 3,14 … Šta?"
+    assert normalizer.normalize(text) == text
+
+    # Decomposed "c" + caron from a PDF equals the composed letter
+    assert normalizer.normalize("c\u030celija") == "\u010delija"
+    assert normalizer.normalize("ǉubav ǈubica ǌiva") == "ljubav Ljubica njiva"
+    print("✅ Serbian text preserved")
+
+
+def test_extraction_artifacts_are_removed():
+    """Ligatures, invisible characters, odd spaces and line-break hyphens are cleaned up"""
+    print("🧪 Testing extraction artifacts:")
+    normalizer = TextNormalizer("sr")
+    assert normalizer.normalize("ﬁnalni\u00a0rezultat\u200b  je   dobar\x07") == "finalni rezultat je dobar"
+    assert normalizer.normalize("infor-\nmacija i orga-\n  nizacija") == "informacija i organizacija"
+    # Hyphens that belong to the text stay
+    assert normalizer.normalize("COVID-\n19 i Novi Sad-\nBeograd") == "COVID-19 i Novi Sad-Beograd"
+
+    assert TextNormalizer("en").normalize("„It’s” done") == "\"It's\" done"
+    assert TextNormalizer("sr").normalize("„It’s” done") == "„It’s” done"
+    print("✅ Artifacts removed")
+
+
+if __name__ == "__main__":
+    test_serbian_text_is_preserved()
+    test_extraction_artifacts_are_removed()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Test the OCR stage for scanned PDF pages
+"""
+import os
+import tempfile
+
+from app.core.metrics import metrics
+from app.rag.ocr import OCRStage
+from app.rag.pdf_backends import PDFExtractor
+from app.rag.text_cache import PageTextCache
+from test_chunking import write_pdf
+
+
+class FakeRenderer:
+    """Renders a page to bytes that identify its content"""
+
+    def render(self, file_path, page_index):
+        return b"scan of page 1" if page_index in (1, 2) else f"scan of page {page_index}".encode()
+
+
+class FakeEngine:
+    """Recognizes the fake scans; counts work in a file so worker processes can report it"""
+    cache_key = "fake:srp"
+
+    def __init__(self, log_path):
+        self.log_path = log_path
+
+    def recognize(self, image):
+        with open(self.log_path, "a") as f:
+            f.write("x")
+        return f"Skenirani tekst: {image.decode()}.\nDruga linija.\n"
+
+
+def write_scanned_pdf(path):
+    """Page 1 has a text layer; pages 2 and 3 (identical scans) only an image; page 4 is blank"""
+    write_pdf(
+        path, [b"BT /F1 11 Tf 72 720 Td (Uvod u biologiju i osnovne pojmove.) Tj ET", b"", b"", b""], image_pages=(1, 2)
+    )
+
+
+def test_scanned_pages_are_recognized():
+    """Image-only pages are OCR'd in worker processes, each distinct scan once"""
+    print("🧪 Testing OCR of scanned pages:")
+    metrics.reset()
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "scan.pdf")
+    write_scanned_pdf(path)
+    log_path = os.path.join(directory, "recognized.log")
+    cache = PageTextCache(os.path.join(directory, "cache.db"))
+    ocr = OCRStage(FakeEngine(log_path), FakeRenderer(), workers=2, cache_path=cache.path)
+    extractor = PDFExtractor("pypdf2", cache, ocr)
+
+    try:
+        assert ocr.image_only_pages(path, [[], [], [], []]) == [1, 2]
+        result = extractor.extract(path)
+        assert result.pages[0] == [("Uvod u biologiju i osnovne pojmove.", 11.0)]
+        assert result.pages[1] == result.pages[2] == [("Skenirani tekst: scan of page 1.", 0.0), ("Druga linija.", 0.0)]
+        assert result.pages[3] == []
+        assert (result.ocr.pages, result.ocr.failed) == (2, 0) and result.ocr.pages_per_second > 0
+
+        # Pages 2 and 3 render identically: at most one of them reaches the engine
+        # when they run in parallel, and neither does on a second file
+        copy = os.path.join(directory, "copy.pdf")
+        with open(path, "rb") as source, open(copy, "ab") as target:
+            target.write(source.read() + b"\n% re-saved\n")
+        assert extractor.extract(copy).ocr.cache_hits == 2
+        with open(log_path) as f:
+            assert 1 <= len(f.read()) <= 2
+        assert metrics.snapshot()["counters"]["ocr_pages_total{source=cache}"] >= 2
+    finally:
+        ocr.shutdown()
+    print("✅ Scanned pages recognized")
+
+
+class CrashingEngine(FakeEngine):
+    """Kills its worker process on the first scan, as a native crash would"""
+
+    def recognize(self, image):
+        if not os.path.exists(self.log_path):
+            with open(self.log_path, "w") as f:
+                f.write("crashed")
+            os._exit(1)
+        return super().recognize(image)
+
+
+def test_worker_crash_restarts_pool():
+    """A crashed worker fails its pages once; the pool is replaced and nothing empty is cached"""
+    print("🧪 Testing OCR worker crash:")
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "scan.pdf")
+    write_scanned_pdf(path)
+    cache = PageTextCache(os.path.join(directory, "cache.db"))
+    ocr = OCRStage(CrashingEngine(os.path.join(directory, "crash.log")), FakeRenderer(), workers=1)
+    extractor = PDFExtractor("pypdf2", cache, ocr)
+
+    try:
+        first = extractor.extract(path)
+        assert first.ocr.failed > 0 and first.pages[1] == []
+        # The failed pages were not cached as empty: a second run recognizes them
+        second = extractor.extract(path)
+        assert (second.ocr.pages, second.ocr.failed) == (2, 0)
+        assert second.pages[1][0] == ("Skenirani tekst: scan of page 1.", 0.0)
+    finally:
+        ocr.shutdown()
+    print("✅ OCR recovered from a crashed worker")
+
+
+if __name__ == "__main__":
+    test_scanned_pages_are_recognized()
+    test_worker_crash_restarts_pool()
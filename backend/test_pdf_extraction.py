@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Test PDF backend selection and the per-page text cache
+"""
+import hashlib
+import os
+import tempfile
+from types import SimpleNamespace
+
+from app.rag.pdf_backends import PDFBackend, PDFExtractor, PdfiumBackend, PyPDF2Backend
+from app.rag.text_cache import PageTextCache
+from test_chunking import write_pdf
+
+PAGES = [
+    b"BT /F1 20 Tf 72 720 Td (Osnove biologije) Tj ET BT /F1 11 Tf 72 690 Td (Prva strana.) Tj ET",
+    b"BT /F1 11 Tf 72 720 Td (Druga strana.) Tj ET",
+]
+
+
+class CountingBackend(PyPDF2Backend):
+    """PyPDF2 extraction that counts how often files are parsed"""
+    parsed = 0
+
+    def extract(self, file_path):
+        CountingBackend.parsed += 1
+        return super().extract(file_path)
+
+
+class BrokenBackend(PDFBackend):
+    """A fast backend that cannot read the file"""
+    name = "broken"
+
+    def extract(self, file_path):
+        raise RuntimeError("unsupported font encoding")
+
+
+def test_pages_are_parsed_once():
+    """Extracting the same file again, even under another name, reads the cache"""
+    print("🧪 Testing the PDF text cache:")
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "lecture.pdf")
+    write_pdf(path, PAGES)
+    cache = PageTextCache(os.path.join(directory, "cache.db"))
+    extractor = PDFExtractor("pypdf2", cache)
+    extractor.backends = [CountingBackend()]
+
+    first = extractor.extract(path)
+    assert first.pages == [[("Osnove biologije", 20.0), ("Prva strana.", 11.0)], [("Druga strana.", 11.0)]]
+
+    copy = os.path.join(directory, "copy.pdf")
+    with open(path, "rb") as source, open(copy, "wb") as target:
+        target.write(source.read())
+    # A second process sharing the cache file sees the same pages
+    second = PDFExtractor("pypdf2", PageTextCache(cache.path))
+    second.backends = [CountingBackend()]
+    assert second.extract(copy).pages == first.pages
+    assert CountingBackend.parsed == 1
+    print("✅ Parsed once, served twice")
+
+
+def test_fallback_per_file():
+    """A file the preferred backend cannot read is extracted by the next one"""
+    print("🧪 Testing backend fallback:")
+    path = os.path.join(tempfile.mkdtemp(), "lecture.pdf")
+    write_pdf(path, PAGES)
+    extractor = PDFExtractor("pypdf2")
+    extractor.backends = [BrokenBackend(), PyPDF2Backend()]
+
+    result = extractor.extract(path)
+    assert result.backend == "pypdf2" and len(result.pages) == 2
+    print(f"✅ Extracted with {result.backend}")
+
+
+def test_pdfium_matches_pypdf2():
+    """PDFium, the default when installed, reads the same lines and font sizes as PyPDF2"""
+    print("🧪 Testing the PDFium backend:")
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "lecture.pdf")
+    write_pdf(path, PAGES + [b"BT /F1 14 Tf 72 720 Td (   Uvlaka) Tj ET", b""])
+    pdfium = PdfiumBackend().extract(path)
+    assert pdfium.pages == PyPDF2Backend().extract(path).pages
+    assert pdfium.pages[2] == [("Uvlaka", 14.0)] and pdfium.pages[3] == []
+
+    # The caller's hash of the file is the cache key; the file is not hashed again
+    with open(path, "rb") as f:
+        file_hash = hashlib.sha256(f.read()).hexdigest()
+    cache = PageTextCache(os.path.join(directory, "cache.db"))
+    PDFExtractor("pdfium", cache).extract(path, file_hash)
+    assert cache.get(file_hash, PdfiumBackend().cache_key)[0] == pdfium.pages
+    print("✅ PDFium and PyPDF2 agree")
+
+
+def test_pdfium_font_size_index_outside_bmp():
+    """Font sizes are looked up by PDFium index, which counts UTF-16 units"""
+    text = "\U0001d6fc i \U0001d6fd\r\n  Beta\r\nGama"
+    sizes = [20.0] * 8 + [11.0] * 8 + [9.0] * 4  # one per UTF-16 unit
+    textpage = SimpleNamespace(
+        raw=None, get_text_range=lambda: text, count_chars=lambda: len(text.encode("utf-16-le")) // 2
+    )
+    pdfium_c = SimpleNamespace(FPDFText_GetFontSize=lambda raw, index: sizes[index])
+    assert PdfiumBackend._lines(textpage, pdfium_c) == [
+        ("\U0001d6fc i \U0001d6fd", 20.0), ("Beta", 11.0), ("Gama", 9.0)
+    ]
+
+
+if __name__ == "__main__":
+    test_pages_are_parsed_once()
+    test_fallback_per_file()
+    test_pdfium_matches_pypdf2()
+    test_pdfium_font_size_index_outside_bmp()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Test incremental re-ingestion of an edited document
+"""
+import os
+import tempfile
+
+from app.rag.chunking import TextBlock
+from app.rag.document_processor import DocumentProcessor
+from app.rag.rag_service import RAGService
+
+
+class CountingEmbeddingService:
+    """Records how many chunks were embedded"""
+
+    def __init__(self):
+        self.embedded = 0
+        self.backend = "torch"
+
+    def generate_embeddings(self, chunks):
+        self.embedded += len(chunks)
+        return [
+            {"chunk_id": chunk.chunk_id, "content": chunk.content, "embedding": [0.0, 1.0], "embedding_dim": 2,
+             "metadata": {"page_number": chunk.page_number, "embedding_backend": self.backend, **chunk.metadata}}
+            for chunk in chunks
+        ]
+
+
+class MemoryVectorStore:
+    """The parts of VectorStore that re-ingestion uses, backed by a dict"""
+
+    def __init__(self):
+        self.items = {}
+
+    def get_document_chunks(self, document_id, include_embeddings=True):
+        return [
+            {"id": chunk_id, "content": content, "metadata": dict(metadata)}
+            for chunk_id, (content, metadata) in self.items.items()
+            if metadata["document_id"] == document_id
+        ]
+
+    def add_documents(self, embeddings, document_id, metadata=None):
+        for data in embeddings:
+            chunk_metadata = {key: value for key, value in data["metadata"].items() if value is not None}
+            self.items[f"{document_id}_{data['chunk_id']}"] = (
+                data["content"], {**chunk_metadata, **(metadata or {}), "document_id": document_id}
+            )
+        return True
+
+    def upsert_documents(self, documents):
+        for document_id, embeddings, metadata in documents:
+            self.add_documents(embeddings, document_id, metadata)
+        return sum(len(embeddings) for _, embeddings, _ in documents)
+
+    def update_metadata(self, ids, metadatas):
+        for chunk_id, metadata in zip(ids, metadatas):
+            self.items[chunk_id] = (self.items[chunk_id][0], metadata)
+
+    def delete_chunks(self, ids):
+        for chunk_id in ids:
+            del self.items[chunk_id]
+
+
+def create_rag_service():
+    service = RAGService.__new__(RAGService)
+    service.document_processor = DocumentProcessor()
+    service.embedding_service = CountingEmbeddingService()
+    service.vector_store = MemoryVectorStore()
+    return service
+
+
+def paragraph(topic):
+    return " ".join(f"Sentence {i} explains part {i} of {topic} in some detail." for i in range(40))
+
+
+def test_edit_reembeds_changed_chunks_only():
+    """A one-word fix re-embeds the chunks containing it and keeps every other chunk ID"""
+    print("🧪 Testing incremental re-ingestion:")
+    rag_service = create_rag_service()
+    path = os.path.join(tempfile.mkdtemp(), "notes.txt")
+    topics = ["photosynthesis", "respiration", "mitosis", "meiosis", "osmosis"]
+
+    with open(path, "w") as f:
+        f.write(" ".join(paragraph(topic) for topic in topics))
+    first = rag_service.reingest_document(path, ".txt", "7")
+    before = set(rag_service.vector_store.items)
+    assert first["chunks_added"] == first["total_chunks"] == len(before) > 10
+    assert all(chunk_id.startswith("7_c_") for chunk_id in before)
+
+    # Unchanged file: nothing to embed
+    assert rag_service.reingest_document(path, ".txt", "7")["chunks_added"] == 0
+
+    with open(path, "w") as f:
+        f.write(" ".join(paragraph(topic) for topic in topics).replace("part 20 of mitosis", "part 20 of mitoses"))
+    embedded = rag_service.embedding_service.embedded
+    second = rag_service.reingest_document(path, ".txt", "7")
+    after = set(rag_service.vector_store.items)
+
+    # The edited sentence lives in one chunk, plus the next one through the overlap
+    assert 1 <= second["chunks_added"] <= 2
+    assert second["chunks_removed"] == second["chunks_added"]
+    assert rag_service.embedding_service.embedded - embedded == second["chunks_added"]
+    assert len(before & after) == len(before) - second["chunks_removed"]
+    assert sum("mitoses" in content for content, _ in rag_service.vector_store.items.values()) >= 1
+    print(f"✅ {second['chunks_added']} of {second['total_chunks']} chunks re-embedded")
+
+
+def test_replaced_file_updates_kept_chunks():
+    """A new file with the same text keeps every chunk but takes the new title and type"""
+    rag_service = create_rag_service()
+    path = os.path.join(tempfile.mkdtemp(), "notes.txt")
+    with open(path, "w") as f:
+        f.write(paragraph("osmosis"))
+    rag_service.reingest_document(path, ".txt", "5", {"title": "notes.docx", "file_type": ".docx"})
+
+    summary = rag_service.reingest_document(path, ".txt", "5", {"title": "notes.pdf", "file_type": ".pdf"})
+    assert summary["chunks_added"] == summary["chunks_removed"] == 0
+    assert {(metadata["title"], metadata["file_type"]) for _, metadata in rag_service.vector_store.items.values()} == {
+        ("notes.pdf", ".pdf")
+    }
+
+
+def test_renamed_heading_updates_kept_chunks():
+    """Chunks under a renamed heading keep their IDs but take the new section"""
+    rag_service = create_rag_service()
+    path = os.path.join(tempfile.mkdtemp(), "notes.txt")
+    with open(path, "w") as f:
+        f.write("# Intro\n\n" + paragraph("osmosis"))
+    first = rag_service.reingest_document(path, ".txt", "4")
+
+    with open(path, "w") as f:
+        f.write("# Introduction\n\n" + paragraph("osmosis"))
+    second = rag_service.reingest_document(path, ".txt", "4")
+    assert second["chunks_added"] == second["chunks_removed"] == 0
+    assert second["chunks_updated"] == first["total_chunks"]
+    assert {metadata["section_path"] for _, metadata in rag_service.vector_store.items.values()} == {"Introduction"}
+    assert {metadata["section"] for _, metadata in rag_service.vector_store.items.values()} == {"Introduction"}
+
+
+def test_backend_switch_reembeds_kept_chunks():
+    """Chunks embedded by another backend are embedded again under the same IDs"""
+    rag_service = create_rag_service()
+    path = os.path.join(tempfile.mkdtemp(), "notes.txt")
+    with open(path, "w") as f:
+        f.write(paragraph("photosynthesis"))
+    first = rag_service.reingest_document(path, ".txt", "3")
+    before = set(rag_service.vector_store.items)
+
+    rag_service.embedding_service.backend = "onnx-int8"
+    second = rag_service.reingest_document(path, ".txt", "3")
+    assert second["chunks_reembedded"] == second["chunks_added"] == first["total_chunks"]
+    assert second["chunks_removed"] == 0 and set(rag_service.vector_store.items) == before
+    assert {metadata["embedding_backend"] for _, metadata in rag_service.vector_store.items.values()} == {"onnx-int8"}
+    assert rag_service.reingest_document(path, ".txt", "3")["chunks_added"] == 0
+
+
+def test_repeated_chunks_get_distinct_ids():
+    """Identical chunks on different pages no longer collide"""
+    chunks = DocumentProcessor().chunk_blocks([
+        TextBlock("Part one", page_number=1, heading_level=1), TextBlock("Same text. " * 3, page_number=1),
+        TextBlock("Part two", page_number=2, heading_level=1), TextBlock("Same text. " * 3, page_number=2)
+    ])
+    ids = [chunk.chunk_id for chunk in DocumentProcessor.assign_chunk_ids(chunks)]
+    assert len(set(ids)) == 2 and ids[1] == ids[0] + "_2"
+    assert [chunk.metadata["chunk_index"] for chunk in chunks] == [0, 1]
+
+
+if __name__ == "__main__":
+    test_edit_reembeds_changed_chunks_only()
+    test_replaced_file_updates_kept_chunks()
+    test_renamed_heading_updates_kept_chunks()
+    test_backend_switch_reembeds_kept_chunks()
+    test_repeated_chunks_get_distinct_ids()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Test resumable uploads: byte ranges, resuming after a drop, and finalizing
+"""
+import asyncio
+import hashlib
+import os
+import tempfile
+
+from app.models.blob import Blob
+from app.models.document import Document
+from app.models.upload_session import UploadPart, UploadStatus
+from app.services.blob_storage import BlobStore, UploadTooLarge
+from app.services.resumable_uploads import (
+    UploadAlreadyCompleted, UploadIncomplete, UploadOffsetConflict, append_part, complete_upload, create_upload,
+    finalize_upload
+)
+from test_grading import create_session, create_test_fixture
+
+
+def body(*chunks):
+    """Request body stream; a dropped connection looks like an early end"""
+    async def stream():
+        for chunk in chunks:
+            yield chunk
+    return stream()
+
+
+def put(db, upload, offset, *chunks, store):
+    try:
+        return asyncio.run(append_part(db, upload, offset, body(*chunks), store))
+    except (UploadOffsetConflict, UploadTooLarge) as e:
+        return e
+
+
+def test_resumable_upload():
+    """A file sent in ranges, with a dropped and a duplicate request, assembles intact"""
+    print("🧪 Testing resumable uploads:")
+    db = create_session()
+    student, _, _ = create_test_fixture(db)
+    store = BlobStore(tempfile.mkdtemp())
+    content = b"%PDF-1.7\n" + os.urandom(300_000)
+
+    upload = create_upload(db, student.id, "../../lecture.pdf", len(content))
+    assert (upload.filename, upload.offset) == ("lecture.pdf", 0)
+
+    assert put(db, upload, 0, content[:100_000], store=store) == 100_000
+    # A retried request for the same range is told where to continue
+    conflict = put(db, upload, 0, content[:100_000], store=store)
+    assert isinstance(conflict, UploadOffsetConflict) and conflict.offset == 100_000
+    # The connection dropped after 50 KB of this range; those bytes are kept
+    assert put(db, upload, 100_000, content[100_000:150_000], store=store) == 150_000
+
+    try:
+        asyncio.run(finalize_upload(upload, store))
+        assert False, "finalized an incomplete upload"
+    except UploadIncomplete:
+        pass
+
+    # Nothing past the declared length is accepted
+    assert isinstance(put(db, upload, 150_000, content[150_000:] + b"extra", store=store), UploadTooLarge)
+    assert put(db, upload, 150_000, content[150_000:250_000], content[250_000:], store=store) == len(content)
+    assert [part.size for part in upload.parts] == [100_000, 50_000, len(content) - 150_000]
+
+    staged = asyncio.run(finalize_upload(upload, store))
+    # A second finalize request assembled the same parts concurrently
+    racing = asyncio.run(finalize_upload(upload, store))
+    assert staged.sha256 == hashlib.sha256(content).hexdigest()
+    document = complete_upload(db, upload, staged, store)
+    try:
+        complete_upload(db, upload, racing, store)
+        assert False, "finalized an upload twice"
+    except UploadAlreadyCompleted:
+        pass
+    assert db.query(Document).count() == 1
+    with open(document.file_path, "rb") as f:
+        assert f.read() == content
+    assert (upload.status, upload.document_id) == (UploadStatus.COMPLETED, document.id)
+    assert db.query(UploadPart).count() == 0
+    assert db.get(Blob, staged.sha256).ref_count == 1
+    assert os.listdir(store.temp_dir) == []
+    print(f"✅ {len(content)} bytes assembled from 3 parts")
+
+
+if __name__ == "__main__":
+    test_resumable_upload()